@@ -1,8 +1,12 @@
-import cloudscraper
 import json
+import os
 from datetime import datetime
 import pandas as pd
 import re
+
+# URL base de la API de Matchstat. Se puede cambiar con la variable de entorno MATCHSTAT_URL, por ejemplo para
+# apuntar al servidor local de tenis/servidor_replay.py (http://localhost:8000/tennis/api2)
+URL_MATCHSTAT = os.environ.get('MATCHSTAT_URL', 'https://matchstat.com/tennis/api2').rstrip('/')
     
 def get_player_birthday_country(player_name, scraper):
     """
@@ -14,7 +18,7 @@ def get_player_birthday_country(player_name, scraper):
         tuple: Fecha de nacimiento como timestamp y país del jugador.
     """
     player_name=player_name.replace(" ", "%20")
-    url_player = f"https://matchstat.com/tennis/api2/profile/{player_name}?includeAll=true"
+    url_player = f"{URL_MATCHSTAT}/profile/{player_name}?includeAll=true"
     try:
         response_player = scraper.get(url_player)
 
@@ -54,8 +58,10 @@ def obtener_ranking(ranking_inicial):
         fechas_inicial=ranking_inicial.columns[3:].tolist()
         fechas_inicial=[datetime.fromtimestamp(int(date)).strftime('%d.%m.%Y') for date in fechas_inicial]    
 
-    url_dates = "https://matchstat.com/tennis/api2/ranking/atp/filters?includeAll=true"
+    url_dates = f"{URL_MATCHSTAT}/ranking/atp/filters?includeAll=true"
 
+    # cloudscraper solo hace falta aquí; se importa al usarlo para no pagar su carga al importar el módulo
+    import cloudscraper
     scraper = cloudscraper.create_scraper()  # Crea un scraper que supera Cloudflare
     response = scraper.get(url_dates)
 
@@ -93,7 +99,7 @@ def obtener_ranking(ranking_inicial):
         print(f"Processing date: {date} de {len(fechas_calcular)}")
         timestamp = date_to_timestamp[date]
         for page in range (0, 10):
-            url_page = f"https://matchstat.com/tennis/api2/ranking/atp/?date={date}&countryAcr=&group=singles&page={page}&includeAll=true"
+            url_page = f"{URL_MATCHSTAT}/ranking/atp/?date={date}&countryAcr=&group=singles&page={page}&includeAll=true"
             response_page = scraper.get(url_page)
             if(response_page.status_code==200):
                 json_data_page=json.loads(response_page.text)
@@ -218,32 +224,32 @@ def preprocess_name(name):
 
     return processed_name
     
-if __name__ == "__main__":
+def main(ruta='../data/ranking', rank_inicial=False, fichero_salida='ranking.csv'):
     """
-    Función principal que ejecuta el programa de scraping de partidos de tenis.
-    Configura los parámetros globales, descarga los partidos nuevos si es necesario, y procesa los
-    partidos actuales y previos.
+    Descarga el ranking ATP semanal y lo guarda en la carpeta indicada.
+    Args:
+        ruta (str): Carpeta del ranking (la que lee 2.scrapper.py es <datos>/ranking).
+        rank_inicial (bool): Si es True, se parte de ruta/ranking.csv y solo se descargan las fechas que faltan.
+        fichero_salida (str): Nombre del fichero en el que se guarda el ranking dentro de ruta.
     """
-    ruta=f'C:/INDAT/tfg_estadistica_tenis/cambio_Scraper'
-    rank_inicial=False
-    
     if rank_inicial:
         ranking_inicial=f'{ruta}/ranking.csv'
         ranking_inicial=pd.read_csv(ranking_inicial)
     else:
         ranking_inicial=pd.DataFrame()
 
-        
-
     df_ranking, calculado =obtener_ranking(ranking_inicial)
     df_ranking = change_alpha3(df_ranking)
     df_ranking = change_problematic_rows(df_ranking)
 
-
     if calculado:
         print("Ranking actualizado")
-        df_ranking.to_csv("C:/INDAT/tfg_estadistica_tenis/cambio_Scraper/ranking2.csv", index=False)
+        os.makedirs(ruta, exist_ok=True)
+        df_ranking.to_csv(f'{ruta}/{fichero_salida}', index=False)
     else:
         print("Ranking ya estaba actualizado a fecha de hoy")
 
-    
+if __name__ == "__main__":
+    # Las rutas son relativas al directorio del script, como en 2.scrapper.py
+    os.chdir(os.path.dirname(os.path.abspath(__file__)))
+    main()
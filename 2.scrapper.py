@@ -1,70 +1,56 @@
 import pandas as pd
-import requests
 import json
 import re
-from rapidfuzz import process, fuzz
 import numpy as np
-from sklearn.linear_model import LinearRegression
 import sys
 import os
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+from tenis.esquema import guardar_tabla, leer_tabla
+from tenis.instrumentacion import log, log_activo, metricas
+from tenis.odds import TablaOdds, fraccion_a_decimal
+from tenis.peticiones import ClienteHTTP
 
 ranking=None
 players=None
+tabla_odds=None
 ruta=None
+# URL base de la API de Sofascore. Se puede cambiar con la variable de entorno SOFASCORE_URL, por ejemplo para
+# apuntar al servidor local de tenis/servidor_replay.py (http://localhost:8000/api/v1)
+URL_SOFASCORE=os.environ.get('SOFASCORE_URL', 'https://www.sofascore.com/api/v1').rstrip('/')
+# Días desde el último partido de una temporada a partir de los cuales se da por terminada y no se vuelve a consultar
+DIAS_TEMPORADA_CERRADA=30
+# Estados de Sofascore de los partidos que todavía no han terminado: en el modo incremental se vuelven a consultar
+ESTADOS_PENDIENTES=('notstarted', 'inprogress', 'interrupted', 'postponed')
+# Descargas de cuotas a la vez (en segundo plano mientras se procesan los partidos)
+HILOS_ODDS=4
+# Peticiones por segundo con las que se empieza; el cliente las ajusta según los 429 que devuelva la API
+cliente_http=ClienteHTTP(tasa_inicial=float(os.environ.get('SOFASCORE_TASA', 5)))
 
 def get_json_from_url(url, max_retries=5, timeout=30):
     """
-    Obtiene un JSON de una URL con manejo de errores y reintentos.
+    Obtiene un JSON de una URL con reintentos (espera exponencial con jitter y Retry-After), pausa del host
+    si la API bloquea (403) o falla repetidamente, y límite adaptativo de peticiones por segundo (ver
+    tenis/peticiones.py).
     Args:
         url (str): URL de la que obtener el JSON.
-        max_retries (int): Número máximo de reintentos en caso de error.
+        max_retries (int): Número máximo de reintentos en caso de error transitorio.
         timeout (int): Tiempo máximo de espera para la solicitud.
     Returns:
-        dict: JSON obtenido de la URL, o None si falla.
+        dict: JSON obtenido de la URL, o None si no existe (404) o se agotan los reintentos.
     """
-    retries = 0
-    
-    while retries < max_retries:
-        try:
-            # Realizar la solicitud
-            response = requests.get(url, timeout=timeout)
-            
-            # Verificar el código de estado
-            if response.status_code == 200:
-                return json.loads(response.text)
-            else:
-                if response.status_code == 404:
-                    print(f"Error 404: No se encontró la URL {url}.")
-                    break
-                elif response.status_code==403:
-                    print(f"Error 403: Acceso denegado a la URL.")
-                    sys.exit(1)
-
-                else:
-                    print(f"Error {response.status_code}: {response.reason}")
-
-        
-        except requests.exceptions.ConnectionError as e:
-            print(f"Error de conexión: {str(e)}")
-        except requests.exceptions.Timeout as e:
-            print(f"Timeout: {str(e)}")
-        except requests.exceptions.RequestException as e:
-            print(f"Error en la solicitud: {str(e)}")
-        except json.JSONDecodeError as e:
-            print(f"Error al decodificar JSON: {str(e)}")
-        except Exception as e:
-            print(f"Error inesperado: {str(e)}")
-        
-        retries += 1
-    return None
+    return cliente_http.obtener_json(url, max_retries, timeout)
 
 def instanciar_variables_globales(nuevo):
     """
     Inicializa las variables globales y carga los datos de los archivos CSV si existen.
     Args:
-        nuevo (bool): Si es True, se crea un nuevo DataFrame para players, si es False, se carga desde el archivo CSV.
+        nuevo (bool): Si es True, se crea un nuevo DataFrame para players y una tabla de cuotas vacía, si es False,
+            se cargan desde los archivos CSV.
     """
-    global players, ranking, ruta
+    global players, ranking, ruta, tabla_odds
+    tabla_odds = TablaOdds(descargar_odds, f'{ruta}/odds.csv', HILOS_ODDS, cargar=not nuevo)
     if not nuevo:
         archivo_players = f'{ruta}/players.csv'
         if os.path.exists(archivo_players):
@@ -79,7 +65,7 @@ def instanciar_variables_globales(nuevo):
         ranking = pd.read_csv(archivo_ranking)
         ranking['player'] = [preprocess_name(name) for name in ranking['player']]
     else:
-        print(f"El archivo {archivo_ranking} no existe. Asegúrate de que el archivo esté en la ruta correcta.")
+        log(f"El archivo {archivo_ranking} no existe. Asegúrate de que el archivo esté en la ruta correcta.", 'error')
         sys.exit(1)
         
 def safe_divide(numerator, denominator, precision=4):
@@ -121,25 +107,6 @@ def preprocess_name(name):
     # Reemplazar espacios por guiones
     return name.replace(' ', '-')
 
-def fraccion_a_decimal(fraccion):
-    """
-    Convierte una fracción o un número en formato de cadena a su valor decimal.
-    Args:
-        fraccion (str): Fracción en formato de cadena o número.
-    Returns:
-        float: Valor decimal de la fracción, o None si no se puede convertir.
-    """
-    if fraccion is None or pd.isna(fraccion) or fraccion == '':
-        return None
-    try:
-        if '/' in str(fraccion):
-            numerador, denominador = map(float, str(fraccion).split('/'))
-            return numerador / denominador
-        else:
-            return float(fraccion)
-    except (ValueError, ZeroDivisionError):
-        return None
-    
 def scraping_tournaments():
     """
     Scrapea los torneos de tenis de la API de SofaScore.
@@ -147,7 +114,7 @@ def scraping_tournaments():
         list: Lista de IDs de torneos válidos.
     """
     id_tournaments = []
-    url_tournaments= "https://www.sofascore.com/api/v1/category/3/unique-tournaments"
+    url_tournaments= f"{URL_SOFASCORE}/category/3/unique-tournaments"
    
     json_data_tournaments = get_json_from_url(url_tournaments)
     id_tournaments = []
@@ -165,13 +132,13 @@ def scraping_tournaments():
     id_tournaments = list(set(id_tournaments))
     return id_tournaments
 
-def scraping_seasons(id_tournaments, year):
-    """Scrapea las temporadas de los torneos de tenis para un año específico.
+def torneos_del_year(id_tournaments, year):
+    """Ajusta la lista de torneos de un año: quita los que no se juegan ese año y añade los que cambian de ID.
     Args:
         id_tournaments (list): Lista de IDs de torneos.
-        year (int): Año para el que se quieren las temporadas.
+        year (int): Año.
     Returns:
-        list: Lista de tuplas con el ID del torneo y el ID de la temporada.
+        list: Lista de IDs de torneos de ese año.
     """
     filtered_tournaments = id_tournaments.copy()
     if (year==2024):
@@ -211,44 +178,197 @@ def scraping_seasons(id_tournaments, year):
             filtered_tournaments.remove(2491) #munich
         if 2510 not in filtered_tournaments:
             filtered_tournaments.append(2510) #toronto
-    
+    return filtered_tournaments
+
+def seasons_torneo(id):
+    """Descarga las temporadas de un torneo.
+    Args:
+        id (int): ID del torneo.
+    Returns:
+        dict: Para cada año (str), lista de IDs de temporada.
+    """
+    url_seasons = f"{URL_SOFASCORE}/unique-tournament/{id}/seasons"
+    json_data_seasons = get_json_from_url(url_seasons)
+    por_year = {}
+    for season in (json_data_seasons or {}).get('seasons', []):
+        por_year.setdefault(str(int(season['year'])), []).append(season['id'])
+        log(season['name'], 'debug')
+    return por_year
+
+def scraping_seasons(id_tournaments, years, manifiesto=None, max_hilos=4):
+    """Scrapea las temporadas de los torneos de tenis para uno o varios años. Las temporadas de cada torneo se
+    descargan una sola vez para todos los años, y en paralelo entre torneos.
+    Args:
+        id_tournaments (list): Lista de IDs de torneos.
+        years (int or list): Año o años para los que se quieren las temporadas.
+        manifiesto (dict): Manifiesto de descubrimiento (ver cargar_manifiesto). Si se indica, las temporadas de
+            años anteriores al actual que ya estén en él no se vuelven a descargar, y se guardan las nuevas.
+        max_hilos (int): Número de torneos que se consultan a la vez.
+    Returns:
+        list: Lista de tuplas con el ID del torneo y el ID de la temporada, por año y torneo.
+    """
+    if isinstance(years, int):
+        years = [years]
+    torneos_por_year = {year: torneos_del_year(id_tournaments, year) for year in years}
+    conocidas = manifiesto.setdefault('temporadas', {}) if manifiesto is not None else {}
+    year_actual = datetime.now().year
+
+    # Solo se descargan los torneos a los que les falta algún año, o que tienen años que aún no han terminado
+    pendientes = []
+    for year, torneos in torneos_por_year.items():
+        for id in torneos:
+            if id not in pendientes and (year >= year_actual or str(year) not in conocidas.get(str(id), {})):
+                pendientes.append(id)
+    with ThreadPoolExecutor(max_workers=max_hilos) as executor:
+        for id, por_year in zip(pendientes, executor.map(seasons_torneo, pendientes)):
+            temporadas = conocidas.setdefault(str(id), {})
+            temporadas.update(por_year)
+            # Los años sin temporada también se guardan, para no volver a preguntar por ellos
+            for year in years:
+                if year < year_actual:
+                    temporadas.setdefault(str(year), [])
+
     id_tournaments_seasons = []
-    for id in filtered_tournaments:
-        url_seasons = f"https://www.sofascore.com/api/v1/unique-tournament/{id}/seasons"
-        json_data_seasons = get_json_from_url(url_seasons)
-        for season in json_data_seasons['seasons']:
-            if(int(season['year']) == year):
-                id_tournaments_seasons.append((id, season['id']))
-                print(season['name'])
- 
+    for year, torneos in torneos_por_year.items():
+        for id in torneos:
+            for id_season in conocidas.get(str(id), {}).get(str(year), []):
+                id_tournaments_seasons.append((id, id_season))
     return id_tournaments_seasons
 
-def scraping_id_matches(id_tournaments_seasons):
-    """Scrapea los IDs de los partidos de tenis de los torneos y temporadas especificados.
+def eventos_temporada(tournament, season, conocidos=(), max_paginas=50):
+    """Descarga los eventos de una temporada siguiendo hasNextPage desde la página 0 (la más reciente). Si se
+    indican eventos ya conocidos, se para en la primera página que contenga alguno.
+    Args:
+        tournament (int): ID del torneo.
+        season (int): ID de la temporada.
+        conocidos (set): IDs de eventos ya descargados.
+        max_paginas (int): Número máximo de páginas a descargar.
+    Returns:
+        list: Eventos nuevos, del más antiguo al más reciente.
+    """
+    paginas = []
+    for pagina in range(max_paginas):
+        url_tournament_season=f"{URL_SOFASCORE}/unique-tournament/{tournament}/season/{season}/events/last/{pagina}"
+        json_data_tournament_season = get_json_from_url(url_tournament_season)
+        if json_data_tournament_season is None:
+            break
+        eventos = json_data_tournament_season.get('events', [])
+        nuevos = [evento for evento in eventos if evento['id'] not in conocidos]
+        paginas.append(nuevos)
+        if len(nuevos) < len(eventos) or not json_data_tournament_season.get('hasNextPage', len(eventos) > 0):
+            break
+    # Cada página va del más antiguo al más reciente, y las páginas del más reciente al más antiguo
+    return [evento for eventos in reversed(paginas) for evento in eventos]
+
+@metricas.medir()
+def scraping_id_matches(id_tournaments_seasons, manifiesto=None, max_hilos=4):
+    """Scrapea los IDs de los partidos de tenis de los torneos y temporadas especificados, en paralelo entre temporadas.
     Args:
         id_tournaments_seasons (list): Lista de tuplas con el ID del torneo y el ID de la temporada.
+        manifiesto (dict): Manifiesto de descubrimiento (ver cargar_manifiesto). Si se indica, de las temporadas ya
+            vistas solo se descargan las páginas con eventos nuevos, y las cerradas no se consultan.
+        max_hilos (int): Número de temporadas que se consultan a la vez.
     Returns:
-        list: Lista de IDs de partidos.
+        list: Lista de IDs de partidos, por temporada y del más antiguo al más reciente.
     """
+    vistas = manifiesto.setdefault('eventos', {}) if manifiesto is not None else {}
+    ahora = datetime.now().timestamp()
+
+    def descubrir(torneo_season):
+        tournament, season = torneo_season
+        clave = f'{tournament}/{season}'
+        entrada = vistas.get(clave, {'ids': [], 'timestamps': [], 'ultimo_timestamp': None})
+        if entrada.get('cerrada'):
+            return clave, entrada
+        log(f'{tournament} {season}', 'debug')
+        nuevos = eventos_temporada(tournament, season, set(entrada['ids']))
+        ids = entrada['ids'] + [evento['id'] for evento in nuevos]
+        timestamps_ids = entrada.get('timestamps', [None] * len(entrada['ids'])) + [evento.get('startTimestamp') for evento in nuevos]
+        timestamps = [evento['startTimestamp'] for evento in nuevos if 'startTimestamp' in evento]
+        if entrada['ultimo_timestamp'] is not None:
+            timestamps.append(entrada['ultimo_timestamp'])
+        ultimo = max(timestamps) if timestamps else None
+        # Una temporada se da por cerrada cuando su último partido es de hace más de DIAS_TEMPORADA_CERRADA días
+        cerrada = ultimo is not None and ahora - ultimo > DIAS_TEMPORADA_CERRADA * 86400
+        return clave, {'ids': ids, 'timestamps': timestamps_ids, 'ultimo_timestamp': ultimo, 'cerrada': cerrada}
+
     id_partidos = []
-    for tournament,season in id_tournaments_seasons:
-        print(tournament, season)
-        for i in range (10, -1, -1):
-            url_tournament_season=f"https://www.sofascore.com/api/v1/unique-tournament/{tournament}/season/{season}/events/last/"+str(i)
-            json_data_tournament_season = get_json_from_url(url_tournament_season)
-            if json_data_tournament_season is None:
-                continue
-            else:
-                for j in range (len(json_data_tournament_season['events'])):
-                    id_partidos.append(json_data_tournament_season['events'][j]['id'])
+    with ThreadPoolExecutor(max_workers=max_hilos) as executor:
+        for clave, entrada in executor.map(descubrir, id_tournaments_seasons):
+            vistas[clave] = entrada
+            id_partidos.extend(entrada['ids'])
     
     return id_partidos
 
+def eventos_posteriores(id_partidos, manifiesto, desde_timestamp, descargados=()):
+    """Filtra los IDs de partidos que quedan por descargar: los que empiezan después de una fecha, según los
+    timestamps del manifiesto, y los pendientes (sin terminar en una ejecución anterior), quitando los ya descargados.
+    Args:
+        id_partidos (list): Lista de IDs de partidos (ver scraping_id_matches).
+        manifiesto (dict): Manifiesto de descubrimiento con los eventos de cada temporada y los pendientes.
+        desde_timestamp (int): Marca de tiempo; None para quedarse con todos.
+        descargados (iterable): IDs de los partidos que ya están en actual.
+    Returns:
+        list: IDs de los partidos posteriores a desde_timestamp (o sin fecha conocida) o pendientes que no se han
+            descargado todavía, en el mismo orden.
+    """
+    descargados = set(descargados)
+    pendientes = set(manifiesto.get('pendientes', []))
+    timestamps = {}
+    for entrada in manifiesto.get('eventos', {}).values():
+        timestamps.update(zip(entrada['ids'], entrada.get('timestamps', [])))
+    return [id for id in id_partidos if id not in descargados and
+            (desde_timestamp is None or id in pendientes or timestamps.get(id) is None or timestamps[id] > desde_timestamp)]
+
+def partido_pendiente(json_data):
+    """Indica si un partido descartado puede entrar más adelante porque aún no ha terminado (no empezado, en juego,
+    interrumpido o aplazado).
+    Args:
+        json_data (dict): JSON del partido.
+    Returns:
+        bool: True si el partido no ha terminado todavía.
+    """
+    return bool(json_data) and json_data.get('status', {}).get('type') in ESTADOS_PENDIENTES
+
+def cargar_manifiesto(ruta_manifiesto):
+    """Carga el manifiesto de descubrimiento: temporadas de cada torneo y eventos de cada temporada ya descargados.
+    Args:
+        ruta_manifiesto (str): Ruta del fichero JSON.
+    Returns:
+        dict: Manifiesto, vacío si el fichero no existe.
+    """
+    if not os.path.exists(ruta_manifiesto):
+        return {}
+    with open(ruta_manifiesto, encoding='utf-8') as f:
+        return json.load(f)
+
+def guardar_manifiesto(manifiesto, ruta_manifiesto):
+    """Guarda el manifiesto de descubrimiento (en un temporal que se renombra, para no dejarlo a medias).
+    Args:
+        manifiesto (dict): Manifiesto.
+        ruta_manifiesto (str): Ruta del fichero JSON.
+    """
+    temporal = ruta_manifiesto + '.tmp'
+    with open(temporal, 'w', encoding='utf-8') as f:
+        json.dump(manifiesto, f)
+    os.replace(temporal, ruta_manifiesto)
+
+def obtener_evento(id_partido):
+    """
+    Args:
+        id_partido (int): ID del partido.
+    Returns:
+        dict: JSON del partido (el 'event' de /event/{id}), o None si no se puede obtener.
+    """
+    json_data = get_json_from_url(f"{URL_SOFASCORE}/event/{int(id_partido)}")
+    return None if json_data is None else json_data.get('event')
+
+@metricas.medir()
 def scraping_partido(id_partido, actual):
     """
     Scrapea los datos de un partido de tenis específico.
     Args:
-        id_partido (int or dict): ID del partido o un diccionario con los datos del partido.
+        id_partido (int or dict): ID del partido o un diccionario con los datos del partido (el JSON del evento).
         actual (bool): Si es True, se obtienen las probabilidades actuales, si es False, se obtienen los resultados previos.
     Returns:
         pd.DataFrame: DataFrame con los datos del partido.
@@ -301,10 +421,9 @@ def scraping_partido(id_partido, actual):
     
 
     #Identificadores de partido
-    if(actual):
+    if not isinstance(id_partido, dict):
+        json_data = obtener_evento(id_partido)
         df.loc[0,'idEvent']=int(id_partido)
-        url_match="https://www.sofascore.com/api/v1/event/"+str(int(df.loc[0,'idEvent']))
-        json_data = get_json_from_url(url_match)['event']
     else:
         json_data = id_partido
         df.loc[0,'idEvent']=int(json_data['id'])
@@ -354,7 +473,7 @@ def scraping_partido(id_partido, actual):
     
     tour=df.loc[0, 'tournamentName']
     if tour is not None:
-        if any(substring in df.loc[0,'tournamentName'] for substring in ['Exhibition','Davis','Doubles','Double']):
+        if any(substring in df.loc[0,'tournamentName'] for substring in TORNEOS_EXCLUIDOS):
             #print('Torneo no válido: ', df.loc[0,'tournamentName'])
             df.loc[0,'idHome']=None
             df.loc[0,'idAway']=None
@@ -447,48 +566,29 @@ def scraping_partido(id_partido, actual):
             ] if val != -1)
     return df
 
+def descargar_odds(id_match):
+    """
+    Args:
+        id_match (int): ID del partido.
+    Returns:
+        dict: JSON de las cuotas destacadas del partido, o None si no tiene.
+    """
+    return get_json_from_url(f'{URL_SOFASCORE}/event/{id_match}/odds/1/featured')
+
+@metricas.medir()
 def extraer_odds(id_match):
     """
-    Extrae las probabilidades de victoria de un partido de tenis a partir de su ID.
+    Extrae las probabilidades de victoria de un partido de tenis a partir de su ID. Las cuotas se leen de la
+    tabla local (ver tenis/odds.py), que las descarga en segundo plano desde que se conocen los partidos; solo
+    se espera si la de este partido aún no ha llegado.
     Args:
         id_match (int): ID del partido.
     Returns:
         tuple: Probabilidades de victoria del jugador local y visitante, o (None, None) si no se pueden obtener.
     """
-    url_odds = f'https://www.sofascore.com/api/v1/event/{id_match}/odds/1/featured'
-    json_data_odds = get_json_from_url(url_odds)
-    if json_data_odds is None:
-        print("No se pudieron obtener datos de odds")
-        return (None, None)
-    else:
-        try:
-            json_data_odds_featured = json_data_odds['featured']['default']['choices']
-            initialFractionalValueHome = json_data_odds_featured[0]['initialFractionalValue']
-            initialFractionalValueAway = json_data_odds_featured[1]['initialFractionalValue']
-            
-            # Convertir valores fraccionales a decimales
-            initialDecimalValueHome = fraccion_a_decimal(initialFractionalValueHome)
-            initialDecimalValueAway = fraccion_a_decimal(initialFractionalValueAway)
-            
-            # Verificar que los valores decimales no sean None antes de calcular
-            if initialDecimalValueHome is not None and initialDecimalValueAway is not None:
-                # Las cuotas decimales incluyen la devolución de la apuesta
-                initialOddsHome = initialDecimalValueHome + 1
-                initialOddsAway = initialDecimalValueAway + 1
-                
-                # Calcular probabilidades implícitas
-                probabilityHome = 1 / initialOddsHome if initialOddsHome != 0 else None
-                probabilityAway = 1 / initialOddsAway if initialOddsAway != 0 else None
-                
-                return (probabilityHome, probabilityAway)
-            else:
-                print(f"No se pudieron convertir los valores fraccionales: Home={initialFractionalValueHome}, Away={initialFractionalValueAway}")
-                return (None, None)
-        
-        except (KeyError, IndexError) as e:
-            print(f"Error al extraer odds: {e}")
-            return (None, None)
+    return tabla_odds.probabilidades(id_match)
         
+@metricas.medir()
 def get_player(id, startTimeStamp):
     """
     Obtiene los datos de un jugador de tenis a partir de su ID y la fecha de inicio del partido.
@@ -504,6 +604,7 @@ def get_player(id, startTimeStamp):
     ])
     df_return.loc[0,'id']=id
     player = players.loc[players['id'] == id]
+    metricas.registrar_cache('players', not player.empty)
     
     if player.empty:
         player = scraping_individual_player(id)
@@ -555,8 +656,9 @@ def get_player(id, startTimeStamp):
 
                         if(closest_matches.empty):
                             matched_player=None
-                            print(f"No hay un match válido para {name_player_preprocessed} porque no hay coincidencia de cumpleaños (no existe, ej jugador joven).")
+                            log(f"No hay un match válido para {name_player_preprocessed} porque no hay coincidencia de cumpleaños (no existe, ej jugador joven).", 'debug')
                         else:
+                            from rapidfuzz import process, fuzz
                             best_match, score , _= process.extractOne(
                                 name_player_preprocessed, closest_matches['player'].values, scorer=fuzz.token_sort_ratio
                             )
@@ -564,14 +666,14 @@ def get_player(id, startTimeStamp):
                             if score>= 45:
                                 matched_player=best_match
                                 ranking.loc[ranking['player'] == matched_player, 'player'] = name_player_preprocessed
-                                print("matched", matched_player, "player", name_player_preprocessed, "score", score)
+                                log(f"matched {matched_player} player {name_player_preprocessed} score {score}", 'debug')
                                 
                                 with open(f'{ruta}/matches.txt', 'a' , encoding='utf-8') as archivo:
                                     archivo.write(f'matched {matched_player} player {name_player_preprocessed} score {score} \n')  
                                     
                             else:
                                 matched_player=None
-                                print(f"No hay un match válido para {name_player_preprocessed} con score {score}. El mejor match ({best_match}) fue descartado.")
+                                log(f"No hay un match válido para {name_player_preprocessed} con score {score}. El mejor match ({best_match}) fue descartado.", 'debug')
                         
                         
 
@@ -627,7 +729,7 @@ def scraping_individual_player(id):
     Returns:
         pd.DataFrame: DataFrame con los datos del jugador, incluyendo ID, fecha de nacimiento, altura, peso, mano dominante, país y ranking.
     """
-    urlJugador="https://www.sofascore.com/api/v1/team/"+str(id)
+    urlJugador=f"{URL_SOFASCORE}/team/"+str(id)
     json_data2= get_json_from_url(urlJugador)
     df_player=pd.DataFrame(columns=[
             'id','birthDate', 'height', 'weight', 'rightHanded', 'fullName', 'country'
@@ -669,6 +771,7 @@ def scraping_individual_player(id):
     
     return df_player
 
+@metricas.medir()
 def get_last_matches(id_player, id_event,num_previos):
     """
     Obtiene los últimos partidos de un jugador de tenis a partir de su ID y el ID del partido actual.
@@ -685,8 +788,8 @@ def get_last_matches(id_player, id_event,num_previos):
     page=0
     while(df_return.shape[0]<num_previos):
         try:
-            url_last_matches_player=f"https://www.sofascore.com/api/v1/team/{id_player}/events/last/{page}"
-            print(url_last_matches_player)
+            url_last_matches_player=f"{URL_SOFASCORE}/team/{id_player}/events/last/{page}"
+            log(url_last_matches_player, 'debug')
             json_data_last_player = get_json_from_url(url_last_matches_player)['events']
             events=list(reversed(json_data_last_player))
             for j,event in enumerate(events):
@@ -700,6 +803,11 @@ def get_last_matches(id_player, id_event,num_previos):
                     continue
 
                 if(found_current_match):
+                    # Lo que se puede decidir con el JSON se filtra antes de buscar el partido anterior y
+                    # de pedir los datos de los jugadores
+                    if filtrar_json_partido(event, False):
+                        continue
+
                     last_match_timestamp = None
                     # Verificar si hay un partido anterior en esta página
 
@@ -710,7 +818,7 @@ def get_last_matches(id_player, id_event,num_previos):
                     # Si no hay partido anterior en esta página, buscar en la página siguiente
                     if last_match_timestamp is None:
                         try:
-                            next_page_url = f"https://www.sofascore.com/api/v1/team/{id_player}/events/last/{page+1}"
+                            next_page_url = f"{URL_SOFASCORE}/team/{id_player}/events/last/{page+1}"
                             next_page_data = get_json_from_url(next_page_url)['events']    
                             if len(next_page_data) > 0:
                                 # El último evento de la página anterior
@@ -735,14 +843,71 @@ def get_last_matches(id_player, id_event,num_previos):
             page+=1
 
         except (Exception, KeyError) as e:
-            print(f"Error al obtener página {page} de partidos:")
+            log(f"Error al obtener página {page} de partidos: {e}", 'aviso')
             break
 
     return df_return
     
+# Torneos que no se seleccionan: exhibiciones, copa Davis y dobles
+TORNEOS_EXCLUIDOS=['Exhibition','Davis','Doubles','Double']
+
+def _descartar(regla, actual, fase):
+    """Cuenta el partido descartado por la regla (ver metricas.registrar_filtro) y devuelve True."""
+    metricas.registrar_filtro(regla, 'actual' if actual else 'previo', fase)
+    return True
+
+def filtrar_json_partido(json_data, actual):
+    """
+    Filtra un partido con las condiciones que se pueden comprobar en su JSON, antes de pedir los datos de los
+    jugadores (get_player) y las cuotas: así los partidos que se van a descartar no cuestan peticiones.
+    Args:
+        json_data (dict): JSON del partido (el 'event' de /event/{id} o un evento de /team/{id}/events/last).
+        actual (bool): Si es True, se filtran partidos actuales, si es False, se filtran partidos previos.
+    Returns:
+        bool: True si el partido no cumple las condiciones de selección, False si sí las cumple
+    """
+    if not json_data:
+        return _descartar('sin_datos', actual, 'json')
+    if json_data.get('homeTeam', {}).get('id') is None or json_data.get('awayTeam', {}).get('id') is None:
+        return _descartar('sin_jugadores', actual, 'json')
+    nombre_torneo = json_data.get('tournament', {}).get('uniqueTournament', {}).get('name')
+    if nombre_torneo is None or pd.isna(nombre_torneo):
+        return _descartar('sin_torneo', actual, 'json')
+
+    #nombres de los torneos, elimino exhibiciones, copa davis y dobles
+    if any(substring in nombre_torneo for substring in TORNEOS_EXCLUIDOS):
+        return _descartar('torneo_no_valido', actual, 'json')
+
+    #si no hay tipo de suelo, no se selecciona
+    if json_data.get('groundType') is None or pd.isna(json_data.get('groundType')):
+        return _descartar('sin_superficie', actual, 'json')
+
+    #si no hay ganador, no se selecciona
+    if json_data.get('winnerCode') is None or pd.isna(json_data.get('winnerCode')):
+        return _descartar('sin_ganador', actual, 'json')
+
+    #si el partido está cancelado o retirada antes de jugar, no se selecciona o si está descalificado o pospuesto, SOLO PARTIDOS TERMINADOS
+    if json_data.get('status', {}).get('code') != 100:
+        return _descartar('no_terminado', actual, 'json')
+
+    if not(actual):
+        #si no hay resultado de cada jugador, no se selecciona
+        home_score = json_data.get('homeScore', {}).get('current')
+        away_score = json_data.get('awayScore', {}).get('current')
+        if home_score is None or away_score is None or pd.isna(home_score) or pd.isna(away_score):
+            return _descartar('sin_resultado', actual, 'json')
+        #si el resultado es 0-0 no se selecciona
+        if home_score == 0 and away_score == 0:
+            return _descartar('resultado_0_0', actual, 'json')
+
+    metricas.registrar_filtro('aceptado', 'actual' if actual else 'previo', 'json')
+    return False
+
 def filtrar_partido(df_partido, actual):
     """
-    Filtra un partido de tenis según una serie de condiciones para determinar si debe ser seleccionado.
+    Filtra un partido de tenis según las condiciones que dependen de los datos de los jugadores. Las que se
+    pueden comprobar en el JSON del partido (torneo, superficie, ganador, estado, resultado) se comprueban
+    antes con filtrar_json_partido.
     Args:
         df_partido (pd.DataFrame): DataFrame con los datos del partido.
         actual (bool): Si es True, se filtran partidos actuales, si es False, se filtran partidos previos.
@@ -751,74 +916,79 @@ def filtrar_partido(df_partido, actual):
     """
     #si el partido está vacío, no se selecciona (no debería pasar)
     if df_partido.empty:
-        #print('Partido vacío')
-        return True
+        return _descartar('vacio', actual, 'enriquecido')
     if df_partido.loc[0,'idHome'] is None or df_partido.loc[0,'idAway'] is None:
-        #print('Partido sin jugadores')
-        return True
-    if pd.isna(df_partido.loc[0,'tournamentName']):
-        #print('Torneo vacío')
-        return True
-    
-    #nombres de los torneos, elimino exhibiciones, copa davis y dobles
-    if any(substring in df_partido.loc[0,'tournamentName'] for substring in ['Exhibition','Davis','Doubles','Double']):
-        #print(f"Torneo no válido: {df_partido_actual.loc[0,'tournamentName']}")
-        return True
-    
-    #si no hay tipo de suelo, no se selecciona
-    if pd.isna(df_partido.loc[0,'groundType']):
-        #print('Tipo de suelo vacío')
-        return True
-    
-    #si no hay ganador, no se selecciona
-    if pd.isna(df_partido.loc[0,'winnerCode']):
-        #print('Ganador vacío')
-        return True
+        return _descartar('sin_jugadores', actual, 'enriquecido')
 
-    #si el partido está cancelado o retirada antes de jugar, no se selecciona o si está descalificado o pospuesto, SOLO PARTIDOS TERMINADOS
-    #if df_partido.loc[0,'status'] in [92, 70,91,97,98, 60]:
-    if df_partido.loc[0,'status'] != 100:
-        #print('Partido cancelado o retirada antes de jugar')
-        return True
-    
-    #print(df_partido_actual.columns)
     #si no tengo altura y peso, no selecciono (una de las dos sí porque puedo imputar por regresion)
-    #print(df_partido_actual.loc[0,'WeightHome'],df_partido_actual.loc[0,'HeightHome'])
     if pd.isna(df_partido.loc[0,'WeightHome']) and pd.isna(df_partido.loc[0, 'HeightHome']):
-        #print('home vacío')
-        return True
+        return _descartar('sin_altura_peso', actual, 'enriquecido')
     if pd.isna(df_partido.loc[0,'WeightAway']) and pd.isna(df_partido.loc[0, 'HeightAway']):
-        #print('away vacío')
-        return True
+        return _descartar('sin_altura_peso', actual, 'enriquecido')
     
     #si no tengo datos del jugador (todo incompleto excepto el id), no selecciono,
     # se toma de referencia el cumpleaños
-    #print(df_partido_actual.loc[0,'birthDateHome'],df_partido_actual.loc[0,'birthDateAway'])
     if pd.isna(df_partido.loc[0,'birthDateHome']) or pd.isna(df_partido.loc[0,'birthDateAway']):
-        #print('Datos del jugador vacíos')
-        return True
+        return _descartar('sin_nacimiento', actual, 'enriquecido')
 
     #Si el partido que hay que filtrar es un actual, no puede ser -100 ningun ranking
     if (actual):
         if df_partido.loc[0,'ActualRankingHome'] == -100 and df_partido.loc[0,'BestRankingHome'] == -100:
-            #print('Ranking actual vacío')
-            return True
+            return _descartar('sin_ranking', actual, 'enriquecido')
         if df_partido.loc[0,'ActualRankingAway'] == -100 and df_partido.loc[0,'BestRankingAway'] == -100:
-            #print('Ranking actual vacío')
-            return True
-    
-    if not(actual):
-        #si no hay resultado de cada jugador, no se selecciona
-        if pd.isna(df_partido.loc[0,'homeScore']) or pd.isna(df_partido.loc[0,'awayScore']):
-            #print('Resultado vacío')
-            return True
-        #si el resultado es 0-0 no se selecciona
-        if (df_partido.loc[0,'homeScore']==0) and (df_partido.loc[0,'awayScore']==0):
-            #print('Resultado 0-0')
-            return True
+            return _descartar('sin_ranking', actual, 'enriquecido')
     
+    metricas.registrar_filtro('aceptado', 'actual' if actual else 'previo', 'enriquecido')
     return False
 
+def resumen_filtros():
+    """
+    Muestra cuántos partidos ha descartado cada regla. Los descartados con el JSON se ahorran las dos llamadas
+    a get_player (y la espera de las cuotas en los actuales); el ahorro se estima con su tiempo medio.
+    """
+    datos = metricas.instantanea()
+    etapa_jugador = datos['etapas'].get('get_player', {'llamadas': 0, 'segundos': 0.0})
+    media_jugador = etapa_jugador['segundos'] / etapa_jugador['llamadas'] if etapa_jugador['llamadas'] else 0.0
+    for partido, fases in datos['filtros'].items():
+        for fase, reglas in fases.items():
+            for regla, n in sorted(reglas.items(), key=lambda item: -item[1]):
+                if regla == 'aceptado':
+                    continue
+                ahorro = f", ~{2 * n * media_jugador:.1f} s de get_player ahorrados" if fase == 'json' else ''
+                log(f"Filtro {partido} ({fase}) {regla}: {n} partidos{ahorro}")
+
+def rellenar_previos(df_previos, num_previos):
+    """
+    Completa con filas de relleno los partidos previos de un jugador que tiene menos de num_previos, para que
+    todos los bloques de previos tengan el mismo tamaño. Las filas de relleno van al final del bloque (después
+    del partido más antiguo), están vacías y tienen relleno=1.
+    Args:
+        df_previos (pd.DataFrame): DataFrame con los partidos previos del jugador.
+        num_previos (int): Tamaño del bloque.
+    Returns:
+        pd.DataFrame: DataFrame con num_previos filas.
+    """
+    df_previos = df_previos.copy()
+    df_previos['relleno'] = 0
+    faltan = num_previos - df_previos.shape[0]
+    if faltan <= 0:
+        return df_previos
+    relleno = pd.DataFrame(np.nan, index=range(faltan), columns=df_previos.columns)
+    relleno['relleno'] = 1
+    return pd.concat([df_previos, relleno], ignore_index=True)
+
+def es_relleno(df):
+    """
+    Indica qué filas de un DataFrame de previos son de relleno.
+    Args:
+        df (pd.DataFrame): DataFrame con los partidos previos.
+    Returns:
+        pd.Series: Serie booleana, True en las filas de relleno. Todo False si el DataFrame no tiene columna relleno.
+    """
+    if 'relleno' not in df.columns:
+        return pd.Series(False, index=df.index)
+    return pd.to_numeric(df['relleno'], errors='coerce').fillna(0).astype(bool)
+
 def impute_player_data(previos):
     """
     Imputa los datos de altura y peso de los jugadores en el DataFrame previos. Utiliza regresión lineal para predecir los valores faltantes basándose en los
@@ -828,8 +998,15 @@ def impute_player_data(previos):
     Returns:
         pd.DataFrame: DataFrame con los datos imputados.
     """
+    # Las filas de relleno no son partidos: se imputan solo las filas reales y el relleno se deja vacío
+    relleno = es_relleno(previos)
+    if relleno.any():
+        result = previos.copy()
+        result.loc[~relleno] = impute_player_data(previos.loc[~relleno])
+        return result
+
     # Crear una copia del DataFrame completo
-    print('Imputando datos')
+    log('Imputando datos')
     result = previos.copy()
     
     # Identificar filas con NA en altura y peso
@@ -854,6 +1031,8 @@ def impute_player_data(previos):
     # Jugadores locales con ambos valores NaN
 
     if mask_complete.any():
+        # sklearn tarda en importarse y solo hace falta aquí, así que no se importa al cargar el scraper
+        from sklearn.linear_model import LinearRegression
         reg = LinearRegression()
         
         # Si hay alturas que faltan, predecir con peso
@@ -910,7 +1089,8 @@ def reorganizar_partidos(actual,previos,num_previos=50):
         id_home_actual=partido_actual['idHome']
         id_away_actual=partido_actual['idAway']
         
-        print(f"Procesando partido actual {idx}, Home ID: {id_home_actual}, Away ID: {id_away_actual}")
+        if log_activo('debug'):
+            log(f"Procesando partido actual {idx}, Home ID: {id_home_actual}, Away ID: {id_away_actual}", 'debug')
 
         inicio_home= idx*num_previos*2
         fin_home=inicio_home+num_previos-1
@@ -921,13 +1101,13 @@ def reorganizar_partidos(actual,previos,num_previos=50):
             if(previos.loc[i,'idAway'] == id_home_actual):
                 df_previos_reorganizado.loc[i] = intercambiar_home_away(previos.loc[i])
                 if i < len(previos) and df_previos_reorganizado.loc[i, 'idHome'] != id_home_actual:
-                    print(f"Error: En el índice {i}, después de la reorganización idHome = {df_previos_reorganizado.loc[i, 'idHome']}, esperado {id_home_actual}")
+                    log(f"Error: En el índice {i}, después de la reorganización idHome = {df_previos_reorganizado.loc[i, 'idHome']}, esperado {id_home_actual}", 'error')
 
         for i in range(inicio_away,fin_away+1):
             if(previos.loc[i,'idHome'] == id_away_actual):
                 df_previos_reorganizado.loc[i] = intercambiar_home_away(previos.loc[i])
                 if i < len(previos) and df_previos_reorganizado.loc[i, 'idAway'] != id_away_actual:
-                    print(f"Error: En el índice {i}, después de la reorganización idAway = {df_previos_reorganizado.loc[i, 'idAway']}, esperado {id_away_actual}")
+                    log(f"Error: En el índice {i}, después de la reorganización idAway = {df_previos_reorganizado.loc[i, 'idAway']}, esperado {id_away_actual}", 'error')
 
     return df_previos_reorganizado
 
@@ -972,7 +1152,8 @@ def intercambiar_home_away(partido):
     return partido_reorganizado
 
 def invertir_bloques(df, tamano_bloque=50):
-    """    Invierte los bloques de un DataFrame en bloques de tamaño fijo.
+    """    Invierte los bloques de un DataFrame en bloques de tamaño fijo. Las filas de relleno se quedan al final
+    del bloque, de forma que los partidos reales quedan al principio, del más antiguo al más reciente.
     Args:
         df (pd.DataFrame): DataFrame a invertir.
         tamano_bloque (int): Tamaño de los bloques a invertir.
@@ -985,17 +1166,20 @@ def invertir_bloques(df, tamano_bloque=50):
     # Calculamos el número de bloques completos
     num_filas = len(df)
     num_bloques = num_filas // tamano_bloque
+    relleno = es_relleno(df).values
     
     # Procesamos cada bloque
     for i in range(0, num_bloques):
-        print(f"Procesando bloque {i} de {num_bloques}")
+        if log_activo('debug'):
+            log(f"Procesando bloque {i} de {num_bloques}", 'debug')
         # Índices de inicio y fin del bloque actual
         inicio = i * tamano_bloque
         fin = inicio + tamano_bloque
         
-        # Extraemos el bloque y lo invertimos
+        # Extraemos el bloque y lo invertimos, dejando el relleno al final
         bloque = df.iloc[inicio:fin].copy()
-        bloque_invertido = bloque.iloc[::-1].reset_index(drop=True)
+        relleno_bloque = relleno[inicio:fin]
+        bloque_invertido = pd.concat([bloque[~relleno_bloque].iloc[::-1], bloque[relleno_bloque]]).reset_index(drop=True)
         
         # Añadimos el bloque invertido al nuevo DataFrame
         df_invertido = pd.concat([df_invertido, bloque_invertido], ignore_index=True)
@@ -1025,7 +1209,8 @@ def ordenar_por_timestamp(actual, previos, num_previos=50):
     
     # Para cada fila en actual_ordenado, reorganizar los bloques correspondientes de previos
     for i, row in actual_copy.iterrows():
-        print(f'Ordenando fila {i} de {actual_copy.shape[0]}')
+        if log_activo('debug'):
+            log(f'Ordenando fila {i} de {actual_copy.shape[0]}', 'debug')
         original_idx = int(row['original_index'])  # Convertir a entero
         
         # Calcular los índices de los bloques en previos
@@ -1034,7 +1219,7 @@ def ordenar_por_timestamp(actual, previos, num_previos=50):
         
         # Verificar límites
         if inicio_bloque >= len(previos_copy) or fin_bloque > len(previos_copy):
-            print(f"Advertencia: Índice fuera de rango. Original_idx: {original_idx}, Inicio: {inicio_bloque}, Fin: {fin_bloque}, Len previos: {len(previos_copy)}")
+            log(f"Advertencia: Índice fuera de rango. Original_idx: {original_idx}, Inicio: {inicio_bloque}, Fin: {fin_bloque}, Len previos: {len(previos_copy)}", 'aviso')
             continue
         
         # Obtener el bloque correspondiente de previos
@@ -1062,7 +1247,7 @@ def limpieza_final(df, actual):
     Returns:
         pd.DataFrame: DataFrame limpio y formateado.
     """
-    print('limpiando datos finales')
+    log('limpiando datos finales')
     df['idTournament']= df['idTournament'].fillna(0).astype(int)
     df['idSeason']= df['idSeason'].fillna(0).astype(int)
     df['idEvent']= df['idEvent'].fillna(0).astype(int)
@@ -1088,119 +1273,137 @@ def limpieza_final(df, actual):
 
     df['year']= df['year'].fillna(0).astype(int)
 
-    df['birthDateHome'] = df['birthDateHome'].astype(int)
-    df['birthDateAway'] = df['birthDateAway'].astype(int)
-    df['ActualRankingHome']= df['ActualRankingHome'].astype(int)
-    df['ActualRankingAway']= df['ActualRankingAway'].astype(int)
-    df['BestRankingHome']= df['BestRankingHome'].astype(int)
-    df['BestRankingAway']= df['BestRankingAway'].astype(int)
+    # Las filas de relleno no tienen datos: con Int64 se quedan vacías en lugar de fallar al convertir
+    relleno = es_relleno(df)
+    tipo_entero = 'Int64' if relleno.any() else int
+    df['birthDateHome'] = df['birthDateHome'].astype(tipo_entero)
+    df['birthDateAway'] = df['birthDateAway'].astype(tipo_entero)
+    df['ActualRankingHome']= df['ActualRankingHome'].astype(tipo_entero)
+    df['ActualRankingAway']= df['ActualRankingAway'].astype(tipo_entero)
+    df['BestRankingHome']= df['BestRankingHome'].astype(tipo_entero)
+    df['BestRankingAway']= df['BestRankingAway'].astype(tipo_entero)
+    if not actual:
+        df['relleno'] = relleno.astype(int)
 
     df = df.replace({'groundType': {'Clay':'Red clay', 'Red clay indoor':'Red clay', 'Carpet indoor':'Hardcourt indoor'}})
 
 
     return df
 
-def main():  
+def postprocesar(actual, previos, num_previos=50):
     """
-    Función principal que ejecuta el programa de scraping de partidos de tenis.
-    Configura los parámetros globales, descarga los partidos nuevos si es necesario, y procesa los
-    partidos actuales y previos.
+    Aplica el postprocesado completo a los partidos descargados: imputación, reorganización home/away,
+    inversión de los bloques, orden por fecha y limpieza final.
+    Args:
+        actual (pd.DataFrame): Partidos actuales tal como se descargan.
+        previos (pd.DataFrame): Partidos previos tal como se descargan (2*num_previos filas por partido actual).
+        num_previos (int): Tamaño de cada bloque de previos.
+    Returns:
+        tuple: DataFrames finales de partidos actuales y previos.
     """
-    global ruta, players, ranking
-    #### PARAMETROS QUE RIGEN EL PROGRAMA ####
-
-    ##Se necesita el archivo de ranking, en la carpeta ruta/ranking, si no, ejecutar el otro programa antes
-
-
-    # ruta: directorio donde se guardan los datos
-    # partidos_nuevo: si es true, se descargan los partidos nuevos,el id, sino se cargan de csv
-    # nuevo: Si es true, se descargan el acutal, el previos y el ranking nuevo, sino se cargan de csv, por si son parciales
-    # num_previos: número de partidos previos a obtener para cada jugador
-    # years: años a descargar, por defecto 2021,2022,2023,2024
+    with metricas.etapa('impute_player_data'):
+        previos_imputado=impute_player_data(previos)
+        actual_imputado=impute_player_data(actual)
+    return postprocesar_imputados(actual_imputado, previos_imputado, num_previos)
 
-    # Cambiar el directorio de trabajo al del script
-    os.chdir(os.path.dirname(os.path.abspath(__file__)))
-    print("Directorio actual:", os.getcwd())
-
-    ruta=f'../data'
-    partidos_nuevo=True
-    nuevo=True
-    num_previos=50
-    years=[2021,2022,2023,2024]
-    
-
-    instanciar_variables_globales(nuevo)      
+def postprocesar_imputados(actual_imputado, previos_imputado, num_previos=50):
+    """
+    Postprocesado de postprocesar a partir de los datos ya imputados.
+    """
+    with metricas.etapa('reorganizar_partidos'):
+        previos_reorganizado=reorganizar_partidos(actual_imputado,previos_imputado, num_previos)
+    with metricas.etapa('invertir_bloques'):
+        previos_invertido = invertir_bloques(previos_reorganizado, num_previos)
+    with metricas.etapa('ordenar_por_timestamp'):
+        actual_ordenado, previos_ordenado= ordenar_por_timestamp(actual_imputado, previos_invertido, num_previos)
+
+    with metricas.etapa('limpieza_final'):
+        actual_final = limpieza_final(actual_ordenado, True)
+        previos_final = limpieza_final(previos_ordenado, False)
+    return actual_final, previos_final
+
+def fusionar_ordenado(actual_final, previos_final, actual_nuevo, previos_nuevo, num_previos=50):
+    """
+    Une dos datasets finales (actuales ordenados por fecha y bloques de previos alineados) en uno solo
+    ordenado por startTimestamp, moviendo cada bloque de 2*num_previos filas con su partido actual.
+    Args:
+        actual_final, previos_final (pd.DataFrame): Dataset existente.
+        actual_nuevo, previos_nuevo (pd.DataFrame): Partidos nuevos, ya postprocesados.
+        num_previos (int): Tamaño de cada bloque de previos.
+    Returns:
+        tuple: DataFrames de partidos actuales y previos ordenados.
+    """
+    actual = pd.concat([actual_final, actual_nuevo], ignore_index=True)
+    previos = pd.concat([previos_final, previos_nuevo], ignore_index=True)
+    orden = np.argsort(actual['startTimestamp'].values, kind='stable')
+    filas = (orden[:, None] * 2 * num_previos + np.arange(2 * num_previos)).ravel()
+    return actual.iloc[orden].reset_index(drop=True), previos.iloc[filas].reset_index(drop=True)
 
-    if partidos_nuevo:
-        tournaments = scraping_tournaments()
-        print(tournaments)
-        id_tournaments_seasons = []
-        for i in years:
-            id_tournaments_seasons.extend(scraping_seasons(tournaments, i))
-        id_partidos = scraping_id_matches(id_tournaments_seasons)
-
-        id_partidos_df = pd.DataFrame(id_partidos, columns=['id'])
-        id_partidos_df.to_csv(f'{ruta}/id_partidos.csv', index=False)
-    else:
-        id_partidos=pd.read_csv(f'{ruta}/id_partidos.csv')['id'].values
-        id_partidos = list(id_partidos)
-        
-    
-    if nuevo:
-        previos = pd.DataFrame(columns=[
-                #Identificadores de partido
-                'idTournament', 'tournamentName' , 'idSeason', 'idEvent','round' ,'groundType','periodCount',
-
-                #Target
-                'winnerCode',
-
-                #referencia al partido posterior
-                'idNext',
-                #------------------------------------Caracterísitcas a priori----------------------------------------------#
-                #Datos temporales del partido
-                'startTimestamp','lastMatchTimestamp','year',
-
-                #Datos del jugador local
-                'idHome', 'birthDateHome','ActualRankingHome', 'BestRankingHome', 'BestRankingDateHome',
-                'HeightHome', 'WeightHome', 'RightHandedHome', 'countryHome',
-
-                #Datos del jugador visitante
-                'idAway', 'birthDateAway','ActualRankingAway', 'BestRankingAway', 'BestRankingDateAway',
-                'HeightAway', 'WeightAway', 'RightHandedAway', 'countryAway',
-
-                #----------------------------Características a posteriori:-------------------------------------------------------#
-                #Estado del partido
-                'status', 
-
-                #Datos de resultado del partido
-                'homeScore', 'awayScore',
-
-                # Datos de resultados en los sets: -1 si no existen
-                'set1performanceHome', 'set1performanceAway',
-                'set2performanceHome', 'set2performanceAway',
-                'set3performanceHome', 'set3performanceAway',
-                'set4performanceHome', 'set4performanceAway',
-                'set5performanceHome', 'set5performanceAway',
-
-                # Datos de juegos totales
-                'totalGamesHome', 'totalGamesAway',
-
-            ]) 
-        actual = pd.DataFrame(columns=[
+def actualizar_final(actual, previos, n_anteriores, actual_final, previos_final, num_previos=50):
+    """
+    Postprocesa solo los partidos añadidos en una actualización incremental y los une al dataset final existente.
+    La imputación se ajusta con todos los partidos (es barata y así usa todos los datos disponibles), pero
+    reorganizar_partidos, invertir_bloques, ordenar_por_timestamp y limpieza_final solo recorren los bloques nuevos.
+    Args:
+        actual (pd.DataFrame): Partidos actuales descargados (los anteriores y los nuevos al final).
+        previos (pd.DataFrame): Partidos previos descargados, alineados con actual.
+        n_anteriores (int): Número de partidos actuales que ya estaban en el dataset final.
+        actual_final, previos_final (pd.DataFrame): Dataset final existente.
+        num_previos (int): Tamaño de cada bloque de previos.
+    Returns:
+        tuple: DataFrames finales de partidos actuales y previos, con los nuevos incluidos y ordenados por fecha.
+    """
+    if actual.shape[0] == n_anteriores:
+        return actual_final, previos_final
+    with metricas.etapa('impute_player_data'):
+        previos_imputado=impute_player_data(previos).iloc[n_anteriores*2*num_previos:].reset_index(drop=True)
+        actual_imputado=impute_player_data(actual).iloc[n_anteriores:].reset_index(drop=True)
+    actual_nuevo, previos_nuevo = postprocesar_imputados(actual_imputado, previos_imputado, num_previos)
+    return fusionar_ordenado(actual_final, previos_final, actual_nuevo, previos_nuevo, num_previos)
+
+def descubrir_partidos(years, ruta_manifiesto):
+    """
+    Descubre los IDs de los partidos de los torneos de los años indicados y los guarda en id_partidos.csv.
+    Args:
+        years (list): Años a descargar.
+        ruta_manifiesto (str): Fichero con las temporadas y eventos ya descubiertos (ver cargar_manifiesto).
+    Returns:
+        tuple: Lista de IDs de partidos y manifiesto de descubrimiento.
+    """
+    tournaments = scraping_tournaments()
+    log(tournaments, 'debug')
+    # El manifiesto guarda las temporadas y eventos ya descubiertos: en las siguientes ejecuciones solo se
+    # descargan las temporadas y páginas nuevas
+    manifiesto = cargar_manifiesto(ruta_manifiesto)
+    id_tournaments_seasons = scraping_seasons(tournaments, years, manifiesto)
+    id_partidos = scraping_id_matches(id_tournaments_seasons, manifiesto)
+    guardar_manifiesto(manifiesto, ruta_manifiesto)
+
+    id_partidos_df = pd.DataFrame(id_partidos, columns=['id'])
+    id_partidos_df.to_csv(f'{ruta}/id_partidos.csv', index=False)
+    return id_partidos, manifiesto
+
+def datasets_vacios():
+    """
+    Returns:
+        tuple: DataFrames actual y previos vacíos, con las columnas que rellena el scraper.
+    """
+    previos = pd.DataFrame(columns=[
             #Identificadores de partido
-            'idTournament', 'tournamentName','idSeason', 'idEvent', 'round','groundType','periodCount',
+            'idTournament', 'tournamentName' , 'idSeason', 'idEvent','round' ,'groundType','periodCount',
 
             #Target
             'winnerCode',
-            #-------------------------------------Probabilidades de la casa de apuestas --------------------------------#
-            'ProbabilityHome', 'ProbabilityAway', 
+
+            #referencia al partido posterior
+            'idNext',
             #------------------------------------Caracterísitcas a priori----------------------------------------------#
             #Datos temporales del partido
-            'startTimestamp','year',
+            'startTimestamp','lastMatchTimestamp','year',
 
             #Datos del jugador local
             'idHome', 'birthDateHome','ActualRankingHome', 'BestRankingHome', 'BestRankingDateHome',
-            'HeightHome', 'WeightHome', 'RightHandedHome', 'countryHome',   
+            'HeightHome', 'WeightHome', 'RightHandedHome', 'countryHome',
 
             #Datos del jugador visitante
             'idAway', 'birthDateAway','ActualRankingAway', 'BestRankingAway', 'BestRankingDateAway',
@@ -1209,14 +1412,79 @@ def main():
             #----------------------------Características a posteriori:-------------------------------------------------------#
             #Estado del partido
             'status', 
-        ])
-    else:
-        actual=pd.read_csv(f'{ruta}/actual.csv')
-        previos=pd.read_csv(f'{ruta}/previos.csv')
-    
-    #para cada jugador, se obtienen los 50 partidos previos
-    num_previos=50
-    if(actual.empty):
+
+            #Datos de resultado del partido
+            'homeScore', 'awayScore',
+
+            # Datos de resultados en los sets: -1 si no existen
+            'set1performanceHome', 'set1performanceAway',
+            'set2performanceHome', 'set2performanceAway',
+            'set3performanceHome', 'set3performanceAway',
+            'set4performanceHome', 'set4performanceAway',
+            'set5performanceHome', 'set5performanceAway',
+
+            # Datos de juegos totales
+            'totalGamesHome', 'totalGamesAway',
+
+            # 1 en las filas de relleno de los jugadores con menos de num_previos partidos previos
+            'relleno',
+
+        ]) 
+    actual = pd.DataFrame(columns=[
+        #Identificadores de partido
+        'idTournament', 'tournamentName','idSeason', 'idEvent', 'round','groundType','periodCount',
+
+        #Target
+        'winnerCode',
+        #-------------------------------------Probabilidades de la casa de apuestas --------------------------------#
+        'ProbabilityHome', 'ProbabilityAway', 
+        #------------------------------------Caracterísitcas a priori----------------------------------------------#
+        #Datos temporales del partido
+        'startTimestamp','year',
+
+        #Datos del jugador local
+        'idHome', 'birthDateHome','ActualRankingHome', 'BestRankingHome', 'BestRankingDateHome',
+        'HeightHome', 'WeightHome', 'RightHandedHome', 'countryHome',   
+
+        #Datos del jugador visitante
+        'idAway', 'birthDateAway','ActualRankingAway', 'BestRankingAway', 'BestRankingDateAway',
+        'HeightAway', 'WeightAway', 'RightHandedAway', 'countryAway',
+
+        #----------------------------Características a posteriori:-------------------------------------------------------#
+        #Estado del partido
+        'status', 
+
+        #Número de partidos previos reales (sin relleno) de cada jugador
+        'numPreviosHome', 'numPreviosAway',
+    ])
+    return actual, previos
+
+def extraer_partidos(actual, previos, id_partidos, num_previos=50, min_previos=10, incremental=False, manifiesto=None):
+    """
+    Descarga los partidos actuales y sus bloques de previos, continuando desde el último partido de actual,
+    y guarda actual.parquet y previos.parquet (con el esquema de tenis/esquema.py) después de cada partido.
+    Args:
+        actual (pd.DataFrame): Partidos actuales ya descargados (vacío para empezar de cero).
+        previos (pd.DataFrame): Bloques de previos ya descargados.
+        id_partidos (list): IDs de los partidos descubiertos.
+        num_previos (int): Número máximo de partidos previos de cada jugador (tamaño de cada bloque de previos).
+        min_previos (int): Número mínimo de partidos previos de cada jugador para quedarse con el partido.
+        incremental (bool): Si es True, solo se descargan los partidos posteriores al último startTimestamp
+            de actual, según los timestamps del manifiesto, y los que estaban sin terminar en la ejecución anterior.
+        manifiesto (dict): Manifiesto de descubrimiento (necesario en el modo incremental). Se actualiza su lista
+            de pendientes con los partidos descartados por no haber terminado.
+    Returns:
+        tuple: DataFrames actual y previos con los partidos nuevos añadidos al final.
+    """
+    #para cada jugador, se obtienen hasta num_previos partidos previos
+    if incremental:
+        ultimo_timestamp = actual['startTimestamp'].max() if not actual.empty else None
+        descargados = actual['idEvent'] if not actual.empty else ()
+        id_partidos = eventos_posteriores(id_partidos, manifiesto, ultimo_timestamp, descargados)
+        # Los partidos sin terminar se apuntan en el manifiesto para volver a consultarlos en la siguiente ejecución
+        pendientes = set(manifiesto.get('pendientes', [])) - set(id_partidos) - set(descargados)
+        inicio_real=0
+    elif(actual.empty):
         inicio_real=0
         id_partidos=id_partidos[inicio_real:]
     else:
@@ -1226,56 +1494,160 @@ def main():
         id_partidos=id_partidos[(inicio_real):]
 
     num_partidos=len(id_partidos)
-    print('Partidos a extraer',num_partidos)
+    if incremental:
+        manifiesto['pendientes'] = sorted(pendientes)
+    log(f'Partidos a extraer {num_partidos}')
+    # Las cuotas se descargan en segundo plano, por delante de los partidos que se van procesando
+    tabla_odds.precargar(id_partidos)
 
     for i in range(num_partidos):
         id_event=id_partidos[i]
-        print('actual',i+inicio_real, id_event)
+        log(f'actual {i+inicio_real} {id_event}', 'debug')
+
+        json_evento = obtener_evento(id_event)
+        if filtrar_json_partido(json_evento, True):
+            log('Actual skipped', 'debug')
+            if incremental and partido_pendiente(json_evento):
+                pendientes.add(id_event)
+                manifiesto['pendientes'] = sorted(pendientes)
+            continue
 
-        df_partido_actual =scraping_partido(id_event, True)
+        df_partido_actual =scraping_partido(json_evento, True)
 
         if filtrar_partido(df_partido_actual, True):
-            print('Actual skipped')
+            log('Actual skipped', 'debug')
             continue
         
         id_home=int(df_partido_actual.loc[0,'idHome'])
         df_partidos_anteriores_home=get_last_matches(id_home,id_event, num_previos)
-        if df_partidos_anteriores_home.shape[0]<num_previos:         
-            print('previos home',len(df_partidos_anteriores_home)) 
+        if df_partidos_anteriores_home.shape[0]<min_previos:         
+            log(f'previos home {len(df_partidos_anteriores_home)}', 'debug')
             continue
         
         id_away=int(df_partido_actual.loc[0,'idAway'])
         df_partidos_anteriores_away=get_last_matches(id_away,id_event, num_previos)
-        if df_partidos_anteriores_away.shape[0]<num_previos:          
-            print('previos away',len(df_partidos_anteriores_away)) 
+        if df_partidos_anteriores_away.shape[0]<min_previos:          
+            log(f'previos away {len(df_partidos_anteriores_away)}', 'debug')
             continue
 
+        # Se guarda cuántos previos reales tiene cada jugador y se completan los bloques hasta num_previos
+        df_partido_actual['numPreviosHome'] = df_partidos_anteriores_home.shape[0]
+        df_partido_actual['numPreviosAway'] = df_partidos_anteriores_away.shape[0]
+        df_partidos_anteriores_home = rellenar_previos(df_partidos_anteriores_home, num_previos)
+        df_partidos_anteriores_away = rellenar_previos(df_partidos_anteriores_away, num_previos)
+
         previos = pd.concat([previos, df_partidos_anteriores_home,df_partidos_anteriores_away], ignore_index=True)
         actual=pd.concat([actual, df_partido_actual],ignore_index=True)
         
         if(previos.shape[0]/actual.shape[0]!=(num_previos*2)):
-            print(f"Error: El número de partidos previos ({previos.shape[0]}) no es el esperado ({num_previos*2})")          
+            log(f"Error: El número de partidos previos ({previos.shape[0]}) no es el esperado ({num_previos*2})", 'error')          
             sys.exit(1)
 
-        print(f"Guardando Partido actual, dimension= {previos.shape[0]/actual.shape[0]}, no apagar")
-        previos.to_csv(f'{ruta}/previos.csv', index=False)
-        actual.to_csv(f'{ruta}/actual.csv',index=False)
+        log(f"Guardando Partido actual, dimension= {previos.shape[0]/actual.shape[0]}, no apagar", 'debug')
+        guardar_tabla(previos, f'{ruta}/previos.parquet')
+        guardar_tabla(actual, f'{ruta}/actual.parquet')
         players.to_csv(f'{ruta}/players.csv',index=False)
         ranking.to_csv(f'{ruta}/ranking.csv',index=False)
-        print("Partido ya guardado")
-        print('-------------------------------')
-    
-    
-    previos_imputado=impute_player_data(previos)
-    actual_imputado=impute_player_data(actual)
-    previos_reorganizado=reorganizar_partidos(actual_imputado,previos_imputado, num_previos)
-    previos_invertido = invertir_bloques(previos_reorganizado, num_previos)
-    actual_ordenado, previos_ordenado= ordenar_por_timestamp(actual_imputado, previos_invertido, num_previos)
-
-    actual_final = limpieza_final(actual_ordenado, True)
-    previos_final = limpieza_final(previos_ordenado, False)
-    actual_final.to_csv(f'{ruta}/completo/actual_final.csv', index=False)
-    previos_final.to_csv(f'{ruta}/completo/previos_final.csv', index=False)
+        tabla_odds.guardar()
+        log("Partido ya guardado", 'debug')
+        log('-------------------------------', 'debug')
+    return actual, previos
+
+def finalizar_dataset(actual, previos, num_previos=50, n_anteriores=None):
+    """
+    Postprocesa actual y previos y guarda completo/actual_final.parquet y completo/previos_final.parquet.
+    Args:
+        actual (pd.DataFrame): Partidos actuales.
+        previos (pd.DataFrame): Bloques de previos.
+        num_previos (int): Número de partidos previos de cada jugador.
+        n_anteriores (int): Si se indica y ya existe el dataset final, solo se postprocesan los partidos a partir
+            de esa fila (los descargados en esta ejecución) y se unen a él (ver actualizar_final).
+    """
+    os.makedirs(f'{ruta}/completo', exist_ok=True)
+    ruta_actual_final=f'{ruta}/completo/actual_final.parquet'
+    ruta_previos_final=f'{ruta}/completo/previos_final.parquet'
+    if n_anteriores is not None and os.path.exists(ruta_actual_final) and os.path.exists(ruta_previos_final):
+        actual_final, previos_final = actualizar_final(actual, previos, n_anteriores,
+                                                       leer_tabla(ruta_actual_final, tipado=False),
+                                                       leer_tabla(ruta_previos_final, tipado=False), num_previos)
+    else:
+        actual_final, previos_final = postprocesar(actual, previos, num_previos)
+    guardar_tabla(actual_final, ruta_actual_final)
+    guardar_tabla(previos_final, ruta_previos_final)
+
+def main(ruta_datos='../data', partidos_nuevo=True, nuevo=True, num_previos=50, min_previos=10,
+         years=(2021, 2022, 2023, 2024), ruta_metricas=None, intervalo_metricas=60, ruta_manifiesto=None,
+         incremental=False, extraer=True, postprocesar_final=True):
+    """
+    Función principal que ejecuta el programa de scraping de partidos de tenis.
+    Configura los parámetros globales, descarga los partidos nuevos si es necesario, y procesa los
+    partidos actuales y previos. Se necesita el archivo de ranking, en la carpeta ruta_datos/ranking; si no
+    existe, hay que ejecutar antes 1.ranking.py. El nivel del log se elige con la variable de entorno
+    TENIS_LOG (debug, info, aviso, error, nada).
+    Args:
+        ruta_datos (str): Directorio donde se guardan los datos.
+        partidos_nuevo (bool): Si es True, se descubren los IDs de los partidos; si no, se cargan de id_partidos.csv.
+        nuevo (bool): Si es True, se empiezan de cero actual, previos y players; si no, se cargan de los
+            ficheros guardados, por si son parciales.
+        num_previos (int): Número máximo de partidos previos a obtener para cada jugador (tamaño de cada bloque de previos).
+        min_previos (int): Número mínimo de partidos previos de cada jugador para quedarse con el partido; los
+            bloques de los jugadores con menos de num_previos se completan con filas de relleno.
+        years (list): Años a descargar.
+        ruta_metricas (str): Fichero donde se vuelcan las métricas de las peticiones y de las etapas (.json o .prom).
+            Por defecto, ruta_datos/metricas.json.
+        intervalo_metricas (float): Segundos entre volcados de las métricas.
+        ruta_manifiesto (str): Fichero con las temporadas y eventos ya descubiertos (ver cargar_manifiesto). Por
+            defecto, ruta_datos/manifiesto_descubrimiento.json.
+        incremental (bool): Si es True, se parte de los datos existentes y solo se descargan los partidos posteriores
+            al último startTimestamp de actual.parquet; el postprocesado se hace solo sobre ellos y se unen al dataset final.
+        extraer (bool): Si es False, no se descargan partidos (por ejemplo, para solo descubrir o solo postprocesar).
+        postprocesar_final (bool): Si es False, no se genera el dataset final de completo/.
+    """
+    global ruta
+    ruta = ruta_datos
+    ruta_metricas = ruta_metricas or f'{ruta}/metricas.json'
+    ruta_manifiesto = ruta_manifiesto or f'{ruta}/manifiesto_descubrimiento.json'
+
+    if incremental:
+        partidos_nuevo=True
+        nuevo=False
+
+    instanciar_variables_globales(nuevo)      
+    parar_metricas = metricas.volcar_periodicamente(ruta_metricas, intervalo_metricas)
+
+    manifiesto = None
+    if partidos_nuevo:
+        id_partidos, manifiesto = descubrir_partidos(years, ruta_manifiesto)
+    elif extraer:
+        id_partidos=pd.read_csv(f'{ruta}/id_partidos.csv')['id'].values
+        id_partidos = list(id_partidos)
+
+    if extraer or postprocesar_final:
+        if nuevo:
+            actual, previos = datasets_vacios()
+        else:
+            # El scraper trabaja con los tipos sueltos de siempre y aplica el esquema al guardar
+            actual=leer_tabla(f'{ruta}/actual.parquet', tipado=False)
+            previos=leer_tabla(f'{ruta}/previos.parquet', tipado=False)
+        n_anteriores=actual.shape[0]
+
+    if extraer:
+        try:
+            actual, previos = extraer_partidos(actual, previos, id_partidos, num_previos, min_previos, incremental, manifiesto)
+        finally:
+            # Se guardan los pendientes aunque la extracción se corte a medias
+            if manifiesto is not None:
+                guardar_manifiesto(manifiesto, ruta_manifiesto)
+        tabla_odds.cerrar()
+        tabla_odds.guardar()
+    if postprocesar_final:
+        finalizar_dataset(actual, previos, num_previos, n_anteriores if incremental else None)
+    resumen_filtros()
+    parar_metricas.set()
+    metricas.guardar(ruta_metricas)
             
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    # Cambiar el directorio de trabajo al del script
+    os.chdir(os.path.dirname(os.path.abspath(__file__)))
+    print("Directorio actual:", os.getcwd())
+    main()
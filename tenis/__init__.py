@@ -0,0 +1,4 @@
+"""
+Código reutilizable del TFG: modelo, bucle de entrenamiento por ventanas temporales y utilidades
+compartidas por los scripts y los notebooks.
+"""
@@ -0,0 +1,3 @@
+from tenis.cli import main
+
+main()
@@ -0,0 +1,568 @@
+"""
+Resúmenes del análisis descriptivo (3.analisis_descriptivo.ipynb) calculados en una sola pasada por lotes de
+actual.parquet, sin cargar el dataset en memoria. Cada estadística es un resumen combinable: conteos exactos
+por valor (de los que salen medianas e histogramas exactos de los rankings, que son enteros), momentos hasta el
+cuarto orden (media, desviación, asimetría y curtosis con las mismas fórmulas que pandas), histogramas de
+ancho fijo y una muestra por hash de idEvent para los gráficos de dispersión. El resumen de dos trozos del
+dataset es la combinación de sus resúmenes, así que se guarda en JSON y, cuando el scraper añade partidos, solo
+se procesan las filas nuevas.
+
+    resumen = actualizar_resumen('../data/actual.parquet', '../data/previos.parquet', '../data/resumen_eda.json')
+    resumen.conteo('groundType')
+    resumen.describir_rankings()
+
+    python -m tenis.agregados --datos ../data
+"""
+import argparse
+import json
+import math
+import os
+import time
+
+import numpy as np
+import pandas as pd
+
+from tenis.esquema import contar_filas, leer_por_lotes
+
+# Grupos de nivel del partido (media de los dos rankings), como el pd.cut del notebook
+NIVELES = [('Medio', 0, 700), ('Alto', 700, 850), ('Elite', 850, 900)]
+# Diferencia de ranking a partir de la que se considera que Home tiene ventaja grande
+VENTAJA_GRANDE = 30
+VERSION = 1
+
+
+def _valor(valor):
+    """Valor de numpy a su tipo de Python, para las claves de los conteos y el JSON."""
+    if isinstance(valor, tuple):
+        return tuple(_valor(v) for v in valor)
+    return valor.item() if hasattr(valor, 'item') else valor
+
+
+def _clave(valor):
+    """Las claves compuestas se guardan en JSON como listas y se vuelven a leer como tuplas."""
+    return tuple(valor) if isinstance(valor, list) else valor
+
+
+class Momentos:
+    """
+    Número de valores, media, sumas de potencias centradas de orden 2 a 4, mínimo y máximo. Se combinan con las
+    fórmulas de Pébay, sin perder precisión como las sumas de potencias sin centrar.
+    """
+
+    def __init__(self, n=0, media=0.0, m2=0.0, m3=0.0, m4=0.0, minimo=math.inf, maximo=-math.inf):
+        self.n, self.media, self.m2, self.m3, self.m4 = n, media, m2, m3, m4
+        self.minimo, self.maximo = minimo, maximo
+
+    @classmethod
+    def desde_valores(cls, valores):
+        """Momentos de un array; los NaN no cuentan."""
+        valores = np.asarray(valores, dtype=np.float64)
+        valores = valores[~np.isnan(valores)]
+        if len(valores) == 0:
+            return cls()
+        media = valores.mean()
+        centrados = valores - media
+        cuadrados = centrados * centrados
+        return cls(len(valores), float(media), float(cuadrados.sum()), float((cuadrados * centrados).sum()),
+                   float((cuadrados * cuadrados).sum()), float(valores.min()), float(valores.max()))
+
+    def combinar(self, otro):
+        """Añade los momentos de otro trozo de datos."""
+        if otro.n == 0:
+            return self
+        if self.n == 0:
+            self.__dict__.update(otro.__dict__)
+            return self
+        na, nb = self.n, otro.n
+        n = na + nb
+        d = otro.media - self.media
+        dn = d / n
+        m2 = self.m2 + otro.m2 + d * dn * na * nb
+        m3 = (self.m3 + otro.m3 + d * dn * dn * na * nb * (na - nb)
+              + 3 * dn * (na * otro.m2 - nb * self.m2))
+        m4 = (self.m4 + otro.m4 + d * dn * dn * dn * na * nb * (na * na - na * nb + nb * nb)
+              + 6 * dn * dn * (na * na * otro.m2 + nb * nb * self.m2) + 4 * dn * (na * otro.m3 - nb * self.m3))
+        self.n, self.media, self.m2, self.m3, self.m4 = n, self.media + dn * nb, m2, m3, m4
+        self.minimo, self.maximo = min(self.minimo, otro.minimo), max(self.maximo, otro.maximo)
+        return self
+
+    def actualizar(self, valores):
+        return self.combinar(Momentos.desde_valores(valores))
+
+    def std(self):
+        """Desviación típica muestral (ddof=1), como Series.std."""
+        return math.sqrt(self.m2 / (self.n - 1)) if self.n > 1 else math.nan
+
+    def asimetria(self):
+        """Asimetría corregida por sesgo, como Series.skew."""
+        n = self.n
+        if n < 3:
+            return math.nan
+        if self.m2 == 0:
+            return 0.0
+        return math.sqrt(n * (n - 1)) / (n - 2) * (self.m3 / n) / (self.m2 / n) ** 1.5
+
+    def curtosis(self):
+        """Exceso de curtosis corregido por sesgo, como Series.kurt."""
+        n = self.n
+        if n < 4:
+            return math.nan
+        if self.m2 == 0:
+            return 0.0
+        return ((n + 1) * n * (n - 1) * self.m4 / ((n - 2) * (n - 3) * self.m2 ** 2)
+                - 3 * (n - 1) ** 2 / ((n - 2) * (n - 3)))
+
+    def a_dict(self):
+        return {'n': self.n, 'media': self.media, 'm2': self.m2, 'm3': self.m3, 'm4': self.m4,
+                'minimo': self.minimo if self.n else None, 'maximo': self.maximo if self.n else None}
+
+    @classmethod
+    def desde_dict(cls, d):
+        d = dict(d)
+        d['minimo'] = math.inf if d['minimo'] is None else d['minimo']
+        d['maximo'] = -math.inf if d['maximo'] is None else d['maximo']
+        return cls(**d)
+
+
+class Conteos:
+    """
+    Número de apariciones de cada valor (los NaN no cuentan). Es exacto mientras haya pocos valores distintos:
+    torneos, superficies, años, rankings o claves compuestas (nivel, tramo de diferencia).
+    """
+
+    def __init__(self, conteos=None):
+        self.conteos = dict(conteos or {})
+
+    def actualizar(self, valores):
+        valores = pd.Series(valores)
+        if isinstance(valores.dtype, pd.CategoricalDtype):
+            valores = valores.astype(object)
+        for valor, n in valores.value_counts().items():
+            valor = _valor(valor)
+            self.conteos[valor] = self.conteos.get(valor, 0) + int(n)
+        return self
+
+    def combinar(self, otro):
+        for valor, n in otro.conteos.items():
+            self.conteos[valor] = self.conteos.get(valor, 0) + n
+        return self
+
+    def serie(self):
+        """Conteos ordenados de mayor a menor, como value_counts."""
+        return pd.Series(self.conteos, dtype='int64').sort_values(ascending=False, kind='stable')
+
+    def a_dict(self):
+        return [[list(valor) if isinstance(valor, tuple) else valor, n] for valor, n in self.conteos.items()]
+
+    @classmethod
+    def desde_dict(cls, d):
+        return cls({_clave(valor): n for valor, n in d})
+
+
+def momentos_ponderados(conteos):
+    """
+    Args:
+        conteos (pd.Series): Número de apariciones de cada valor numérico (índice), como Conteos.serie o un
+            trozo suyo.
+    Returns:
+        Momentos: Momentos de los valores, cada uno repetido tantas veces como aparece.
+    """
+    conteos = conteos[conteos > 0]
+    if conteos.empty:
+        return Momentos()
+    valores, pesos = conteos.index.to_numpy(dtype=np.float64), conteos.to_numpy(dtype=np.float64)
+    n = pesos.sum()
+    media = (valores * pesos).sum() / n
+    centrados = valores - media
+    cuadrados = centrados * centrados
+    return Momentos(int(n), float(media), float((pesos * cuadrados).sum()), float((pesos * cuadrados * centrados).sum()),
+                    float((pesos * cuadrados * cuadrados).sum()), float(valores.min()), float(valores.max()))
+
+
+def cuantil_ponderado(conteos, q):
+    """Cuantil q de los valores contados en conteos, con interpolación lineal como Series.quantile."""
+    conteos = conteos[conteos > 0].sort_index()
+    if conteos.empty:
+        return math.nan
+    acumulado = conteos.to_numpy().cumsum()
+    posicion = (acumulado[-1] - 1) * q
+    abajo = conteos.index[np.searchsorted(acumulado, math.floor(posicion), side='right')]
+    arriba = conteos.index[np.searchsorted(acumulado, math.ceil(posicion), side='right')]
+    return abajo + (arriba - abajo) * (posicion - math.floor(posicion))
+
+
+class Histograma:
+    """Histograma de ancho fijo con solo los tramos ocupados: el tramo de x es floor(x / ancho)."""
+
+    def __init__(self, ancho, tramos=None):
+        self.ancho = ancho
+        self.tramos = Conteos(tramos)
+
+    def actualizar(self, valores):
+        valores = np.asarray(valores, dtype=np.float64)
+        valores = valores[~np.isnan(valores)]
+        self.tramos.actualizar(np.floor(valores / self.ancho).astype(np.int64))
+        return self
+
+    def combinar(self, otro):
+        self.tramos.combinar(otro.tramos)
+        return self
+
+    def denso(self):
+        """
+        Returns:
+            tuple: (conteos, bordes) con todos los tramos entre el primero y el último ocupados, para plt.stairs.
+        """
+        if not self.tramos.conteos:
+            return np.zeros(0), np.zeros(1)
+        primero, ultimo = min(self.tramos.conteos), max(self.tramos.conteos)
+        conteos = np.zeros(ultimo - primero + 1)
+        for tramo, n in self.tramos.conteos.items():
+            conteos[tramo - primero] = n
+        return conteos, np.arange(primero, ultimo + 2) * self.ancho
+
+    def a_dict(self):
+        return {'ancho': self.ancho, 'tramos': self.tramos.a_dict()}
+
+    @classmethod
+    def desde_dict(cls, d):
+        return cls(d['ancho'], Conteos.desde_dict(d['tramos']).conteos)
+
+
+class Muestra:
+    """
+    Muestra de tamaño fijo para los gráficos de dispersión: las filas con menor hash de idEvent. El hash no
+    depende del orden ni de los lotes, así que combinar muestras da la misma que muestrear todo el dataset.
+    """
+
+    def __init__(self, tamano, filas=None):
+        self.tamano = tamano
+        self.filas = list(filas or [])
+
+    @staticmethod
+    def _hash(ids):
+        return (np.asarray(ids, dtype=np.uint64) * np.uint64(2654435761)) % np.uint64(2 ** 32)
+
+    def actualizar(self, ids, *columnas):
+        ids = np.asarray(ids, dtype=np.float64)
+        validos = ~np.isnan(ids)
+        prioridad = self._hash(ids[validos].astype(np.int64))
+        nuevas = np.column_stack([prioridad.astype(np.float64)]
+                                 + [np.asarray(c, dtype=np.float64)[validos] for c in columnas])
+        if len(nuevas) > self.tamano:
+            nuevas = nuevas[np.argpartition(nuevas[:, 0], self.tamano)[:self.tamano]]
+        return self._recortar(nuevas.tolist())
+
+    def combinar(self, otro):
+        return self._recortar(otro.filas)
+
+    def _recortar(self, filas):
+        self.filas = sorted(self.filas + filas, key=lambda fila: fila[0])[:self.tamano]
+        return self
+
+    def valores(self):
+        """Columnas de la muestra (sin la prioridad), como array de forma (n_filas, n_columnas)."""
+        return np.asarray(self.filas)[:, 1:] if self.filas else np.zeros((0, 0))
+
+    def a_dict(self):
+        return {'tamano': self.tamano, 'filas': self.filas}
+
+    @classmethod
+    def desde_dict(cls, d):
+        return cls(d['tamano'], d['filas'])
+
+
+class ResumenEDA:
+    """
+    Todos los resúmenes del análisis descriptivo. Las estadísticas de mercado, objetivo y físicas se calculan,
+    como en el notebook, sobre las filas completas (sin nulos en ninguna columna ni nivel de partido fuera de
+    los grupos) tras corregir las probabilidades mal descargadas. Los tramos de diferencia de ranking son de
+    ancho fijo (ancho_dif) en lugar del pd.cut de 10 tramos del notebook, que depende del rango de los datos y
+    no se puede combinar.
+    """
+
+    def __init__(self, ancho_dif=10, ancho_altura=0.01, ancho_peso=1.0, ancho_probabilidad=0.02,
+                 tamano_muestra=5000):
+        self.parametros = {'ancho_dif': ancho_dif, 'ancho_altura': ancho_altura, 'ancho_peso': ancho_peso,
+                           'ancho_probabilidad': ancho_probabilidad, 'tamano_muestra': tamano_muestra}
+        # Filas de actual ya procesadas e idEvent de la última, para comprobar al actualizar que no han cambiado
+        self.filas = 0
+        self.ultimo_id = None
+        self.filas_previos = 0
+        self.conteos = {nombre: Conteos() for nombre in
+                        ('year', 'tournamentName', 'groundType', 'ActualRanking', 'BestRanking',
+                         'nivel', 'nivel_ventaja', 'nivel_ventaja_home', 'nivel_dif', 'nivel_dif_home',
+                         'winnerCode', 'superficie', 'superficie_home')}
+        self.momentos = {nombre: Momentos() for nombre in
+                         ('suma_probabilidades', 'ProbabilityHome', 'dif_altura', 'dif_peso')}
+        self.histogramas = {
+            'ProbabilityHome': Histograma(ancho_probabilidad), 'ProbabilityAway': Histograma(ancho_probabilidad),
+            'dif_altura': Histograma(ancho_altura), 'dif_peso': Histograma(ancho_peso),
+        }
+        self.muestra = Muestra(tamano_muestra)
+        self.completos = 0
+        self.aciertos_mercado = 0
+        # Primer partido de cada nivel con ventaja grande de Home: (ranking Home, ranking Away, diferencia)
+        self.ejemplos = {}
+
+    def actualizar(self, lote):
+        """
+        Args:
+            lote (pd.DataFrame): Filas consecutivas de actual.parquet, con todas sus columnas.
+        """
+        if lote.empty:
+            return self
+        for columna in ('year', 'tournamentName', 'groundType'):
+            self.conteos[columna].actualizar(lote[columna])
+        numericas = {}
+        for columna in ('ActualRanking', 'BestRanking', 'Probability', 'Height', 'Weight'):
+            for lado in ('Home', 'Away'):
+                numericas[columna + lado] = pd.to_numeric(lote[columna + lado], errors='coerce').to_numpy(
+                    dtype=np.float64, na_value=np.nan)
+        for columna in ('ActualRanking', 'BestRanking'):
+            self.conteos[columna].actualizar(np.concatenate([numericas[columna + 'Home'], numericas[columna + 'Away']]))
+
+        # Nivel del partido y diferencia de ranking
+        home, away = numericas['ActualRankingHome'], numericas['ActualRankingAway']
+        gana_home = pd.to_numeric(lote['winnerCode'], errors='coerce').astype('float64').to_numpy() == 0
+        dif = home - away
+        nivel_partido = (home + away) / 2
+        nivel = np.full(len(lote), None, dtype=object)
+        for nombre, desde, hasta in NIVELES:
+            nivel[(nivel_partido > desde) & (nivel_partido <= hasta)] = nombre
+        con_nivel = nivel != None  # noqa: E711
+        self.conteos['nivel'].actualizar(nivel[con_nivel])
+        tramo = np.floor(dif / self.parametros['ancho_dif'])
+        con_dif = con_nivel & ~np.isnan(dif)
+        claves = pd.Series(list(zip(nivel[con_dif], tramo[con_dif].astype(np.int64))), dtype=object)
+        self.conteos['nivel_dif'].actualizar(claves)
+        self.conteos['nivel_dif_home'].actualizar(claves[gana_home[con_dif]])
+        ventaja = con_nivel & (dif > VENTAJA_GRANDE)
+        self.conteos['nivel_ventaja'].actualizar(nivel[ventaja])
+        self.conteos['nivel_ventaja_home'].actualizar(nivel[ventaja & gana_home])
+        for nombre, _, _ in NIVELES:
+            if nombre not in self.ejemplos and (ventaja & (nivel == nombre)).any():
+                posicion = np.argmax(ventaja & (nivel == nombre))
+                self.ejemplos[nombre] = [float(home[posicion]), float(away[posicion]), float(dif[posicion])]
+
+        # Probabilidades mal descargadas, corregidas como en el notebook
+        probabilidad_home, probabilidad_away = numericas['ProbabilityHome'].copy(), numericas['ProbabilityAway'].copy()
+        probabilidad_away[probabilidad_away == 125] = 0.125
+        probabilidad_home[probabilidad_home == 125] = 0.125
+        ambas_uno = (probabilidad_home == 1) & (probabilidad_away == 1)
+        probabilidad_home[ambas_uno] = 0.1
+        probabilidad_away[ambas_uno] = 0.943396226
+
+        # Filas completas
+        completos = lote.notna().all(axis=1).to_numpy() & con_nivel
+        self.completos += int(completos.sum())
+        probabilidad_home, probabilidad_away = probabilidad_home[completos], probabilidad_away[completos]
+        gana_home_completos = gana_home[completos]
+        self.momentos['suma_probabilidades'].actualizar(probabilidad_home + probabilidad_away)
+        self.momentos['ProbabilityHome'].actualizar(probabilidad_home)
+        self.histogramas['ProbabilityHome'].actualizar(probabilidad_home)
+        self.histogramas['ProbabilityAway'].actualizar(probabilidad_away)
+        self.aciertos_mercado += int(((probabilidad_home > 0.5) == gana_home_completos).sum())
+        self.muestra.actualizar(lote['idEvent'].to_numpy(dtype=np.float64, na_value=np.nan)[completos],
+                                dif[completos], probabilidad_home)
+        self.conteos['winnerCode'].actualizar(lote['winnerCode'][completos])
+        superficie = lote['groundType'].astype(object).to_numpy()[completos]
+        self.conteos['superficie'].actualizar(superficie)
+        self.conteos['superficie_home'].actualizar(superficie[gana_home_completos])
+        for nombre, medida in (('dif_altura', 'Height'), ('dif_peso', 'Weight')):
+            diferencia = (numericas[medida + 'Home'] - numericas[medida + 'Away'])[completos]
+            self.momentos[nombre].actualizar(diferencia)
+            self.histogramas[nombre].actualizar(diferencia)
+
+        self.filas += len(lote)
+        self.ultimo_id = _valor(lote['idEvent'].iloc[-1])
+        return self
+
+    def combinar(self, otro):
+        """Añade el resumen de otro trozo del dataset (por ejemplo, otra temporada descargada aparte)."""
+        if otro.parametros != self.parametros:
+            raise ValueError('Los resúmenes tienen parámetros distintos y no se pueden combinar')
+        for grupo, grupo_otro in ((self.conteos, otro.conteos), (self.momentos, otro.momentos),
+                                  (self.histogramas, otro.histogramas)):
+            for nombre, resumen in grupo.items():
+                resumen.combinar(grupo_otro[nombre])
+        self.muestra.combinar(otro.muestra)
+        self.filas += otro.filas
+        self.ultimo_id = otro.ultimo_id
+        self.filas_previos += otro.filas_previos
+        self.completos += otro.completos
+        self.aciertos_mercado += otro.aciertos_mercado
+        for nivel, ejemplo in otro.ejemplos.items():
+            self.ejemplos.setdefault(nivel, ejemplo)
+        return self
+
+    # Consultas para el notebook
+
+    def conteo(self, columna):
+        """value_counts de year, tournamentName o groundType."""
+        return self.conteos[columna].serie()
+
+    def rankings(self, columna='ActualRanking'):
+        """
+        Args:
+            columna (str): 'ActualRanking' o 'BestRanking' (Home y Away juntos).
+        Returns:
+            pd.Series: Apariciones de cada ranking, ordenadas por ranking. Sirve para plt.hist con weights y,
+                filtrando el índice, para momentos_ponderados y cuantil_ponderado de un rango de rankings.
+        """
+        return self.conteos[columna].serie().sort_index()
+
+    def describir_rankings(self):
+        """Media, desviación, mediana, asimetría y curtosis de los rankings actual y mejor."""
+        columnas = {}
+        for columna, titulo in (('ActualRanking', 'Actual Ranking'), ('BestRanking', 'Best Ranking')):
+            conteos = self.rankings(columna)
+            momentos = momentos_ponderados(conteos)
+            columnas[titulo] = [momentos.media if momentos.n else math.nan, momentos.std(),
+                                cuantil_ponderado(conteos, 0.5), momentos.asimetria(), momentos.curtosis()]
+        return pd.DataFrame(columnas, index=['mean', 'std', 'median', 'skewness', 'kurtosis'])
+
+    def niveles(self):
+        """
+        Returns:
+            pd.DataFrame: Por grupo de nivel, partidos, partidos con ventaja grande de Home y % de victorias Home
+                en ellos.
+        """
+        nombres = [nombre for nombre, _, _ in NIVELES]
+        partidos = self.conteos['nivel'].serie().reindex(nombres, fill_value=0)
+        ventaja = self.conteos['nivel_ventaja'].serie().reindex(nombres, fill_value=0)
+        victorias = self.conteos['nivel_ventaja_home'].serie().reindex(nombres, fill_value=0)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            tasa = victorias / ventaja.where(ventaja > 0) * 100
+        return pd.DataFrame({'partidos': partidos, 'partidos_ventaja': ventaja, 'victorias_home': tasa})
+
+    def diferencias(self, nivel):
+        """
+        Args:
+            nivel (str): Grupo de nivel ('Medio', 'Alto' o 'Elite').
+        Returns:
+            pd.DataFrame: Por tramo de diferencia de ranking (índice: centro del tramo), partidos y % de
+                victorias Home.
+        """
+        ancho = self.parametros['ancho_dif']
+        partidos = {tramo: n for (nombre, tramo), n in self.conteos['nivel_dif'].conteos.items() if nombre == nivel}
+        victorias = self.conteos['nivel_dif_home'].conteos
+        tramos = sorted(partidos)
+        return pd.DataFrame({
+            'partidos': [partidos[tramo] for tramo in tramos],
+            'victorias_home': [victorias.get((nivel, tramo), 0) / partidos[tramo] * 100 for tramo in tramos],
+        }, index=pd.Index([(tramo + 0.5) * ancho for tramo in tramos], name='diferencia'))
+
+    def mercado(self):
+        """Suma media de probabilidades, vigorish, media de ProbabilityHome y precisión del mercado."""
+        suma = self.momentos['suma_probabilidades']
+        return {
+            'suma_probabilidades': suma.media if suma.n else math.nan,
+            'vigorish': suma.media - 1 if suma.n else math.nan,
+            'media_probabilidad_home': self.momentos['ProbabilityHome'].media if suma.n else math.nan,
+            'precision': self.aciertos_mercado / self.completos if self.completos else math.nan,
+        }
+
+    def victorias_superficie(self):
+        """% de victorias Home por superficie (filas completas), como el groupby del notebook."""
+        partidos = self.conteos['superficie'].serie().sort_index()
+        victorias = self.conteos['superficie_home'].serie().reindex(partidos.index, fill_value=0)
+        return victorias / partidos * 100
+
+    def a_dict(self):
+        return {
+            'version': VERSION, 'parametros': self.parametros, 'filas': self.filas, 'ultimo_id': self.ultimo_id,
+            'filas_previos': self.filas_previos, 'completos': self.completos,
+            'aciertos_mercado': self.aciertos_mercado, 'ejemplos': self.ejemplos,
+            'conteos': {nombre: c.a_dict() for nombre, c in self.conteos.items()},
+            'momentos': {nombre: m.a_dict() for nombre, m in self.momentos.items()},
+            'histogramas': {nombre: h.a_dict() for nombre, h in self.histogramas.items()},
+            'muestra': self.muestra.a_dict(),
+        }
+
+    @classmethod
+    def desde_dict(cls, d):
+        resumen = cls(**d['parametros'])
+        for atributo in ('filas', 'ultimo_id', 'filas_previos', 'completos', 'aciertos_mercado', 'ejemplos'):
+            setattr(resumen, atributo, d[atributo])
+        resumen.conteos = {nombre: Conteos.desde_dict(c) for nombre, c in d['conteos'].items()}
+        resumen.momentos = {nombre: Momentos.desde_dict(m) for nombre, m in d['momentos'].items()}
+        resumen.histogramas = {nombre: Histograma.desde_dict(h) for nombre, h in d['histogramas'].items()}
+        resumen.muestra = Muestra.desde_dict(d['muestra'])
+        return resumen
+
+    def guardar(self, ruta):
+        """Guarda el resumen en JSON (en un temporal que se renombra, como guardar_tabla)."""
+        os.makedirs(os.path.dirname(ruta) or '.', exist_ok=True)
+        temporal = f'{ruta}.tmp'
+        with open(temporal, 'w', encoding='utf-8') as fichero:
+            json.dump(self.a_dict(), fichero, ensure_ascii=False)
+        os.replace(temporal, ruta)
+
+    @classmethod
+    def cargar(cls, ruta):
+        with open(ruta, encoding='utf-8') as fichero:
+            d = json.load(fichero)
+        if d.get('version') != VERSION:
+            raise ValueError(f'{ruta} es de otra versión del resumen')
+        return cls.desde_dict(d)
+
+
+def _mismo_prefijo(resumen, ruta_actual):
+    """Comprueba que las filas ya resumidas siguen siendo las primeras de actual (que solo se han añadido filas)."""
+    if resumen.filas == 0:
+        return True
+    if resumen.filas > contar_filas(ruta_actual):
+        return False
+    ultima = next(leer_por_lotes(ruta_actual, columnas=['idEvent'], tamano_lote=1, desde=resumen.filas - 1), None)
+    return ultima is not None and _valor(ultima['idEvent'].iloc[0]) == resumen.ultimo_id
+
+
+def actualizar_resumen(ruta_actual, ruta_previos, ruta_resumen, tamano_lote=100_000, **parametros):
+    """
+    Carga el resumen guardado y le añade las filas de actual que aún no ha visto. Se recalcula desde cero si no
+    existe, si los parámetros son otros o si las filas ya resumidas han cambiado (por ejemplo, tras el
+    postprocesado del scraper).
+    Args:
+        ruta_actual, ruta_previos (str): actual.parquet y previos.parquet (o sus .csv).
+        ruta_resumen (str): JSON del resumen.
+        tamano_lote (int): Filas de actual por lote.
+        **parametros: Parámetros de ResumenEDA.
+    Returns:
+        ResumenEDA: Resumen actualizado (y guardado si ha cambiado).
+    """
+    nuevo = ResumenEDA(**parametros)
+    resumen = None
+    if os.path.exists(ruta_resumen):
+        try:
+            resumen = ResumenEDA.cargar(ruta_resumen)
+        except (ValueError, KeyError, TypeError) as e:
+            print(f'No se puede usar el resumen guardado ({e}), se recalcula')
+    if resumen is None or resumen.parametros != nuevo.parametros or not _mismo_prefijo(resumen, ruta_actual):
+        resumen = nuevo
+    desde = resumen.filas
+    for lote in leer_por_lotes(ruta_actual, tamano_lote=tamano_lote, desde=desde):
+        resumen.actualizar(lote)
+    filas_previos = contar_filas(ruta_previos)
+    if resumen.filas != desde or resumen.filas_previos != filas_previos or not os.path.exists(ruta_resumen):
+        resumen.filas_previos = filas_previos
+        resumen.guardar(ruta_resumen)
+    print(f'Resumen con {resumen.filas} partidos ({resumen.filas - desde} nuevos)')
+    return resumen
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Resúmenes del análisis descriptivo calculados por lotes')
+    parser.add_argument('--datos', default='../data')
+    parser.add_argument('--salida', default=None, help='JSON del resumen (por defecto resumen_eda.json en --datos)')
+    parser.add_argument('--tamano-lote', type=int, default=100_000)
+    parser.add_argument('--desde-cero', action='store_true', help='Recalcular aunque exista el resumen')
+    args = parser.parse_args()
+
+    salida = args.salida or os.path.join(args.datos, 'resumen_eda.json')
+    if args.desde_cero and os.path.exists(salida):
+        os.remove(salida)
+    inicio = time.perf_counter()
+    actualizar_resumen(os.path.join(args.datos, 'actual.parquet'), os.path.join(args.datos, 'previos.parquet'),
+                       salida, tamano_lote=args.tamano_lote)
+    print(f'Resumen actualizado en {time.perf_counter() - inicio:.2f} s: {salida}')
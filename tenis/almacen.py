@@ -0,0 +1,252 @@
+"""
+Almacén normalizado de los partidos previos. En previos cada partido histórico se copia en todos los bloques de
+num_previos filas en los que aparece (un partido entra en los bloques de los dos jugadores durante muchos
+torneos seguidos), así que el CSV ocupa unas 100 veces lo que actual y casi todo son filas repetidas.
+
+El almacén guarda:
+- 'tabla': las filas distintas (float32), una por partido y orientación, con una fila de ceros al final que
+  hace de relleno.
+- 'indices': por cada partido actual, un array int32 de forma (2, num_previos) con la fila de la tabla de cada
+  previo del local y del visitante (-1, la fila de ceros, para el relleno).
+- 'orientacion': un flag por previo que indica que la fila se usa con local y visitante intercambiados (las
+  columnas ...Home/...Away y home.../away... se intercambian y winnerCode pasa a 1 - winnerCode). Así un mismo
+  partido visto desde el bloque de cada jugador se guarda una sola vez cuando sus características coinciden.
+- 'id_evento': el idEvent de cada fila de la tabla, si se conoce.
+
+Las filas repetidas se detectan por su contenido exacto, de modo que la vista de 100 filas por partido se
+reconstruye sin ninguna diferencia. Para entrenar no se reconstruye entera: PreviosIndexados reúne las filas de
+cada ventana al indexar, como si fuera el tensor denso.
+
+    almacen = normalizar_previos(previos, num_previos=50, id_evento=id_evento_previos)
+    guardar_almacen(almacen, 'data/previos_normalizado.npz')
+"""
+import numpy as np
+import pandas as pd
+
+RELLENO = -1
+
+
+def intercambio_columnas(columnas, columnas_invertir=('winnerCode',)):
+    """
+    Transformación afín que intercambia local y visitante en una fila: x' = x[permutacion] * escala + desplazamiento.
+    Args:
+        columnas (list): Columnas de las filas de previos.
+        columnas_invertir (tuple): Columnas binarias que pasan a 1 - x al intercambiar (el ganador).
+    Returns:
+        tuple: Arrays permutacion, escala y desplazamiento, de longitud len(columnas).
+    """
+    columnas = list(columnas)
+    posicion = {columna: i for i, columna in enumerate(columnas)}
+    permutacion = np.arange(len(columnas))
+    for i, columna in enumerate(columnas):
+        for a, b in (('Home', 'Away'), ('Away', 'Home'), ('home', 'away'), ('away', 'home')):
+            if a in columna and columna.replace(a, b) in posicion:
+                permutacion[i] = posicion[columna.replace(a, b)]
+                break
+    escala = np.ones(len(columnas), dtype=np.float32)
+    desplazamiento = np.zeros(len(columnas), dtype=np.float32)
+    for columna in columnas_invertir:
+        if columna in posicion:
+            escala[posicion[columna]] = -1
+            desplazamiento[posicion[columna]] = 1
+    return permutacion, escala, desplazamiento
+
+
+def _claves(X, ids=None):
+    """Una clave (bytes de la fila y, si hay, su idEvent) por fila, comparable con np.unique."""
+    partes = [np.ascontiguousarray(X).view(np.uint8).reshape(len(X), -1)]
+    if ids is not None:
+        partes.append(ids.astype(np.int64).reshape(-1, 1).view(np.uint8))
+    bytes_filas = np.ascontiguousarray(np.hstack(partes))
+    return bytes_filas.view(np.dtype((np.void, bytes_filas.shape[1]))).ravel()
+
+
+def normalizar_previos(previos, num_previos=50, id_evento=None, columnas_invertir=('winnerCode',)):
+    """
+    Args:
+        previos (pd.DataFrame): Previos preprocesados en bloques de 2*num_previos filas por partido actual
+            (num_previos del local y num_previos del visitante), solo con columnas numéricas.
+        num_previos (int): Número de partidos previos de cada jugador.
+        id_evento (np.array): idEvent de cada fila de previos (NaN en el relleno). Si se indica, forma parte de
+            la clave, así que dos partidos distintos nunca comparten fila.
+        columnas_invertir (tuple): Columnas que cambian a 1 - x al intercambiar local y visitante.
+    Returns:
+        dict: Almacén con 'tabla', 'indices', 'orientacion', 'id_evento', 'columnas' y 'num_previos'.
+    """
+    columnas = list(previos.columns)
+    n_filas = previos.shape[0]
+    if n_filas % (2 * num_previos):
+        raise ValueError(f"previos tiene {n_filas} filas, que no son bloques de {2 * num_previos}")
+    X = previos.to_numpy(dtype=np.float32)
+    permutacion, escala, desplazamiento = intercambio_columnas(columnas, columnas_invertir)
+    X_intercambiado = X[:, permutacion] * escala + desplazamiento
+
+    ids = None
+    if id_evento is not None:
+        ids = pd.to_numeric(pd.Series(id_evento)).fillna(-1).to_numpy(np.int64)
+
+    # Un código por contenido para cada fila y para su versión intercambiada
+    claves = _claves(np.vstack([X, X_intercambiado]), None if ids is None else np.concatenate([ids, ids]))
+    _, codigos = np.unique(claves, return_inverse=True)
+    codigos = codigos.ravel()
+    codigo, codigo_intercambiado = codigos[:n_filas], codigos[n_filas:]
+
+    # Se guarda la versión intercambiada si es la de menor código y al volver a intercambiarla sale la fila
+    # original exactamente (en float32 1 - (1 - x) no siempre es x)
+    reversible = (_claves(X_intercambiado[:, permutacion] * escala + desplazamiento) == _claves(X))
+    orientacion = reversible & (codigo_intercambiado < codigo)
+    canonico = np.where(orientacion, codigo_intercambiado, codigo)
+
+    _, primera, fila_tabla = np.unique(canonico, return_index=True, return_inverse=True)
+    tabla = np.where(orientacion[primera, None], X_intercambiado[primera], X[primera])
+    tabla = np.vstack([tabla, np.zeros((1, len(columnas)), dtype=np.float32)])
+    indices = fila_tabla.ravel().astype(np.int32)
+
+    # Las filas de ceros (el relleno de los jugadores con pocos previos) apuntan a la fila de relleno
+    ceros = ~X.any(axis=1)
+    if ids is not None:
+        ceros &= ids < 0
+    indices[ceros] = RELLENO
+    orientacion[ceros] = False
+
+    return {
+        'tabla': tabla,
+        'indices': indices.reshape(-1, 2, num_previos),
+        'orientacion': orientacion.reshape(-1, 2, num_previos),
+        'id_evento': None if ids is None else np.append(ids[primera], -1),
+        'columnas': columnas,
+        'num_previos': num_previos,
+        'columnas_invertir': list(columnas_invertir),
+    }
+
+
+def reunir(tabla, indices, orientacion, permutacion, escala, desplazamiento):
+    """
+    Reúne las filas de la tabla y deshace el intercambio de las que lo llevan. Sirve con arrays de numpy y
+    con tensores de torch.
+    Args:
+        tabla: Filas distintas, de forma (n_filas, n_features).
+        indices: Filas a reunir, de cualquier forma.
+        orientacion: Flags de intercambio, de la misma forma que indices.
+        permutacion, escala, desplazamiento: Intercambio de local y visitante (ver intercambio_columnas).
+    Returns:
+        Filas de forma indices.shape + (n_features,).
+    """
+    filas = tabla[indices]
+    intercambiadas = filas[..., permutacion] * escala + desplazamiento
+    if isinstance(filas, np.ndarray):
+        return np.where(orientacion[..., None], intercambiadas, filas)
+    return intercambiadas.where(orientacion[..., None], filas)
+
+
+def reconstruir_previos(almacen):
+    """
+    Returns:
+        pd.DataFrame: La vista densa original, con 2*num_previos filas por partido actual.
+    """
+    permutacion, escala, desplazamiento = intercambio_columnas(almacen['columnas'], almacen['columnas_invertir'])
+    filas = reunir(almacen['tabla'], almacen['indices'], almacen['orientacion'], permutacion, escala, desplazamiento)
+    return pd.DataFrame(filas.reshape(-1, filas.shape[-1]), columns=almacen['columnas'])
+
+
+def filtrar_almacen(almacen, mascara):
+    """
+    Args:
+        almacen (dict): Almacén de previos.
+        mascara (np.array): Partidos actuales que se mantienen (booleanos o índices).
+    Returns:
+        dict: Almacén con los índices de esos partidos. La tabla se comparte.
+    """
+    return {**almacen, 'indices': almacen['indices'][mascara], 'orientacion': almacen['orientacion'][mascara]}
+
+
+def previos_jugador(almacen, jugador):
+    """
+    Args:
+        almacen (dict): Almacén de previos.
+        jugador (int): 0 para los previos del local y 1 para los del visitante.
+    Returns:
+        dict: Almacén con índices y orientación de forma (n_partidos, num_previos), el equivalente a
+            previos_home o previos_away (ver tenis.entrenamiento.separar_previos). La tabla se comparte.
+    """
+    return {**almacen, 'indices': almacen['indices'][:, jugador], 'orientacion': almacen['orientacion'][:, jugador]}
+
+
+def guardar_almacen(almacen, ruta):
+    """Guarda el almacén comprimido en un .npz."""
+    np.savez_compressed(
+        ruta, tabla=almacen['tabla'], indices=almacen['indices'], orientacion=almacen['orientacion'],
+        id_evento=np.array([]) if almacen['id_evento'] is None else almacen['id_evento'],
+        columnas=np.array(almacen['columnas']), num_previos=almacen['num_previos'],
+        columnas_invertir=np.array(almacen['columnas_invertir']))
+
+
+def cargar_almacen(ruta):
+    """Carga un almacén guardado con guardar_almacen."""
+    with np.load(ruta) as datos:
+        return {
+            'tabla': datos['tabla'],
+            'indices': datos['indices'],
+            'orientacion': datos['orientacion'],
+            'id_evento': datos['id_evento'] if datos['id_evento'].size else None,
+            'columnas': datos['columnas'].tolist(),
+            'num_previos': int(datos['num_previos']),
+            'columnas_invertir': datos['columnas_invertir'].tolist(),
+        }
+
+
+class PreviosIndexados:
+    """
+    Previos de un jugador como tensor perezoso de forma (n_partidos, num_previos, n_features): al indexar con
+    los partidos de una ventana se reúnen solo sus filas. Sustituye a datos['home'] y datos['away'].
+    """
+
+    def __init__(self, tabla, indices, orientacion, permutacion, escala, desplazamiento):
+        """
+        Args:
+            tabla (torch.Tensor): Filas distintas (ver normalizar_previos), con la fila de relleno al final.
+            indices (torch.Tensor): Fila de cada previo, de forma (n_partidos, num_previos).
+            orientacion (torch.Tensor): Flags de intercambio, de la misma forma que indices.
+            permutacion, escala, desplazamiento (torch.Tensor): Intercambio de local y visitante.
+        """
+        self.tabla = tabla
+        self.indices = indices
+        self.orientacion = orientacion
+        self.permutacion = permutacion
+        self.escala = escala
+        self.desplazamiento = desplazamiento
+
+    @classmethod
+    def desde_almacen(cls, almacen, device='cpu'):
+        """
+        Args:
+            almacen (dict): Almacén de los previos de un jugador (ver previos_jugador).
+            device (torch.device): Dispositivo en el que dejar la tabla y los índices.
+        """
+        # torch se importa aquí para que normalizar el almacén (en el preprocesamiento) no lo necesite
+        import torch
+        permutacion, escala, desplazamiento = intercambio_columnas(almacen['columnas'], almacen['columnas_invertir'])
+        return cls(torch.as_tensor(almacen['tabla'], dtype=torch.float32).to(device),
+                   torch.as_tensor(almacen['indices'].astype(np.int64)).to(device),
+                   torch.as_tensor(almacen['orientacion']).to(device),
+                   torch.as_tensor(permutacion).to(device), torch.as_tensor(escala).to(device),
+                   torch.as_tensor(desplazamiento).to(device))
+
+    @property
+    def shape(self):
+        return (*self.indices.shape, self.tabla.shape[1])
+
+    @property
+    def device(self):
+        return self.tabla.device
+
+    def __len__(self):
+        return self.indices.shape[0]
+
+    def __getitem__(self, idx):
+        return reunir(self.tabla, self.indices[idx], self.orientacion[idx], self.permutacion, self.escala, self.desplazamiento)
+
+    def share_memory_(self):
+        for tensor in (self.tabla, self.indices, self.orientacion, self.permutacion, self.escala, self.desplazamiento):
+            tensor.share_memory_()
+        return self
@@ -0,0 +1,231 @@
+"""
+Backtest de apuestas con las predicciones walk-forward: ¿la probabilidad del modelo gana al mercado?
+
+De cada partido se toma la probabilidad de que gane el visitante según el modelo, la del mercado sin margen
+(probability_away), el margen (vigorish) y el resultado (winnerCode, 1 si gana el visitante). Las cuotas que se
+pagan son las del mercado con margen: 1 / (probabilidad * (1 + vigorish)). En cada partido se elige el lado con
+más ventaja (valor esperado por unidad apostada, p * cuota - 1) y se apuesta si supera el umbral.
+
+Todas las combinaciones de umbral de ventaja y estrategia (apuesta plana o fracciones de Kelly) se evalúan a la
+vez con arrays de forma (estrategias, umbrales, partidos): la banca de cada ventana sale de una suma acumulada
+por tramos (aditiva en la apuesta plana, de log-crecimientos en Kelly), y las apuestas, la ganancia, el ROI y el
+drawdown máximo por ventana de reducciones con reduceat, sin bucles de Python. Cada ventana empieza con banca 1
+y los partidos se liquidan en el orden en el que vienen.
+
+    predicciones = []
+    entrenar_walk_forward(..., predicciones=predicciones)
+    df = datos_backtest(tabla_predicciones(predicciones), cargar_mercado(tarea, ruta))
+    resultados = backtest(df['probabilidad'], df['probability_away'], df['vigorish'], df['winnerCode'], df['ventana'])
+    resumen_backtest(resultados)
+
+    python -m tenis.apuestas --predicciones resultados/predicciones_walk_forward_clasificacion.csv --tarea clasificacion
+"""
+import argparse
+
+import numpy as np
+import pandas as pd
+
+from tenis.entrenamiento import cargar_mercado
+
+UMBRALES = np.round(np.arange(0.0, 0.205, 0.01), 2)
+FRACCIONES_KELLY = (0.1, 0.25, 0.5, 1.0)
+# Apuesta plana: fracción de la banca inicial de la ventana en cada apuesta
+APUESTA_PLANA = 0.01
+# Pérdida máxima de una apuesta de Kelly, para que el log-crecimiento sea finito aunque la fracción sea 1
+PERDIDA_MAXIMA = 1 - 1e-12
+# Columnas de la salida de backtest
+COLUMNAS_BACKTEST = ['ventana', 'estrategia', 'umbral', 'apuestas', 'aciertos', 'apostado', 'ganancia', 'roi',
+                     'banca_final', 'max_drawdown']
+
+
+def cuotas(probabilidad_away, vigorish):
+    """
+    Args:
+        probabilidad_away (np.array): Probabilidad del mercado sin margen de que gane el visitante.
+        vigorish (np.array): Margen del mercado (suma de las probabilidades implícitas menos 1).
+    Returns:
+        tuple: Cuotas decimales del local y del visitante.
+    """
+    return 1 / ((1 - probabilidad_away) * (1 + vigorish)), 1 / (probabilidad_away * (1 + vigorish))
+
+
+def _acumulada_por_tramos(x, inicios):
+    """Suma acumulada en el último eje que vuelve a empezar en cada posición de inicios."""
+    acumulada = np.cumsum(x, axis=-1)
+    previa = np.concatenate((np.zeros(x.shape[:-1] + (1,)), acumulada[..., inicios[1:] - 1]), axis=-1)
+    return acumulada - np.repeat(previa, np.diff(np.append(inicios, x.shape[-1])), axis=-1)
+
+
+def _maximo_por_tramos(x, inicios):
+    """
+    Máximo acumulado en el último eje que vuelve a empezar en cada posición de inicios. A cada tramo se le suma
+    un desplazamiento mayor que el rango de x, así que un solo np.maximum.accumulate no mezcla tramos.
+    """
+    tramo = np.repeat(np.arange(len(inicios)), np.diff(np.append(inicios, x.shape[-1])))
+    desplazamiento = tramo * (np.nanmax(x) - np.nanmin(x) + 1)
+    return np.maximum.accumulate(x + desplazamiento, axis=-1) - desplazamiento
+
+
+def backtest(probabilidad, probabilidad_mercado, vigorish, gana_away, ventanas=None, umbrales=UMBRALES,
+             fracciones_kelly=FRACCIONES_KELLY, apuesta_plana=APUESTA_PLANA):
+    """
+    Evalúa de una vez todas las combinaciones de estrategia y umbral de ventaja en cada ventana.
+    Args:
+        probabilidad (array): Probabilidad del modelo de que gane el visitante.
+        probabilidad_mercado (array): Probabilidad del mercado sin margen de que gane el visitante
+            (probability_away). Los partidos sin ella no se apuestan.
+        vigorish (array): Margen del mercado de cada partido.
+        gana_away (array): 1 si ganó el visitante (winnerCode), 0 si ganó el local.
+        ventanas (array): Ventana de cada partido. Un partido puede estar en varias (las de test se solapan) con
+            una predicción distinta en cada una. None para tratar todos los partidos como una sola ventana.
+        umbrales (array): Ventajas mínimas (p * cuota - 1) para apostar.
+        fracciones_kelly (iterable): Fracciones del criterio de Kelly a evaluar.
+        apuesta_plana (float): Apuesta de la estrategia plana, en fracción de la banca inicial.
+    Returns:
+        pd.DataFrame: Una fila por estrategia ('plana', 'kelly_0.25'...), umbral y ventana, con el número de
+            apuestas y aciertos, lo apostado, la ganancia, el ROI (ganancia / apostado), la banca final y el
+            drawdown máximo (caída desde el máximo de la banca, en fracción).
+    """
+    probabilidad = np.asarray(probabilidad, dtype=np.float64)
+    probabilidad_mercado = np.asarray(probabilidad_mercado, dtype=np.float64)
+    vigorish = np.asarray(vigorish, dtype=np.float64)
+    gana_away = np.asarray(gana_away, dtype=np.float64)
+    ventanas = np.zeros(len(probabilidad), dtype=np.int64) if ventanas is None else np.asarray(ventanas)
+    umbrales = np.asarray(umbrales, dtype=np.float64)
+    fracciones_kelly = np.asarray(fracciones_kelly, dtype=np.float64)
+    if len(probabilidad) == 0:
+        # Sin predicciones (por ejemplo, tabla_predicciones([])) no hay ventanas que evaluar
+        return pd.DataFrame(columns=COLUMNAS_BACKTEST)
+
+    # Partidos de cada ventana seguidos, en su orden original
+    orden = np.argsort(ventanas, kind='stable')
+    probabilidad, probabilidad_mercado, vigorish, gana_away, ventanas = (
+        probabilidad[orden], probabilidad_mercado[orden], vigorish[orden], gana_away[orden], ventanas[orden])
+    nombres_ventanas, inicios = np.unique(ventanas, return_index=True)
+
+    # Lado con más ventaja de cada partido
+    with np.errstate(divide='ignore', invalid='ignore'):
+        cuota_home, cuota_away = cuotas(probabilidad_mercado, vigorish)
+    ventaja_home = (1 - probabilidad) * cuota_home - 1
+    ventaja_away = probabilidad * cuota_away - 1
+    apuesta_away = ventaja_away >= ventaja_home
+    ventaja = np.where(apuesta_away, ventaja_away, ventaja_home)
+    cuota = np.where(apuesta_away, cuota_away, cuota_home)
+    acierto = apuesta_away == (gana_away == 1)
+    validos = np.isfinite(ventaja) & np.isfinite(cuota) & (cuota > 1) & np.isfinite(gana_away)
+    # Ganancia por unidad apostada y fracción de Kelly completa, ventaja / (cuota - 1)
+    retorno = np.where(validos, np.where(acierto, cuota - 1, -1.0), 0.0)
+    kelly = np.where(validos, np.clip(ventaja / np.where(validos, cuota - 1, 1), 0, 1), 0.0)
+
+    # (umbrales, partidos)
+    apuesta = validos & (ventaja > umbrales[:, None])
+
+    # Apuesta plana: la banca cambia en apuesta_plana * retorno en cada apuesta
+    apostado_plana = apuesta_plana * apuesta
+    banca_plana = 1 + _acumulada_por_tramos(apostado_plana * retorno, inicios)
+
+    # Kelly: se apuesta fraccion * kelly de la banca, así que la banca es el producto de (1 + fracción * retorno)
+    fraccion = fracciones_kelly[:, None, None] * kelly * apuesta
+    crecimiento = np.log1p(np.maximum(fraccion * retorno, -PERDIDA_MAXIMA))
+    log_banca = _acumulada_por_tramos(crecimiento, inicios)
+    banca_kelly = np.exp(log_banca)
+    apostado_kelly = fraccion * np.exp(log_banca - crecimiento)
+
+    # Drawdown: caída desde el máximo de la banca, que incluye la banca inicial (1). En Kelly se calcula con el
+    # logaritmo de la banca, que crece mucho menos que la banca
+    maximo_plana = np.maximum(_maximo_por_tramos(banca_plana, inicios), 1)
+    maximo_kelly = np.maximum(_maximo_por_tramos(log_banca, inicios), 0)
+    drawdown = np.concatenate(((1 - banca_plana / maximo_plana)[None], 1 - np.exp(log_banca - maximo_kelly)))
+
+    # (estrategias, umbrales, partidos)
+    banca = np.concatenate((banca_plana[None], banca_kelly))
+    apostado = np.concatenate((apostado_plana[None], apostado_kelly))
+    apuestas = np.broadcast_to(apuesta, banca.shape)
+    finales = np.append(inicios[1:], banca.shape[-1]) - 1
+
+    n_apuestas = np.add.reduceat(apuestas, inicios, axis=-1, dtype=np.int64)
+    total_apostado = np.add.reduceat(apostado, inicios, axis=-1)
+    ganancia = banca[..., finales] - 1
+    with np.errstate(divide='ignore', invalid='ignore'):
+        roi = np.where(n_apuestas > 0, ganancia / total_apostado, np.nan)
+    metricas = {
+        'apuestas': n_apuestas,
+        'aciertos': np.add.reduceat(apuestas & acierto, inicios, axis=-1, dtype=np.int64),
+        'apostado': total_apostado,
+        'ganancia': ganancia,
+        'roi': roi,
+        'banca_final': banca[..., finales],
+        'max_drawdown': np.maximum.reduceat(drawdown, inicios, axis=-1),
+    }
+
+    estrategias = ['plana'] + [f'kelly_{f:g}' for f in fracciones_kelly]
+    forma = banca.shape[:2] + (len(inicios),)
+    indice = {
+        'ventana': np.broadcast_to(nombres_ventanas, forma).ravel(),
+        'estrategia': np.broadcast_to(np.array(estrategias)[:, None, None], forma).ravel(),
+        'umbral': np.broadcast_to(umbrales[None, :, None], forma).ravel(),
+    }
+    return pd.DataFrame({**indice, **{nombre: valor.ravel() for nombre, valor in metricas.items()}}, columns=COLUMNAS_BACKTEST)
+
+
+def resumen_backtest(resultados):
+    """
+    Resume el backtest de todas las ventanas por estrategia y umbral.
+    Args:
+        resultados (pd.DataFrame): Salida de backtest.
+    Returns:
+        pd.DataFrame: Apuestas, aciertos, apostado y ganancia totales, ROI global, ganancia media por ventana,
+            porcentaje de ventanas con ganancia y drawdown máximo medio y peor.
+    """
+    grupos = resultados.groupby(['estrategia', 'umbral'])
+    resumen = grupos.agg(apuestas=('apuestas', 'sum'), aciertos=('aciertos', 'sum'), apostado=('apostado', 'sum'),
+                         ganancia=('ganancia', 'sum'), ganancia_media=('ganancia', 'mean'),
+                         max_drawdown_medio=('max_drawdown', 'mean'), max_drawdown=('max_drawdown', 'max'))
+    resumen['roi'] = resumen['ganancia'] / resumen['apostado'].where(resumen['apostado'] > 0)
+    resumen['ventanas_ganadoras'] = grupos['ganancia'].apply(lambda ganancia: (ganancia > 0).mean())
+    resumen['acierto'] = resumen['aciertos'] / resumen['apuestas'].where(resumen['apuestas'] > 0)
+    return resumen.reset_index()
+
+
+def datos_backtest(predicciones, mercado, cabeza=None):
+    """
+    Cruza las predicciones walk-forward con las probabilidades del mercado y el resultado de cada partido.
+    Args:
+        predicciones (pd.DataFrame): Predicciones por ventana (ver tenis.entrenamiento.tabla_predicciones).
+        mercado (pd.DataFrame): Salida de tenis.entrenamiento.cargar_mercado para la misma tarea.
+        cabeza (str): Cabeza cuya predicción se usa como probabilidad de que gane el visitante. Por defecto,
+            'clasificacion' si está y si no 'regresion'.
+    Returns:
+        pd.DataFrame: predicciones con 'probabilidad' y las columnas de mercado.
+    """
+    if cabeza is None:
+        cabeza = 'clasificacion' if 'prediccion_clasificacion' in predicciones.columns else 'regresion'
+    df = predicciones.join(mercado, on='indice_dataset')
+    if df.empty and f'prediccion_{cabeza}' not in df.columns:
+        # Sin predicciones (tabla_predicciones([])) tampoco hay columnas de predicción
+        df['probabilidad'] = pd.Series(dtype=np.float64)
+    else:
+        df['probabilidad'] = df[f'prediccion_{cabeza}']
+    return df
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Backtest de apuestas con las predicciones walk-forward')
+    parser.add_argument('--predicciones', required=True, help='CSV de predicciones por ventana (python -m tenis train)')
+    parser.add_argument('--tarea', default='clasificacion', choices=['regresion', 'clasificacion', 'multitarea'])
+    parser.add_argument('--datos', default='../data')
+    parser.add_argument('--cabeza', default=None, choices=['regresion', 'clasificacion'])
+    parser.add_argument('--umbrales', type=float, nargs='+', default=None)
+    parser.add_argument('--kelly', type=float, nargs='+', default=list(FRACCIONES_KELLY), help='Fracciones de Kelly')
+    parser.add_argument('--apuesta-plana', type=float, default=APUESTA_PLANA)
+    parser.add_argument('--salida', default=None, help='CSV con los resultados por ventana, estrategia y umbral')
+    args = parser.parse_args()
+
+    df = datos_backtest(pd.read_csv(args.predicciones), cargar_mercado(args.tarea, args.datos), args.cabeza)
+    resultados = backtest(df['probabilidad'], df['probability_away'], df['vigorish'], df['winnerCode'], df['ventana'],
+                          umbrales=UMBRALES if args.umbrales is None else args.umbrales,
+                          fracciones_kelly=args.kelly, apuesta_plana=args.apuesta_plana)
+    print(resumen_backtest(resultados).to_string(index=False))
+    if args.salida is not None:
+        resultados.to_csv(args.salida, index=False)
+        print(f'Resultados guardados en {args.salida}')
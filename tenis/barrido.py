@@ -0,0 +1,288 @@
+import argparse
+import itertools
+import json
+import os
+import random
+import time
+
+import numpy as np
+import pandas as pd
+import torch
+import torch.multiprocessing as mp
+from concurrent.futures import ProcessPoolExecutor
+
+from tenis.checkpoints import ventanas_guardadas
+from tenis.entrenamiento import TAREAS, cargar_datos, entrenar_ventanas, preparar_tensores
+from tenis.resultados import AlmacenResultados, resumen_por_ventana
+
+# Parámetros que definen las ventanas: tienen que ser iguales en todos los trials para que la ventana k sea la misma
+PARAMETROS_VENTANAS = ('training_weeks', 'testing_weeks', 'step_size')
+
+# Tensores del dataset en cada proceso del barrido (en memoria compartida, de solo lectura)
+_DATOS = None
+
+
+def generar_configuraciones(espacio, estrategia='grid', n_trials=20, semilla=0):
+    """
+    Genera las configuraciones de hiperparámetros a probar.
+    Args:
+        espacio (dict): Para cada parámetro, una lista de valores o, solo en 'random' y 'halving', un rango a muestrear:
+            {'uniforme': [min, max]}, {'log': [min, max]} (escala logarítmica) o {'entero': [min, max]}.
+        estrategia (str): 'grid' (producto cartesiano de las listas), 'random' o 'halving' (muestreo aleatorio).
+        n_trials (int): Número de configuraciones a muestrear en 'random' y 'halving'.
+        semilla (int): Semilla del muestreo.
+    Returns:
+        list: Lista de diccionarios con los parámetros de cada configuración.
+    """
+    if estrategia == 'grid':
+        if any(not isinstance(valores, list) for valores in espacio.values()):
+            raise ValueError("En la búsqueda en rejilla todos los parámetros tienen que ser listas de valores")
+        claves = list(espacio)
+        return [dict(zip(claves, valores)) for valores in itertools.product(*espacio.values())]
+
+    rng = random.Random(semilla)
+    configuraciones = []
+    for _ in range(n_trials):
+        config = {}
+        for clave, valores in espacio.items():
+            if isinstance(valores, list):
+                config[clave] = rng.choice(valores)
+            elif 'log' in valores:
+                minimo, maximo = valores['log']
+                config[clave] = float(np.exp(rng.uniform(np.log(minimo), np.log(maximo))))
+            elif 'entero' in valores:
+                config[clave] = rng.randint(*valores['entero'])
+            else:
+                config[clave] = rng.uniform(*valores['uniforme'])
+        configuraciones.append(config)
+    return configuraciones
+
+
+def calcular_rondas(estrategia, total_ventanas, ventanas_poda=None, fraccion_supervivientes=0.5, min_ventanas=10, eta=3):
+    """
+    Calcula en qué ventanas se para a comparar los trials y qué fracción sigue adelante.
+    Args:
+        estrategia (str): 'grid', 'random' o 'halving'.
+        total_ventanas (int): Número total de ventanas de la evaluación.
+        ventanas_poda (int): En 'grid' y 'random', ventana tras la que se podan los peores trials. None para no podar.
+        fraccion_supervivientes (float): En 'grid' y 'random', fracción de trials que siguen tras la poda.
+        min_ventanas (int): En 'halving', ventanas de la primera ronda.
+        eta (int): En 'halving', factor de crecimiento de las ventanas y de reducción de los trials en cada ronda.
+    Returns:
+        list: Tuplas (hasta_ventana, fraccion_supervivientes). La última ronda siempre llega al final.
+    """
+    if estrategia == 'halving':
+        rondas = []
+        ventanas = min_ventanas
+        while ventanas < total_ventanas:
+            rondas.append((ventanas, 1 / eta))
+            ventanas *= eta
+        return rondas + [(None, 1.0)]
+    if ventanas_poda is not None and ventanas_poda < total_ventanas:
+        return [(ventanas_poda, fraccion_supervivientes), (None, 1.0)]
+    return [(None, 1.0)]
+
+
+def _inicializar_proceso(datos, hilos):
+    global _DATOS
+    _DATOS = datos
+    # Cada proceso usa pocos hilos para no saturar la CPU entre todos los trials
+    torch.set_num_threads(hilos)
+
+
+def _huella_datos(datos):
+    """Resumen del dataset (tamaño y semanas) para reconocer si un trial se entrenó con otros datos."""
+    semanas = pd.unique(datos['year_week_id'])
+    return {'forma_actual': list(datos['actual'].shape), 'semanas': len(semanas),
+            'primera_semana': str(semanas[0]), 'ultima_semana': str(semanas[-1])}
+
+
+def _preparar_directorio_trial(directorio_trial, configuracion):
+    """
+    Guarda la configuración del trial en su carpeta, o comprueba que coincide con la de los checkpoints que ya
+    haya, para no continuar un trial con los pesos de otra configuración.
+    Args:
+        directorio_trial (str): Carpeta de checkpoints del trial.
+        configuracion (dict): Parámetros, tarea, semilla y huella de los datos del trial.
+    Raises:
+        ValueError: Si la carpeta tiene checkpoints de otra configuración (o sin configuración guardada).
+    """
+    ruta = os.path.join(directorio_trial, 'configuracion.json')
+    # Ida y vuelta por JSON para comparar con lo que se lee del fichero (tuplas como listas, etc.)
+    configuracion = json.loads(json.dumps(configuracion, default=str, sort_keys=True))
+    if ventanas_guardadas(directorio_trial):
+        guardada = None
+        if os.path.exists(ruta):
+            with open(ruta, encoding='utf-8') as f:
+                guardada = json.load(f)
+        if guardada != configuracion:
+            raise ValueError(f"{directorio_trial} tiene checkpoints de otra configuración: usa otro directorio del barrido o bórralo")
+        return
+    os.makedirs(directorio_trial, exist_ok=True)
+    with open(ruta, 'w', encoding='utf-8') as f:
+        json.dump(configuracion, f, indent=2, sort_keys=True)
+
+
+def _ejecutar_trial(trial, params, tarea, hasta_ventana, directorio, semilla):
+    """Entrena (o continúa entrenando) un trial hasta la ventana indicada, reanudando desde sus checkpoints."""
+    directorio_trial = os.path.join(directorio, f'trial_{trial:03d}')
+    guardadas = ventanas_guardadas(directorio_trial)
+    reanudar_desde = guardadas[-1] + 1 if guardadas else None
+    if reanudar_desde is None:
+        torch.manual_seed(semilla + trial)
+
+    inicio = time.perf_counter()
+    _, df, _ = entrenar_ventanas(_DATOS, tarea=tarea, directorio_checkpoints=directorio_trial,
+                                 reanudar_desde=reanudar_desde, hasta_ventana=hasta_ventana, verbose=False, **params)
+    return trial, resumen_por_ventana(df), time.perf_counter() - inicio
+
+
+def ejecutar_barrido(datos, espacio, tarea='regresion', estrategia='grid', n_trials=20, fijos=None,
+                     metrica='ValidationLoss', maximizar=False, ventanas_poda=None, fraccion_supervivientes=0.5,
+                     min_ventanas=10, eta=3, n_procesos=None, hilos_por_trial=1, directorio='barridos/barrido', semilla=0,
+                     almacen_resultados=None):
+    """
+    Ejecuta un barrido de hiperparámetros sobre la evaluación por ventanas temporales. Los trials se
+    reparten entre varios procesos que comparten una única copia de los tensores del dataset. Los trials
+    avanzan por rondas: al terminar cada ronda se comparan con la media de la métrica en las ventanas
+    comunes y solo los mejores continúan (desde su checkpoint) hasta la siguiente.
+    Si el directorio ya tiene un barrido, cada trial se reanuda desde sus checkpoints solo si su configuración
+    (parámetros, tarea, semilla y datos) es la misma; si no, se lanza un error en lugar de mezclar resultados.
+    Args:
+        datos (dict): Tensores del dataset (ver preparar_tensores), en CPU.
+        espacio (dict): Espacio de búsqueda (ver generar_configuraciones). No puede incluir los parámetros de las
+            ventanas (training_weeks, testing_weeks, step_size), que van en fijos.
+        tarea (str): 'regresion' o 'clasificacion'.
+        estrategia (str): 'grid', 'random' o 'halving'.
+        n_trials (int): Número de configuraciones en 'random' y 'halving'.
+        fijos (dict): Parámetros de entrenar_ventanas comunes a todos los trials (por ejemplo epochs).
+        metrica (str): Columna de resultados con la que se comparan los trials.
+        maximizar (bool): Si es True, la métrica es mejor cuanto mayor (AUC, R2...).
+        ventanas_poda (int): En 'grid' y 'random', ventana tras la que se podan los peores trials.
+        fraccion_supervivientes (float): En 'grid' y 'random', fracción de trials que siguen tras la poda.
+        min_ventanas (int): En 'halving', ventanas de la primera ronda.
+        eta (int): En 'halving', factor de reducción de trials en cada ronda.
+        n_procesos (int): Número de procesos. Por defecto, tantos como núcleos entre hilos_por_trial.
+        hilos_por_trial (int): Hilos de torch de cada proceso.
+        directorio (str): Carpeta donde se guardan los checkpoints de cada trial y las tablas de resultados.
+        semilla (int): Semilla del muestreo y de la inicialización de los modelos.
+        almacen_resultados (str): Base de datos de resultados (ver tenis/resultados.py) en la que se registra
+            cada trial como una ejecución. None para no registrarlos.
+    Returns:
+        tuple: Tabla resumen (una fila por trial) y tabla con las métricas finales de cada trial y ventana.
+    """
+    if tarea not in TAREAS:
+        raise ValueError(f"El barrido compara trials con una sola métrica, la tarea tiene que ser una de {list(TAREAS)}")
+    fijos = fijos or {}
+    barridos = [clave for clave in PARAMETROS_VENTANAS if clave in espacio]
+    if barridos:
+        raise ValueError(f"Los parámetros de las ventanas {barridos} no se pueden barrer: los trials se comparan ventana a ventana, "
+                         "fíjalos en fijos")
+    configuraciones = generar_configuraciones(espacio, estrategia, n_trials, semilla)
+    if n_procesos is None:
+        n_procesos = max(1, (os.cpu_count() or 1) // hilos_por_trial)
+    os.makedirs(directorio, exist_ok=True)
+
+    # Las rondas se calculan con las ventanas fijas del barrido (o las de por defecto), las mismas en todos los trials
+    semanas_ventana = fijos.get('training_weeks', 10) + fijos.get('testing_weeks', 3)
+    total_ventanas = len(range(0, len(pd.unique(datos['year_week_id'])) - semanas_ventana + 1, fijos.get('step_size', 1)))
+    rondas = calcular_rondas(estrategia, total_ventanas, ventanas_poda, fraccion_supervivientes, min_ventanas, eta)
+
+    huella = _huella_datos(datos)
+    for trial, config in enumerate(configuraciones):
+        _preparar_directorio_trial(os.path.join(directorio, f'trial_{trial:03d}'),
+                                   {'params': {**fijos, **config}, 'tarea': tarea, 'semilla': semilla + trial, 'datos': huella})
+
+    for tensor in datos.values():
+        # Los previos del almacén normalizado (PreviosIndexados) también se pueden compartir
+        if hasattr(tensor, 'share_memory_'):
+            tensor.share_memory_()
+
+    activos = list(range(len(configuraciones)))
+    resultados = {}
+    tiempos = {trial: 0.0 for trial in activos}
+    estado = {trial: 'completo' for trial in activos}
+    primera_ronda = rondas[0][0]
+
+    contexto = mp.get_context('spawn')
+    with ProcessPoolExecutor(max_workers=n_procesos, mp_context=contexto, initializer=_inicializar_proceso,
+                             initargs=(datos, hilos_por_trial)) as executor:
+        for numero_ronda, (hasta_ventana, fraccion) in enumerate(rondas, start=1):
+            print(f"Ronda {numero_ronda} de {len(rondas)}: {len(activos)} trials hasta la ventana {hasta_ventana or 'final'}")
+            futuros = [executor.submit(_ejecutar_trial, trial, {**fijos, **configuraciones[trial]}, tarea,
+                                       hasta_ventana, directorio, semilla) for trial in activos]
+            for futuro in futuros:
+                trial, df_ventanas, segundos = futuro.result()
+                resultados[trial] = df_ventanas
+                tiempos[trial] += segundos
+
+            if fraccion >= 1.0 or len(activos) <= 1:
+                continue
+            puntuaciones = {trial: _puntuacion(resultados[trial], metrica, hasta_ventana) for trial in activos}
+            ordenados = sorted(activos, key=lambda t: puntuaciones[t], reverse=maximizar)
+            n_siguen = max(1, int(round(len(activos) * fraccion)))
+            for trial in ordenados[n_siguen:]:
+                estado[trial] = f'podado en la ventana {hasta_ventana}'
+            activos = ordenados[:n_siguen]
+            print(f"Siguen los trials {sorted(activos)}")
+
+    df_ventanas = pd.concat([df.assign(trial=trial) for trial, df in resultados.items()], ignore_index=True)
+    columnas_metricas = ['TrainingLoss', 'ValidationLoss'] + list(TAREAS[tarea]['columnas'])
+
+    filas = []
+    for trial, config in enumerate(configuraciones):
+        df = resultados[trial]
+        fila = {'trial': trial, **config, 'estado': estado[trial], 'ventanas': len(df), 'tiempo_s': round(tiempos[trial], 1)}
+        # Métrica en las ventanas de la primera ronda, que todos los trials han entrenado: comparable entre todos
+        fila[f'{metrica}_primera_ronda'] = _puntuacion(df, metrica, primera_ronda)
+        for columna in columnas_metricas:
+            fila[columna] = df[columna].mean()
+        filas.append(fila)
+    df_resumen = pd.DataFrame(filas).sort_values(f'{metrica}_primera_ronda', ascending=not maximizar)
+
+    if almacen_resultados is not None:
+        almacen = AlmacenResultados(almacen_resultados)
+        for trial, config in enumerate(configuraciones):
+            ejecucion = almacen.nueva_ejecucion(tarea, {**fijos, **config}, nombre=f'{os.path.basename(directorio)}/trial_{trial:03d}')
+            almacen.registrar_ventanas(ejecucion.id, tarea, resultados[trial])
+        almacen.cerrar()
+
+    df_resumen.to_csv(os.path.join(directorio, 'resultados.csv'), index=False)
+    df_ventanas.to_csv(os.path.join(directorio, 'ventanas.csv'), index=False)
+    return df_resumen, df_ventanas
+
+
+def _puntuacion(df_ventanas, metrica, hasta_ventana):
+    """Media de la métrica en las ventanas hasta hasta_ventana (todas si es None)."""
+    if hasta_ventana is not None:
+        df_ventanas = df_ventanas[df_ventanas['Window'] <= hasta_ventana]
+    return df_ventanas[metrica].mean()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Barrido de hiperparámetros sobre la evaluación por ventanas temporales')
+    parser.add_argument('espacio', help='JSON con el espacio de búsqueda, por ejemplo {"hidden_size": [64, 128], "lr": {"log": [0.0001, 0.01]}}')
+    parser.add_argument('--tarea', default='regresion', choices=list(TAREAS))
+    parser.add_argument('--estrategia', default='halving', choices=['grid', 'random', 'halving'])
+    parser.add_argument('--trials', type=int, default=27)
+    parser.add_argument('--metrica', default='ValidationLoss')
+    parser.add_argument('--maximizar', action='store_true')
+    parser.add_argument('--ventanas-poda', type=int, default=None)
+    parser.add_argument('--procesos', type=int, default=None)
+    parser.add_argument('--hilos', type=int, default=1)
+    parser.add_argument('--datos', default='../data')
+    parser.add_argument('--normalizado', action='store_true', help='Leer los previos de previos_normalizado.npz')
+    parser.add_argument('--directorio', default='barridos/barrido')
+    parser.add_argument('--almacen', default=None, help='Base de datos de resultados en la que registrar los trials')
+    args = parser.parse_args()
+
+    with open(args.espacio, encoding='utf-8') as f:
+        espacio = json.load(f)
+
+    actual_diferencias, previos_home, previos_away = cargar_datos(args.tarea, args.datos, normalizado=args.normalizado)
+    datos = preparar_tensores(actual_diferencias, previos_home, previos_away, TAREAS[args.tarea]['objetivo'])
+    df_resumen, _ = ejecutar_barrido(datos, espacio, tarea=args.tarea, estrategia=args.estrategia, n_trials=args.trials,
+                                     metrica=args.metrica, maximizar=args.maximizar, ventanas_poda=args.ventanas_poda,
+                                     n_procesos=args.procesos, hilos_por_trial=args.hilos, directorio=args.directorio,
+                                     almacen_resultados=args.almacen)
+    print(df_resumen.to_string(index=False))
@@ -0,0 +1,241 @@
+"""
+Benchmark de las etapas del scraper y del entrenamiento con datos sintéticos (ver tenis/sintetico.py).
+
+Cada etapa se ejecuta varias veces y se guarda el tiempo mínimo y la mediana en un JSON. Si se indica un
+JSON de referencia, se compara etapa a etapa y el programa termina con código 1 cuando alguna es más lenta
+que la referencia por encima del umbral:
+
+    python -m tenis.benchmark --escala pequena --guardar-base        # guarda la referencia
+    python -m tenis.benchmark --escala pequena --umbral 0.2          # compara con ella
+"""
+import argparse
+import contextlib
+import importlib.util
+import io
+import json
+import os
+import platform
+import statistics
+import sys
+import tempfile
+import time
+
+import numpy as np
+import pandas as pd
+import torch
+
+from tenis.entrenamiento import preparar_tensores
+from tenis.modelo import TennisRNN
+from tenis import sintetico
+
+# Tamaños de los datos sintéticos de cada escala
+ESCALAS = {
+    'pequena': {'jugadores': 200, 'fechas': 100, 'actuales': 20, 'consultas': 50, 'preprocesado': 1000},
+    'media': {'jugadores': 1000, 'fechas': 250, 'actuales': 100, 'consultas': 200, 'preprocesado': 5000},
+    'grande': {'jugadores': 3000, 'fechas': 260, 'actuales': 400, 'consultas': 500, 'preprocesado': 20000},
+}
+RUTA_SCRAPPER = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), '2.scrapper.py')
+
+
+def cargar_scrapper(ruta=RUTA_SCRAPPER):
+    """
+    Importa 2.scrapper.py como módulo (el nombre empieza por un número, así que no se puede importar directamente).
+    Returns:
+        module: Módulo del scraper, sin ejecutar main.
+    """
+    spec = importlib.util.spec_from_file_location('scrapper', ruta)
+    modulo = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(modulo)
+    return modulo
+
+
+def medir(funcion, preparar=None, repeticiones=5):
+    """
+    Mide el tiempo de una función. La salida por pantalla de la función se descarta.
+    Args:
+        funcion (callable): Función a medir.
+        preparar (callable): Función que devuelve los argumentos de cada repetición; su tiempo no cuenta.
+        repeticiones (int): Número de ejecuciones.
+    Returns:
+        dict: Tiempo mínimo, mediana y número de repeticiones, en segundos.
+    """
+    tiempos = []
+    for _ in range(repeticiones):
+        argumentos = preparar() if preparar is not None else ()
+        with contextlib.redirect_stdout(io.StringIO()):
+            inicio = time.perf_counter()
+            funcion(*argumentos)
+            tiempos.append(time.perf_counter() - inicio)
+    return {'segundos_min': min(tiempos), 'segundos_mediana': statistics.median(tiempos), 'repeticiones': repeticiones}
+
+
+def etapas_scrapper(scrapper, escala, semilla=0):
+    """
+    Prepara las etapas del scraper con datos sintéticos.
+    Args:
+        scrapper (module): Módulo del scraper (ver cargar_scrapper).
+        escala (dict): Tamaños de los datos (ver ESCALAS).
+        semilla (int): Semilla de los datos sintéticos.
+    Returns:
+        dict: Para cada etapa, una tupla (funcion, preparar).
+    """
+    ranking = sintetico.generar_ranking(escala['jugadores'], escala['fechas'], semilla=semilla)
+    jugadores = sintetico.generar_jugadores(ranking, semilla=semilla)
+    # Igual que en instanciar_variables_globales
+    ranking['player'] = [scrapper.preprocess_name(nombre) for nombre in ranking['player']]
+    actual, previos = sintetico.generar_partidos(jugadores, escala['actuales'], semilla=semilla)
+    carpeta = tempfile.mkdtemp(prefix='benchmark_')
+
+    rng = np.random.default_rng(semilla)
+    fechas = ranking.columns[3:].astype(int)
+    consultas = list(zip(rng.choice(jugadores['id'].values, escala['consultas']),
+                         rng.integers(fechas[0], fechas[-1] + sintetico.SEMANA, escala['consultas'])))
+
+    def preparar_get_player():
+        # get_player modifica el ranking (renombra los jugadores emparejados), así que se parte de una copia
+        scrapper.ranking = ranking.copy()
+        scrapper.players = jugadores.copy()
+        scrapper.ruta = carpeta
+        return ()
+
+    def get_player():
+        for id_jugador, timestamp in consultas:
+            scrapper.get_player(int(id_jugador), int(timestamp))
+
+    return {
+        'get_player': (get_player, preparar_get_player),
+        'reorganizar_partidos': (scrapper.reorganizar_partidos, lambda: (actual, previos)),
+        'impute_player_data': (scrapper.impute_player_data, lambda: (previos,)),
+        'invertir_bloques': (scrapper.invertir_bloques, lambda: (previos,)),
+        'ordenar_por_timestamp': (scrapper.ordenar_por_timestamp, lambda: (actual, previos)),
+    }
+
+
+def etapas_entrenamiento(escala, hidden_size=128, num_layers=2, semilla=0):
+    """
+    Prepara una época de entrenamiento de TennisRNN (forward, backward y paso del optimizador sobre el 80% de
+    los partidos y evaluación sobre el 20% restante), igual que en entrenar_ventanas.
+    Args:
+        escala (dict): Tamaños de los datos (ver ESCALAS).
+        hidden_size, num_layers: Hiperparámetros del modelo.
+        semilla (int): Semilla de los datos sintéticos y del modelo.
+    Returns:
+        dict: Para cada etapa, una tupla (funcion, preparar).
+    """
+    actual_diferencias, previos_home, previos_away = sintetico.generar_preprocesado(escala['preprocesado'], semilla=semilla)
+    datos = preparar_tensores(actual_diferencias, previos_home, previos_away, 'probability_away')
+    corte = int(0.8 * datos['actual'].shape[0])
+
+    torch.manual_seed(semilla)
+    model = TennisRNN(datos['actual'].shape[1], datos['home'].shape[2], hidden_size, num_layers, 1, 0.2)
+    optimizer = torch.optim.Adam(model.parameters(), lr=0.001)
+    criterion = torch.nn.MSELoss()
+
+    def epoca():
+        model.train()
+        y_pred = model(datos['actual'][:corte], datos['home'][:corte], datos['away'][:corte])
+        loss = criterion(y_pred, datos['y'][:corte])
+        optimizer.zero_grad()
+        loss.backward()
+        optimizer.step()
+        model.eval()
+        with torch.no_grad():
+            criterion(model(datos['actual'][corte:], datos['home'][corte:], datos['away'][corte:]), datos['y'][corte:]).item()
+
+    return {'epoca_tennisrnn': (epoca, None)}
+
+
+def ejecutar_benchmark(nombre_escala='pequena', etapas=None, repeticiones=5, semilla=0):
+    """
+    Ejecuta el benchmark de las etapas indicadas.
+    Args:
+        nombre_escala (str): Clave de ESCALAS.
+        etapas (list): Etapas a medir. None para todas.
+        repeticiones (int): Ejecuciones de cada etapa.
+        semilla (int): Semilla de los datos sintéticos.
+    Returns:
+        dict: Resultados con la escala, el entorno y los tiempos de cada etapa.
+    """
+    escala = ESCALAS[nombre_escala]
+    disponibles = {}
+    disponibles.update(etapas_scrapper(cargar_scrapper(), escala, semilla))
+    disponibles.update(etapas_entrenamiento(escala, semilla=semilla))
+    if etapas is None:
+        etapas = list(disponibles)
+
+    resultados = {
+        'escala': nombre_escala,
+        'tamanos': escala,
+        'entorno': {'python': platform.python_version(), 'torch': torch.__version__, 'pandas': pd.__version__,
+                    'cpus': os.cpu_count(), 'hilos_torch': torch.get_num_threads()},
+        'etapas': {},
+    }
+    for etapa in etapas:
+        if etapa not in disponibles:
+            raise ValueError(f"Etapa desconocida: {etapa}. Opciones: {list(disponibles)}")
+        funcion, preparar = disponibles[etapa]
+        print(f'Midiendo {etapa}')
+        resultados['etapas'][etapa] = medir(funcion, preparar, repeticiones)
+        print(f"  {resultados['etapas'][etapa]['segundos_min']:.4f} s")
+    return resultados
+
+
+def comparar_con_base(resultados, base, umbral=0.2):
+    """
+    Compara los tiempos mínimos de cada etapa con los de la referencia.
+    Args:
+        resultados (dict): Resultados de ejecutar_benchmark.
+        base (dict): Resultados de referencia (misma estructura).
+        umbral (float): Empeoramiento relativo permitido (0.2 = un 20% más lento).
+    Returns:
+        pd.DataFrame: Una fila por etapa con los tiempos, el cociente y si es una regresión.
+    """
+    if base.get('escala') != resultados['escala']:
+        raise ValueError(f"La referencia es de la escala {base.get('escala')} y los resultados de {resultados['escala']}")
+    filas = []
+    for etapa, medida in resultados['etapas'].items():
+        if etapa not in base['etapas']:
+            continue
+        referencia = base['etapas'][etapa]['segundos_min']
+        cociente = medida['segundos_min'] / referencia
+        filas.append({'etapa': etapa, 'base': referencia, 'actual': medida['segundos_min'],
+                      'cociente': cociente, 'regresion': cociente > 1 + umbral})
+    return pd.DataFrame(filas, columns=['etapa', 'base', 'actual', 'cociente', 'regresion'])
+
+
+def _escribir_json(datos, ruta):
+    carpeta = os.path.dirname(ruta)
+    if carpeta:
+        os.makedirs(carpeta, exist_ok=True)
+    with open(ruta, 'w', encoding='utf-8') as f:
+        json.dump(datos, f, indent=2)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Benchmark de las etapas del scraper y del entrenamiento con datos sintéticos')
+    parser.add_argument('--escala', default='pequena', choices=list(ESCALAS))
+    parser.add_argument('--etapas', nargs='+', default=None)
+    parser.add_argument('--repeticiones', type=int, default=5)
+    parser.add_argument('--umbral', type=float, default=0.2, help='Empeoramiento relativo permitido respecto a la referencia')
+    parser.add_argument('--salida', default='benchmarks/ultimo.json')
+    parser.add_argument('--base', default=None, help='JSON de referencia. Por defecto benchmarks/base_<escala>.json')
+    parser.add_argument('--guardar-base', action='store_true', help='Guarda los resultados como nueva referencia')
+    args = parser.parse_args()
+
+    resultados = ejecutar_benchmark(args.escala, args.etapas, args.repeticiones)
+    _escribir_json(resultados, args.salida)
+    ruta_base = args.base or f'benchmarks/base_{args.escala}.json'
+
+    if args.guardar_base:
+        _escribir_json(resultados, ruta_base)
+        print(f'Referencia guardada en {ruta_base}')
+    elif os.path.exists(ruta_base):
+        with open(ruta_base, encoding='utf-8') as f:
+            base = json.load(f)
+        df_comparacion = comparar_con_base(resultados, base, args.umbral)
+        print(df_comparacion.to_string(index=False))
+        if df_comparacion['regresion'].any():
+            print(f"Regresión de rendimiento en: {', '.join(df_comparacion.loc[df_comparacion['regresion'], 'etapa'])}")
+            sys.exit(1)
+    else:
+        print(f'No hay referencia en {ruta_base}; se puede crear con --guardar-base')
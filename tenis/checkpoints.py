@@ -0,0 +1,223 @@
+import copy
+import glob
+import os
+import re
+from concurrent.futures import ThreadPoolExecutor
+
+import torch
+
+
+class GestorCheckpoints:
+    """
+    Gestiona los estados del modelo durante el entrenamiento por ventanas.
+
+    Los pesos del mejor modelo de la ventana y los del modelo con el que se arranca la siguiente ventana
+    (warm-start) se guardan en buffers reservados una sola vez y se actualizan con copy_, en lugar de
+    hacer copy.deepcopy del state_dict en cada mejora. Si se indica un directorio, al terminar cada
+    ventana se escribe en disco (en un hilo aparte) todo lo necesario para reanudar la ejecución desde
+    la ventana siguiente: pesos, estado del optimizador, estado del generador aleatorio y resultados.
+    Los resultados van en un fichero aparte por ventana y solo con los de esa ventana, para que los
+    checkpoints no crezcan con el número de ventanas; al reanudar se juntan los de todas las anteriores.
+    """
+
+    def __init__(self, modelo, directorio=None, asincrono=True):
+        """
+        Args:
+            modelo (nn.Module): Modelo cuyos pesos se van a guardar. Los buffers se reservan con su forma.
+            directorio (str): Carpeta donde se escriben los checkpoints por ventana. Si es None, no se escribe nada en disco.
+            asincrono (bool): Si es True, la escritura en disco se hace en un hilo aparte para no bloquear el entrenamiento.
+        """
+        estado = modelo.state_dict()
+        self.mejor = {k: torch.empty_like(v) for k, v in estado.items()}
+        self.anterior = {k: torch.empty_like(v) for k, v in estado.items()}
+        self.hay_mejor = False
+        self.hay_anterior = False
+
+        self.directorio = directorio
+        self._executor = None
+        self._pendientes = []
+        if directorio is not None:
+            os.makedirs(directorio, exist_ok=True)
+            if asincrono:
+                self._executor = ThreadPoolExecutor(max_workers=1)
+
+    # ------------------------------------------------------------------ snapshots en memoria
+
+    def reiniciar_ventana(self):
+        """Marca que en la ventana actual todavía no hay mejor modelo."""
+        self.hay_mejor = False
+
+    @torch.no_grad()
+    def guardar_mejor(self, modelo, miembros=None):
+        """
+        Copia los pesos actuales del modelo en el buffer del mejor modelo de la ventana.
+        Args:
+            modelo (nn.Module): Modelo del que copiar los pesos.
+            miembros (torch.Tensor): En un TennisRNNConjunto, máscara de los miembros cuyo mejor modelo se
+                actualiza (los pesos tienen el miembro como primera dimensión). None para copiarlos todos.
+        """
+        for k, v in modelo.state_dict().items():
+            if miembros is None:
+                self.mejor[k].copy_(v)
+            else:
+                self.mejor[k][miembros] = v[miembros]
+        self.hay_mejor = True
+
+    def cargar_mejor(self, modelo):
+        """Carga en el modelo los pesos del mejor modelo de la ventana."""
+        modelo.load_state_dict(self.mejor)
+
+    @torch.no_grad()
+    def consolidar_ventana(self):
+        """Guarda el mejor modelo de la ventana como punto de partida (warm-start) de la siguiente."""
+        for k, v in self.mejor.items():
+            self.anterior[k].copy_(v)
+        self.hay_anterior = True
+
+    def cargar_anterior(self, modelo):
+        """Carga en el modelo los pesos de warm-start guardados al terminar la ventana anterior."""
+        modelo.load_state_dict(self.anterior)
+
+    # ------------------------------------------------------------------ persistencia en disco
+
+    def ruta_ventana(self, ventana):
+        return os.path.join(self.directorio, f'ventana_{ventana:03d}.pt')
+
+    def ruta_extra(self, ventana):
+        return os.path.join(self.directorio, f'ventana_{ventana:03d}_extra.pt')
+
+    def guardar_ventana(self, ventana, modelo, optimizador, extra=None):
+        """
+        Guarda en disco el estado al terminar una ventana. Se toma una copia en CPU de todo en el momento
+        de la llamada, así que el entrenamiento puede seguir modificando modelo, optimizador y buffers
+        mientras se escribe.
+        Args:
+            ventana (int): Número de la ventana que acaba de terminar.
+            modelo (nn.Module): Modelo al final de la ventana.
+            optimizador (torch.optim.Optimizer): Optimizador al final de la ventana.
+            extra (dict): Información adicional de esta ventana (sus filas de resultados, ejemplos...), sin la de
+                las anteriores. Se guarda en un fichero aparte (ver cargar_ventana).
+        """
+        if self.directorio is None:
+            return
+        estado = {
+            'ventana': ventana,
+            'modelo': _copia_cpu(modelo.state_dict()),
+            'anterior': _copia_cpu(self.anterior) if self.hay_anterior else None,
+            'optimizador': _copia_cpu(optimizador.state_dict()),
+            'rng': torch.get_rng_state(),
+        }
+        extra = copy.deepcopy(extra) if extra is not None else {}
+        # Primero la información adicional: si hay checkpoint de una ventana, también está su fichero extra
+        escrituras = [(extra, self.ruta_extra(ventana)), (estado, self.ruta_ventana(ventana))]
+        if self._executor is None:
+            _escribir_todos(escrituras)
+        else:
+            # Se propagan los errores de escrituras anteriores en lugar de perderlos en el hilo
+            self._pendientes = [f for f in self._pendientes if not f.done() or f.result()]
+            self._pendientes.append(self._executor.submit(_escribir_todos, escrituras))
+
+    def ventanas_guardadas(self):
+        """
+        Returns:
+            list: Números de ventana con checkpoint en disco, ordenados.
+        """
+        return ventanas_guardadas(self.directorio)
+
+    def ultima_ventana(self):
+        """
+        Returns:
+            int: Última ventana con checkpoint en disco, o None si no hay ninguno.
+        """
+        ventanas = self.ventanas_guardadas()
+        return ventanas[-1] if ventanas else None
+
+    def cargar_ventana(self, modelo, optimizador, hasta=None):
+        """
+        Restaura el estado guardado tras la última ventana terminada que no sea posterior a `hasta`.
+        Deja el modelo, el optimizador, el buffer de warm-start y el generador aleatorio exactamente como
+        estaban al terminar esa ventana.
+        Args:
+            modelo (nn.Module): Modelo en el que cargar los pesos.
+            optimizador (torch.optim.Optimizer): Optimizador en el que cargar su estado.
+            hasta (int): Ventana máxima a considerar. Si es None, se usa la última guardada.
+        Returns:
+            dict: Estado cargado (incluye 'ventana' y 'extras', la información adicional de cada ventana guardada
+                hasta esa, en orden), o None si no hay checkpoint válido.
+        """
+        self.esperar()
+        ventanas = [v for v in self.ventanas_guardadas() if hasta is None or v <= hasta]
+        if not ventanas:
+            return None
+        estado = torch.load(self.ruta_ventana(ventanas[-1]), map_location='cpu', weights_only=False)
+        estado['extras'] = [torch.load(self.ruta_extra(v), map_location='cpu', weights_only=False)
+                            for v in ventanas if os.path.exists(self.ruta_extra(v))]
+
+        modelo.load_state_dict(estado['modelo'])
+        optimizador.load_state_dict(estado['optimizador'])
+        if estado['anterior'] is not None:
+            with torch.no_grad():
+                for k, v in estado['anterior'].items():
+                    self.anterior[k].copy_(v)
+            self.hay_anterior = True
+        else:
+            self.hay_anterior = False
+        torch.set_rng_state(estado['rng'])
+        return estado
+
+    def esperar(self):
+        """Espera a que terminen las escrituras pendientes."""
+        for futuro in self._pendientes:
+            futuro.result()
+        self._pendientes = []
+
+    def cerrar(self):
+        """Espera a las escrituras pendientes y libera el hilo de escritura."""
+        self.esperar()
+        if self._executor is not None:
+            self._executor.shutdown()
+            self._executor = None
+
+
+def ventanas_guardadas(directorio):
+    """
+    Lista las ventanas con checkpoint en un directorio, sin necesidad de tener el modelo instanciado.
+    Args:
+        directorio (str): Carpeta de checkpoints.
+    Returns:
+        list: Números de ventana con checkpoint en disco, ordenados.
+    """
+    if directorio is None:
+        return []
+    ventanas = []
+    for ruta in glob.glob(os.path.join(directorio, 'ventana_*.pt')):
+        encontrado = re.search(r'ventana_(\d+)\.pt$', ruta)
+        if encontrado:
+            ventanas.append(int(encontrado.group(1)))
+    return sorted(ventanas)
+
+
+def _copia_cpu(objeto):
+    """Copia recursiva de un state_dict (o de cualquier estructura con tensores) a CPU."""
+    if torch.is_tensor(objeto):
+        return objeto.detach().to('cpu', copy=True)
+    if isinstance(objeto, dict):
+        return {k: _copia_cpu(v) for k, v in objeto.items()}
+    if isinstance(objeto, (list, tuple)):
+        return type(objeto)(_copia_cpu(v) for v in objeto)
+    return copy.deepcopy(objeto)
+
+
+def _escribir(estado, ruta):
+    """Escribe el checkpoint en un fichero temporal y lo renombra, para no dejar ficheros a medias si se corta."""
+    temporal = ruta + '.tmp'
+    torch.save(estado, temporal)
+    os.replace(temporal, ruta)
+    return True
+
+
+def _escribir_todos(escrituras):
+    """Escribe en orden una lista de pares (estado, ruta)."""
+    for estado, ruta in escrituras:
+        _escribir(estado, ruta)
+    return True
@@ -0,0 +1,352 @@
+"""
+Punto de entrada del pipeline completo, con un subcomando por etapa:
+
+    python -m tenis ranking        # 1.ranking.py: ranking ATP semanal
+    python -m tenis discover       # 2.scrapper.py: IDs de los partidos (y manifiesto de descubrimiento)
+    python -m tenis scrape         # 2.scrapper.py: partidos actuales y bloques de previos
+    python -m tenis postprocess    # 2.scrapper.py: dataset final de completo/
+    python -m tenis eda            # ejecuta 3.analisis_descriptivo.ipynb
+    python -m tenis preprocess     # ejecuta 4.preprocesamiento.ipynb
+    python -m tenis train          # entrena con ventanas walk-forward y guarda modelo y resultados
+    python -m tenis evaluate       # ejecuta 6.analisis_resultados.ipynb
+    python -m tenis score          # predicciones del modelo guardado para todos los partidos
+    python -m tenis backtest       # backtest de apuestas con las predicciones walk-forward de train
+    python -m tenis run            # las etapas desactualizadas, en orden de dependencias (ver tenis.pipeline)
+
+Los parámetros se leen de un JSON (por defecto tenis.json, si existe) que se combina con CONFIGURACION; las
+rutas son relativas al directorio desde el que se lanza. Las dependencias pesadas (torch, sklearn, rapidfuzz,
+cloudscraper, nbclient) se importan dentro de los comandos que las usan, así que arrancar el CLI o un
+proceso del scraper no las carga.
+"""
+import argparse
+import copy
+import importlib.util
+import json
+import os
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+CONFIGURACION = {
+    'datos': '../data',
+    'ranking': {'inicial': False, 'fichero': 'ranking.csv'},
+    'scraper': {
+        'years': [2021, 2022, 2023, 2024],
+        'num_previos': 50,
+        'min_previos': 10,
+        'nuevo': True,
+        'incremental': False,
+        'metricas': None,
+        'intervalo_metricas': 60,
+    },
+    'eda': {'notebook': '3.analisis_descriptivo.ipynb', 'directorio': '.'},
+    'preprocesamiento': {'notebook': '4.preprocesamiento.ipynb', 'directorio': '.'},
+    'entrenamiento': {
+        'tarea': 'regresion',
+        'normalizado': False,
+        'max_previos': None,
+        # None (escalado global del preprocesamiento), 'ventana' o 'acumulado' (ver tenis/escalado.py)
+        'escalado': None,
+        'resultados': 'resultados',
+        'almacen_resultados': 'resultados/resultados.sqlite',
+        'modelos': 'modelos',
+        'checkpoints': 'checkpoints',
+        'parametros': {
+            'hidden_size': 128, 'num_layers': 2, 'dropout_rate': 0.2, 'lr': 0.001, 'epochs': 100, 'patience': 5,
+            'training_weeks': 10, 'testing_weeks': 3,
+        },
+    },
+    'evaluacion': {'notebook': '6.analisis_resultados.ipynb', 'directorio': '.'},
+    'pipeline': {'estado': '.pipeline', 'tareas': ['regresion', 'clasificacion'], 'procesos': 2},
+}
+
+
+def _combinar(base, cambios):
+    """Combina dos diccionarios de configuración; los valores de cambios tienen prioridad."""
+    resultado = copy.deepcopy(base)
+    for clave, valor in cambios.items():
+        if isinstance(valor, dict) and isinstance(resultado.get(clave), dict):
+            resultado[clave] = _combinar(resultado[clave], valor)
+        else:
+            resultado[clave] = valor
+    return resultado
+
+
+def cargar_configuracion(ruta=None):
+    """
+    Args:
+        ruta (str): JSON de configuración. Si es None se usa tenis.json si existe.
+    Returns:
+        dict: CONFIGURACION combinada con el contenido del fichero.
+    """
+    if ruta is None:
+        if not os.path.exists('tenis.json'):
+            return copy.deepcopy(CONFIGURACION)
+        ruta = 'tenis.json'
+    with open(ruta, encoding='utf-8') as f:
+        return _combinar(CONFIGURACION, json.load(f))
+
+
+def cargar_script(nombre):
+    """
+    Importa un script de la raíz del repositorio (1.ranking.py, 2.scrapper.py) como módulo, sin ejecutar su main.
+    """
+    spec = importlib.util.spec_from_file_location(nombre.split('.')[1], os.path.join(RAIZ, nombre))
+    modulo = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(modulo)
+    return modulo
+
+
+def ejecutar_notebook(ruta, directorio='.'):
+    """
+    Ejecuta un notebook de principio a fin y lo guarda con sus salidas.
+    Args:
+        ruta (str): Notebook a ejecutar.
+        directorio (str): Directorio de trabajo de las celdas (las rutas de los notebooks son relativas a él).
+    """
+    import nbformat
+    from nbclient import NotebookClient
+
+    notebook = nbformat.read(ruta, as_version=4)
+    NotebookClient(notebook, timeout=None, resources={'metadata': {'path': directorio}}).execute()
+    nbformat.write(notebook, ruta)
+
+
+def _scraper(configuracion, **kwargs):
+    parametros = configuracion['scraper']
+    scraper = cargar_script('2.scrapper.py')
+    scraper.main(ruta_datos=configuracion['datos'], num_previos=parametros['num_previos'],
+                 min_previos=parametros['min_previos'], years=parametros['years'], ruta_metricas=parametros['metricas'],
+                 intervalo_metricas=parametros['intervalo_metricas'], **kwargs)
+
+
+def comando_ranking(configuracion, args):
+    ranking = cargar_script('1.ranking.py')
+    ranking.main(os.path.join(configuracion['datos'], 'ranking'), configuracion['ranking']['inicial'],
+                 configuracion['ranking']['fichero'])
+
+
+def comando_discover(configuracion, args):
+    _scraper(configuracion, partidos_nuevo=True, nuevo=False, extraer=False, postprocesar_final=False)
+
+
+def comando_scrape(configuracion, args):
+    # En el modo incremental la extracción también descubre los partidos nuevos y actualiza el dataset final
+    incremental = configuracion['scraper']['incremental']
+    _scraper(configuracion, partidos_nuevo=incremental, nuevo=configuracion['scraper']['nuevo'],
+             incremental=incremental, postprocesar_final=incremental)
+
+
+def comando_postprocess(configuracion, args):
+    _scraper(configuracion, partidos_nuevo=False, nuevo=False, extraer=False, postprocesar_final=True)
+
+
+def comando_eda(configuracion, args):
+    ejecutar_notebook(configuracion['eda']['notebook'], configuracion['eda']['directorio'])
+
+
+def comando_preprocess(configuracion, args):
+    ejecutar_notebook(configuracion['preprocesamiento']['notebook'], configuracion['preprocesamiento']['directorio'])
+
+
+# Sufijos de los ficheros de resultados, los mismos que usan 5.prediccion.ipynb y 6.analisis_resultados.ipynb
+SUFIJOS_RESULTADOS = {'regresion': 'REGRESSION', 'clasificacion': 'CLASSIFICATION', 'multitarea': 'MULTITASK'}
+
+
+def _ruta_modelo(configuracion, tarea):
+    return os.path.join(configuracion['entrenamiento']['modelos'], f'tennis_rnn_{tarea}.pt')
+
+
+def _ruta_predicciones_walk_forward(configuracion, tarea):
+    return os.path.join(configuracion['entrenamiento']['resultados'], f'predicciones_walk_forward_{tarea}.csv')
+
+
+def comando_train(configuracion, args):
+    import torch
+    import pandas as pd
+    from tenis.entrenamiento import cargar_datos, entrenar_walk_forward, tabla_predicciones
+    from tenis.modelo import TennisRNNConjunto
+    from tenis.resultados import AlmacenResultados
+
+    entrenamiento = configuracion['entrenamiento']
+    tarea = args.tarea or entrenamiento['tarea']
+    actual_diferencias, previos_home, previos_away = cargar_datos(tarea, configuracion['datos'],
+                                                                  normalizado=entrenamiento['normalizado'])
+    almacen = registro = None
+    if entrenamiento['almacen_resultados']:
+        # Cada entrenamiento es una ejecución nueva del almacén de resultados, con sus métricas por ventana
+        almacen = AlmacenResultados(entrenamiento['almacen_resultados'])
+        registro = almacen.nueva_ejecucion(
+            tarea, {'max_previos': entrenamiento['max_previos'], 'normalizado': entrenamiento['normalizado'],
+                    'escalado': entrenamiento['escalado'], **entrenamiento['parametros']}, nombre=f'cli/{tarea}')
+    predicciones = []
+    try:
+        model, resultados, ejemplos = entrenar_walk_forward(
+            actual_diferencias, previos_home, previos_away, tarea=tarea, max_previos=entrenamiento['max_previos'],
+            escalado=entrenamiento['escalado'], directorio_checkpoints=os.path.join(entrenamiento['checkpoints'], tarea), reanudar_desde=args.reanudar_desde,
+            hasta_ventana=args.hasta_ventana, registro=registro, predicciones=predicciones, **entrenamiento['parametros'])
+    finally:
+        # Se cierra la conexión con el almacén aunque el entrenamiento falle
+        if almacen is not None:
+            almacen.cerrar()
+
+    os.makedirs(entrenamiento['modelos'], exist_ok=True)
+    os.makedirs(entrenamiento['resultados'], exist_ok=True)
+    # Junto al modelo se guardan los tamaños de la red, para poder reconstruirla en score
+    if isinstance(model, TennisRNNConjunto):
+        tamanos = {clave: model.configuracion[clave] for clave in ('input_size_actual', 'input_size_previos')}
+    elif model.codificador == 'transformer':
+        tamanos = {'input_size_actual': model.actual_projection.in_features,
+                   'input_size_previos': model.codificador_home.proyeccion.in_features,
+                   'indice_dias': model.codificador_home.indice_dias}
+    else:
+        tamanos = {'input_size_actual': model.actual_projection.in_features,
+                   'input_size_previos': model.gru_home.input_size}
+    torch.save({'state_dict': model.state_dict(), 'tarea': tarea, **tamanos, 'parametros': entrenamiento['parametros']},
+               _ruta_modelo(configuracion, tarea))
+    if isinstance(resultados, dict):
+        sufijos = {cabeza: f"{SUFIJOS_RESULTADOS[cabeza]}_MULTITASK" for cabeza in resultados}
+    else:
+        resultados, sufijos = {tarea: resultados}, {tarea: SUFIJOS_RESULTADOS[tarea]}
+    for cabeza, df in resultados.items():
+        df.to_csv(os.path.join(entrenamiento['resultados'], f'df_visualization_global_{sufijos[cabeza]}.csv'), index=False)
+    pd.DataFrame(ejemplos).to_csv(
+        os.path.join(entrenamiento['resultados'], f'ejemplos_predicciones_{SUFIJOS_RESULTADOS[tarea]}.csv'), index=False)
+    # Predicciones fuera de muestra de cada ventana, para el backtest de apuestas
+    tabla_predicciones(predicciones).to_csv(_ruta_predicciones_walk_forward(configuracion, tarea), index=False)
+
+
+def comando_evaluate(configuracion, args):
+    ejecutar_notebook(configuracion['evaluacion']['notebook'], configuracion['evaluacion']['directorio'])
+
+
+def comando_score(configuracion, args):
+    import torch
+    import pandas as pd
+    from tenis.entrenamiento import cabezas_de, cargar_datos, objetivos_de, preparar_tensores, ventanas_walk_forward
+    from tenis.escalado import EscaladoVentanas
+    from tenis.modelo import TennisRNN, TennisRNNConjunto, TennisRNNMultitarea
+
+    entrenamiento = configuracion['entrenamiento']
+    tarea = args.tarea or entrenamiento['tarea']
+    guardado = torch.load(_ruta_modelo(configuracion, tarea), map_location='cpu')
+    parametros = guardado['parametros']
+    tamanos = (guardado['input_size_actual'], guardado['input_size_previos'], parametros['hidden_size'],
+               parametros['num_layers'], 1, parametros['dropout_rate'])
+    conjunto = parametros.get('miembros', 1) > 1
+    if conjunto:
+        model = TennisRNNConjunto(*tamanos, miembros=parametros['miembros'], multitarea=tarea == 'multitarea')
+    else:
+        model = (TennisRNNMultitarea if tarea == 'multitarea' else TennisRNN)(
+            *tamanos, codificador=parametros.get('codificador', 'gru'), indice_dias=guardado.get('indice_dias'))
+    model.load_state_dict(guardado['state_dict'])
+    model.eval()
+
+    actual_diferencias, previos_home, previos_away = cargar_datos(tarea, configuracion['datos'],
+                                                                  normalizado=entrenamiento['normalizado'])
+    datos = preparar_tensores(actual_diferencias, previos_home, previos_away, objetivos_de(tarea),
+                              max_previos=entrenamiento['max_previos'], escalado=entrenamiento['escalado'])
+    transformacion = None
+    if datos['escalado'] is not None:
+        # El modelo guardado es el de la última ventana, así que se escala con las semanas de su entrenamiento
+        semanas_train = ventanas_walk_forward(datos['year_week_id'], parametros.get('training_weeks', 10),
+                                              parametros.get('testing_weeks', 3))[-1][1]
+        transformacion = datos['escalado'].transformacion(semanas_train, 'cpu')
+    predicciones, varianzas = [], []
+    with torch.no_grad():
+        for inicio in range(0, datos['actual'].shape[0], args.lote):
+            lote = torch.arange(inicio, min(inicio + args.lote, datos['actual'].shape[0]))
+            longitudes = [None if datos[clave] is None else datos[clave][lote] for clave in ('len_home', 'len_away')]
+            entradas = (datos['actual'][lote], datos['home'][lote], datos['away'][lote])
+            if transformacion is not None:
+                entradas = EscaladoVentanas.aplicar(transformacion, *entradas, *longitudes)
+            prediccion = model(*entradas, *longitudes)
+            if conjunto:
+                # Predicción media de los miembros y su varianza como medida de incertidumbre
+                varianzas.append(TennisRNNConjunto.varianza(prediccion))
+                prediccion = TennisRNNConjunto.media(prediccion)
+            predicciones.append(prediccion)
+    predicciones = torch.cat(predicciones).numpy()
+
+    df = pd.DataFrame({'year_week_id': datos['year_week_id']})
+    for j, (cabeza, objetivo) in enumerate(zip(cabezas_de(tarea), objetivos_de(tarea))):
+        df[objetivo] = datos['y'][:, j].numpy()
+        df[f'prediccion_{cabeza}'] = predicciones[:, j]
+        if conjunto:
+            df[f'varianza_{cabeza}'] = torch.cat(varianzas)[:, j].numpy()
+    salida = args.salida or os.path.join(entrenamiento['resultados'], f'predicciones_{tarea}.csv')
+    os.makedirs(os.path.dirname(salida) or '.', exist_ok=True)
+    df.to_csv(salida, index_label='indice_dataset')
+    print(f'Predicciones guardadas en {salida}')
+
+
+def comando_backtest(configuracion, args):
+    import pandas as pd
+    from tenis.apuestas import backtest, datos_backtest, resumen_backtest
+    from tenis.entrenamiento import cargar_mercado
+
+    entrenamiento = configuracion['entrenamiento']
+    tarea = args.tarea or entrenamiento['tarea']
+    df = datos_backtest(pd.read_csv(_ruta_predicciones_walk_forward(configuracion, tarea)),
+                        cargar_mercado(tarea, configuracion['datos']))
+    resultados = backtest(df['probabilidad'], df['probability_away'], df['vigorish'], df['winnerCode'], df['ventana'])
+    print(resumen_backtest(resultados).to_string(index=False))
+    salida = args.salida or os.path.join(entrenamiento['resultados'], f'backtest_{tarea}.csv')
+    resultados.to_csv(salida, index=False)
+    print(f'Resultados del backtest guardados en {salida}')
+
+
+def comando_run(configuracion, args):
+    from tenis.pipeline import Orquestador, ejecutar_proceso, etapas_pipeline
+
+    orquestador = Orquestador(etapas_pipeline(configuracion), configuracion['pipeline']['estado'],
+                              lambda etapa: ejecutar_proceso(etapa, args.config))
+    if args.plan:
+        for nombre, estado in orquestador.plan(args.etapas, args.forzar).items():
+            print(f'{nombre:<24}{estado}')
+        return
+    resultados = orquestador.ejecutar_etapas(args.etapas, args.forzar,
+                                             args.procesos or configuracion['pipeline']['procesos'])
+    if any(estado in ('fallida', 'bloqueada') for estado in resultados.values()):
+        raise SystemExit(1)
+
+
+COMANDOS = {
+    'ranking': (comando_ranking, 'Descarga el ranking ATP semanal (1.ranking.py)'),
+    'discover': (comando_discover, 'Descubre los IDs de los partidos (2.scrapper.py)'),
+    'scrape': (comando_scrape, 'Descarga los partidos actuales y sus previos (2.scrapper.py)'),
+    'postprocess': (comando_postprocess, 'Genera el dataset final de completo/ (2.scrapper.py)'),
+    'eda': (comando_eda, 'Ejecuta el notebook de análisis exploratorio'),
+    'preprocess': (comando_preprocess, 'Ejecuta el notebook de preprocesamiento'),
+    'train': (comando_train, 'Entrena el modelo con ventanas walk-forward'),
+    'evaluate': (comando_evaluate, 'Ejecuta el notebook de análisis de resultados'),
+    'score': (comando_score, 'Predice con el modelo guardado todos los partidos del dataset'),
+    'backtest': (comando_backtest, 'Backtest de apuestas con las predicciones walk-forward de train'),
+    'run': (comando_run, 'Ejecuta las etapas desactualizadas en orden de dependencias'),
+}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='python -m tenis', description='Pipeline de predicción de partidos de tenis')
+    parser.add_argument('--config', default=None, help='JSON de configuración (por defecto tenis.json si existe)')
+    subparsers = parser.add_subparsers(dest='comando', required=True)
+    for nombre, (_, ayuda) in COMANDOS.items():
+        subparser = subparsers.add_parser(nombre, help=ayuda)
+        if nombre in ('train', 'score', 'backtest'):
+            subparser.add_argument('--tarea', default=None, choices=['regresion', 'clasificacion', 'multitarea'])
+        if nombre == 'train':
+            subparser.add_argument('--reanudar-desde', type=int, default=None)
+            subparser.add_argument('--hasta-ventana', type=int, default=None)
+        if nombre == 'score':
+            subparser.add_argument('--salida', default=None, help='CSV de las predicciones')
+            subparser.add_argument('--lote', type=int, default=4096)
+        if nombre == 'backtest':
+            subparser.add_argument('--salida', default=None, help='CSV con los resultados por ventana, estrategia y umbral')
+        if nombre == 'run':
+            subparser.add_argument('etapas', nargs='*', help='Etapas a actualizar (por defecto, todas)')
+            subparser.add_argument('--forzar', nargs='+', default=[], help='Etapas a ejecutar aunque estén actualizadas')
+            subparser.add_argument('--procesos', type=int, default=None, help='Etapas a la vez')
+            subparser.add_argument('--plan', action='store_true', help='Muestra qué etapas están desactualizadas sin ejecutarlas')
+    args = parser.parse_args(argv)
+
+    configuracion = cargar_configuracion(args.config)
+    COMANDOS[args.comando][0](configuracion, args)
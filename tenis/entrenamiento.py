@@ -0,0 +1,737 @@
+import numpy as np
+import pandas as pd
+import torch
+import torch.nn as nn
+import torch.optim as optim
+
+from tenis.almacen import RELLENO, PreviosIndexados, cargar_almacen, filtrar_almacen, previos_jugador
+from tenis.checkpoints import GestorCheckpoints
+from tenis.escalado import EscaladoVentanas
+from tenis.esquema import ESQUEMA_PREPROCESADO, leer_tabla
+from tenis.perfilado import SIN_PERFILADO
+from tenis.modelo import (TennisRNN, TennisRNNConjunto, TennisRNNMultitarea, calcular_metricas_regresion,
+                          calcular_metricas_clasificacion)
+
+# Configuración de cada tarea: columna objetivo, función de pérdida, métricas y columnas del df de resultados
+TAREAS = {
+    'regresion': {
+        'objetivo': 'probability_away',
+        'criterio': nn.MSELoss,
+        'metricas': calcular_metricas_regresion,
+        'columnas': {'MAE': 'mae', 'MSE': 'mse', 'RMSE': 'rmse', 'R2': 'r2', 'MAPE': 'mape'},
+        'log': ('r2', 'mae'),
+    },
+    'clasificacion': {
+        'objetivo': 'winnerCode',
+        'criterio': nn.BCELoss,
+        'metricas': calcular_metricas_clasificacion,
+        'columnas': {'Accuracy': 'accuracy', 'Precision': 'precision', 'Recall': 'recall', 'F1': 'f1', 'AUC': 'auc'},
+        'log': ('auc', 'accuracy'),
+    },
+}
+
+# En el modo multitarea se entrenan las dos tareas a la vez; este es el orden de las salidas del modelo
+MULTITAREA = ('regresion', 'clasificacion')
+
+# Precisiones de entrenamiento: 'bf16' usa autocast a bfloat16 (las pérdidas y las métricas se calculan en float32)
+PRECISIONES = {'fp32': None, 'bf16': torch.bfloat16}
+
+# Característica de los previos con los días sin jugar antes de cada partido, que usa el codificador Transformer
+COLUMNA_DIAS = 'days_no_played'
+
+
+def cabezas_de(tarea):
+    """Tareas (cabezas del modelo) que se entrenan con la tarea indicada."""
+    return list(MULTITAREA) if tarea == 'multitarea' else [tarea]
+
+
+def objetivos_de(tarea):
+    """Columnas objetivo de la tarea indicada, en el orden de las salidas del modelo."""
+    return [TAREAS[cabeza]['objetivo'] for cabeza in cabezas_de(tarea)]
+
+
+def _silencio(*args, **kwargs):
+    pass
+
+
+def separar_previos(actual_diferencias, previos, num_previos=50):
+    """
+    Separa los bloques de previos (num_previos filas del local seguidas de num_previos del visitante por
+    cada partido actual) en dos DataFrames, uno por jugador.
+    Args:
+        actual_diferencias (pd.DataFrame): DataFrame con los partidos actuales.
+        previos (pd.DataFrame): DataFrame con los partidos previos en bloques de 2*num_previos filas.
+        num_previos (int): Número de partidos previos de cada jugador.
+    Returns:
+        tuple: DataFrames previos_home y previos_away, con num_previos filas por partido actual.
+    """
+    bloques = np.arange(actual_diferencias.shape[0])[:, None] * num_previos * 2
+    # Índices para home (primeras 50 filas del bloque) y away (siguientes 50 filas del bloque)
+    indices_home = (bloques + np.arange(num_previos)).ravel()
+    indices_away = (bloques + num_previos + np.arange(num_previos)).ravel()
+
+    previos_home = previos.iloc[indices_home].reset_index(drop=True)
+    previos_away = previos.iloc[indices_away].reset_index(drop=True)
+    return previos_home, previos_away
+
+
+def cargar_datos(tarea, ruta='../data', num_previos=50, normalizado=False):
+    """
+    Carga los datasets preprocesados y los deja listos para entrenar, igual que en 5.prediccion.ipynb: para la
+    regresión se eliminan los partidos sin probabilidades (y sus bloques de previos), y se quitan las columnas
+    que no entran a la red. En 'multitarea' se mantienen todos los partidos; los que no tienen probabilidades
+    quedan con NaN en probability_away y no cuentan en la pérdida ni en las métricas de regresión.
+    Args:
+        tarea (str): 'regresion', 'clasificacion' o 'multitarea'.
+        ruta (str): Carpeta con actual_diferencias_preproc_escalado.parquet y previos_preproc_escalado.parquet
+            (o sus .csv, ver tenis.esquema.leer_tabla).
+        num_previos (int): Número de partidos previos de cada jugador.
+        normalizado (bool): Si es True, los previos se leen del almacén normalizado previos_normalizado.npz
+            (ver tenis.almacen) en lugar de previos_preproc_escalado.parquet, sin construir la vista densa.
+    Returns:
+        tuple: DataFrames actual_diferencias, previos_home y previos_away. Con normalizado=True, previos_home
+            y previos_away son los almacenes de cada jugador (ver tenis.almacen.previos_jugador).
+    """
+    actual_diferencias = leer_tabla(f'{ruta}/actual_diferencias_preproc_escalado.parquet', esquema=ESQUEMA_PREPROCESADO)
+    if normalizado:
+        previos = cargar_almacen(f'{ruta}/previos_normalizado.npz')
+    else:
+        previos = leer_tabla(f'{ruta}/previos_preproc_escalado.parquet', esquema=ESQUEMA_PREPROCESADO)
+
+    if tarea == 'regresion':
+        validas = filas_regresion(actual_diferencias)
+        if normalizado:
+            previos = filtrar_almacen(previos, validas)
+        else:
+            previos = previos[np.repeat(validas, num_previos * 2)]
+        actual_diferencias = actual_diferencias[validas].drop(columns=['vigorish', 'winnerCode', 'probability_home'])
+    elif tarea == 'multitarea':
+        actual_diferencias = actual_diferencias.drop(columns=['vigorish', 'probability_home'])
+    else:
+        actual_diferencias = actual_diferencias.drop(columns=['probability_home', 'probability_away', 'vigorish'])
+
+    actual_diferencias = actual_diferencias.reset_index(drop=True)
+    if normalizado:
+        return actual_diferencias, previos_jugador(previos, 0), previos_jugador(previos, 1)
+    previos_home, previos_away = separar_previos(actual_diferencias, previos.reset_index(drop=True), num_previos)
+    return actual_diferencias, previos_home, previos_away
+
+
+def filas_regresion(actual_diferencias):
+    """Partidos que entran en la regresión: los que tienen todas las columnas, incluidas las probabilidades."""
+    return ~actual_diferencias.isnull().any(axis=1).values
+
+
+def cargar_mercado(tarea, ruta='../data'):
+    """
+    Probabilidades del mercado, margen y resultado de los partidos, en el mismo orden de filas que el
+    actual_diferencias de cargar_datos (así que indice_dataset sirve para cruzarlos con las predicciones).
+    Args:
+        tarea (str): 'regresion', 'clasificacion' o 'multitarea'.
+        ruta (str): Carpeta con actual_diferencias_preproc_escalado.parquet.
+    Returns:
+        pd.DataFrame: Columnas year_week_id, probability_home, probability_away, vigorish y winnerCode.
+    """
+    actual_diferencias = leer_tabla(f'{ruta}/actual_diferencias_preproc_escalado.parquet', esquema=ESQUEMA_PREPROCESADO)
+    if tarea == 'regresion':
+        actual_diferencias = actual_diferencias[filas_regresion(actual_diferencias)]
+    columnas = ['year_week_id', 'probability_home', 'probability_away', 'vigorish', 'winnerCode']
+    return actual_diferencias[columnas].reset_index(drop=True)
+
+
+def preparar_tensores(actual_diferencias, previos_home, previos_away, objetivo, num_previos=50, device='cpu', max_previos=None,
+                      escalado=None):
+    """
+    Convierte una sola vez todo el dataset a tensores. Cada ventana toma después sus filas indexando,
+    sin volver a construir las listas de índices ni copiar desde pandas.
+    Si actual_diferencias tiene las columnas 'numPreviosHome' y 'numPreviosAway' (jugadores con menos de
+    num_previos partidos previos, con el bloque completado con relleno), se guardan como longitudes de las
+    secuencias para que el modelo no procese el relleno, y no entran como características.
+    Si los previos son almacenes normalizados (ver tenis.almacen), 'home' y 'away' son PreviosIndexados:
+    solo se pasan a tensor la tabla de partidos distintos y los índices, y cada ventana reúne sus filas.
+    Args:
+        actual_diferencias (pd.DataFrame): Partidos actuales con 'year_week_id' y la columna objetivo.
+        previos_home (pd.DataFrame or dict): Previos del jugador local, num_previos filas por partido actual,
+            o su almacén normalizado.
+        previos_away (pd.DataFrame or dict): Previos del jugador visitante, igual que previos_home.
+        objetivo (str or list): Columna (o columnas) a predecir.
+        num_previos (int): Longitud de la secuencia de previos.
+        device (torch.device): Dispositivo en el que dejar los tensores.
+        max_previos (int): Número máximo de partidos previos a usar de cada jugador (los más recientes). None para usar todos.
+        escalado (str): 'ventana' o 'acumulado' para escalar cada ventana solo con las estadísticas de sus semanas
+            de entrenamiento (o de todas las semanas hasta el final de su entrenamiento), sin fuga de información
+            (ver tenis/escalado.py). None para usar el escalado global del preprocesamiento.
+    Returns:
+        dict: Tensores 'actual', 'home', 'away', 'y', longitudes 'len_home' y 'len_away' (None si todas las
+            secuencias están completas), el array 'year_week_id', los nombres de las características de los
+            previos 'columnas_previos' y 'escalado' (EscaladoVentanas o None).
+    """
+    objetivos = [objetivo] if isinstance(objetivo, str) else list(objetivo)
+    n_partidos = actual_diferencias.shape[0]
+    normalizado = isinstance(previos_home, dict)
+
+    columnas_longitud = ['numPreviosHome', 'numPreviosAway']
+    if all(columna in actual_diferencias.columns for columna in columnas_longitud):
+        len_home = actual_diferencias['numPreviosHome'].fillna(num_previos).values.astype(np.int64)
+        len_away = actual_diferencias['numPreviosAway'].fillna(num_previos).values.astype(np.int64)
+    else:
+        len_home = np.full(n_partidos, num_previos, dtype=np.int64)
+        len_away = np.full(n_partidos, num_previos, dtype=np.int64)
+
+    X_actual = actual_diferencias.drop(columns=objetivos + ['year_week_id'] + columnas_longitud, errors='ignore')
+    columnas_actual = list(X_actual.columns)
+    X_actual = X_actual.values
+    Y_actual = actual_diferencias[objetivos].values
+
+    columnas_previos = previos_home['columnas'] if normalizado else list(previos_home.columns)
+    if normalizado:
+        # Se recortan los índices (el relleno apunta a la fila de ceros) en lugar de las filas
+        previos_home, previos_away = dict(previos_home), dict(previos_away)
+        if max_previos is not None and max_previos < num_previos:
+            for previos, longitudes in ((previos_home, len_home), (previos_away, len_away)):
+                indices, _ = recortar_historico(previos['indices'][:, :, None], longitudes, max_previos, RELLENO)
+                orientacion, _ = recortar_historico(previos['orientacion'][:, :, None], longitudes, max_previos, False)
+                previos['indices'], previos['orientacion'] = indices[:, :, 0], orientacion[:, :, 0]
+            len_home, len_away = np.minimum(len_home, max_previos), np.minimum(len_away, max_previos)
+            num_previos = max_previos
+        X_home = PreviosIndexados.desde_almacen(previos_home, device)
+        X_away = PreviosIndexados.desde_almacen(previos_away, device)
+    else:
+        # Reshape para GRU: (n_samples, seq_length, n_features)
+        n_features = previos_home.shape[1]
+        X_home = previos_home.values.reshape(n_partidos, num_previos, n_features)
+        X_away = previos_away.values.reshape(n_partidos, num_previos, n_features)
+
+        if max_previos is not None and max_previos < num_previos:
+            X_home, len_home = recortar_historico(X_home, len_home, max_previos)
+            X_away, len_away = recortar_historico(X_away, len_away, max_previos)
+            num_previos = max_previos
+        X_home = torch.tensor(X_home, dtype=torch.float32).to(device)
+        X_away = torch.tensor(X_away, dtype=torch.float32).to(device)
+
+    # Si no hay relleno no se empaqueta: el resultado es el mismo y las GRUs van más rápido
+    completas = (len_home == num_previos).all() and (len_away == num_previos).all()
+
+    datos = {
+        'actual': torch.tensor(X_actual, dtype=torch.float32).to(device),
+        'home': X_home,
+        'away': X_away,
+        'y': torch.tensor(Y_actual, dtype=torch.float32).to(device),
+        # pack_padded_sequence necesita las longitudes en CPU
+        'len_home': None if completas else torch.tensor(len_home),
+        'len_away': None if completas else torch.tensor(len_away),
+        'year_week_id': actual_diferencias['year_week_id'].values,
+        'columnas_previos': columnas_previos,
+        'escalado': None,
+    }
+    if escalado is not None:
+        datos['escalado'] = EscaladoVentanas.desde_datos(datos, columnas_actual, columnas_previos, escalado)
+    return datos
+
+
+def recortar_historico(X, longitudes, max_previos, relleno=0):
+    """
+    Se queda con los max_previos partidos previos más recientes de cada secuencia. Los partidos reales están
+    al principio de la secuencia, del más antiguo al más reciente, y el relleno al final.
+    Args:
+        X (np.array): Secuencias de forma (n_partidos, num_previos, n_features).
+        longitudes (np.array): Número de partidos reales de cada secuencia.
+        max_previos (int): Longitud máxima de las secuencias recortadas.
+        relleno: Valor con el que se completan las secuencias recortadas.
+    Returns:
+        tuple: Secuencias de forma (n_partidos, max_previos, n_features) y sus nuevas longitudes.
+    """
+    inicio = np.maximum(longitudes - max_previos, 0)
+    indices = inicio[:, None] + np.arange(max_previos)
+    recortado = np.take_along_axis(X, np.minimum(indices, X.shape[1] - 1)[:, :, None], axis=1)
+    nuevas_longitudes = np.minimum(longitudes, max_previos)
+    # Lo que queda detrás de los partidos reales vuelve a ser relleno
+    recortado[np.arange(max_previos)[None, :] >= nuevas_longitudes[:, None]] = relleno
+    return recortado, nuevas_longitudes
+
+
+def ventanas_walk_forward(year_week_id, training_weeks=10, testing_weeks=3, step_size=1):
+    """
+    Genera las ventanas temporales de entrenamiento y test.
+    Args:
+        year_week_id (np.array): Identificador de semana de cada partido actual.
+        training_weeks (int): Número de semanas para entrenamiento.
+        testing_weeks (int): Número de semanas para prueba.
+        step_size (int): Paso de avance entre ventanas (en semanas).
+    Returns:
+        list: Tuplas (ventana, semanas_train, semanas_test, indices_train, indices_test).
+    """
+    all_year_weeks = pd.unique(year_week_id)
+    ventanas = []
+    for i in range(0, len(all_year_weeks) - (training_weeks + testing_weeks) + 1, step_size):
+        # Índice de la ventana actual (comenzando desde 1)
+        current_window = i // step_size + 1
+        train_year_weeks = all_year_weeks[i:i+training_weeks]
+        test_year_weeks = all_year_weeks[i+training_weeks:i+training_weeks+testing_weeks]
+        train_indices = np.flatnonzero(np.isin(year_week_id, train_year_weeks))
+        test_indices = np.flatnonzero(np.isin(year_week_id, test_year_weeks))
+        ventanas.append((current_window, train_year_weeks, test_year_weeks, train_indices, test_indices))
+    return ventanas
+
+
+def guardar_ejemplos_prediccion(ejemplos_predicciones, y_pred, y_true, indices_test, ventana, umbral_precision=0.05, umbral_error=0.20,
+                                varianza=None):
+    """
+    Guarda ejemplos de predicciones para análisis posterior. Con un conjunto de modelos, y_pred es la media de
+    los miembros y varianza su varianza, que se guarda con cada ejemplo.
+    """
+    y_pred_np = y_pred.cpu().numpy().flatten()
+    y_true_np = y_true.cpu().numpy().flatten()
+    varianza_np = None if varianza is None else varianza.cpu().numpy().flatten()
+
+    # Calcular errores absolutos
+    errores = np.abs(y_pred_np - y_true_np)
+
+    # Casos de alta precisión (error < umbral_precision) y de error significativo (error > umbral_error)
+    indices_precision = np.where(errores < umbral_precision)[0]
+    indices_error = np.where(errores > umbral_error)[0]
+
+    # Guardar algunos ejemplos de cada tipo (máximo 3 por ventana)
+    for tipo, indices in (('alta_precision', indices_precision[:3]), ('error_significativo', indices_error[:3])):
+        for idx in indices:
+            ejemplo = {
+                'ventana': ventana,
+                'tipo': tipo,
+                'indice_dataset': indices_test[idx],
+                'prediccion': y_pred_np[idx],
+                'real': y_true_np[idx],
+                'error': errores[idx]
+            }
+            if varianza_np is not None:
+                ejemplo['varianza'] = varianza_np[idx]
+            ejemplos_predicciones.append(ejemplo)
+
+
+def tabla_predicciones(predicciones):
+    """
+    Junta las predicciones por ventana que va guardando entrenar_ventanas (parámetro predicciones).
+    Returns:
+        pd.DataFrame: Una fila por ventana y partido de test, con 'ventana', 'indice_dataset' y 'prediccion_<cabeza>'.
+    """
+    if not predicciones:
+        return pd.DataFrame(columns=['ventana', 'indice_dataset'])
+    return pd.concat([pd.DataFrame(prediccion) for prediccion in predicciones], ignore_index=True)
+
+
+def columnas_resultados(cabeza, miembros=1):
+    """
+    Columnas del DataFrame de resultados por ventana y época de una cabeza. Con un conjunto de modelos se añaden
+    'Varianza' y las pérdidas y métricas de cada miembro con su número como sufijo.
+    """
+    columnas = ['Window', 'Epoch', 'TrainingLoss', 'ValidationLoss'] + list(TAREAS[cabeza]['columnas'])
+    if miembros > 1:
+        columnas += ['Varianza'] + [f'{columna}_{k}' for k in range(miembros) for columna in columnas[2:]]
+    return columnas
+
+
+def fila_miembro(fila, k):
+    """Fila de resultados de un conjunto reducida a las columnas del miembro k, con los nombres de un modelo normal."""
+    sufijo = f'_{k}'
+    miembro = {'Window': fila['Window'], 'Epoch': fila['Epoch']}
+    miembro.update({columna[:-len(sufijo)]: valor for columna, valor in fila.items() if columna.endswith(sufijo)})
+    return miembro
+
+
+def longitudes_ventana(datos, train_indices, test_indices):
+    """
+    Longitudes de los históricos de entrenamiento y test de una ventana.
+    Returns:
+        tuple: len_train_home, len_train_away, len_test_home, len_test_away (None si no hay relleno).
+    """
+    if datos.get('len_home') is None:
+        return None, None, None, None
+    train, test = torch.as_tensor(train_indices), torch.as_tensor(test_indices)
+    return datos['len_home'][train], datos['len_away'][train], datos['len_home'][test], datos['len_away'][test]
+
+
+def entrenar_walk_forward(actual_diferencias, previos_home, previos_away, tarea='regresion', num_previos=50, device=None, max_previos=None,
+                          escalado=None, **kwargs):
+    """
+    Entrena un TennisRNN con ventanas temporales deslizantes a partir de los DataFrames preprocesados.
+    Convierte los datos a tensores y delega en entrenar_ventanas.
+    Args:
+        actual_diferencias (pd.DataFrame): Partidos actuales preprocesados, con 'year_week_id' y la columna objetivo.
+        previos_home (pd.DataFrame): Previos del jugador local (ver separar_previos).
+        previos_away (pd.DataFrame): Previos del jugador visitante (ver separar_previos).
+        tarea (str): 'regresion' (probability_away, MSE), 'clasificacion' (winnerCode, BCE) o 'multitarea'.
+        num_previos (int): Número de partidos previos de cada jugador.
+        device (torch.device): Dispositivo de entrenamiento. Por defecto, cuda si está disponible.
+        max_previos (int): Número máximo de partidos previos a usar de cada jugador (ver preparar_tensores).
+        escalado (str): 'ventana', 'acumulado' o None (ver preparar_tensores).
+        **kwargs: Resto de parámetros de entrenar_ventanas.
+    Returns:
+        tuple: Modelo entrenado, resultados por ventana y época y lista de ejemplos de predicción (ver entrenar_ventanas).
+    """
+    if device is None:
+        device = torch.device('cuda' if torch.cuda.is_available() else 'cpu')
+    perfil = kwargs.get('perfilador') or SIN_PERFILADO
+    with perfil.fase('preparar_tensores'):
+        datos = preparar_tensores(actual_diferencias, previos_home, previos_away, objetivos_de(tarea), num_previos, device, max_previos,
+                                  escalado)
+    return entrenar_ventanas(datos, tarea=tarea, **kwargs)
+
+
+def entrenar_ventanas(datos, tarea='regresion',
+                      hidden_size=128, num_layers=2, dropout_rate=0.2, lr=0.001,
+                      epochs=100, patience=5, min_delta=0.00001, view_step=5,
+                      training_weeks=10, testing_weeks=3, step_size=1, pesos_tareas=None,
+                      directorio_checkpoints=None, reanudar_desde=None, hasta_ventana=None, verbose=True,
+                      precision='fp32', compilar=False, hilos=None, perfilador=None, registro=None, miembros=1,
+                      codificador='gru', predicciones=None):
+    """
+    Entrena un TennisRNN con ventanas temporales deslizantes: en cada ventana se entrena con
+    training_weeks semanas, se evalúa en las testing_weeks siguientes con early stopping, y el mejor modelo
+    de la ventana es el punto de partida de la siguiente.
+    Args:
+        datos (dict): Tensores del dataset (ver preparar_tensores). No se modifican, así que pueden estar en memoria compartida.
+        tarea (str): 'regresion' (probability_away, MSE), 'clasificacion' (winnerCode, BCE) o 'multitarea' (las dos
+            a la vez con un tronco común y una cabeza por tarea; la pérdida es la suma ponderada de ambas).
+        hidden_size, num_layers, dropout_rate, lr: Hiperparámetros del modelo y del optimizador.
+        epochs, patience, min_delta, view_step: Parámetros del entrenamiento y del early stopping.
+        training_weeks, testing_weeks, step_size: Parámetros de las ventanas temporales.
+        pesos_tareas (dict): En 'multitarea', peso de la pérdida de cada tarea. Por defecto 1 para las dos.
+        directorio_checkpoints (str): Carpeta donde guardar un checkpoint al terminar cada ventana. None para no guardar.
+        reanudar_desde (int): Ventana desde la que reanudar usando los checkpoints de directorio_checkpoints.
+        hasta_ventana (int): Última ventana a entrenar. None para llegar hasta el final.
+        verbose (bool): Si es False, no se imprime el progreso.
+        precision (str): 'fp32' o 'bf16' (autocast a bfloat16, pensado para CPU). Ver tenis/rendimiento.py para el coste en métricas.
+        compilar (bool): Si es True, el forward (y con él el backward) se compila con torch.compile.
+        hilos (int): Número de hilos intra-op de torch. None para dejar el valor actual.
+        perfilador (PerfiladorVentanas): Si se indica, se mide el tiempo de cada fase en cada ventana (ver tenis/perfilado.py).
+        registro (Ejecucion): Si se indica, al terminar cada ventana se guardan sus métricas finales en el almacén
+            de resultados (ver tenis/resultados.py).
+        miembros (int): Número de modelos con distinta inicialización que se entrenan a la vez (TennisRNNConjunto).
+            Con más de uno, las pérdidas y métricas de cada fila son las de la media de los miembros, 'Varianza' es
+            la varianza media entre miembros de las predicciones de test, y cada miembro tiene además sus propias
+            columnas (R2_0, R2_1...). Cada miembro tiene su propio early stopping: la ventana termina cuando todos
+            han agotado la paciencia y cada uno se queda con su mejor época. En el almacén de resultados cada
+            miembro se registra también como la cabeza '<cabeza>/<miembro>'.
+        codificador (str): 'gru' o 'transformer' (ver TennisRNN). El Transformer usa days_no_played, si está entre
+            las características de los previos, para codificar el tiempo entre partidos.
+        predicciones (list): Si se indica, al terminar cada ventana se añaden las predicciones de test de su mejor
+            modelo (fuera de muestra), con 'ventana', 'indice_dataset' y una columna 'prediccion_<cabeza>' por
+            cabeza. tabla_predicciones las junta en un DataFrame (ver tenis/apuestas.py para el backtest).
+    Returns:
+        tuple: Modelo entrenado, resultados por ventana y época (un DataFrame, o un diccionario con un DataFrame por
+            tarea en 'multitarea') y lista de ejemplos de predicción.
+    """
+    if precision not in PRECISIONES:
+        raise ValueError(f"Precisión no soportada: {precision}. Opciones: {list(PRECISIONES)}")
+    if hilos is not None:
+        torch.set_num_threads(hilos)
+    log = print if verbose else _silencio
+    perfil = perfilador if perfilador is not None else SIN_PERFILADO
+    cabezas = cabezas_de(tarea)
+    criterios = {cabeza: TAREAS[cabeza]['criterio']() for cabeza in cabezas}
+    pesos = {cabeza: 1.0 for cabeza in cabezas}
+    pesos.update(pesos_tareas or {})
+    device = datos['actual'].device
+    input_size_actual = datos['actual'].shape[1]
+    input_size_previos = datos['home'].shape[2]
+
+    # Inicialización del modelo
+    conjunto = miembros > 1
+    tamanos = dict(input_size_actual=input_size_actual, input_size_previos=input_size_previos, hidden_size=hidden_size,
+                   num_layers=num_layers, output_size=1, dropout_rate=dropout_rate)
+    if codificador != 'gru':
+        if conjunto:
+            raise ValueError("El conjunto de miembros (miembros > 1) solo está disponible con codificador='gru'")
+        columnas_previos = list(datos.get('columnas_previos') or [])
+        tamanos['codificador'] = codificador
+        tamanos['indice_dias'] = columnas_previos.index(COLUMNA_DIAS) if COLUMNA_DIAS in columnas_previos else None
+    if conjunto:
+        model = TennisRNNConjunto(**tamanos, miembros=miembros, multitarea=tarea == 'multitarea').to(device)
+    else:
+        clase_modelo = TennisRNNMultitarea if tarea == 'multitarea' else TennisRNN
+        model = clase_modelo(**tamanos).to(device)
+    optimizer = optim.Adam(model.parameters(), lr=lr)
+    gestor = GestorCheckpoints(model, directorio_checkpoints)
+    # El modelo compilado comparte los parámetros con model; los checkpoints se hacen siempre sobre model para
+    # que el state_dict no lleve el prefijo del módulo compilado
+    red = torch.compile(model, dynamic=True) if compilar else model
+    tipo_autocast = PRECISIONES[precision]
+
+    filas = {cabeza: [] for cabeza in cabezas}
+    ejemplos_predicciones = []
+
+    ventanas = ventanas_walk_forward(datos['year_week_id'], training_weeks, testing_weeks, step_size)
+    total_windows = len(ventanas)
+
+    if reanudar_desde is not None:
+        estado = gestor.cargar_ventana(model, optimizer, hasta=reanudar_desde - 1)
+        if estado is None:
+            log(f"No hay checkpoints anteriores a la ventana {reanudar_desde}, se empieza desde el principio")
+            reanudar_desde = None
+        else:
+            # Cada checkpoint guarda solo lo de su ventana: se juntan los de todas las ventanas ya terminadas
+            for extra in estado['extras']:
+                for cabeza in cabezas:
+                    filas[cabeza].extend(extra.get('filas', {}).get(cabeza, []))
+                ejemplos_predicciones.extend(extra.get('ejemplos', []))
+                if predicciones is not None:
+                    predicciones.extend(extra.get('predicciones', []))
+            log(f"Reanudando en la ventana {estado['ventana'] + 1} con el estado guardado de la ventana {estado['ventana']}")
+            reanudar_desde = estado['ventana'] + 1
+
+    def calcular_perdidas(pred, y, validos):
+        """
+        Pérdida de cada cabeza, solo en las filas con objetivo, y pérdida total ponderada. Con un conjunto (pred de
+        forma (K, batch, salidas)) son tensores con la pérdida de cada miembro.
+        """
+        if pred.dim() == 3:
+            perdidas = [calcular_perdidas(pred_miembro, y, validos) for pred_miembro in pred]
+            return ({cabeza: torch.stack([por_cabeza[cabeza] for por_cabeza, _ in perdidas]) for cabeza in cabezas},
+                    torch.stack([total for _, total in perdidas]))
+        por_cabeza = {}
+        for j, cabeza in enumerate(cabezas):
+            pred_cabeza, y_cabeza = pred[:, j:j+1], y[:, j:j+1]
+            if validos[cabeza] is not None:
+                pred_cabeza, y_cabeza = pred_cabeza[validos[cabeza]], y_cabeza[validos[cabeza]]
+            por_cabeza[cabeza] = criterios[cabeza](pred_cabeza, y_cabeza)
+        if len(cabezas) == 1:
+            return por_cabeza, por_cabeza[cabezas[0]]
+        return por_cabeza, sum(pesos[cabeza] * por_cabeza[cabeza] for cabeza in cabezas)
+
+    def adelante(x_actual, x_home, x_away, len_home, len_away):
+        """Forward del modelo con la precisión elegida; la salida se devuelve siempre en float32."""
+        if tipo_autocast is None:
+            return red(x_actual, x_home, x_away, len_home, len_away)
+        with torch.autocast(device_type=device.type, dtype=tipo_autocast):
+            salida = red(x_actual, x_home, x_away, len_home, len_away)
+        return salida.float()
+
+    def filas_con_objetivo(y):
+        """Máscara de filas con objetivo para cada cabeza (None si lo tienen todas, para no copiar)."""
+        validos = {}
+        for j, cabeza in enumerate(cabezas):
+            mascara = ~torch.isnan(y[:, j])
+            validos[cabeza] = None if bool(mascara.all()) else mascara
+        return validos
+
+    def nueva_fila(current_window, epoch, train_losses, test_losses, metrics, miembros_fila=None):
+        for cabeza in cabezas:
+            fila = {'Window': current_window, 'Epoch': epoch,
+                    'TrainingLoss': train_losses[cabeza], 'ValidationLoss': test_losses[cabeza]}
+            for columna, clave in TAREAS[cabeza]['columnas'].items():
+                fila[columna] = metrics[cabeza][clave]
+            if miembros_fila is not None:
+                fila['Varianza'] = miembros_fila['varianza'][cabeza]
+                for k in range(miembros):
+                    fila[f'TrainingLoss_{k}'] = miembros_fila['train'][cabeza][k]
+                    fila[f'ValidationLoss_{k}'] = miembros_fila['test'][cabeza][k]
+                    for columna, clave in TAREAS[cabeza]['columnas'].items():
+                        fila[f'{columna}_{k}'] = miembros_fila['metricas'][k][cabeza][clave]
+            filas[cabeza].append(fila)
+
+    def resumen_metricas(metrics):
+        return ', '.join(f'{clave.upper()}: {metrics[cabeza][clave]:.4f}' for cabeza in cabezas for clave in TAREAS[cabeza]['log'])
+
+    for current_window, train_year_weeks, test_year_weeks, train_indices, test_indices in ventanas:
+        if reanudar_desde is not None and current_window < reanudar_desde:
+            continue
+        if hasta_ventana is not None and current_window > hasta_ventana:
+            break
+        log(f"Ventana {current_window} de {total_windows}")
+        log(f"Entrenando con semanas: {train_year_weeks}, testeando en semanas {test_year_weeks}, len train: {len(train_indices)}, len test: {len(test_indices)}, porcentaje: {len(train_indices)/(len(train_indices)+len(test_indices)):.2f}")
+
+        # Comprobar si hay suficientes datos
+        if len(train_indices) < 50 or len(test_indices) < 10:
+            log(f"Saltando ventana {current_window} por datos insuficientes: train={len(train_indices)}, test={len(test_indices)}")
+            continue
+
+        # Filas y ejemplos que hay antes de la ventana, para guardar en su checkpoint solo los nuevos
+        inicio_filas = {cabeza: len(filas[cabeza]) for cabeza in cabezas}
+        inicio_ejemplos = len(ejemplos_predicciones)
+        # La traza se cierra (y se escribe) también si la ventana falla
+        with perfil.traza(current_window, device):
+            perfil.inicio_ventana(current_window, device)
+
+            with perfil.fase('preparacion'):
+                train_idx = torch.as_tensor(train_indices, device=device)
+                test_idx = torch.as_tensor(test_indices, device=device)
+                tensor_X_train_actual = datos['actual'][train_idx]
+                tensor_Y_train_actual = datos['y'][train_idx]
+                tensor_X_test_actual = datos['actual'][test_idx]
+                tensor_Y_test_actual = datos['y'][test_idx]
+                tensor_X_train_previos_home = datos['home'][train_idx]
+                tensor_X_train_previos_away = datos['away'][train_idx]
+                tensor_X_test_previos_home = datos['home'][test_idx]
+                tensor_X_test_previos_away = datos['away'][test_idx]
+                len_train_home, len_train_away, len_test_home, len_test_away = longitudes_ventana(datos, train_indices, test_indices)
+                validos_train = filas_con_objetivo(tensor_Y_train_actual)
+                validos_test = filas_con_objetivo(tensor_Y_test_actual)
+                if datos.get('escalado') is not None:
+                    # Escalado con las estadísticas de las semanas de entrenamiento de esta ventana
+                    transformacion = datos['escalado'].transformacion(train_year_weeks, device)
+                    tensor_X_train_actual, tensor_X_train_previos_home, tensor_X_train_previos_away = EscaladoVentanas.aplicar(
+                        transformacion, tensor_X_train_actual, tensor_X_train_previos_home, tensor_X_train_previos_away,
+                        len_train_home, len_train_away)
+                    tensor_X_test_actual, tensor_X_test_previos_home, tensor_X_test_previos_away = EscaladoVentanas.aplicar(
+                        transformacion, tensor_X_test_actual, tensor_X_test_previos_home, tensor_X_test_previos_away,
+                        len_test_home, len_test_away)
+
+            # Early stopping
+            best_val_loss = float('inf')
+            patience_counter = 0
+            epoca_mejor = 0
+            miembros_fila = None
+            if conjunto:
+                # Early stopping de cada miembro
+                mejor_miembros = np.full(miembros, np.inf)
+                paciencia_miembros = np.zeros(miembros, dtype=np.int64)
+                epoca_mejor = np.zeros(miembros, dtype=np.int64)
+            gestor.reiniciar_ventana()
+
+            # Aplicar warm-up si no es la primera ventana
+            if current_window > 1 and gestor.hay_anterior:
+                with perfil.fase('carga_pesos'):
+                    gestor.cargar_anterior(model)
+                log(f"Iniciando ventana {current_window} con pesos de la ventana anterior")
+
+            # Entrenamiento
+            for epoch in range(epochs):
+                perfil.epoca()
+                model.train()
+
+                with perfil.fase('forward_backward'):
+                    # Forward pass
+                    y_pred = adelante(tensor_X_train_actual, tensor_X_train_previos_home, tensor_X_train_previos_away, len_train_home, len_train_away)
+                    train_losses, loss = calcular_perdidas(y_pred, tensor_Y_train_actual, validos_train)
+
+                    # Backward pass y optimización
+                    optimizer.zero_grad()
+                    # Los miembros no comparten parámetros: el gradiente de la suma es el de la pérdida de cada uno
+                    (loss.sum() if conjunto else loss).backward()
+                    optimizer.step()
+                    if conjunto:
+                        miembros_fila = {'train': {cabeza: perdida.tolist() for cabeza, perdida in train_losses.items()}}
+                        with torch.no_grad():
+                            train_losses, loss = calcular_perdidas(TennisRNNConjunto.media(y_pred), tensor_Y_train_actual, validos_train)
+                    train_loss = loss.item()
+                    train_losses = {cabeza: perdida.item() for cabeza, perdida in train_losses.items()}
+
+                model.eval()
+                with torch.no_grad():
+                    with perfil.fase('evaluacion'):
+                        y_test_pred = adelante(tensor_X_test_actual, tensor_X_test_previos_home, tensor_X_test_previos_away, len_test_home, len_test_away)
+                        if conjunto:
+                            y_test_miembros = y_test_pred
+                            test_losses, total_test_loss = calcular_perdidas(y_test_miembros, tensor_Y_test_actual, validos_test)
+                            perdidas_miembros = total_test_loss.cpu().numpy()
+                            miembros_fila['test'] = {cabeza: perdida.tolist() for cabeza, perdida in test_losses.items()}
+                            y_test_pred = TennisRNNConjunto.media(y_test_miembros)
+                            varianza_test = TennisRNNConjunto.varianza(y_test_miembros)
+                        test_losses, total_test_loss = calcular_perdidas(y_test_pred, tensor_Y_test_actual, validos_test)
+                        test_loss = total_test_loss.item()
+                        test_losses = {cabeza: perdida.item() for cabeza, perdida in test_losses.items()}
+                        if conjunto:
+                            mejoran = mejor_miembros - perdidas_miembros > min_delta
+                            mejora = bool(mejoran.any())
+                        else:
+                            mejora = best_val_loss - test_loss > min_delta
+
+                    with perfil.fase('metricas'):
+                        metrics = {}
+                        if conjunto:
+                            miembros_fila['metricas'] = [{} for _ in range(miembros)]
+                            miembros_fila['varianza'] = {}
+                        for j, cabeza in enumerate(cabezas):
+                            pred_cabeza, y_cabeza, indices_cabeza = y_test_pred[:, j:j+1], tensor_Y_test_actual[:, j:j+1], test_indices
+                            mascara = validos_test[cabeza]
+                            if mascara is not None:
+                                pred_cabeza, y_cabeza, indices_cabeza = pred_cabeza[mascara], y_cabeza[mascara], test_indices[mascara.cpu().numpy()]
+                            metrics[cabeza] = TAREAS[cabeza]['metricas'](pred_cabeza, y_cabeza)
+                            varianza_cabeza = None
+                            if conjunto:
+                                varianza_cabeza = varianza_test[:, j:j+1] if mascara is None else varianza_test[mascara, j:j+1]
+                                miembros_fila['varianza'][cabeza] = varianza_cabeza.mean().item()
+                                for k in range(miembros):
+                                    pred_miembro = y_test_miembros[k, :, j:j+1] if mascara is None else y_test_miembros[k, mascara, j:j+1]
+                                    miembros_fila['metricas'][k][cabeza] = TAREAS[cabeza]['metricas'](pred_miembro, y_cabeza)
+
+                            # Guardar ejemplos de predicción
+                            if cabeza == 'regresion' and (epoch == 0 or mejora):
+                                guardar_ejemplos_prediccion(ejemplos_predicciones, pred_cabeza, y_cabeza, indices_cabeza, current_window,
+                                                            varianza=varianza_cabeza)
+
+                    # Early stopping
+                    if conjunto:
+                        # Cada miembro guarda su mejor época; se para cuando ninguno ha mejorado en patience épocas
+                        if mejora:
+                            with perfil.fase('checkpoint'):
+                                gestor.guardar_mejor(model, torch.as_tensor(mejoran, device=device))
+                        mejor_miembros = np.where(mejoran, perdidas_miembros, mejor_miembros)
+                        epoca_mejor = np.where(mejoran, epoch, epoca_mejor)
+                        paciencia_miembros = np.where(mejoran, 0, paciencia_miembros + 1)
+                        patience_counter = int(paciencia_miembros.min())
+                    elif mejora:
+                        best_val_loss = test_loss
+                        # Guardar el estado del modelo
+                        with perfil.fase('checkpoint'):
+                            gestor.guardar_mejor(model)
+                        patience_counter = 0
+                        epoca_mejor = epoch
+                    else:
+                        patience_counter += 1
+
+                    if patience_counter >= patience:
+                        log(f'Ventana {current_window}, Época: {epoch}, Train Loss: {train_loss:.8f}, Test Loss: {test_loss:.8f}, {resumen_metricas(metrics)}')
+                        nueva_fila(current_window, epoch, train_losses, test_losses, metrics, miembros_fila)
+                        log(f"Early stopping en la ventana {current_window}, época {epoch}")
+                        break
+
+                if epoch % view_step == 0:
+                    log(f'Ventana {current_window}, Época: {epoch}, Train Loss: {train_loss:.8f}, Test Loss: {test_loss:.8f}, {resumen_metricas(metrics)}')
+
+                # Guardar información para visualización
+                nueva_fila(current_window, epoch, train_losses, test_losses, metrics, miembros_fila)
+
+            with perfil.fase('checkpoint'):
+                # Cargar el mejor modelo
+                if gestor.hay_mejor:
+                    gestor.cargar_mejor(model)  # Cargar el mejor modelo de esta ventana
+                    gestor.consolidar_ventana()  # Guardar para la siguiente ventana
+                    log(f"Mejor modelo guardado en la época  {epoca_mejor.tolist() if conjunto else epoca_mejor} para la ventana {current_window}")
+
+            if predicciones is not None:
+                with perfil.fase('evaluacion'):
+                    # Predicciones de test del modelo con el que termina la ventana
+                    model.eval()
+                    with torch.no_grad():
+                        pred_test = adelante(tensor_X_test_actual, tensor_X_test_previos_home, tensor_X_test_previos_away,
+                                             len_test_home, len_test_away)
+                    if conjunto:
+                        pred_test = TennisRNNConjunto.media(pred_test)
+                    pred_test = pred_test.cpu().numpy()
+                    prediccion_ventana = {'ventana': np.full(len(test_indices), current_window), 'indice_dataset': test_indices}
+                    for j, cabeza in enumerate(cabezas):
+                        prediccion_ventana[f'prediccion_{cabeza}'] = pred_test[:, j]
+                    predicciones.append(prediccion_ventana)
+
+            with perfil.fase('checkpoint'):
+                extra = {'filas': {cabeza: filas[cabeza][inicio_filas[cabeza]:] for cabeza in cabezas},
+                         'ejemplos': ejemplos_predicciones[inicio_ejemplos:]}
+                if predicciones is not None:
+                    extra['predicciones'] = [prediccion_ventana]
+                gestor.guardar_ventana(current_window, model, optimizer, extra=extra)
+            if registro is not None:
+                # La última fila de cada cabeza es la de la última época de la ventana
+                for cabeza in cabezas:
+                    fila = filas[cabeza][-1]
+                    registro.registrar_ventana(cabeza, fila)
+                    for k in range(miembros if conjunto else 0):
+                        # Cada miembro como una cabeza más, con las columnas de sus métricas sin el sufijo
+                        registro.registrar_ventana(f'{cabeza}/{k}', fila_miembro(fila, k))
+            perfil.fin_ventana()
+        log("-------------------")
+
+    gestor.cerrar()
+    resultados = {cabeza: pd.DataFrame(filas[cabeza], columns=columnas_resultados(cabeza, miembros)) for cabeza in cabezas}
+    if tarea != 'multitarea':
+        resultados = resultados[tarea]
+    return model, resultados, ejemplos_predicciones
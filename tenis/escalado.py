@@ -0,0 +1,261 @@
+"""
+Escalado sin fuga de información por ventana walk-forward. 4.preprocesamiento.ipynb ajusta los escaladores con
+todo el dataset, así que cada ventana ve medias y rangos calculados también con las semanas de test y las
+futuras. Aquí se precalculan, por semana, el número de valores, la suma, la suma de cuadrados, el mínimo y el
+máximo de cada columna; con sus sumas acumuladas (y una tabla dispersa para mínimos y máximos) las
+estadísticas de las semanas de entrenamiento de cualquier ventana salen en O(1), y entrenar_ventanas escala
+los tensores de cada ventana con ellas.
+
+Como el escalado estándar y el min-max son invariantes a una transformación afín previa, escalar por ventana
+los datos ya escalados globalmente da lo mismo que escalar los datos originales con las estadísticas de la
+ventana: no hace falta guardar el dataset sin escalar.
+
+    datos = preparar_tensores(..., escalado='ventana')
+    entrenar_ventanas(datos, ...)
+"""
+import numpy as np
+import pandas as pd
+import torch
+
+# Columnas que escala 4.preprocesamiento.ipynb y con qué escalador
+COLUMNAS_ESCALADO = {
+    'actual': {
+        'estandar': ['porcentajeActualRanking', 'porcentajeBestRanking', 'difHeight', 'difWeight', 'difYear',
+                     'difElo', 'difEloSuperficie', 'difGlicko'],
+        'minmax': [],
+    },
+    'previos': {
+        'estandar': ['HeightHome', 'WeightHome', 'HeightAway', 'WeightAway', 'edad_home', 'edad_away', 'days_no_played',
+                     'EloHome', 'EloAway', 'EloSuperficieHome', 'EloSuperficieAway', 'GlickoHome', 'GlickoAway',
+                     'GlickoRdHome', 'GlickoRdAway'],
+        'minmax': ['ActualRankingHome', 'BestRankingHome', 'ActualRankingAway', 'BestRankingAway', 'homeScore',
+                   'awayScore', 'set1performanceHome', 'set1performanceAway', 'set2performanceHome',
+                   'set2performanceAway', 'set3performanceHome', 'set3performanceAway', 'set4performanceHome',
+                   'set4performanceAway', 'set5performanceHome', 'set5performanceAway', 'totalGamesHome',
+                   'totalGamesAway'],
+    },
+}
+
+MODOS = ('ventana', 'acumulado')
+
+
+class EstadisticasSemanales:
+    """
+    Estadísticas por columna de un conjunto de filas agrupadas por semana, consultables para cualquier rango de
+    semanas consecutivas en O(1): conteo, suma y suma de cuadrados con sumas acumuladas, y mínimo y máximo con
+    una tabla dispersa (el mínimo de [a, b) es el de los dos bloques de 2^k semanas que lo cubren).
+    """
+
+    def __init__(self, conteo, suma, suma_cuadrados, minimo, maximo):
+        """
+        Args:
+            conteo, suma, suma_cuadrados, minimo, maximo (np.array): Estadísticas de cada semana, de forma
+                (n_semanas, n_columnas). Las semanas sin valores tienen mínimo inf y máximo -inf.
+        """
+        ceros = np.zeros((1, conteo.shape[1]))
+        self.conteo = np.vstack([ceros, np.cumsum(conteo, axis=0)])
+        self.suma = np.vstack([ceros, np.cumsum(suma, axis=0)])
+        self.suma_cuadrados = np.vstack([ceros, np.cumsum(suma_cuadrados, axis=0)])
+        self.minimos = [minimo]
+        self.maximos = [maximo]
+        salto = 1
+        while 2 * salto <= len(minimo):
+            self.minimos.append(np.minimum(self.minimos[-1][:-salto], self.minimos[-1][salto:]))
+            self.maximos.append(np.maximum(self.maximos[-1][:-salto], self.maximos[-1][salto:]))
+            salto *= 2
+
+    @classmethod
+    def desde_filas(cls, valores, semana, n_semanas, validos=None):
+        """
+        Args:
+            valores (np.array): Filas, de forma (n_filas, n_columnas).
+            semana (np.array): Posición de la semana de cada fila (0..n_semanas-1).
+            n_semanas (int): Número de semanas.
+            validos (np.array): Filas que cuentan (por ejemplo, sin el relleno de los previos). Por defecto, todas.
+        """
+        estadisticas = cls.acumulador(n_semanas, valores.shape[1])
+        cls.acumular(estadisticas, valores, semana, validos)
+        return cls(*estadisticas)
+
+    @staticmethod
+    def acumulador(n_semanas, n_columnas):
+        """Estadísticas vacías (conteo, suma, suma de cuadrados, mínimo y máximo) para ir acumulando filas."""
+        return (np.zeros((n_semanas, n_columnas)), np.zeros((n_semanas, n_columnas)), np.zeros((n_semanas, n_columnas)),
+                np.full((n_semanas, n_columnas), np.inf), np.full((n_semanas, n_columnas), -np.inf))
+
+    @staticmethod
+    def acumular(estadisticas, valores, semana, validos=None):
+        """Añade unas filas a las estadísticas de sus semanas. Los NaN no cuentan."""
+        conteo, suma, suma_cuadrados, minimo, maximo = estadisticas
+        valores = np.asarray(valores, dtype=np.float64)
+        presentes = ~np.isnan(valores)
+        if validos is not None:
+            presentes &= np.asarray(validos)[:, None]
+        semana = np.asarray(semana)
+        if (np.diff(semana) < 0).any():
+            orden = np.argsort(semana, kind='stable')
+            semana, valores, presentes = semana[orden], valores[orden], presentes[orden]
+        # Con las filas ordenadas por semana (los partidos ya suelen venir así), cada semana es un tramo contiguo
+        cortes = np.flatnonzero(semana[1:] != semana[:-1]) + 1
+        for inicio, fin in zip(np.r_[0, cortes], np.r_[cortes, len(semana)]):
+            if fin == inicio:
+                continue
+            w = semana[inicio]
+            tramo, presentes_tramo = valores[inicio:fin], presentes[inicio:fin]
+            limpios = np.where(presentes_tramo, tramo, 0.0)
+            conteo[w] += presentes_tramo.sum(axis=0)
+            suma[w] += limpios.sum(axis=0)
+            suma_cuadrados[w] += (limpios * limpios).sum(axis=0)
+            minimo[w] = np.minimum(minimo[w], np.where(presentes_tramo, tramo, np.inf).min(axis=0))
+            maximo[w] = np.maximum(maximo[w], np.where(presentes_tramo, tramo, -np.inf).max(axis=0))
+
+    def rango(self, desde, hasta):
+        """
+        Args:
+            desde, hasta (int): Semanas [desde, hasta).
+        Returns:
+            dict: 'n', 'media', 'std' (poblacional, como StandardScaler), 'min' y 'max' de cada columna.
+        """
+        n = self.conteo[hasta] - self.conteo[desde]
+        with np.errstate(invalid='ignore', divide='ignore'):
+            media = (self.suma[hasta] - self.suma[desde]) / n
+            varianza = (self.suma_cuadrados[hasta] - self.suma_cuadrados[desde]) / n - media * media
+        nivel = int(np.log2(hasta - desde))
+        bloque = 1 << nivel
+        minimo = np.minimum(self.minimos[nivel][desde], self.minimos[nivel][hasta - bloque])
+        maximo = np.maximum(self.maximos[nivel][desde], self.maximos[nivel][hasta - bloque])
+        return {'n': n, 'media': media, 'std': np.sqrt(np.maximum(varianza, 0)), 'min': minimo, 'max': maximo}
+
+
+def _indices_escalado(nombres, columnas):
+    """Posiciones de las columnas con escalado estándar y min-max (solo las que están en nombres)."""
+    nombres = list(nombres)
+    return {escalador: [nombres.index(columna) for columna in columnas.get(escalador, []) if columna in nombres]
+            for escalador in ('estandar', 'minmax')}
+
+
+def _afin(estadisticas, indices, n_columnas):
+    """
+    Centro y escala de cada columna (0 y 1 en las que no se escalan), como StandardScaler y MinMaxScaler. Las
+    estadísticas son solo de las columnas escaladas: primero las estándar y después las min-max.
+    """
+    estandar, minmax = indices['estandar'], indices['minmax']
+    n_estandar = len(estandar)
+    centro = np.zeros(n_columnas)
+    escala = np.ones(n_columnas)
+    centro[estandar] = estadisticas['media'][:n_estandar]
+    escala[estandar] = estadisticas['std'][:n_estandar]
+    centro[minmax] = estadisticas['min'][n_estandar:]
+    escala[minmax] = estadisticas['max'][n_estandar:] - estadisticas['min'][n_estandar:]
+    # Columnas constantes o sin datos en la ventana: se dejan sin escalar, como hacen los escaladores de sklearn
+    escala[~np.isfinite(escala) | (escala == 0)] = 1
+    centro[~np.isfinite(centro)] = 0
+    return centro, escala
+
+
+class EscaladoVentanas:
+    """
+    Escalado de cada ventana con las estadísticas de sus semanas de entrenamiento ('ventana') o de todas las
+    semanas hasta el final de su entrenamiento ('acumulado').
+    """
+
+    def __init__(self, estadisticas_actual, estadisticas_previos, columnas_actual, columnas_previos, semanas,
+                 modo='ventana', columnas=None):
+        """
+        Args:
+            estadisticas_actual, estadisticas_previos (EstadisticasSemanales): Estadísticas por semana de las
+                columnas escaladas, primero las de escalado estándar y después las min-max.
+            columnas_actual, columnas_previos (list): Nombres de las columnas de los tensores 'actual' y de previos.
+            semanas (np.array): year_week_id en el orden en el que los recorre ventanas_walk_forward.
+            modo (str): 'ventana' o 'acumulado'.
+            columnas (dict): Columnas a escalar y con qué escalador. Por defecto, COLUMNAS_ESCALADO.
+        """
+        if modo not in MODOS:
+            raise ValueError(f"Modo de escalado no soportado: {modo}. Opciones: {list(MODOS)}")
+        columnas = columnas or COLUMNAS_ESCALADO
+        self.estadisticas = {'actual': estadisticas_actual, 'previos': estadisticas_previos}
+        self.indices = {'actual': _indices_escalado(columnas_actual, columnas['actual']),
+                        'previos': _indices_escalado(columnas_previos, columnas['previos'])}
+        self.n_columnas = {'actual': len(columnas_actual), 'previos': len(columnas_previos)}
+        self.posicion = {semana: i for i, semana in enumerate(semanas)}
+        self.modo = modo
+
+    @classmethod
+    def desde_datos(cls, datos, columnas_actual, columnas_previos, modo='ventana', columnas=None, tamano_bloque=4096):
+        """
+        Calcula las estadísticas por semana a partir de los tensores del dataset (ver preparar_tensores). De los
+        previos cuentan las filas de los bloques local y visitante de cada partido, sin el relleno, en la
+        semana del partido actual.
+        Args:
+            datos (dict): Tensores del dataset.
+            columnas_actual, columnas_previos (list): Nombres de las columnas.
+            modo (str): 'ventana' o 'acumulado'.
+            columnas (dict): Columnas a escalar (ver COLUMNAS_ESCALADO).
+            tamano_bloque (int): Partidos por bloque al recorrer los previos (acota la memoria).
+        """
+        columnas = columnas or COLUMNAS_ESCALADO
+        # Solo se calculan estadísticas de las columnas que se escalan
+        indices_actual = _indices_escalado(columnas_actual, columnas['actual'])
+        indices_previos = _indices_escalado(columnas_previos, columnas['previos'])
+        usadas_actual = indices_actual['estandar'] + indices_actual['minmax']
+        usadas_previos = indices_previos['estandar'] + indices_previos['minmax']
+
+        semanas = pd.unique(datos['year_week_id'])
+        posicion = pd.Series(np.arange(len(semanas)), index=semanas)
+        semana = posicion.loc[datos['year_week_id']].to_numpy()
+        actual = EstadisticasSemanales.desde_filas(datos['actual'].cpu().numpy()[:, usadas_actual], semana, len(semanas))
+
+        estadisticas = EstadisticasSemanales.acumulador(len(semanas), len(usadas_previos))
+        n_partidos = datos['actual'].shape[0]
+        # Sin columnas de previos que escalar no hay nada que acumular: los previos se quedan sin escalar
+        for inicio in range(0, n_partidos if usadas_previos else 0, tamano_bloque):
+            fin = min(inicio + tamano_bloque, n_partidos)
+            bloque = torch.arange(inicio, fin)
+            for clave, clave_longitud in (('home', 'len_home'), ('away', 'len_away')):
+                filas = datos[clave][bloque].cpu().numpy()[:, :, usadas_previos]
+                num_previos = filas.shape[1]
+                if datos.get(clave_longitud) is None:
+                    validos = None
+                else:
+                    validos = (np.arange(num_previos)[None, :] < datos[clave_longitud][bloque].numpy()[:, None]).ravel()
+                EstadisticasSemanales.acumular(estadisticas, filas.reshape(-1, filas.shape[2]),
+                                               np.repeat(semana[inicio:fin], num_previos), validos)
+        previos = EstadisticasSemanales(*estadisticas)
+        return cls(actual, previos, columnas_actual, columnas_previos, semanas, modo, columnas)
+
+    def transformacion(self, semanas_train, device='cpu'):
+        """
+        Args:
+            semanas_train (np.array): year_week_id de las semanas de entrenamiento de la ventana (consecutivas).
+            device (torch.device): Dispositivo de los tensores devueltos.
+        Returns:
+            dict: Centro y escala (tensores) de 'actual' y de 'previos': x_escalado = (x - centro) / escala.
+        """
+        hasta = self.posicion[semanas_train[-1]] + 1
+        desde = 0 if self.modo == 'acumulado' else self.posicion[semanas_train[0]]
+        transformacion = {}
+        for parte in ('actual', 'previos'):
+            centro, escala = _afin(self.estadisticas[parte].rango(desde, hasta), self.indices[parte], self.n_columnas[parte])
+            transformacion[parte] = (torch.tensor(centro, dtype=torch.float32, device=device),
+                                     torch.tensor(escala, dtype=torch.float32, device=device))
+        return transformacion
+
+    @staticmethod
+    def aplicar(transformacion, x_actual, x_home, x_away, len_home=None, len_away=None):
+        """
+        Escala los tensores de una ventana. El relleno de los previos (las posiciones a partir de la longitud de
+        cada secuencia) sigue siendo cero.
+        Returns:
+            tuple: x_actual, x_home y x_away escalados.
+        """
+        centro, escala = transformacion['actual']
+        x_actual = (x_actual - centro) / escala
+        centro, escala = transformacion['previos']
+        escalados = []
+        for x, longitudes in ((x_home, len_home), (x_away, len_away)):
+            x = (x - centro) / escala
+            if longitudes is not None:
+                reales = torch.arange(x.shape[1], device=x.device)[None, :] < longitudes.to(x.device)[:, None]
+                x = x * reales[:, :, None]
+            escalados.append(x)
+        return x_actual, escalados[0], escalados[1]
@@ -0,0 +1,191 @@
+"""
+Esquema de tipos de los datasets de partidos y su guardado en Parquet. Los CSV se leían sin tipos: los ids como
+float64, tournamentName, groundType y los países como cadenas de Python repetidas en cada fila, RightHanded como
+float... y cada notebook los volvía a parsear. Con el esquema los ids son int32, los timestamps int64, las
+medidas float32 y las cadenas categóricas, y el Parquet (comprimido con zstd) los conserva al leer.
+
+Las columnas enteras que tienen huecos (las filas de relleno de previos) se guardan con el tipo entero de pandas
+que admite nulos (Int32, Int64...), como hace limpieza_final en el scraper.
+
+    guardar_tabla(actual, '../data/actual.parquet')
+    actual = leer_tabla('../data/actual.parquet')
+    guardar_tabla(actual_diferencias, '../data/actual_diferencias_preproc_escalado.parquet', ESQUEMA_PREPROCESADO)
+"""
+import os
+
+import numpy as np
+import pandas as pd
+
+ESQUEMA_PARTIDOS = {
+    # Identificadores
+    'idTournament': 'int32', 'idSeason': 'int32', 'idEvent': 'int32', 'idNext': 'int32', 'idHome': 'int32',
+    'idAway': 'int32', 'round': 'int16',
+    # Timestamps (segundos)
+    'startTimestamp': 'int64', 'lastMatchTimestamp': 'int64', 'birthDateHome': 'int64', 'birthDateAway': 'int64',
+    'BestRankingDateHome': 'int64', 'BestRankingDateAway': 'int64',
+    # Enteros pequeños
+    'year': 'int16', 'periodCount': 'int8', 'winnerCode': 'int8', 'RightHandedHome': 'int8',
+    'RightHandedAway': 'int8', 'relleno': 'int8', 'numPreviosHome': 'int16', 'numPreviosAway': 'int16',
+    'ActualRankingHome': 'int16', 'ActualRankingAway': 'int16', 'BestRankingHome': 'int16', 'BestRankingAway': 'int16',
+    'homeScore': 'int8', 'awayScore': 'int8', 'totalGamesHome': 'int16', 'totalGamesAway': 'int16',
+    # Medidas
+    'HeightHome': 'float32', 'WeightHome': 'float32', 'HeightAway': 'float32', 'WeightAway': 'float32',
+    'ProbabilityHome': 'float32', 'ProbabilityAway': 'float32',
+    **{f'set{s}performance{lado}': 'float32' for s in range(1, 6) for lado in ('Home', 'Away')},
+    # Cadenas
+    'tournamentName': 'category', 'groundType': 'category', 'countryHome': 'category', 'countryAway': 'category',
+    'status': 'category',
+}
+# En los datasets preprocesados las columnas de los partidos ya están escaladas: solo se fijan las enteras. Las
+# columnas que no están en el esquema se guardan como float32 si son decimales y con el entero más pequeño en el
+# que caben si son enteras
+ESQUEMA_PREPROCESADO = {
+    'winnerCode': 'int8', 'year_week_id': 'int32', 'numPreviosHome': 'int16', 'numPreviosAway': 'int16',
+}
+COMPRESION = 'zstd'
+
+
+def _convertir(serie, tipo):
+    """Convierte una columna a su tipo del esquema; los enteros con huecos pasan al tipo de pandas con nulos."""
+    if tipo == 'category':
+        return serie.astype('category')
+    valores = pd.to_numeric(serie, errors='coerce')
+    if tipo.startswith('float'):
+        return valores.astype(tipo)
+    if (valores.dropna() % 1 != 0).any():
+        raise ValueError(f"La columna {serie.name} tiene valores no enteros y el esquema la declara {tipo}")
+    if valores.isna().any():
+        return valores.astype(tipo.capitalize())
+    return valores.astype(tipo)
+
+
+def aplicar_esquema(df, esquema=None):
+    """
+    Args:
+        df (pd.DataFrame): Partidos (actual, previos o sus versiones finales) o datasets preprocesados.
+        esquema (dict): Tipo de cada columna. Por defecto, ESQUEMA_PARTIDOS (ESQUEMA_PREPROCESADO para los
+            datasets preprocesados).
+    Returns:
+        pd.DataFrame: Copia de df con los tipos del esquema, y float32 o el entero más pequeño en el resto de
+            columnas numéricas.
+    """
+    esquema = ESQUEMA_PARTIDOS if esquema is None else esquema
+    df = df.copy()
+    for columna in df.columns:
+        serie = df[columna]
+        if columna in esquema:
+            df[columna] = _convertir(serie, esquema[columna])
+        elif pd.api.types.is_bool_dtype(serie):
+            df[columna] = serie.astype('int8')
+        elif pd.api.types.is_float_dtype(serie):
+            df[columna] = serie.astype('float32')
+        elif pd.api.types.is_integer_dtype(serie):
+            if pd.api.types.is_extension_array_dtype(serie) and not serie.isna().any():
+                # Sin huecos no hace falta el entero con nulos, que numpy convierte a object
+                serie = serie.astype('int64')
+            df[columna] = pd.to_numeric(serie, downcast='integer')
+    return df
+
+
+def sin_esquema(df):
+    """
+    Devuelve df con los tipos con los que se leían los CSV: categóricas como object y enteros con nulos como
+    float64. El postprocesado del scraper compara e intercambia filas una a una y no admite pd.NA ni categorías
+    distintas en las columnas Home y Away.
+    """
+    df = df.copy()
+    for columna in df.columns:
+        serie = df[columna]
+        if isinstance(serie.dtype, pd.CategoricalDtype):
+            df[columna] = serie.astype(object).where(serie.notna(), np.nan)
+        elif pd.api.types.is_extension_array_dtype(serie) and pd.api.types.is_numeric_dtype(serie):
+            df[columna] = serie.astype('float64') if serie.isna().any() else serie.astype('int64')
+    return df
+
+
+def guardar_tabla(df, ruta, esquema=None):
+    """
+    Guarda df en Parquet con el esquema aplicado. Se escribe en un temporal y se renombra, así que un corte a
+    mitad de escritura no deja el fichero anterior a medias.
+    Args:
+        df (pd.DataFrame): Datos a guardar.
+        ruta (str): Fichero .parquet.
+        esquema (dict): Ver aplicar_esquema.
+    """
+    os.makedirs(os.path.dirname(ruta) or '.', exist_ok=True)
+    temporal = f'{ruta}.tmp'
+    aplicar_esquema(df, esquema).to_parquet(temporal, index=False, compression=COMPRESION)
+    os.replace(temporal, ruta)
+
+
+def leer_tabla(ruta, columnas=None, tipado=True, esquema=None):
+    """
+    Lee un dataset guardado con guardar_tabla. Si no existe el .parquet pero sí el .csv con el mismo nombre (datos
+    descargados antes de usar Parquet), se lee el CSV y se le aplica el esquema.
+    Args:
+        ruta (str): Fichero .parquet.
+        columnas (list): Columnas a leer (todas si es None).
+        tipado (bool): Si es False, se devuelve con los tipos de los CSV (ver sin_esquema).
+        esquema (dict): Esquema que se aplica al leer un .csv (ver aplicar_esquema).
+    Returns:
+        pd.DataFrame: Datos leídos.
+    """
+    if os.path.exists(ruta):
+        df = pd.read_parquet(ruta, columns=columnas)
+    else:
+        ruta_csv = os.path.splitext(ruta)[0] + '.csv'
+        if not os.path.exists(ruta_csv):
+            raise FileNotFoundError(f'No existe {ruta} ni {ruta_csv}')
+        df = aplicar_esquema(pd.read_csv(ruta_csv, usecols=columnas), esquema)
+    return df if tipado else sin_esquema(df)
+
+
+def contar_filas(ruta):
+    """Número de filas de un dataset guardado con guardar_tabla (o de su .csv), sin leerlo."""
+    if os.path.exists(ruta):
+        import pyarrow.parquet as pq
+        return pq.ParquetFile(ruta).metadata.num_rows
+    with open(os.path.splitext(ruta)[0] + '.csv', 'rb') as fichero:
+        return max(sum(1 for _ in fichero) - 1, 0)
+
+
+def leer_por_lotes(ruta, columnas=None, tamano_lote=100_000, desde=0, esquema=None):
+    """
+    Lee un dataset por lotes de filas, sin cargarlo entero en memoria. En Parquet se saltan sin leerlos los
+    grupos de filas anteriores a desde.
+    Args:
+        ruta (str): Fichero .parquet (o su .csv, como en leer_tabla).
+        columnas (list): Columnas a leer (todas si es None).
+        tamano_lote (int): Filas por lote.
+        desde (int): Primera fila a leer.
+        esquema (dict): Esquema que se aplica a los lotes del .csv (ver aplicar_esquema).
+    Yields:
+        pd.DataFrame: Lotes con el índice igual a la posición de cada fila en el dataset.
+    """
+    if os.path.exists(ruta):
+        import pyarrow.parquet as pq
+        fichero = pq.ParquetFile(ruta)
+        grupos, fila = [], 0
+        for grupo in range(fichero.num_row_groups):
+            filas_grupo = fichero.metadata.row_group(grupo).num_rows
+            if fila + filas_grupo > desde:
+                grupos.append(grupo)
+            fila += filas_grupo
+        if not grupos:
+            return
+        # Primera fila del primer grupo que se lee
+        fila = sum(fichero.metadata.row_group(grupo).num_rows for grupo in range(grupos[0]))
+        for lote in fichero.iter_batches(batch_size=tamano_lote, row_groups=grupos, columns=columnas):
+            df = lote.to_pandas()
+            df.index = pd.RangeIndex(fila, fila + len(df))
+            fila += len(df)
+            if fila > desde:
+                yield df.loc[max(desde, df.index[0]):]
+        return
+    ruta_csv = os.path.splitext(ruta)[0] + '.csv'
+    fila = desde
+    for df in pd.read_csv(ruta_csv, usecols=columnas, chunksize=tamano_lote, skiprows=range(1, desde + 1)):
+        df.index = pd.RangeIndex(fila, fila + len(df))
+        fila += len(df)
+        yield aplicar_esquema(df, esquema)
+
@@ -0,0 +1,253 @@
+"""
+Instrumentación de la descarga de datos: peticiones por endpoint (con histograma de latencias), reintentos,
+errores por código de estado, bytes descargados, aciertos de caché, partidos descartados por cada regla de
+filtrado y tiempo por etapa del pipeline. Las
+métricas se pueden volcar periódicamente a JSON o a texto de Prometheus.
+
+También incluye un log con niveles para sustituir a los print de los bucles. El nivel se elige con la
+variable de entorno TENIS_LOG (debug, info, aviso, error o nada; por defecto info) o con configurar_log.
+En los bucles conviene comprobar log_activo('debug') antes de construir el mensaje, para no pagar el
+formateo cuando el nivel está desactivado.
+"""
+import contextlib
+import functools
+import json
+import os
+import re
+import threading
+import time
+from collections import Counter, defaultdict
+from urllib.parse import urlsplit
+
+NIVELES = {'debug': 10, 'info': 20, 'aviso': 30, 'error': 40, 'nada': 100}
+_nivel = NIVELES.get(os.environ.get('TENIS_LOG', 'info').lower(), NIVELES['info'])
+
+# Límites superiores (en segundos) de los intervalos del histograma de latencias
+LIMITES_LATENCIA = (0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+
+def configurar_log(nivel):
+    """
+    Args:
+        nivel (str): Nivel mínimo de los mensajes que se imprimen (ver NIVELES).
+    """
+    global _nivel
+    if nivel not in NIVELES:
+        raise ValueError(f"Nivel de log desconocido: {nivel}. Opciones: {list(NIVELES)}")
+    _nivel = NIVELES[nivel]
+
+
+def log_activo(nivel):
+    """Indica si los mensajes del nivel indicado se imprimen."""
+    return NIVELES[nivel] >= _nivel
+
+
+def log(mensaje, nivel='info'):
+    """Imprime el mensaje si su nivel está activo."""
+    if NIVELES[nivel] >= _nivel:
+        print(mensaje)
+
+
+def plantilla_endpoint(url):
+    """
+    Agrupa las URLs por endpoint, cambiando los segmentos numéricos de la ruta por {id} y quitando los parámetros.
+    Por ejemplo https://www.sofascore.com/api/v1/team/123/events/last/0 -> /api/v1/team/{id}/events/last/{id}.
+    """
+    ruta = urlsplit(url).path
+    return re.sub(r'/\d+(?=/|$)', '/{id}', ruta)
+
+
+class Metricas:
+    """Contadores de las peticiones y de las etapas del pipeline. Se puede usar desde varios hilos."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reiniciar()
+
+    def reiniciar(self):
+        with self._lock:
+            self.inicio = time.time()
+            self.peticiones = Counter()  # (plantilla, estado) -> número
+            self.reintentos = Counter()  # (plantilla, motivo) -> número
+            self.bytes = Counter()  # plantilla -> bytes
+            self.latencias = defaultdict(lambda: [0] * (len(LIMITES_LATENCIA) + 1))  # plantilla -> cuentas por intervalo
+            self.segundos_peticiones = Counter()  # plantilla -> suma de latencias
+            self.cache = Counter()  # (nombre, 'acierto'/'fallo') -> número
+            self.filtros = Counter()  # (partido, fase, regla) -> número
+            self.etapas = defaultdict(lambda: {'llamadas': 0, 'segundos': 0.0})
+
+    def registrar_peticion(self, url, estado, segundos, n_bytes=0):
+        """
+        Args:
+            url (str): URL pedida.
+            estado (int or str): Código de estado HTTP, o el tipo de error si no hubo respuesta ('timeout', 'conexion'...).
+            segundos (float): Duración de la petición.
+            n_bytes (int): Tamaño de la respuesta.
+        """
+        plantilla = plantilla_endpoint(url)
+        intervalo = next((k for k, limite in enumerate(LIMITES_LATENCIA) if segundos <= limite), len(LIMITES_LATENCIA))
+        with self._lock:
+            self.peticiones[(plantilla, str(estado))] += 1
+            self.bytes[plantilla] += n_bytes
+            self.latencias[plantilla][intervalo] += 1
+            self.segundos_peticiones[plantilla] += segundos
+
+    def registrar_reintento(self, url, motivo):
+        with self._lock:
+            self.reintentos[(plantilla_endpoint(url), str(motivo))] += 1
+
+    def registrar_cache(self, nombre, acierto):
+        with self._lock:
+            self.cache[(nombre, 'acierto' if acierto else 'fallo')] += 1
+
+    def registrar_filtro(self, regla, partido, fase):
+        """
+        Args:
+            regla (str): Regla que descarta el partido, o 'aceptado' si pasa todas las de la fase.
+            partido (str): Tipo de partido ('actual' o 'previo').
+            fase (str): 'json' si se decide con el JSON del partido (antes de pedir los datos de los jugadores) o
+                'enriquecido' si se decide con el partido completo.
+        """
+        with self._lock:
+            self.filtros[(partido, fase, regla)] += 1
+
+    def registrar_etapa(self, nombre, segundos):
+        with self._lock:
+            self.etapas[nombre]['llamadas'] += 1
+            self.etapas[nombre]['segundos'] += segundos
+
+    @contextlib.contextmanager
+    def etapa(self, nombre):
+        """Mide el tiempo de un bloque: with metricas.etapa('imputacion'): ..."""
+        inicio = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.registrar_etapa(nombre, time.perf_counter() - inicio)
+
+    def medir(self, nombre=None):
+        """Decorador que mide el tiempo de cada llamada a la función como una etapa."""
+        def decorador(funcion):
+            nombre_etapa = nombre or funcion.__name__
+
+            @functools.wraps(funcion)
+            def envoltorio(*args, **kwargs):
+                with self.etapa(nombre_etapa):
+                    return funcion(*args, **kwargs)
+            return envoltorio
+        return decorador
+
+    def instantanea(self):
+        """
+        Returns:
+            dict: Estado actual de las métricas, serializable a JSON.
+        """
+        with self._lock:
+            endpoints = {}
+            for (plantilla, estado), n in self.peticiones.items():
+                endpoint = endpoints.setdefault(plantilla, {'peticiones': 0, 'estados': {}, 'reintentos': {}})
+                endpoint['peticiones'] += n
+                endpoint['estados'][estado] = n
+            for plantilla, endpoint in endpoints.items():
+                endpoint['bytes'] = self.bytes[plantilla]
+                endpoint['segundos'] = self.segundos_peticiones[plantilla]
+                endpoint['latencia_media'] = self.segundos_peticiones[plantilla] / endpoint['peticiones']
+                endpoint['histograma'] = dict(zip([str(limite) for limite in LIMITES_LATENCIA] + ['+Inf'],
+                                                  self.latencias[plantilla]))
+            for (plantilla, motivo), n in self.reintentos.items():
+                endpoints.setdefault(plantilla, {'peticiones': 0, 'estados': {}, 'reintentos': {}})['reintentos'][motivo] = n
+            cache = {}
+            for (nombre, resultado), n in self.cache.items():
+                cache.setdefault(nombre, {'acierto': 0, 'fallo': 0})[resultado] = n
+            filtros = {}
+            for (partido, fase, regla), n in self.filtros.items():
+                filtros.setdefault(partido, {}).setdefault(fase, {})[regla] = n
+            return {
+                'segundos_totales': time.time() - self.inicio,
+                'endpoints': endpoints,
+                'cache': cache,
+                'filtros': filtros,
+                'etapas': {nombre: dict(valores) for nombre, valores in self.etapas.items()},
+            }
+
+    def a_prometheus(self, prefijo='tenis'):
+        """
+        Returns:
+            str: Métricas en el formato de texto de Prometheus.
+        """
+        datos = self.instantanea()
+        lineas = [f'# TYPE {prefijo}_peticiones_total counter']
+        for plantilla, endpoint in datos['endpoints'].items():
+            for estado, n in endpoint['estados'].items():
+                lineas.append(f'{prefijo}_peticiones_total{{endpoint="{plantilla}",estado="{estado}"}} {n}')
+        lineas.append(f'# TYPE {prefijo}_reintentos_total counter')
+        for plantilla, endpoint in datos['endpoints'].items():
+            for motivo, n in endpoint['reintentos'].items():
+                lineas.append(f'{prefijo}_reintentos_total{{endpoint="{plantilla}",motivo="{motivo}"}} {n}')
+        lineas.append(f'# TYPE {prefijo}_bytes_total counter')
+        for plantilla, endpoint in datos['endpoints'].items():
+            lineas.append(f'{prefijo}_bytes_total{{endpoint="{plantilla}"}} {endpoint.get("bytes", 0)}')
+        lineas.append(f'# TYPE {prefijo}_latencia_segundos histogram')
+        for plantilla, endpoint in datos['endpoints'].items():
+            if 'histograma' not in endpoint:
+                continue
+            acumulado = 0
+            for limite, n in endpoint['histograma'].items():
+                acumulado += n
+                lineas.append(f'{prefijo}_latencia_segundos_bucket{{endpoint="{plantilla}",le="{limite}"}} {acumulado}')
+            lineas.append(f'{prefijo}_latencia_segundos_sum{{endpoint="{plantilla}"}} {endpoint["segundos"]}')
+            lineas.append(f'{prefijo}_latencia_segundos_count{{endpoint="{plantilla}"}} {endpoint["peticiones"]}')
+        lineas.append(f'# TYPE {prefijo}_cache_total counter')
+        for nombre, resultados in datos['cache'].items():
+            for resultado, n in resultados.items():
+                lineas.append(f'{prefijo}_cache_total{{cache="{nombre}",resultado="{resultado}"}} {n}')
+        lineas.append(f'# TYPE {prefijo}_filtro_partidos_total counter')
+        for partido, fases in datos['filtros'].items():
+            for fase, reglas in fases.items():
+                for regla, n in reglas.items():
+                    lineas.append(f'{prefijo}_filtro_partidos_total{{partido="{partido}",fase="{fase}",regla="{regla}"}} {n}')
+        lineas.append(f'# TYPE {prefijo}_etapa_segundos_total counter')
+        for nombre, etapa in datos['etapas'].items():
+            lineas.append(f'{prefijo}_etapa_segundos_total{{etapa="{nombre}"}} {etapa["segundos"]}')
+            lineas.append(f'{prefijo}_etapa_llamadas_total{{etapa="{nombre}"}} {etapa["llamadas"]}')
+        return '\n'.join(lineas) + '\n'
+
+    def guardar(self, ruta):
+        """
+        Guarda las métricas en JSON, o en texto de Prometheus si la ruta acaba en .prom.
+        Args:
+            ruta (str): Fichero de destino. Se escribe en un temporal y se renombra para no dejarlo a medias.
+        """
+        carpeta = os.path.dirname(ruta)
+        if carpeta:
+            os.makedirs(carpeta, exist_ok=True)
+        temporal = ruta + '.tmp'
+        with open(temporal, 'w', encoding='utf-8') as f:
+            if ruta.endswith('.prom'):
+                f.write(self.a_prometheus())
+            else:
+                json.dump(self.instantanea(), f, indent=2)
+        os.replace(temporal, ruta)
+
+    def volcar_periodicamente(self, ruta, intervalo=60):
+        """
+        Guarda las métricas cada `intervalo` segundos en un hilo en segundo plano.
+        Args:
+            ruta (str): Fichero de destino (ver guardar).
+            intervalo (float): Segundos entre volcados.
+        Returns:
+            threading.Event: Evento que detiene el volcado al activarlo (con un último volcado).
+        """
+        parar = threading.Event()
+
+        def volcar():
+            while not parar.wait(intervalo):
+                self.guardar(ruta)
+            self.guardar(ruta)
+
+        threading.Thread(target=volcar, daemon=True).start()
+        return parar
+
+
+# Métricas compartidas por todo el proceso
+metricas = Metricas()
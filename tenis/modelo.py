@@ -0,0 +1,414 @@
+import math
+
+import numpy as np
+import torch
+import torch.nn as nn
+import torch.nn.functional as F
+from torch.nn.utils.rnn import pack_padded_sequence
+from sklearn.metrics import (mean_absolute_error, mean_squared_error, r2_score, roc_auc_score, accuracy_score,
+                             precision_score, recall_score, f1_score)
+
+
+class TennisRNN(nn.Module):
+    def __init__(self, input_size_actual, input_size_previos, hidden_size, num_layers, output_size, dropout_rate,
+                 codificador='gru', indice_dias=None):
+        """
+        Args:
+            codificador (str): Cómo se resumen los históricos de los dos jugadores: 'gru' (dos GRUs de dos capas,
+                gru_home y gru_away) o 'transformer' (dos CodificadorTransformer, codificador_home y codificador_away).
+            indice_dias (int): Con 'transformer', posición de days_no_played en las características de los previos,
+                para codificar el tiempo entre partidos. None para usar solo la posición.
+        """
+        super(TennisRNN, self).__init__()
+        if codificador not in CODIFICADORES:
+            raise ValueError(f"Codificador no soportado: {codificador}. Opciones: {list(CODIFICADORES)}")
+        if codificador == 'gru' and num_layers != 2:
+            # tronco se queda con h_n[0], el estado final de la primera capa, como el modelo de la tesis
+            raise ValueError(f"El codificador 'gru' es el de dos capas del modelo original (num_layers=2), no {num_layers}")
+        self.hidden_size = hidden_size
+        self.num_layers = num_layers
+        self.codificador = codificador
+
+        if codificador == 'transformer':
+            # Codificadores de los históricos del jugador local y del visitante
+            self.codificador_home = CodificadorTransformer(input_size_previos, hidden_size, num_layers, dropout_rate,
+                                                           indice_dias=indice_dias)
+            self.codificador_away = CodificadorTransformer(input_size_previos, hidden_size, num_layers, dropout_rate,
+                                                           indice_dias=indice_dias)
+        else:
+            # GRU para datos históricos del jugador local
+            self.gru_home = nn.GRU(
+                input_size=input_size_previos,
+                hidden_size=hidden_size,
+                num_layers=num_layers,
+                batch_first=True,
+                dropout=dropout_rate if num_layers > 1 else 0
+            )
+            # GRU para datos históricos del jugador visitante
+            self.gru_away = nn.GRU(
+                input_size=input_size_previos,
+                hidden_size=hidden_size,
+                num_layers=num_layers,
+                batch_first=True,
+                dropout=dropout_rate if num_layers > 1 else 0
+            )
+        # Capa de proyección para las características actuales
+        self.actual_projection = nn.Linear(input_size_actual, input_size_actual * 2)
+
+        # Capa de concatenación y fully connected
+        combined_size = hidden_size * 2 + input_size_actual * 2
+        self.fc1 = nn.Linear(combined_size, hidden_size)
+        self.dropout1 = nn.Dropout(dropout_rate)
+
+        self.fc2 = nn.Linear(hidden_size, hidden_size//2)
+        self.dropout2 = nn.Dropout(dropout_rate)
+
+        self.fc3 = nn.Linear(hidden_size//2, output_size)
+
+    def forward(self, x_actual, x_home, x_away, len_home=None, len_away=None):
+        x = self.tronco(x_actual, x_home, x_away, len_home, len_away)
+        x = self.fc3(x)
+
+        # Utilizamos sigmoid para obtener un valor entre 0 y 1 (probabilidad)
+        x = torch.sigmoid(x)
+
+        return x
+
+    def tronco(self, x_actual, x_home, x_away, len_home=None, len_away=None):
+        """
+        Parte común del modelo: GRUs (o codificadores Transformer), proyección de las características actuales y
+        capas ocultas. Si se pasan las longitudes de los históricos (len_home, len_away), las secuencias se
+        empaquetan para que las GRUs no procesen las filas de relleno y el estado final sea el del último partido
+        real; el Transformer enmascara el relleno.
+        """
+        if self.codificador == 'transformer':
+            home_features = self.codificador_home(x_home, len_home)
+            away_features = self.codificador_away(x_away, len_away)
+        else:
+            _, (home_features, _) = self.gru_home(empaquetar(x_home, len_home))
+            _, (away_features, _) = self.gru_away(empaquetar(x_away, len_away))
+
+        # Capa de proyección para las características actuales
+        x_actual_projected = self.actual_projection(x_actual)
+        combined = torch.cat((home_features, away_features, x_actual_projected), dim=1)
+
+        # Pasar por las capas fully connected
+        x = torch.relu(self.fc1(combined))
+        x = self.dropout1(x)
+
+        x = torch.relu(self.fc2(x))
+        x = self.dropout2(x)
+
+        return x
+
+
+class TennisRNNMultitarea(TennisRNN):
+    """
+    TennisRNN con el tronco compartido y dos cabezas: una para probability_away (regresión) y otra para
+    winnerCode (clasificación). La salida tiene dos columnas en ese orden, las dos entre 0 y 1.
+    """
+    def __init__(self, input_size_actual, input_size_previos, hidden_size, num_layers, output_size, dropout_rate,
+                 **kwargs):
+        super(TennisRNNMultitarea, self).__init__(input_size_actual, input_size_previos, hidden_size, num_layers, output_size, dropout_rate,
+                                                  **kwargs)
+        del self.fc3
+        self.fc3_regresion = nn.Linear(hidden_size//2, output_size)
+        self.fc3_clasificacion = nn.Linear(hidden_size//2, output_size)
+
+    def forward(self, x_actual, x_home, x_away, len_home=None, len_away=None):
+        x = self.tronco(x_actual, x_home, x_away, len_home, len_away)
+        regresion = torch.sigmoid(self.fc3_regresion(x))
+        clasificacion = torch.sigmoid(self.fc3_clasificacion(x))
+        return torch.cat((regresion, clasificacion), dim=1)
+
+
+class TennisRNNConjunto(nn.Module):
+    """
+    K modelos TennisRNN (o TennisRNNMultitarea) inicializados por separado y entrenados en un solo cálculo: los
+    pesos de cada capa se apilan en un tensor con el miembro como primera dimensión y las capas son
+    multiplicaciones por lotes. Las GRUs local y visitante de todos los miembros avanzan juntas, paso a paso,
+    con una sola multiplicación por lotes de 2K matrices; las secuencias con relleno se tratan con una máscara
+    (el estado deja de actualizarse al pasar del último partido real), que da el mismo estado final que
+    empaquetarlas.
+
+    Como TennisRNN.tronco se queda con h_n[0], el estado final de la primera capa de cada GRU, las capas
+    siguientes no influyen en la salida: se conservan sus pesos (para que miembro() devuelva un TennisRNN
+    completo) pero no se calculan.
+
+    La salida tiene forma (K, batch, salidas); media() y varianza() la resumen por partido.
+    """
+    def __init__(self, input_size_actual, input_size_previos, hidden_size, num_layers, output_size, dropout_rate,
+                 miembros=5, multitarea=False):
+        super(TennisRNNConjunto, self).__init__()
+        clase_modelo = TennisRNNMultitarea if multitarea else TennisRNN
+        self.configuracion = {'input_size_actual': input_size_actual, 'input_size_previos': input_size_previos,
+                              'hidden_size': hidden_size, 'num_layers': num_layers, 'output_size': output_size,
+                              'dropout_rate': dropout_rate}
+        self.clase_modelo = clase_modelo
+        self.miembros = miembros
+        self.dropout_rate = dropout_rate
+        # Cada miembro se inicializa como un TennisRNN más, con la siguiente parte del generador aleatorio
+        modelos = [clase_modelo(**self.configuracion) for _ in range(miembros)]
+        estados = [modelo.state_dict() for modelo in modelos]
+        self.nombres = list(estados[0])
+        self.pesos = nn.ParameterDict({
+            nombre.replace('.', '__'): nn.Parameter(torch.stack([estado[nombre] for estado in estados]))
+            for nombre in self.nombres
+        })
+        self.cabezas = ['fc3_regresion', 'fc3_clasificacion'] if multitarea else ['fc3']
+        # Máscara de los sesgos recurrentes que se suman a la entrada (los de r y z, no el de n)
+        self.register_buffer('_sin_sesgo_n', torch.cat((torch.ones(2 * hidden_size), torch.zeros(hidden_size))),
+                             persistent=False)
+
+    def _peso(self, nombre):
+        return self.pesos[nombre.replace('.', '__')]
+
+    def _lineal(self, x, capa):
+        """x (batch, entrada), compartida por todos los miembros, o (K, batch, entrada) -> (K, batch, salida)."""
+        return torch.matmul(x, self._peso(f'{capa}.weight').transpose(1, 2)) + self._peso(f'{capa}.bias')[:, None, :]
+
+    def _entradas_gru(self, x, gru):
+        """
+        Proyección de la entrada de la primera capa de la GRU para todos los pasos, de forma (3, pasos, K, batch, H)
+        (puertas r, z y n). Los sesgos recurrentes de r y z se suman aquí, una sola vez, en lugar de en cada paso.
+        """
+        batch, pasos, features = x.shape
+        peso = self._peso(f'{gru}.weight_ih_l0')
+        sesgo = self._peso(f'{gru}.bias_ih_l0') + self._peso(f'{gru}.bias_hh_l0') * self._sin_sesgo_n
+        # Una sola multiplicación (pasos*batch, features) x (features, K*3H), con los pasos delante
+        proyeccion = torch.matmul(x.transpose(0, 1).reshape(pasos * batch, features),
+                                  peso.permute(2, 0, 1).reshape(features, -1))
+        proyeccion = proyeccion.view(pasos, batch, self.miembros, -1) + sesgo
+        return proyeccion.view(pasos, batch, self.miembros, 3, -1).permute(3, 0, 2, 1, 4)
+
+    def _grus(self, x_home, x_away, len_home, len_away):
+        """Estado final de la primera capa de las GRUs local y visitante de todos los miembros, (K, batch, H) cada uno."""
+        hidden_size = self.configuracion['hidden_size']
+        entradas = torch.cat((self._entradas_gru(x_home, 'gru_home'), self._entradas_gru(x_away, 'gru_away')), dim=2)
+        # Pesos recurrentes de cada puerta, (2K, H, H), y sesgo recurrente de n, que va multiplicado por r
+        peso_hh = torch.cat((self._peso('gru_home.weight_hh_l0'), self._peso('gru_away.weight_hh_l0')))
+        peso_r, peso_z, peso_n = peso_hh.transpose(1, 2).split(hidden_size, dim=2)
+        sesgo_n = torch.cat((self._peso('gru_home.bias_hh_l0'), self._peso('gru_away.bias_hh_l0')))[:, None, 2 * hidden_size:]
+        pasos, batch = entradas.shape[1], entradas.shape[3]
+        h = entradas.new_zeros(2 * self.miembros, batch, hidden_size)
+        activos = None
+        if len_home is not None:
+            # 1 mientras quedan partidos reales en la secuencia de cada lado, para los K miembros: (2K, batch, 1)
+            longitudes = torch.cat((len_home.to(h.device).expand(self.miembros, -1),
+                                    len_away.to(h.device).expand(self.miembros, -1)))[:, :, None]
+            pasos = int(max(len_home.max(), len_away.max()))
+        # unbind en lugar de indexar: el backward de entradas[t] reservaría en cada paso un tensor del tamaño de entradas
+        entradas_r, entradas_z, entradas_n = (puerta[:pasos].unbind(0) for puerta in entradas.unbind(0))
+        for t in range(pasos):
+            r = torch.sigmoid(torch.baddbmm(entradas_r[t], h, peso_r))
+            z = torch.sigmoid(torch.baddbmm(entradas_z[t], h, peso_z))
+            n = torch.tanh(torch.addcmul(entradas_n[t], r, torch.baddbmm(sesgo_n, h, peso_n)))
+            if len_home is not None:
+                activos = (t < longitudes).to(h.dtype)
+                # Las secuencias ya terminadas conservan su estado
+                z = 1 - activos * (1 - z)
+            h = n + z * (h - n)
+        return h[:self.miembros], h[self.miembros:]
+
+    def forward(self, x_actual, x_home, x_away, len_home=None, len_away=None):
+        home_features, away_features = self._grus(x_home, x_away, len_home, len_away)
+        x_actual_projected = self._lineal(x_actual, 'actual_projection')
+        combined = torch.cat((home_features, away_features, x_actual_projected), dim=2)
+
+        x = F.dropout(torch.relu(self._lineal(combined, 'fc1')), self.dropout_rate, self.training)
+        x = F.dropout(torch.relu(self._lineal(x, 'fc2')), self.dropout_rate, self.training)
+        return torch.cat([torch.sigmoid(self._lineal(x, cabeza)) for cabeza in self.cabezas], dim=2)
+
+    @staticmethod
+    def media(salida):
+        """Predicción del conjunto: media de los miembros, (batch, salidas)."""
+        return salida.mean(dim=0)
+
+    @staticmethod
+    def varianza(salida):
+        """Varianza entre miembros de la predicción de cada partido, (batch, salidas)."""
+        return salida.var(dim=0, unbiased=False)
+
+    def miembro(self, k):
+        """
+        Returns:
+            nn.Module: TennisRNN (o TennisRNNMultitarea) con los pesos del miembro k, por ejemplo para guardarlo
+                como un modelo normal.
+        """
+        modelo = self.clase_modelo(**self.configuracion).to(next(self.parameters()).device)
+        modelo.load_state_dict({nombre: self._peso(nombre)[k].detach() for nombre in self.nombres})
+        return modelo
+
+
+CODIFICADORES = ('gru', 'transformer')
+
+
+class CapaTransformer(nn.Module):
+    """
+    Capa de un Transformer encoder con la normalización antes de cada bloque (pre-norm): autoatención multicabeza
+    y red feed-forward, cada una con su conexión residual. Hace lo mismo que nn.TransformerEncoderLayer con
+    norm_first=True, pero separa q, k y v con unbind (la selección por índice de nn.MultiheadAttention rellena de
+    ceros un tensor del tamaño de la proyección entera en el backward) y aplica el dropout solo a las ramas
+    residuales: el de los pesos de atención, (batch, cabezas, pasos, pasos), era un tercio del tiempo en CPU.
+    """
+    def __init__(self, hidden_size, cabezas, dropout_rate):
+        super(CapaTransformer, self).__init__()
+        self.cabezas = cabezas
+        self.norm_atencion = nn.LayerNorm(hidden_size)
+        self.qkv = nn.Linear(hidden_size, hidden_size * 3)
+        self.salida_atencion = nn.Linear(hidden_size, hidden_size)
+        self.norm_ff = nn.LayerNorm(hidden_size)
+        self.ff1 = nn.Linear(hidden_size, hidden_size * 2)
+        self.ff2 = nn.Linear(hidden_size * 2, hidden_size)
+        self.dropout = nn.Dropout(dropout_rate)
+
+    def forward(self, h, mascara=None):
+        """
+        Args:
+            h (torch.Tensor): Secuencias de forma (batch, pasos, hidden_size).
+            mascara (torch.Tensor): (batch, 1, 1, pasos), True en los pasos a los que se puede atender. None si
+                no hay relleno.
+        """
+        batch, pasos, hidden_size = h.shape
+        q, k, v = self.qkv(self.norm_atencion(h)).view(batch, pasos, 3, self.cabezas, -1).permute(2, 0, 3, 1, 4).unbind(0)
+        atencion = F.scaled_dot_product_attention(q, k, v, attn_mask=mascara)
+        h = h + self.dropout(self.salida_atencion(atencion.transpose(1, 2).reshape(batch, pasos, hidden_size)))
+        return h + self.dropout(self.ff2(torch.relu(self.ff1(self.norm_ff(h)))))
+
+
+class CodificadorTransformer(nn.Module):
+    """
+    Codificador del histórico de un jugador que procesa todos los partidos previos a la vez, en lugar de uno tras
+    otro como la GRU. Cada partido se proyecta a hidden_size y se le suma una codificación sinusoidal de su
+    antigüedad (0 para el partido más reciente, 1 para el anterior...) y, si se indica indice_dias, una
+    codificación aprendida del tiempo sin jugar antes de ese partido (sin(W·days_no_played + b), como Time2Vec).
+    Tras num_layers capas de autoatención (CapaTransformer), con el relleno enmascarado, los partidos se resumen
+    en un vector de hidden_size con una media ponderada cuyos pesos aprende el modelo.
+    """
+    def __init__(self, input_size, hidden_size, num_layers, dropout_rate, cabezas=4, indice_dias=None):
+        """
+        Args:
+            input_size (int): Características de cada partido previo.
+            hidden_size (int): Tamaño del modelo y del vector de salida. Tiene que ser múltiplo de cabezas.
+            num_layers (int): Capas del Transformer.
+            dropout_rate (float): Dropout de las ramas residuales de cada capa.
+            cabezas (int): Cabezas de atención.
+            indice_dias (int): Posición de days_no_played en las características. None para no usarla.
+        """
+        super(CodificadorTransformer, self).__init__()
+        if hidden_size % cabezas != 0:
+            raise ValueError(f"hidden_size ({hidden_size}) tiene que ser múltiplo del número de cabezas ({cabezas})")
+        self.indice_dias = indice_dias
+        self.proyeccion = nn.Linear(input_size, hidden_size)
+        if indice_dias is not None:
+            self.tiempo = nn.Linear(1, hidden_size)
+        self.capas = nn.ModuleList([CapaTransformer(hidden_size, cabezas, dropout_rate) for _ in range(num_layers)])
+        self.norm = nn.LayerNorm(hidden_size)
+        self.atencion = nn.Linear(hidden_size, 1)
+        frecuencias = torch.exp(torch.arange(0, hidden_size, 2) * (-math.log(10000.0) / hidden_size))
+        self.register_buffer('_frecuencias', frecuencias, persistent=False)
+
+    def posicional(self, antiguedad):
+        """Codificación sinusoidal de la antigüedad de cada partido, (batch, pasos, hidden_size)."""
+        angulos = antiguedad.unsqueeze(-1) * self._frecuencias
+        return torch.cat((torch.sin(angulos), torch.cos(angulos)), dim=-1)[..., :self.proyeccion.out_features]
+
+    def forward(self, x, longitudes=None):
+        """
+        Args:
+            x (torch.Tensor): Secuencias de forma (batch, num_previos, features), con los partidos reales al
+                principio, del más antiguo al más reciente.
+            longitudes (torch.Tensor): Número de partidos reales de cada secuencia. None si no hay relleno.
+        Returns:
+            torch.Tensor: Resumen de cada histórico, (batch, hidden_size).
+        """
+        pasos = x.shape[1]
+        validos = None
+        posiciones = torch.arange(pasos, device=x.device)
+        if longitudes is None:
+            antiguedad = (pasos - 1 - posiciones).expand(x.shape[0], pasos)
+        else:
+            longitudes = longitudes.to(x.device)
+            # Los pasos en los que todas las secuencias son relleno no se procesan
+            pasos = int(longitudes.max())
+            x, posiciones = x[:, :pasos], posiciones[:pasos]
+            antiguedad = (longitudes[:, None] - 1 - posiciones).clamp(min=0)
+            validos = posiciones < longitudes[:, None]
+
+        h = self.proyeccion(x) + self.posicional(antiguedad.to(x.dtype))
+        if self.indice_dias is not None:
+            h = h + torch.sin(self.tiempo(x[:, :, self.indice_dias:self.indice_dias + 1]))
+        mascara = None if validos is None else validos[:, None, None, :]
+        for capa in self.capas:
+            h = capa(h, mascara)
+        h = self.norm(h)
+
+        puntuaciones = self.atencion(h).squeeze(-1)
+        if validos is not None:
+            puntuaciones = puntuaciones.masked_fill(~validos, float('-inf'))
+        pesos = torch.softmax(puntuaciones, dim=1)
+        return torch.bmm(pesos.unsqueeze(1).to(h.dtype), h).squeeze(1)
+
+
+def empaquetar(x, longitudes):
+    """
+    Empaqueta un lote de secuencias con relleno al final para pasarlo a una GRU.
+    Args:
+        x (torch.Tensor): Secuencias de forma (batch, num_previos, features), con los partidos reales al principio.
+        longitudes (torch.Tensor): Número de partidos reales de cada secuencia. Si es None, se devuelve x sin empaquetar.
+    Returns:
+        PackedSequence o torch.Tensor: Entrada para la GRU.
+    """
+    if longitudes is None:
+        return x
+    # pack_padded_sequence necesita las longitudes en CPU; enforce_sorted=False devuelve h_n en el orden original
+    return pack_padded_sequence(x, longitudes.cpu(), batch_first=True, enforce_sorted=False)
+
+
+def calcular_metricas_regresion(pred, target):
+    """
+    Calcula métricas específicas para regresión
+    """
+    pred_np = pred.cpu().numpy().flatten()
+    target_np = target.cpu().numpy().flatten()
+
+    # Calcular métricas
+    mae = mean_absolute_error(target_np, pred_np)
+    mse = mean_squared_error(target_np, pred_np)
+    rmse = np.sqrt(mse)
+    r2 = r2_score(target_np, pred_np)
+
+    # MAPE (Mean Absolute Percentage Error) - cuidado con divisiones por cero
+    mape = np.mean(np.abs((target_np - pred_np) / np.clip(target_np, 1e-8, None))) * 100
+
+    return {
+        'mae': mae,
+        'mse': mse,
+        'rmse': rmse,
+        'r2': r2,
+        'mape': mape
+    }
+
+
+def calcular_metricas_clasificacion(pred, target, threshold=0.5):
+    """
+    Calcula métricas específicas para clasificación binaria
+    """
+    # Convertir probabilidades a clases binarias
+    pred_class = (pred >= threshold).float().cpu().numpy()
+    target_class = target.cpu().numpy()
+
+    # Calcular métricas
+    accuracy = accuracy_score(target_class, pred_class)
+    precision = precision_score(target_class, pred_class, zero_division=0)
+    recall = recall_score(target_class, pred_class, zero_division=0)
+    f1 = f1_score(target_class, pred_class, zero_division=0)
+    auc = roc_auc_score(target_class, pred.cpu().numpy())
+
+    return {
+        'accuracy': accuracy,
+        'precision': precision,
+        'recall': recall,
+        'f1': f1,
+        'auc': auc
+    }
@@ -0,0 +1,178 @@
+"""
+Tabla local de cuotas de los partidos. Las cuotas se descargan como una etapa aparte: al conocer los IDs de
+los partidos se encargan todas a un grupo de hilos, que las va descargando mientras el scraper procesa los
+partidos, y el scraper solo lee de la tabla (esperando únicamente si la cuota de ese partido aún no ha llegado).
+
+Por cada partido se guardan las cuotas iniciales y las actuales, en fracción (como las da Sofascore) y en
+decimal (la fracción más 1, incluyendo la devolución de la apuesta), en un CSV con una fila por partido.
+"""
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+from tenis.instrumentacion import log, metricas
+
+COLUMNAS_ODDS = [
+    'idEvent',
+    'initialFractionalHome', 'initialFractionalAway', 'currentFractionalHome', 'currentFractionalAway',
+    'initialDecimalHome', 'initialDecimalAway', 'currentDecimalHome', 'currentDecimalAway',
+]
+
+
+def fraccion_a_decimal(fraccion):
+    """
+    Convierte una fracción o un número en formato de cadena a su valor decimal.
+    Args:
+        fraccion (str): Fracción en formato de cadena o número.
+    Returns:
+        float: Valor decimal de la fracción, o None si no se puede convertir.
+    """
+    if fraccion is None or pd.isna(fraccion) or fraccion == '':
+        return None
+    try:
+        if '/' in str(fraccion):
+            numerador, denominador = map(float, str(fraccion).split('/'))
+            return numerador / denominador
+        else:
+            return float(fraccion)
+    except (ValueError, ZeroDivisionError):
+        return None
+
+
+def _cuota_decimal(fraccion):
+    valor = fraccion_a_decimal(fraccion)
+    return np.nan if valor is None else valor + 1
+
+
+def parsear_odds(id_evento, json_data):
+    """
+    Args:
+        id_evento (int): ID del partido.
+        json_data (dict): Respuesta de /event/{id}/odds/1/featured.
+    Returns:
+        dict: Fila de la tabla de cuotas (ver COLUMNAS_ODDS), con NaN en lo que no venga en la respuesta.
+    """
+    fila = {columna: np.nan for columna in COLUMNAS_ODDS}
+    fila['idEvent'] = id_evento
+    try:
+        choices = json_data['featured']['default']['choices']
+        for lado, choice in zip(('Home', 'Away'), choices[:2]):
+            fila[f'initialFractional{lado}'] = choice.get('initialFractionalValue', np.nan)
+            fila[f'currentFractional{lado}'] = choice.get('fractionalValue', np.nan)
+    except (KeyError, IndexError, TypeError) as e:
+        log(f"Error al extraer odds de {id_evento}: {e}", 'debug')
+    for momento in ('initial', 'current'):
+        for lado in ('Home', 'Away'):
+            fila[f'{momento}Decimal{lado}'] = _cuota_decimal(fila[f'{momento}Fractional{lado}'])
+    return fila
+
+
+class TablaOdds:
+    """
+    Cuotas por idEvent, descargadas en segundo plano. Se puede usar desde varios hilos.
+
+        tabla = TablaOdds(lambda id: get_json_from_url(f'{URL_SOFASCORE}/event/{id}/odds/1/featured'), 'data/odds.csv')
+        tabla.precargar(id_partidos)       # vuelve enseguida
+        tabla.probabilidades(id_partidos[0])
+    """
+
+    def __init__(self, descargar, ruta=None, max_hilos=4, cargar=True):
+        """
+        Args:
+            descargar (callable): Función que recibe un idEvent y devuelve el JSON de sus cuotas, o None.
+            ruta (str): CSV de la tabla.
+            max_hilos (int): Número de descargas de cuotas a la vez.
+            cargar (bool): Si es True y el CSV existe, se cargan las cuotas ya descargadas y no se vuelven a pedir.
+        """
+        self.descargar = descargar
+        self.ruta = ruta
+        self.max_hilos = max_hilos
+        self.filas = {}
+        self._pendientes = {}
+        self._lock = threading.Lock()
+        self._executor = None
+        if cargar and ruta is not None and os.path.exists(ruta):
+            tabla = pd.read_csv(ruta, dtype={columna: str for columna in COLUMNAS_ODDS if 'Fractional' in columna})
+            self.filas = {int(fila['idEvent']): fila for fila in tabla.to_dict('records')}
+
+    def _descargar(self, id_evento):
+        json_data = self.descargar(id_evento)
+        fila = parsear_odds(id_evento, json_data) if json_data is not None else None
+        with self._lock:
+            # Sin respuesta (partido sin cuotas o error) no se guarda, para volver a intentarlo en otra ejecución
+            if fila is not None:
+                self.filas[id_evento] = fila
+            self._pendientes.pop(id_evento, None)
+        return fila
+
+    def precargar(self, ids_eventos):
+        """
+        Encarga en segundo plano las cuotas de los partidos que no están en la tabla, en el orden indicado.
+        Args:
+            ids_eventos (list): IDs de los partidos.
+        Returns:
+            int: Número de partidos encargados.
+        """
+        with self._lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=self.max_hilos, thread_name_prefix='odds')
+            nuevos = [int(id_evento) for id_evento in ids_eventos
+                      if int(id_evento) not in self.filas and int(id_evento) not in self._pendientes]
+            for id_evento in nuevos:
+                self._pendientes[id_evento] = self._executor.submit(self._descargar, id_evento)
+        log(f'Cuotas encargadas: {len(nuevos)} ({len(self.filas)} ya en la tabla)')
+        return len(nuevos)
+
+    def obtener(self, id_evento):
+        """
+        Args:
+            id_evento (int): ID del partido.
+        Returns:
+            dict: Fila de cuotas del partido (ver COLUMNAS_ODDS), o None si no tiene. Si está encargada y aún
+                no ha llegado se espera; si no se encargó se descarga en el momento.
+        """
+        id_evento = int(id_evento)
+        with self._lock:
+            fila = self.filas.get(id_evento)
+            futuro = self._pendientes.get(id_evento)
+        metricas.registrar_cache('odds', fila is not None)
+        if fila is not None:
+            return fila
+        if futuro is not None:
+            return futuro.result()
+        return self._descargar(id_evento)
+
+    def probabilidades(self, id_evento):
+        """
+        Returns:
+            tuple: Probabilidades implícitas de victoria del local y del visitante según las cuotas iniciales,
+                o (None, None) si no se pueden obtener.
+        """
+        fila = self.obtener(id_evento)
+        if fila is None:
+            return (None, None)
+        cuota_home, cuota_away = fila['initialDecimalHome'], fila['initialDecimalAway']
+        if pd.isna(cuota_home) or pd.isna(cuota_away) or cuota_home == 0 or cuota_away == 0:
+            return (None, None)
+        return (1 / cuota_home, 1 / cuota_away)
+
+    def a_dataframe(self):
+        with self._lock:
+            filas = list(self.filas.values())
+        return pd.DataFrame(filas, columns=COLUMNAS_ODDS)
+
+    def guardar(self, ruta=None):
+        """Guarda la tabla en CSV (en un temporal que se renombra, para no dejarla a medias)."""
+        ruta = ruta or self.ruta
+        temporal = ruta + '.tmp'
+        self.a_dataframe().to_csv(temporal, index=False)
+        os.replace(temporal, ruta)
+
+    def cerrar(self, esperar=True):
+        """Termina los hilos de descarga (esperando a las pendientes si esperar es True)."""
+        if self._executor is not None:
+            self._executor.shutdown(wait=esperar, cancel_futures=not esperar)
+            self._executor = None
@@ -0,0 +1,174 @@
+"""
+Perfilado del entrenamiento por ventanas: tiempo de cada fase (preparación de tensores, forward/backward,
+evaluación, métricas, checkpoints) en cada ventana, memoria máxima del proceso y, opcionalmente, una traza
+de torch.profiler de algunas ventanas que se puede abrir en chrome://tracing o en https://ui.perfetto.dev.
+
+    perfilador = PerfiladorVentanas(ventanas_traza=[1, 50], directorio_trazas='resultados/trazas')
+    model, df_visualization_global, _ = entrenar_walk_forward(..., perfilador=perfilador)
+    perfilador.guardar('resultados/perfil_ventanas_REGRESSION.csv')
+"""
+import contextlib
+import os
+import sys
+import time
+
+import pandas as pd
+import torch
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+try:
+    import psutil
+except ImportError:
+    psutil = None
+
+FASES = ['preparacion', 'carga_pesos', 'forward_backward', 'evaluacion', 'metricas', 'checkpoint']
+
+
+def memoria_pico_mb():
+    """
+    Memoria residente máxima (RSS) del proceso desde que empezó, en MB. En Windows se usa psutil si está
+    instalado (peak_wset); si no hay forma de medirla devuelve None.
+    """
+    if resource is not None:
+        pico = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        # Linux la da en KB y macOS en bytes
+        return pico / 1024 ** 2 if sys.platform == 'darwin' else pico / 1024
+    if psutil is not None:
+        info = psutil.Process().memory_info()
+        return getattr(info, 'peak_wset', info.rss) / 1024 ** 2
+    return None
+
+
+class PerfiladorVentanas:
+    """
+    Acumula el tiempo de cada fase del entrenamiento por ventana. entrenar_ventanas llama a inicio_ventana,
+    fase y fin_ventana; el resultado se consulta con tabla() o se guarda con guardar().
+    """
+
+    def __init__(self, ventanas_traza=(), directorio_trazas='trazas', sincronizar=True):
+        """
+        Args:
+            ventanas_traza (iterable): Ventanas que se ejecutan dentro de torch.profiler, exportando una traza de
+                Chrome a directorio_trazas/traza_ventana_<n>.json. Vacío para no generar trazas (tienen coste).
+            directorio_trazas (str): Carpeta de las trazas.
+            sincronizar (bool): Si es True y el entrenamiento es en GPU, se sincroniza al cerrar cada fase para
+                que el tiempo de los kernels asíncronos se cuente en la fase que los lanzó.
+        """
+        self.ventanas_traza = set(ventanas_traza)
+        self.directorio_trazas = directorio_trazas
+        self.sincronizar = sincronizar
+        self.filas = []
+        self.globales = {}
+        self._ventana = None
+        self._device = None
+
+    def inicio_ventana(self, ventana, device=None):
+        self._device = device
+        if device is not None and device.type == 'cuda':
+            torch.cuda.reset_peak_memory_stats(device)
+        self._ventana = {'Window': ventana, 'epocas': 0, 'segundos': time.perf_counter()}
+        self._ventana.update({fase: 0.0 for fase in FASES})
+
+    @contextlib.contextmanager
+    def fase(self, nombre):
+        """Suma el tiempo del bloque a la fase de la ventana en curso (o a las globales si no hay ventana)."""
+        inicio = time.perf_counter()
+        try:
+            yield
+        finally:
+            if self.sincronizar and self._device is not None and self._device.type == 'cuda':
+                torch.cuda.synchronize(self._device)
+            segundos = time.perf_counter() - inicio
+            destino = self._ventana if self._ventana is not None else self.globales
+            destino[nombre] = destino.get(nombre, 0.0) + segundos
+
+    def epoca(self):
+        self._ventana['epocas'] += 1
+
+    def fin_ventana(self):
+        fila = self._ventana
+        fila['segundos'] = time.perf_counter() - fila['segundos']
+        fila['otros'] = fila['segundos'] - sum(fila[fase] for fase in FASES)
+        fila['rss_pico_mb'] = memoria_pico_mb()
+        if self._device is not None and self._device.type == 'cuda':
+            fila['cuda_pico_mb'] = torch.cuda.max_memory_allocated(self._device) / 1024 ** 2
+        self.filas.append(fila)
+        self._ventana = None
+
+    def traza(self, ventana, device=None):
+        """
+        Contexto que ejecuta la ventana dentro de torch.profiler si está en ventanas_traza.
+        Returns:
+            contextmanager: El perfilador de torch o un contexto vacío.
+        """
+        if ventana not in self.ventanas_traza:
+            return contextlib.nullcontext()
+        return self._traza(ventana, device)
+
+    @contextlib.contextmanager
+    def _traza(self, ventana, device):
+        actividades = [torch.profiler.ProfilerActivity.CPU]
+        if device is not None and device.type == 'cuda':
+            actividades.append(torch.profiler.ProfilerActivity.CUDA)
+        os.makedirs(self.directorio_trazas, exist_ok=True)
+        perfil = torch.profiler.profile(activities=actividades)
+        try:
+            with perfil:
+                yield perfil
+        finally:
+            # Si la ventana falla, la traza muestra hasta dónde llegó
+            perfil.export_chrome_trace(os.path.join(self.directorio_trazas, f'traza_ventana_{ventana}.json'))
+
+    def tabla(self):
+        """
+        Returns:
+            pd.DataFrame: Una fila por ventana con los segundos de cada fase, el total, las épocas y la memoria máxima.
+        """
+        columnas = ['Window', 'epocas', 'segundos'] + FASES + ['otros', 'rss_pico_mb']
+        if any('cuda_pico_mb' in fila for fila in self.filas):
+            columnas.append('cuda_pico_mb')
+        df = pd.DataFrame(self.filas, columns=columnas)
+        df['segundos_por_epoca'] = df['segundos'] / df['epocas'].clip(lower=1)
+        return df
+
+    def resumen(self):
+        """
+        Returns:
+            pd.DataFrame: Segundos totales de cada fase (incluidas las globales, como preparar_tensores) y su porcentaje.
+        """
+        df = self.tabla()
+        totales = pd.Series({**self.globales, **{fase: df[fase].sum() for fase in FASES + ['otros']}})
+        return pd.DataFrame({'segundos': totales, 'porcentaje': 100 * totales / totales.sum()})
+
+    def guardar(self, ruta):
+        """Guarda la tabla por ventana en CSV."""
+        carpeta = os.path.dirname(ruta)
+        if carpeta:
+            os.makedirs(carpeta, exist_ok=True)
+        self.tabla().to_csv(ruta, index=False)
+
+
+class _SinPerfilado:
+    """Perfilador que no hace nada, para no llenar entrenar_ventanas de comprobaciones."""
+
+    def inicio_ventana(self, ventana, device=None):
+        pass
+
+    def fase(self, nombre):
+        return contextlib.nullcontext()
+
+    def epoca(self):
+        pass
+
+    def fin_ventana(self):
+        pass
+
+    def traza(self, ventana, device=None):
+        return contextlib.nullcontext()
+
+
+SIN_PERFILADO = _SinPerfilado()
@@ -0,0 +1,320 @@
+"""
+Cliente HTTP para descargar JSON de APIs con límite de peticiones (Sofascore):
+
+- Reintentos con espera exponencial y jitter en los errores transitorios (5xx, 429, timeouts, errores de
+  conexión), respetando la cabecera Retry-After. Los 404 son definitivos y no se reintentan.
+- Un circuito por host: tras varios fallos seguidos, o con un 403 (bloqueo temporal de la API), se dejan de
+  hacer peticiones durante una pausa y después se prueba con una sola; si falla, la pausa se alarga. Así un
+  bloqueo no termina la ejecución, solo la detiene hasta que se levanta. Una URL que devuelve 403 muchas veces
+  seguidas se da por bloqueada y se devuelve None.
+- Un límite adaptativo de peticiones por segundo por host (aumento aditivo, reducción multiplicativa): sube
+  poco a poco mientras las peticiones van bien y se reduce a la mitad con cada 429, de forma que el ritmo
+  se mantiene cerca del límite del proveedor. El límite es común a todos los hilos que usen el cliente.
+"""
+import email.utils
+import json
+import random
+import threading
+import time
+from urllib.parse import urlsplit
+
+import requests
+
+from tenis.instrumentacion import log, metricas
+
+
+def parsear_retry_after(valor):
+    """
+    Args:
+        valor (str): Valor de la cabecera Retry-After (segundos o fecha HTTP).
+    Returns:
+        float: Segundos a esperar, o None si no hay cabecera o no se entiende.
+    """
+    if not valor:
+        return None
+    try:
+        return max(float(valor), 0.0)
+    except ValueError:
+        pass
+    try:
+        fecha = email.utils.parsedate_to_datetime(valor)
+    except (TypeError, ValueError):
+        return None
+    return max(fecha.timestamp() - time.time(), 0.0)
+
+
+class PoliticaReintentos:
+    """Espera exponencial con jitter completo: uniforme entre 0 y min(maximo, base·2^intento)."""
+
+    def __init__(self, max_reintentos=5, base=1.0, maximo=60.0, semilla=None):
+        """
+        Args:
+            max_reintentos (int): Reintentos de un error transitorio antes de devolver None.
+            base (float): Segundos de la espera del primer reintento.
+            maximo (float): Espera máxima en segundos.
+            semilla (int): Semilla del jitter.
+        """
+        self.max_reintentos = max_reintentos
+        self.base = base
+        self.maximo = maximo
+        self._rng = random.Random(semilla)
+
+    def espera(self, intento, retry_after=None):
+        """
+        Args:
+            intento (int): Número de reintento (0 el primero).
+            retry_after (float): Segundos indicados por el servidor; si los hay, se espera al menos eso.
+        Returns:
+            float: Segundos a esperar antes del reintento.
+        """
+        espera = self._rng.uniform(0, min(self.maximo, self.base * 2 ** intento))
+        if retry_after is not None:
+            espera = max(espera, retry_after)
+        return espera
+
+
+class Circuito:
+    """
+    Circuito de un host. Cerrado: las peticiones pasan. Abierto: se espera hasta el final de la pausa.
+    Semiabierto: pasa una petición de prueba; si va bien se cierra y si no se vuelve a abrir con el doble de pausa.
+    """
+
+    def __init__(self, umbral_fallos=5, pausa=30.0, pausa_maxima=1800.0):
+        """
+        Args:
+            umbral_fallos (int): Fallos transitorios seguidos que abren el circuito.
+            pausa (float): Segundos de la primera pausa.
+            pausa_maxima (float): Pausa máxima en segundos.
+        """
+        self.umbral_fallos = umbral_fallos
+        self.pausa_inicial = pausa
+        self.pausa_maxima = pausa_maxima
+        self.estado = 'cerrado'
+        self.fallos = 0
+        self.pausa = pausa
+        self.abierto_hasta = 0.0
+        self.aperturas = 0
+        self._lock = threading.Lock()
+        self._probando = False
+
+    def esperar(self):
+        """
+        Bloquea mientras el circuito está abierto o hay otra petición de prueba en curso.
+        Returns:
+            bool: Si la petición que sigue es la de prueba del circuito semiabierto. Hay que terminarla con
+                exito, fallo o liberar para que puedan pasar las demás.
+        """
+        while True:
+            with self._lock:
+                ahora = time.monotonic()
+                if self.estado == 'cerrado':
+                    return False
+                if self.estado == 'abierto' and ahora >= self.abierto_hasta:
+                    self.estado = 'semiabierto'
+                if self.estado == 'semiabierto' and not self._probando:
+                    self._probando = True
+                    return True
+                espera = max(self.abierto_hasta - ahora, 0.5)
+            time.sleep(espera)
+
+    def exito(self):
+        with self._lock:
+            if self.estado != 'cerrado':
+                log('Circuito cerrado: la API vuelve a responder', 'aviso')
+            self.estado = 'cerrado'
+            self.fallos = 0
+            self.pausa = self.pausa_inicial
+            self._probando = False
+
+    def liberar(self):
+        """Termina la petición de prueba sin resultado concluyente (429, JSON no válido): puede pasar otra."""
+        with self._lock:
+            self._probando = False
+
+    def fallo(self, abrir=False):
+        """
+        Args:
+            abrir (bool): Si es True (por ejemplo con un 403) se abre el circuito sin esperar al umbral.
+        Returns:
+            bool: Si el circuito se ha abierto.
+        """
+        with self._lock:
+            self.fallos += 1
+            if not (abrir or self.estado == 'semiabierto' or self.fallos >= self.umbral_fallos):
+                return False
+            if self.estado == 'semiabierto':
+                self.pausa = min(self.pausa * 2, self.pausa_maxima)
+            self.estado = 'abierto'
+            self.abierto_hasta = time.monotonic() + self.pausa
+            self.aperturas += 1
+            self._probando = False
+            log(f'Circuito abierto durante {self.pausa:.0f} s tras {self.fallos} fallos seguidos', 'aviso')
+            return True
+
+
+class LimitadorAdaptativo:
+    """
+    Límite de peticiones por segundo con aumento aditivo y reducción multiplicativa (AIMD). Al principio, hasta
+    el primer 429, la tasa se duplica cada segundo (como el arranque lento de TCP) para llegar antes al límite.
+    """
+
+    def __init__(self, tasa=5.0, tasa_minima=0.2, tasa_maxima=50.0, incremento=0.5, reduccion=0.5):
+        """
+        Args:
+            tasa (float): Peticiones por segundo iniciales.
+            tasa_minima, tasa_maxima (float): Límites de la tasa.
+            incremento (float): Aumento de la tasa por cada petición correcta, dividido por la tasa actual
+                (es decir, unas `incremento` peticiones/s más por segundo de funcionamiento sin errores).
+            reduccion (float): Factor por el que se multiplica la tasa con cada 429. Como mucho se reduce una vez
+                por segundo, para que una ráfaga de 429 de peticiones simultáneas no la hunda.
+        """
+        self.tasa = tasa
+        self.tasa_minima = tasa_minima
+        self.tasa_maxima = tasa_maxima
+        self.incremento = incremento
+        self.reduccion = reduccion
+        self.arranque = True
+        self._siguiente = 0.0
+        self._ultima_reduccion = 0.0
+        self._lock = threading.Lock()
+
+    def esperar_turno(self):
+        """Espera hasta que toque hacer la siguiente petición según la tasa actual."""
+        with self._lock:
+            ahora = time.monotonic()
+            turno = max(self._siguiente, ahora)
+            self._siguiente = turno + 1.0 / self.tasa
+        if turno > ahora:
+            time.sleep(turno - ahora)
+
+    def exito(self):
+        with self._lock:
+            aumento = 1.0 if self.arranque else self.incremento / self.tasa
+            self.tasa = min(self.tasa + aumento, self.tasa_maxima)
+
+    def saturado(self):
+        with self._lock:
+            ahora = time.monotonic()
+            if ahora - self._ultima_reduccion < 1.0:
+                return
+            self._ultima_reduccion = ahora
+            self.arranque = False
+            self.tasa = max(self.tasa * self.reduccion, self.tasa_minima)
+            log(f'429 recibido: tasa reducida a {self.tasa:.2f} peticiones/s', 'debug')
+
+
+class ClienteHTTP:
+    """Descarga JSON con reintentos, circuito y límite adaptativo por host. Se puede usar desde varios hilos."""
+
+    def __init__(self, politica=None, tasa_inicial=5.0, tasa_maxima=50.0, umbral_fallos=5, pausa=30.0,
+                 pausa_maxima=1800.0, max_bloqueos=10, sesion=None):
+        """
+        Args:
+            politica (PoliticaReintentos): Reintentos de los errores transitorios.
+            tasa_inicial, tasa_maxima (float): Peticiones por segundo iniciales y máximas de cada host.
+            umbral_fallos, pausa, pausa_maxima: Parámetros del circuito de cada host (ver Circuito).
+            max_bloqueos (int): 403 seguidos de una URL tras los que se deja de intentar y se devuelve None.
+            sesion (requests.Session): Sesión HTTP (reutiliza las conexiones). Por defecto, una nueva.
+        """
+        self.politica = politica or PoliticaReintentos()
+        self.max_bloqueos = max_bloqueos
+        self.tasa_inicial = tasa_inicial
+        self.tasa_maxima = tasa_maxima
+        self.umbral_fallos = umbral_fallos
+        self.pausa = pausa
+        self.pausa_maxima = pausa_maxima
+        self.sesion = sesion or requests.Session()
+        self.circuitos = {}
+        self.limitadores = {}
+        self._lock = threading.Lock()
+
+    def _host(self, url):
+        host = urlsplit(url).netloc
+        with self._lock:
+            if host not in self.circuitos:
+                self.circuitos[host] = Circuito(self.umbral_fallos, self.pausa, self.pausa_maxima)
+                self.limitadores[host] = LimitadorAdaptativo(self.tasa_inicial, tasa_maxima=self.tasa_maxima)
+            return self.circuitos[host], self.limitadores[host]
+
+    def obtener_json(self, url, max_reintentos=None, timeout=30):
+        """
+        Args:
+            url (str): URL de la que obtener el JSON.
+            max_reintentos (int): Reintentos de los errores transitorios. Por defecto, los de la política.
+                Las esperas por un 403 o por el circuito abierto no cuentan como reintentos; los 403 seguidos
+                tienen su propio límite (max_bloqueos).
+            timeout (int): Tiempo máximo de espera de cada petición.
+        Returns:
+            dict: JSON obtenido, o None si la URL no existe (404), se agotan los reintentos o sigue bloqueada (403).
+        """
+        if max_reintentos is None:
+            max_reintentos = self.politica.max_reintentos
+        circuito, limitador = self._host(url)
+        intento = 0
+        bloqueos = 0
+        while True:
+            prueba = circuito.esperar()
+            limitador.esperar_turno()
+            inicio = time.perf_counter()
+            retry_after = None
+            try:
+                response = self.sesion.get(url, timeout=timeout)
+            except requests.exceptions.Timeout as e:
+                motivo = 'timeout'
+                log(f"Timeout: {str(e)}", 'aviso')
+            except requests.exceptions.ConnectionError as e:
+                motivo = 'conexion'
+                log(f"Error de conexión: {str(e)}", 'aviso')
+            except requests.exceptions.RequestException as e:
+                motivo = 'solicitud'
+                log(f"Error en la solicitud: {str(e)}", 'aviso')
+            else:
+                motivo = response.status_code
+                metricas.registrar_peticion(url, response.status_code, time.perf_counter() - inicio, len(response.content))
+                if response.status_code == 200:
+                    try:
+                        datos = json.loads(response.text)
+                    except json.JSONDecodeError as e:
+                        motivo = 'json'
+                        log(f"Error al decodificar JSON: {str(e)}", 'aviso')
+                    else:
+                        circuito.exito()
+                        limitador.exito()
+                        return datos
+                elif response.status_code in (404, 410):
+                    circuito.exito()
+                    limitador.exito()
+                    log(f"Error {response.status_code}: No se encontró la URL {url}.", 'debug')
+                    return None
+                elif response.status_code == 403:
+                    # Bloqueo temporal: se pausa el host y se vuelve a probar, sin gastar reintentos
+                    log(f"Error 403: Acceso denegado a la URL. Se pausan las peticiones a {urlsplit(url).netloc}", 'aviso')
+                    circuito.fallo(abrir=True)
+                    limitador.saturado()
+                    bloqueos += 1
+                    if bloqueos >= self.max_bloqueos:
+                        log(f"Se deja de intentar {url} tras {bloqueos} errores 403 seguidos", 'aviso')
+                        return None
+                    metricas.registrar_reintento(url, 403)
+                    continue
+                elif response.status_code == 429:
+                    limitador.saturado()
+                    retry_after = parsear_retry_after(response.headers.get('Retry-After'))
+                else:
+                    log(f"Error {response.status_code}: {response.reason}", 'aviso')
+            if motivo in ('timeout', 'conexion', 'solicitud'):
+                metricas.registrar_peticion(url, motivo, time.perf_counter() - inicio)
+            bloqueos = 0
+            # Los 429 los gestiona el limitador; el resto de errores transitorios cuentan para el circuito
+            if motivo not in (429, 'json'):
+                circuito.fallo()
+            elif prueba:
+                # La prueba no ha dicho nada del bloqueo: se suelta para que pase otra petición
+                circuito.liberar()
+
+            if intento >= max_reintentos:
+                log(f"Se agotaron los reintentos de {url}", 'aviso')
+                return None
+            metricas.registrar_reintento(url, motivo)
+            time.sleep(self.politica.espera(intento, retry_after))
+            intento += 1
@@ -0,0 +1,380 @@
+"""
+Orquestador de las etapas del pipeline como un grafo de dependencias. Cada etapa declara sus ficheros de
+entrada y de salida, el código del que depende (scripts, módulos de tenis/ y notebooks) y sus parámetros; las
+dependencias entre etapas salen solas de qué etapa produce cada entrada.
+
+Antes de ejecutar una etapa se calcula una huella (SHA-256) de su código, sus parámetros y el contenido de sus
+entradas. Si coincide con la de su última ejecución y sus salidas siguen ahí, la etapa no se vuelve a ejecutar.
+Como la huella usa el contenido de las entradas, si una etapa se repite y produce lo mismo las siguientes
+tampoco se repiten. Las salidas de las etapas con cachear=True se copian además en el directorio de estado con
+su huella, así que al volver a unos parámetros ya usados se restauran sin ejecutar nada.
+
+Las etapas independientes (por ejemplo, el análisis exploratorio y el entrenamiento) se ejecutan a la vez, cada
+una en su propio proceso (python -m tenis <comando>).
+
+    python -m tenis run                      # todas las etapas desactualizadas
+    python -m tenis run evaluate --plan      # qué haría falta ejecutar para evaluate
+    python -m tenis run train_regresion --forzar preprocess
+"""
+import hashlib
+import json
+import os
+import shutil
+import subprocess
+import sys
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+from tenis.cli import SUFIJOS_RESULTADOS
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+CODIGO_SCRAPER = ['2.scrapper.py', 'tenis/peticiones.py', 'tenis/odds.py', 'tenis/instrumentacion.py', 'tenis/esquema.py']
+CODIGO_MODELO = ['tenis/entrenamiento.py', 'tenis/modelo.py', 'tenis/checkpoints.py', 'tenis/almacen.py',
+                 'tenis/escalado.py', 'tenis/esquema.py']
+
+
+class Etapa:
+    """Una etapa del pipeline: un subcomando de python -m tenis con sus entradas, salidas, código y parámetros."""
+
+    def __init__(self, nombre, comando, entradas=(), salidas=(), codigo=(), parametros=None, cachear=False):
+        """
+        Args:
+            nombre (str): Nombre de la etapa.
+            comando (list): Argumentos de python -m tenis que la ejecutan (sin --config).
+            entradas (list): Ficheros que lee.
+            salidas (list): Ficheros que escribe.
+            codigo (list): Ficheros de código de los que depende, relativos a la raíz del repositorio. De los
+                notebooks solo cuenta el código de las celdas, no sus salidas.
+            parametros (dict): Parámetros de la configuración que usa.
+            cachear (bool): Si es True, las salidas se guardan con su huella para poder restaurarlas.
+        """
+        self.nombre = nombre
+        self.comando = list(comando)
+        self.entradas = [os.path.normpath(ruta) for ruta in entradas]
+        self.salidas = [os.path.normpath(ruta) for ruta in salidas]
+        self.codigo = list(codigo)
+        self.parametros = parametros or {}
+        self.cachear = cachear
+
+    def __repr__(self):
+        return f'Etapa({self.nombre!r})'
+
+
+def etapas_pipeline(configuracion):
+    """
+    Etapas del pipeline completo: ranking, descubrimiento, extracción y postprocesado de partidos, los
+    notebooks de análisis exploratorio y preprocesamiento, entrenamiento y predicciones de cada tarea de
+    configuracion['pipeline']['tareas'] y el notebook de evaluación.
+    Args:
+        configuracion (dict): Configuración (ver tenis.cli.cargar_configuracion).
+    Returns:
+        list: Lista de Etapa.
+    """
+    datos = configuracion['datos']
+    scraper = configuracion['scraper']
+    entrenamiento = configuracion['entrenamiento']
+    resultados = entrenamiento['resultados']
+    ranking = os.path.join(datos, 'ranking', configuracion['ranking']['fichero'])
+    # Los notebooks leen y escriben en ../data y resultados/ relativos a su directorio de ejecución
+    directorio_pre = configuracion['preprocesamiento']['directorio']
+    directorio_eval = configuracion['evaluacion']['directorio']
+    datos_pre = os.path.join(directorio_pre, '..', 'data')
+    preprocesados = [os.path.join(datos, 'actual_diferencias_preproc_escalado.parquet'),
+                     os.path.join(datos, 'previos_normalizado.npz' if entrenamiento['normalizado']
+                                  else 'previos_preproc_escalado.parquet')]
+
+    etapas = [
+        Etapa('ranking', ['ranking'], salidas=[ranking], codigo=['1.ranking.py'],
+              parametros=configuracion['ranking']),
+        Etapa('discover', ['discover'], entradas=[ranking], salidas=[os.path.join(datos, 'id_partidos.csv')],
+              codigo=CODIGO_SCRAPER, parametros={'years': scraper['years']}),
+        Etapa('scrape', ['scrape'], entradas=[ranking, os.path.join(datos, 'id_partidos.csv')],
+              salidas=[os.path.join(datos, fichero) for fichero in ('actual.parquet', 'previos.parquet', 'players.csv', 'odds.csv')],
+              codigo=CODIGO_SCRAPER, parametros=scraper),
+        Etapa('postprocess', ['postprocess'],
+              entradas=[os.path.join(datos, 'actual.parquet'), os.path.join(datos, 'previos.parquet')],
+              salidas=[os.path.join(datos, 'completo', 'actual_final.parquet'), os.path.join(datos, 'completo', 'previos_final.parquet')],
+              codigo=CODIGO_SCRAPER, parametros={'num_previos': scraper['num_previos']}, cachear=True),
+        Etapa('eda', ['eda'], entradas=[os.path.join(datos_pre, 'actual.parquet'), os.path.join(datos_pre, 'previos.parquet')],
+              codigo=[configuracion['eda']['notebook'], 'tenis/agregados.py', 'tenis/esquema.py']),
+        Etapa('preprocess', ['preprocess'],
+              entradas=[os.path.join(datos_pre, 'actual.parquet'), os.path.join(datos_pre, 'previos.parquet')],
+              salidas=[os.path.join(datos_pre, fichero) for fichero in
+                       ('actual_diferencias_preproc_escalado.parquet', 'previos_preproc_escalado.parquet', 'previos_normalizado.npz')],
+              codigo=[configuracion['preprocesamiento']['notebook'], 'tenis/almacen.py', 'tenis/valoraciones.py',
+                      'tenis/esquema.py'], cachear=True),
+    ]
+
+    for tarea in configuracion['pipeline']['tareas']:
+        if tarea == 'multitarea':
+            visualizacion = [f'df_visualization_global_{SUFIJOS_RESULTADOS[cabeza]}_MULTITASK.csv'
+                             for cabeza in ('regresion', 'clasificacion')]
+        else:
+            visualizacion = [f'df_visualization_global_{SUFIJOS_RESULTADOS[tarea]}.csv']
+        modelo = os.path.join(entrenamiento['modelos'], f'tennis_rnn_{tarea}.pt')
+        parametros = {clave: valor for clave, valor in entrenamiento.items() if clave != 'tarea'}
+        etapas.append(Etapa(
+            f'train_{tarea}', ['train', '--tarea', tarea], entradas=preprocesados,
+            salidas=[modelo] + [os.path.join(resultados, fichero) for fichero in
+                                visualizacion + [f'ejemplos_predicciones_{SUFIJOS_RESULTADOS[tarea]}.csv',
+                                                 f'predicciones_walk_forward_{tarea}.csv']],
+            codigo=CODIGO_MODELO, parametros=parametros, cachear=True))
+        etapas.append(Etapa(
+            f'score_{tarea}', ['score', '--tarea', tarea], entradas=[modelo] + preprocesados,
+            salidas=[os.path.join(resultados, f'predicciones_{tarea}.csv')],
+            codigo=CODIGO_MODELO, parametros=parametros, cachear=True))
+        etapas.append(Etapa(
+            f'backtest_{tarea}', ['backtest', '--tarea', tarea],
+            entradas=[os.path.join(resultados, f'predicciones_walk_forward_{tarea}.csv'), preprocesados[0]],
+            salidas=[os.path.join(resultados, f'backtest_{tarea}.csv')], codigo=['tenis/apuestas.py']))
+
+    etapas.append(Etapa(
+        'evaluate', ['evaluate'],
+        entradas=[os.path.join(directorio_eval, 'resultados', f'df_visualization_global_{sufijo}.csv')
+                  for sufijo in ('REGRESSION', 'CLASSIFICATION')],
+        codigo=[configuracion['evaluacion']['notebook']]))
+    return etapas
+
+
+def huella_fichero(ruta, memoria=None):
+    """
+    Args:
+        ruta (str): Fichero.
+        memoria (dict): Huellas ya calculadas por ruta, con el tamaño y la fecha de modificación con las que se
+            calcularon; si no han cambiado no se vuelve a leer el fichero (los CSV de previos ocupan GB).
+    Returns:
+        str: SHA-256 del contenido, o None si el fichero no existe.
+    """
+    try:
+        estado = os.stat(ruta)
+    except FileNotFoundError:
+        return None
+    clave = os.path.abspath(ruta)
+    if memoria is not None and clave in memoria:
+        tamano, modificado, huella = memoria[clave]
+        if tamano == estado.st_size and modificado == estado.st_mtime_ns:
+            return huella
+    sha = hashlib.sha256()
+    with open(ruta, 'rb') as f:
+        for bloque in iter(lambda: f.read(1 << 20), b''):
+            sha.update(bloque)
+    huella = sha.hexdigest()
+    if memoria is not None:
+        memoria[clave] = [estado.st_size, estado.st_mtime_ns, huella]
+    return huella
+
+
+def huella_codigo(ruta, memoria=None):
+    """Huella de un fichero de código; de los notebooks solo se tiene en cuenta el código de las celdas."""
+    if not ruta.endswith('.ipynb') or not os.path.exists(ruta):
+        return huella_fichero(ruta, memoria)
+    with open(ruta, encoding='utf-8') as f:
+        notebook = json.load(f)
+    fuentes = [''.join(celda['source']) for celda in notebook['cells'] if celda['cell_type'] == 'code']
+    return hashlib.sha256(json.dumps(fuentes).encode('utf-8')).hexdigest()
+
+
+class Orquestador:
+    """
+    Ejecuta las etapas desactualizadas en orden de dependencias, varias a la vez si son independientes.
+    El estado (huella de la última ejecución de cada etapa y huellas de los ficheros) se guarda en
+    directorio_estado/estado.json, y las salidas cacheadas en directorio_estado/salidas/<etapa>/<huella>/.
+    """
+
+    def __init__(self, etapas, directorio_estado='.pipeline', ejecutar=None):
+        """
+        Args:
+            etapas (list): Lista de Etapa.
+            directorio_estado (str): Carpeta del estado y de las salidas cacheadas.
+            ejecutar (callable): Función que ejecuta una etapa; por defecto lanza python -m tenis <comando>.
+        """
+        self.etapas = {etapa.nombre: etapa for etapa in etapas}
+        self.directorio_estado = directorio_estado
+        self.ejecutar = ejecutar or ejecutar_proceso
+        productor = {salida: etapa.nombre for etapa in etapas for salida in etapa.salidas}
+        self.dependencias = {etapa.nombre: sorted({productor[entrada] for entrada in etapa.entradas
+                                                   if entrada in productor and productor[entrada] != etapa.nombre})
+                             for etapa in etapas}
+        self._lock = threading.Lock()
+        self.estado = {'etapas': {}, 'ficheros': {}}
+        ruta = os.path.join(directorio_estado, 'estado.json')
+        if os.path.exists(ruta):
+            with open(ruta, encoding='utf-8') as f:
+                self.estado = json.load(f)
+
+    def _guardar_estado(self):
+        os.makedirs(self.directorio_estado, exist_ok=True)
+        ruta = os.path.join(self.directorio_estado, 'estado.json')
+        with self._lock:
+            with open(ruta + '.tmp', 'w', encoding='utf-8') as f:
+                json.dump(self.estado, f, indent=1)
+            os.replace(ruta + '.tmp', ruta)
+
+    def seleccionar(self, objetivos=None):
+        """
+        Args:
+            objetivos (list): Etapas a actualizar. Por defecto, todas.
+        Returns:
+            list: Los objetivos y todas las etapas de las que dependen, en orden topológico.
+        """
+        for nombre in objetivos or ():
+            if nombre not in self.etapas:
+                raise ValueError(f"Etapa desconocida: {nombre}. Etapas: {', '.join(self.etapas)}")
+        orden, visitadas = [], set()
+
+        def visitar(nombre, camino=()):
+            if nombre in camino:
+                raise ValueError(f"Ciclo en las etapas: {' -> '.join(camino + (nombre,))}")
+            if nombre in visitadas:
+                return
+            for dependencia in self.dependencias[nombre]:
+                visitar(dependencia, camino + (nombre,))
+            visitadas.add(nombre)
+            orden.append(nombre)
+
+        for nombre in objetivos or self.etapas:
+            visitar(nombre)
+        return orden
+
+    def huella(self, nombre):
+        """
+        Returns:
+            str: Huella de la etapa a partir de su código, parámetros y el contenido actual de sus entradas.
+        """
+        etapa = self.etapas[nombre]
+        with self._lock:
+            memoria = self.estado['ficheros']
+            contenido = {
+                'comando': etapa.comando,
+                'codigo': {ruta: huella_codigo(os.path.join(RAIZ, ruta), memoria) for ruta in etapa.codigo},
+                'parametros': etapa.parametros,
+                'entradas': {ruta: huella_fichero(ruta, memoria) for ruta in etapa.entradas},
+            }
+        return hashlib.sha256(json.dumps(contenido, sort_keys=True, default=str).encode('utf-8')).hexdigest()
+
+    def actualizada(self, nombre, huella):
+        etapa = self.etapas[nombre]
+        anterior = self.estado['etapas'].get(nombre, {})
+        return anterior.get('huella') == huella and all(os.path.exists(salida) for salida in etapa.salidas)
+
+    def _directorio_cache(self, nombre, huella):
+        return os.path.join(self.directorio_estado, 'salidas', nombre, huella)
+
+    def _restaurar(self, nombre, huella):
+        """Copia las salidas cacheadas con esa huella a su sitio. Devuelve si estaban todas."""
+        etapa = self.etapas[nombre]
+        directorio = self._directorio_cache(nombre, huella)
+        copias = [os.path.join(directorio, f'{i}_{os.path.basename(salida)}') for i, salida in enumerate(etapa.salidas)]
+        if not etapa.cachear or not etapa.salidas or not all(os.path.exists(copia) for copia in copias):
+            return False
+        for copia, salida in zip(copias, etapa.salidas):
+            os.makedirs(os.path.dirname(salida) or '.', exist_ok=True)
+            shutil.copy2(copia, salida)
+        return True
+
+    def _cachear(self, nombre, huella):
+        etapa = self.etapas[nombre]
+        if not etapa.cachear:
+            return
+        directorio = self._directorio_cache(nombre, huella)
+        os.makedirs(directorio, exist_ok=True)
+        for i, salida in enumerate(etapa.salidas):
+            if os.path.exists(salida):
+                shutil.copy2(salida, os.path.join(directorio, f'{i}_{os.path.basename(salida)}'))
+
+    def _correr(self, nombre, huella, forzada=False):
+        """Ejecuta (o restaura de la caché) una etapa y registra su huella. Devuelve 'restaurada' o 'ejecutada'."""
+        inicio = time.perf_counter()
+        if not forzada and self._restaurar(nombre, huella):
+            resultado = 'restaurada'
+        else:
+            self.ejecutar(self.etapas[nombre])
+            faltan = [salida for salida in self.etapas[nombre].salidas if not os.path.exists(salida)]
+            if faltan:
+                raise RuntimeError(f"La etapa {nombre} no ha generado {', '.join(faltan)}")
+            self._cachear(nombre, huella)
+            resultado = 'ejecutada'
+        with self._lock:
+            self.estado['etapas'][nombre] = {'huella': huella, 'fecha': time.strftime('%Y-%m-%d %H:%M:%S'),
+                                             'segundos': round(time.perf_counter() - inicio, 2)}
+        self._guardar_estado()
+        return resultado
+
+    def plan(self, objetivos=None, forzar=()):
+        """
+        Returns:
+            dict: Por etapa, 'actualizada', 'desactualizada' o 'pendiente' (depende de una etapa que hay que
+                ejecutar, así que no se sabe hasta entonces si cambiarán sus entradas).
+        """
+        plan = {}
+        for nombre in self.seleccionar(objetivos):
+            if any(plan[dependencia] != 'actualizada' for dependencia in self.dependencias[nombre]):
+                plan[nombre] = 'pendiente'
+            elif nombre in forzar or not self.actualizada(nombre, self.huella(nombre)):
+                plan[nombre] = 'desactualizada'
+            else:
+                plan[nombre] = 'actualizada'
+        return plan
+
+    def ejecutar_etapas(self, objetivos=None, forzar=(), procesos=2):
+        """
+        Ejecuta las etapas desactualizadas. Cada etapa se decide cuando han terminado todas aquellas de las que
+        depende, con el contenido que hayan dejado en sus salidas.
+        Args:
+            objetivos (list): Etapas a actualizar (y las que necesitan). Por defecto, todas.
+            forzar (iterable): Etapas que se ejecutan aunque estén actualizadas.
+            procesos (int): Número máximo de etapas ejecutándose a la vez.
+        Returns:
+            dict: Por etapa, 'actualizada', 'restaurada', 'ejecutada', 'fallida' o 'bloqueada' (depende de una fallida).
+        """
+        forzar = set(forzar)
+        orden = self.seleccionar(objetivos)
+        resultados = {}
+        en_curso = {}
+        with ThreadPoolExecutor(max_workers=procesos) as executor:
+            while len(resultados) < len(orden):
+                for nombre in orden:
+                    if nombre in resultados or nombre in en_curso.values():
+                        continue
+                    estados = [resultados.get(dependencia) for dependencia in self.dependencias[nombre]]
+                    if any(estado in ('fallida', 'bloqueada') for estado in estados):
+                        resultados[nombre] = 'bloqueada'
+                        print(f'[{nombre}] bloqueada')
+                        continue
+                    if any(estado is None for estado in estados):
+                        continue
+                    huella = self.huella(nombre)
+                    if nombre not in forzar and self.actualizada(nombre, huella):
+                        resultados[nombre] = 'actualizada'
+                        print(f'[{nombre}] actualizada')
+                        continue
+                    print(f'[{nombre}] ejecutando: python -m tenis {" ".join(self.etapas[nombre].comando)}')
+                    en_curso[executor.submit(self._correr, nombre, huella, nombre in forzar)] = nombre
+                if not en_curso:
+                    continue
+                terminados, _ = wait(en_curso, return_when=FIRST_COMPLETED)
+                for futuro in terminados:
+                    nombre = en_curso.pop(futuro)
+                    try:
+                        resultados[nombre] = futuro.result()
+                    except Exception as e:
+                        resultados[nombre] = 'fallida'
+                        print(f'[{nombre}] fallida: {e}')
+                    else:
+                        segundos = self.estado['etapas'][nombre]['segundos']
+                        print(f'[{nombre}] {resultados[nombre]} en {segundos:.1f} s')
+        return {nombre: resultados[nombre] for nombre in orden}
+
+
+def ejecutar_proceso(etapa, config=None):
+    """
+    Ejecuta una etapa en un proceso aparte (python -m tenis [--config config] <comando>).
+    Args:
+        etapa (Etapa): Etapa a ejecutar.
+        config (str): JSON de configuración que se pasa al proceso.
+    """
+    argumentos = [sys.executable, '-m', 'tenis'] + (['--config', config] if config else []) + etapa.comando
+    entorno = {**os.environ, 'PYTHONPATH': os.pathsep.join(filter(None, [RAIZ, os.environ.get('PYTHONPATH')]))}
+    subprocess.run(argumentos, check=True, env=entorno)
@@ -0,0 +1,131 @@
+import argparse
+import itertools
+import time
+
+import pandas as pd
+import torch
+
+from tenis.resultados import resumen_por_ventana
+from tenis.entrenamiento import TAREAS, cargar_datos, entrenar_ventanas, objetivos_de, preparar_tensores
+from tenis.modelo import CODIFICADORES
+
+# Modos a comparar: (nombre, precision, compilar). El primero es la referencia
+MODOS = [
+    ('fp32', 'fp32', False),
+    ('bf16', 'bf16', False),
+    ('fp32+compile', 'fp32', True),
+    ('bf16+compile', 'bf16', True),
+]
+
+
+def medir_modo(datos, tarea, precision, compilar, hilos, hasta_ventana, semilla=0, **kwargs):
+    """
+    Entrena las primeras ventanas con un modo de ejecución y mide su velocidad y sus métricas.
+    Args:
+        datos (dict): Tensores del dataset (ver preparar_tensores).
+        tarea (str): 'regresion' o 'clasificacion'.
+        precision (str): 'fp32' o 'bf16'.
+        compilar (bool): Si se usa torch.compile.
+        hilos (int): Hilos intra-op de torch.
+        hasta_ventana (int): Última ventana a entrenar.
+        semilla (int): Semilla de torch, la misma en todos los modos para que las métricas sean comparables.
+        **kwargs: Resto de parámetros de entrenar_ventanas.
+    Returns:
+        dict: Épocas entrenadas, segundos, épocas por segundo y métricas de la última ventana.
+    """
+    torch.manual_seed(semilla)
+    inicio = time.perf_counter()
+    _, df, _ = entrenar_ventanas(datos, tarea=tarea, precision=precision, compilar=compilar, hilos=hilos,
+                                 hasta_ventana=hasta_ventana, verbose=False, **kwargs)
+    segundos = time.perf_counter() - inicio
+
+    resumen = resumen_por_ventana(df)
+    fila = {'epocas': len(df), 'segundos': segundos, 'epocas_por_segundo': len(df) / segundos,
+            'ValidationLoss_media': resumen['ValidationLoss'].mean()}
+    ultima = resumen.iloc[-1]
+    for columna in ['ValidationLoss'] + list(TAREAS[tarea]['columnas']):
+        fila[columna] = ultima[columna]
+    return fila
+
+
+def comparar_modos(datos, tarea='regresion', modos=MODOS, hilos=(None,), hasta_ventana=10, **kwargs):
+    """
+    Compara la velocidad y las métricas de varios modos de ejecución con la referencia fp32 sin compilar.
+    El tiempo de los modos compilados incluye la compilación.
+    Args:
+        datos (dict): Tensores del dataset (ver preparar_tensores).
+        tarea (str): 'regresion' o 'clasificacion'.
+        modos (list): Lista de (nombre, precision, compilar). El primero es la referencia.
+        hilos (iterable): Números de hilos intra-op a probar con cada modo. None es el valor por defecto de torch.
+        hasta_ventana (int): Número de ventanas a entrenar en cada medida.
+        **kwargs: Resto de parámetros de entrenar_ventanas.
+    Returns:
+        pd.DataFrame: Una fila por modo y número de hilos, con la aceleración y la diferencia de métricas respecto a la referencia.
+    """
+    hilos_defecto = torch.get_num_threads()
+    filas = []
+    for (nombre, precision, compilar), n_hilos in itertools.product(modos, hilos):
+        n_hilos = n_hilos or hilos_defecto
+        print(f'Midiendo {nombre} con {n_hilos} hilos')
+        fila = {'modo': nombre, 'hilos': n_hilos}
+        fila.update(medir_modo(datos, tarea, precision, compilar, n_hilos, hasta_ventana, **kwargs))
+        filas.append(fila)
+    torch.set_num_threads(hilos_defecto)
+
+    return _frente_a_referencia(pd.DataFrame(filas), tarea)
+
+
+def comparar_codificadores(datos, tarea='regresion', codificadores=CODIFICADORES, hasta_ventana=10, **kwargs):
+    """
+    Compara la velocidad y las métricas de los codificadores de los históricos (GRU y Transformer, ver TennisRNN)
+    con el mismo protocolo de ventanas, en fp32 y sin compilar.
+    Args:
+        datos (dict): Tensores del dataset (ver preparar_tensores).
+        tarea (str): 'regresion' o 'clasificacion'.
+        codificadores (iterable): Codificadores a comparar. El primero es la referencia.
+        hasta_ventana (int): Número de ventanas a entrenar en cada medida.
+        **kwargs: Resto de parámetros de entrenar_ventanas.
+    Returns:
+        pd.DataFrame: Una fila por codificador, con la aceleración y la diferencia de métricas respecto a la referencia.
+    """
+    filas = []
+    for codificador in codificadores:
+        print(f'Midiendo {codificador}')
+        fila = {'codificador': codificador}
+        fila.update(medir_modo(datos, tarea, 'fp32', False, None, hasta_ventana, codificador=codificador, **kwargs))
+        filas.append(fila)
+    return _frente_a_referencia(pd.DataFrame(filas), tarea)
+
+
+def _frente_a_referencia(df, tarea):
+    """Añade a df la aceleración y la diferencia de métricas de cada fila respecto a la primera."""
+    referencia = df.iloc[0]
+    df['aceleracion'] = df['epocas_por_segundo'] / referencia['epocas_por_segundo']
+    for columna in ['ValidationLoss'] + list(TAREAS[tarea]['columnas']):
+        df[f'dif_{columna}'] = df[columna] - referencia[columna]
+    return df
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Velocidad y métricas del entrenamiento en bf16 y con torch.compile frente a fp32 sin compilar, '
+                                                 'o del codificador Transformer frente a las GRUs')
+    parser.add_argument('--tarea', default='regresion', choices=list(TAREAS))
+    parser.add_argument('--datos', default='../data')
+    parser.add_argument('--normalizado', action='store_true', help='Leer los previos de previos_normalizado.npz')
+    parser.add_argument('--ventanas', type=int, default=10)
+    parser.add_argument('--hilos', type=int, nargs='+', default=[None])
+    parser.add_argument('--codificadores', nargs='+', choices=list(CODIFICADORES), default=None,
+                        help='Comparar los codificadores de los históricos (en fp32) en lugar de los modos de ejecución')
+    parser.add_argument('--salida', default=None, help='CSV donde guardar la comparación')
+    args = parser.parse_args()
+
+    actual_diferencias, previos_home, previos_away = cargar_datos(args.tarea, args.datos, normalizado=args.normalizado)
+    datos = preparar_tensores(actual_diferencias, previos_home, previos_away, objetivos_de(args.tarea))
+    if args.codificadores is not None:
+        df_comparacion = comparar_codificadores(datos, tarea=args.tarea, codificadores=args.codificadores,
+                                                hasta_ventana=args.ventanas)
+    else:
+        df_comparacion = comparar_modos(datos, tarea=args.tarea, hilos=args.hilos, hasta_ventana=args.ventanas)
+    print(df_comparacion.to_string(index=False))
+    if args.salida is not None:
+        df_comparacion.to_csv(args.salida, index=False)
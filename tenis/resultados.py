@@ -0,0 +1,267 @@
+"""
+Almacén de resultados de los entrenamientos en SQLite. Cada ejecución (un entrenamiento o un trial de un
+barrido) tiene un id, la huella de su configuración y una fila por ventana con las métricas finales de la
+ventana, que entrenar_ventanas escribe al terminar cada una. Así los resultados de distintas ejecuciones no se
+pisan y se pueden comparar sin releer los CSV por época:
+
+    almacen = AlmacenResultados('resultados/resultados.sqlite')
+    ejecucion = almacen.nueva_ejecucion('regresion', parametros)
+    entrenar_walk_forward(..., registro=ejecucion)
+    almacen.comparar(['R2', 'MAE'], cabeza='regresion')
+    almacen.media_movil('ValidationLoss', ventana=10, cabeza='regresion')
+"""
+import hashlib
+import json
+import os
+import sqlite3
+import time
+import uuid
+
+import pandas as pd
+
+COLUMNAS_VENTANA = ['Epoch', 'TrainingLoss', 'ValidationLoss',
+                    'MAE', 'MSE', 'RMSE', 'R2', 'MAPE', 'Accuracy', 'Precision', 'Recall', 'F1', 'AUC']
+
+ESQUEMA = f"""
+CREATE TABLE IF NOT EXISTS ejecuciones (
+    id_ejecucion TEXT PRIMARY KEY,
+    nombre TEXT,
+    tarea TEXT,
+    huella_config TEXT,
+    config TEXT,
+    fecha TEXT
+);
+CREATE TABLE IF NOT EXISTS ventanas (
+    id_ejecucion TEXT REFERENCES ejecuciones(id_ejecucion),
+    cabeza TEXT,
+    Window INTEGER,
+    {', '.join(f'"{columna}" REAL' for columna in COLUMNAS_VENTANA)},
+    PRIMARY KEY (id_ejecucion, cabeza, Window)
+);
+CREATE INDEX IF NOT EXISTS ejecuciones_huella ON ejecuciones(huella_config);
+CREATE INDEX IF NOT EXISTS ventanas_cabeza ON ventanas(cabeza, Window);
+"""
+
+
+def resumen_por_ventana(df_visualization_global):
+    """
+    Se queda con la última época de cada ventana (la del modelo con el que se termina la ventana).
+    Args:
+        df_visualization_global (pd.DataFrame): Resultados por ventana y época.
+    Returns:
+        pd.DataFrame: Una fila por ventana.
+    """
+    if df_visualization_global.empty:
+        return df_visualization_global
+    ultimas = df_visualization_global.groupby('Window')['Epoch'].idxmax()
+    return df_visualization_global.loc[ultimas.values].reset_index(drop=True)
+
+
+def huella_configuracion(config):
+    """
+    Returns:
+        str: SHA-256 (16 caracteres) de la configuración, independiente del orden de las claves.
+    """
+    return hashlib.sha256(json.dumps(config, sort_keys=True, default=str).encode('utf-8')).hexdigest()[:16]
+
+
+class AlmacenResultados:
+    """Resultados por ejecución y ventana en una base de datos SQLite."""
+
+    def __init__(self, ruta='resultados/resultados.sqlite'):
+        """
+        Args:
+            ruta (str): Fichero de la base de datos; se crea si no existe.
+        """
+        self.ruta = ruta
+        carpeta = os.path.dirname(ruta)
+        if carpeta:
+            os.makedirs(carpeta, exist_ok=True)
+        # WAL permite leer mientras otro proceso escribe (por ejemplo, consultar durante un entrenamiento)
+        self.conexion = sqlite3.connect(ruta, timeout=60)
+        self.conexion.execute('PRAGMA journal_mode=WAL')
+        self.conexion.executescript(ESQUEMA)
+
+    def cerrar(self):
+        self.conexion.close()
+
+    def nueva_ejecucion(self, tarea, config=None, nombre=None, id_ejecucion=None):
+        """
+        Args:
+            tarea (str): 'regresion', 'clasificacion' o 'multitarea'.
+            config (dict): Parámetros de la ejecución; su huella permite agrupar las repeticiones de una configuración.
+            nombre (str): Nombre descriptivo.
+            id_ejecucion (str): Id de la ejecución. Por defecto, fecha y hora más un sufijo aleatorio.
+        Returns:
+            Ejecucion: Ejecución registrada, para pasar a entrenar_ventanas como registro.
+        """
+        config = config or {}
+        id_ejecucion = id_ejecucion or f"{time.strftime('%Y%m%d-%H%M%S')}-{uuid.uuid4().hex[:6]}"
+        with self.conexion:
+            self.conexion.execute(
+                'INSERT OR REPLACE INTO ejecuciones VALUES (?, ?, ?, ?, ?, ?)',
+                (id_ejecucion, nombre, tarea, huella_configuracion(config), json.dumps(config, sort_keys=True, default=str),
+                 time.strftime('%Y-%m-%d %H:%M:%S')))
+        return Ejecucion(self, id_ejecucion)
+
+    def registrar_ventanas(self, id_ejecucion, cabeza, df_ventanas):
+        """
+        Args:
+            id_ejecucion (str): Ejecución.
+            cabeza (str): 'regresion' o 'clasificacion'.
+            df_ventanas (pd.DataFrame): Una fila por ventana con 'Window' y las columnas de COLUMNAS_VENTANA que tenga.
+                Las ventanas ya registradas se sustituyen (por ejemplo, al reanudar desde un checkpoint).
+        """
+        columnas = [columna for columna in COLUMNAS_VENTANA if columna in df_ventanas.columns]
+        filas = [(id_ejecucion, cabeza, int(fila[0]), *[None if pd.isna(valor) else float(valor) for valor in fila[1:]])
+                 for fila in df_ventanas[['Window'] + columnas].itertuples(index=False)]
+        sql_columnas = ', '.join(['id_ejecucion', 'cabeza', 'Window'] + [f'"{columna}"' for columna in columnas])
+        with self.conexion:
+            self.conexion.executemany(
+                f'INSERT OR REPLACE INTO ventanas ({sql_columnas}) VALUES ({", ".join("?" * (len(columnas) + 3))})', filas)
+
+    def importar_csv(self, ruta_csv, tarea, cabeza=None, config=None, nombre=None):
+        """
+        Importa un df_visualization_global_*.csv (una fila por ventana y época) como una ejecución.
+        Args:
+            ruta_csv (str): CSV de resultados por época.
+            tarea (str): Tarea de la ejecución.
+            cabeza (str): Cabeza de los resultados. Por defecto, la tarea.
+            config (dict): Parámetros de la ejecución, si se conocen.
+            nombre (str): Nombre de la ejecución. Por defecto, el del fichero.
+        Returns:
+            Ejecucion: Ejecución creada.
+        """
+        ejecucion = self.nueva_ejecucion(tarea, config, nombre or os.path.basename(ruta_csv))
+        self.registrar_ventanas(ejecucion.id, cabeza or tarea, resumen_por_ventana(pd.read_csv(ruta_csv)))
+        return ejecucion
+
+    def _consulta(self, sql, parametros=()):
+        return pd.read_sql_query(sql, self.conexion, params=parametros)
+
+    @staticmethod
+    def _filtros(ids=None, cabeza=None, huella_config=None, tarea=None):
+        condiciones, parametros = [], []
+        if ids is not None:
+            ids = list(ids)
+            condiciones.append(f'e.id_ejecucion IN ({", ".join("?" * len(ids))})')
+            parametros += ids
+        for columna, valor in (('v.cabeza', cabeza), ('e.huella_config', huella_config), ('e.tarea', tarea)):
+            if valor is not None:
+                condiciones.append(f'{columna} = ?')
+                parametros.append(valor)
+        return (' WHERE ' + ' AND '.join(condiciones)) if condiciones else '', parametros
+
+    def ejecuciones(self):
+        """
+        Returns:
+            pd.DataFrame: Una fila por ejecución con su número de ventanas.
+        """
+        return self._consulta(
+            'SELECT e.id_ejecucion, e.nombre, e.tarea, e.huella_config, e.fecha, e.config, '
+            'COUNT(DISTINCT v.Window) AS ventanas FROM ejecuciones e LEFT JOIN ventanas v USING (id_ejecucion) '
+            'GROUP BY e.id_ejecucion ORDER BY e.fecha')
+
+    def ventanas(self, ids=None, cabeza=None, huella_config=None, tarea=None):
+        """
+        Args:
+            ids (list): Ejecuciones. Por defecto, todas.
+            cabeza (str): Solo los resultados de esa cabeza.
+            huella_config (str): Solo las ejecuciones con esa configuración.
+            tarea (str): Solo las ejecuciones de esa tarea.
+        Returns:
+            pd.DataFrame: Métricas finales por ejecución y ventana, con las mismas columnas que
+                resumen_por_ventana(df_visualization_global) más id_ejecucion, nombre, huella_config y cabeza.
+        """
+        donde, parametros = self._filtros(ids, cabeza, huella_config, tarea)
+        return self._consulta(
+            f'SELECT v.*, e.nombre, e.huella_config FROM ventanas v JOIN ejecuciones e USING (id_ejecucion){donde} '
+            'ORDER BY v.id_ejecucion, v.cabeza, v.Window', parametros)
+
+    def comparar(self, metricas, cabeza=None, ids=None, por='id_ejecucion', desde_ventana=None, hasta_ventana=None):
+        """
+        Compara ejecuciones con la media, la desviación típica, el mínimo y el máximo de cada métrica por ventana.
+        Args:
+            metricas (list): Columnas de COLUMNAS_VENTANA a comparar.
+            cabeza (str): Cabeza de los resultados.
+            ids (list): Ejecuciones. Por defecto, todas.
+            por (str): 'id_ejecucion' o 'huella_config' (agrupa las repeticiones de una misma configuración).
+            desde_ventana, hasta_ventana (int): Rango de ventanas, para comparar ejecuciones en las mismas ventanas.
+        Returns:
+            pd.DataFrame: Una fila por ejecución (o configuración).
+        """
+        if por not in ('id_ejecucion', 'huella_config'):
+            raise ValueError(f"No se puede agrupar por {por}")
+        donde, parametros = self._filtros(ids, cabeza)
+        for condicion, valor in (('v.Window >= ?', desde_ventana), ('v.Window <= ?', hasta_ventana)):
+            if valor is not None:
+                donde += (' AND ' if donde else ' WHERE ') + condicion
+                parametros.append(valor)
+        agregados = []
+        for metrica in metricas:
+            if metrica not in COLUMNAS_VENTANA:
+                raise ValueError(f"Métrica desconocida: {metrica}")
+            columna = f'v."{metrica}"'
+            agregados += [f'AVG({columna}) AS "{metrica}_media"',
+                          # SQLite no tiene desviación típica: se calcula con la media de los cuadrados (con ddof=1,
+                          # como pandas)
+                          f'CASE WHEN COUNT({columna}) > 1 THEN SQRT(MAX(AVG({columna} * {columna}) - AVG({columna}) * '
+                          f'AVG({columna}), 0) * COUNT({columna}) / (COUNT({columna}) - 1)) END AS "{metrica}_std"',
+                          f'MIN({columna}) AS "{metrica}_min"', f'MAX({columna}) AS "{metrica}_max"']
+        return self._consulta(
+            f'SELECT e.{por}, MIN(e.nombre) AS nombre, COUNT(DISTINCT e.id_ejecucion) AS ejecuciones, '
+            f'COUNT(*) AS ventanas, {", ".join(agregados)} '
+            f'FROM ventanas v JOIN ejecuciones e USING (id_ejecucion){donde} GROUP BY e.{por}', parametros)
+
+    def media_movil(self, metrica, ventana=10, centrada=False, cabeza=None, ids=None):
+        """
+        Media móvil de una métrica a lo largo de las ventanas de cada ejecución, calculada en la base de datos.
+        Equivale a df[metrica].rolling(ventana, center=centrada).mean() por ejecución y cabeza.
+        Args:
+            metrica (str): Columna de COLUMNAS_VENTANA.
+            ventana (int): Número de ventanas de la media.
+            centrada (bool): Si es True la media se centra en cada ventana; si no, usa las anteriores.
+            cabeza (str): Cabeza de los resultados.
+            ids (list): Ejecuciones. Por defecto, todas.
+        Returns:
+            pd.DataFrame: id_ejecucion, cabeza, Window, la métrica y su media móvil (NaN mientras no hay
+                suficientes ventanas).
+        """
+        if metrica not in COLUMNAS_VENTANA:
+            raise ValueError(f"Métrica desconocida: {metrica}")
+        # Como en pandas, con ventanas pares la media centrada toma una fila más de las anteriores
+        anteriores = ventana // 2 if centrada else ventana - 1
+        posteriores = ventana - 1 - anteriores
+        donde, parametros = self._filtros(ids, cabeza)
+        marco = (f'OVER (PARTITION BY v.id_ejecucion, v.cabeza ORDER BY v.Window '
+                 f'ROWS BETWEEN {anteriores} PRECEDING AND {posteriores} FOLLOWING)')
+        df = self._consulta(
+            f'SELECT v.id_ejecucion, v.cabeza, v.Window, v."{metrica}", AVG(v."{metrica}") {marco} AS media, '
+            f'COUNT(v."{metrica}") {marco} AS n FROM ventanas v JOIN ejecuciones e USING (id_ejecucion){donde} '
+            'ORDER BY v.id_ejecucion, v.cabeza, v.Window', parametros)
+        df[f'{metrica}_MA'] = df['media'].where(df['n'] == ventana)
+        return df.drop(columns=['media', 'n'])
+
+    def borrar(self, ids):
+        """Borra las ejecuciones indicadas y sus ventanas."""
+        ids = list(ids)
+        marcas = ', '.join('?' * len(ids))
+        with self.conexion:
+            self.conexion.execute(f'DELETE FROM ventanas WHERE id_ejecucion IN ({marcas})', ids)
+            self.conexion.execute(f'DELETE FROM ejecuciones WHERE id_ejecucion IN ({marcas})', ids)
+
+
+class Ejecucion:
+    """Ejecución del almacén en la que entrenar_ventanas registra las métricas finales de cada ventana."""
+
+    def __init__(self, almacen, id_ejecucion):
+        self.almacen = almacen
+        self.id = id_ejecucion
+
+    def registrar_ventana(self, cabeza, fila):
+        """
+        Args:
+            cabeza (str): 'regresion' o 'clasificacion'.
+            fila (dict): Métricas finales de la ventana, con 'Window', 'Epoch', las pérdidas y las métricas de la cabeza.
+        """
+        self.almacen.registrar_ventanas(self.id, cabeza, pd.DataFrame([fila]))
@@ -0,0 +1,498 @@
+"""
+Servidor HTTP local que sustituye a las APIs de Sofascore y Matchstat, para probar y medir 1.ranking.py y
+2.scrapper.py sin depender de los servicios reales.
+
+Sirve los endpoints que usan los scripts con respuestas grabadas (ficheros JSON en una carpeta) o, si no hay
+grabación, con un mundo sintético coherente: jugadores, rankings semanales, torneos, temporadas, partidos,
+históricos de cada jugador y cuotas. Se pueden simular latencia, errores, respuestas 403/429 y un límite de
+peticiones por segundo:
+
+    python -m tenis.servidor_replay --puerto 8000 --latencia 50 --jitter 20 --tasa-error 0.01 --limite 20
+    SOFASCORE_URL=http://localhost:8000/api/v1 python 2.scrapper.py
+    MATCHSTAT_URL=http://localhost:8000/tennis/api2 python 1.ranking.py
+
+Las estadísticas de peticiones servidas se consultan en http://localhost:8000/__estadisticas.
+"""
+import argparse
+import json
+import os
+import random
+import re
+import threading
+import time
+from collections import Counter
+from datetime import datetime, timezone
+from fractions import Fraction
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, unquote, urlsplit
+
+import numpy as np
+
+from tenis import sintetico
+
+PREFIJO_SOFASCORE = '/api/v1'
+PREFIJO_MATCHSTAT = '/tennis/api2'
+POR_PAGINA = 30
+POR_PAGINA_RANKING = 100
+
+# (id, nombre, puntos, superficie). Los ids de los Grand Slams y de los torneos que scraping_seasons añade a
+# mano (2390, 2510, 15952) son los reales para que el scraper se comporte igual que con la API
+TORNEOS = [
+    (2363, 'Australian Open', 2000, 'Hardcourt outdoor'),
+    (2480, 'Roland Garros', 2000, 'Red clay'),
+    (2361, 'Wimbledon', 2000, 'Grass'),
+    (2449, 'US Open', 2000, 'Hardcourt outdoor'),
+    (2391, 'Indian Wells', 1000, 'Hardcourt outdoor'),
+    (2374, 'Madrid', 1000, 'Red clay'),
+    (2390, 'Montreal', 1000, 'Hardcourt outdoor'),
+    (2510, 'Toronto', 1000, 'Hardcourt outdoor'),
+    (2375, 'Barcelona', 500, 'Red clay'),
+    (15952, 'Astana', 500, 'Hardcourt indoor'),
+    (2388, 'ATP Finals', None, 'Hardcourt indoor'),
+    (2411, 'Umag', 250, 'Red clay'),
+    (2415, 'Wimbledon Doubles', 2000, 'Grass'),
+]
+GRAND_SLAMS = {2363, 2480, 2361, 2449}
+
+
+class MundoSintetico:
+    """
+    Datos sintéticos coherentes entre todos los endpoints: los partidos de los torneos aparecen en el
+    histórico de sus jugadores, los rankings de Matchstat son los mismos que usa get_player, etc. Además de
+    los torneos de TORNEOS, cada semana todos los jugadores juegan un partido de un Challenger para que tengan
+    histórico suficiente.
+    """
+
+    def __init__(self, n_jugadores=300, years=(2019, 2020, 2021, 2022, 2023, 2024), semilla=0):
+        """
+        Args:
+            n_jugadores (int): Número de jugadores.
+            years (tuple): Años con torneos y partidos.
+            semilla (int): Semilla del generador.
+        """
+        self.years = list(years)
+        self.inicio = int(datetime(self.years[0], 1, 1, tzinfo=timezone.utc).timestamp())
+        n_semanas = 52 * len(self.years)
+        self.ranking = sintetico.generar_ranking(n_jugadores, n_semanas, semilla=semilla, inicio=self.inicio)
+        self.jugadores = sintetico.generar_jugadores(self.ranking, semilla=semilla)
+        self.fechas = self.ranking.columns[3:].astype(int).values
+        self.posiciones = self.ranking.iloc[:, 3:].values.T  # (fecha, jugador)
+        self.nombres_ranking = [nombre.title() for nombre in self.ranking['player']]
+        self.indice_jugador = {int(id_jugador): i for i, id_jugador in enumerate(self.jugadores['id'])}
+        self.indice_nombre = {nombre.lower(): i for i, nombre in enumerate(self.nombres_ranking)}
+        self._generar_partidos(n_semanas, np.random.default_rng(semilla))
+
+    def _generar_partidos(self, n_semanas, rng):
+        ids = self.jugadores['id'].values
+        columnas = {'torneo': [], 'season': [], 'year': [], 'home': [], 'away': [], 'timestamp': [], 'round': []}
+
+        def anadir(torneo, season, year, home, away, timestamp, ronda):
+            for clave, valor in zip(columnas, (torneo, season, year, home, away, timestamp, ronda)):
+                columnas[clave].append(valor)
+
+        self.temporadas = {}  # id torneo -> lista de (id season, year)
+        for k, (id_torneo, nombre, _, _) in enumerate(TORNEOS):
+            self.temporadas[id_torneo] = []
+            for y, year in enumerate(self.years):
+                season = 40000 + k * 100 + (year - 2000)
+                self.temporadas[id_torneo].append((season, year))
+                semana = y * 52 + (3 + 4 * k) % 48
+                participantes = rng.choice(ids, 32, replace=False)
+                for ronda, n_partidos in [(1, 16), (2, 8), (3, 4), (4, 2), (5, 1)]:
+                    for j in range(n_partidos):
+                        timestamp = self.inicio + semana * sintetico.SEMANA + ronda * 86400 + int(rng.integers(36000, 72000))
+                        anadir(id_torneo, season, year, participantes[2 * j], participantes[2 * j + 1], timestamp, ronda)
+                    # Pasan a la siguiente ronda la mitad de los jugadores (el cuadro no tiene que ser exacto)
+                    participantes = rng.permutation(participantes[:n_partidos])
+
+        # Challengers semanales: todos los jugadores juegan un partido cada semana
+        for semana in range(n_semanas):
+            orden = rng.permutation(ids)
+            year = self.years[min(semana // 52, len(self.years) - 1)]
+            for j in range(len(orden) // 2):
+                timestamp = self.inicio + semana * sintetico.SEMANA + 4 * 86400 + int(rng.integers(36000, 72000))
+                anadir(9000 + semana % 50, 90000 + semana, year, orden[2 * j], orden[2 * j + 1], timestamp, 1)
+
+        self.eventos = {clave: np.array(valores) for clave, valores in columnas.items()}
+        self.eventos['id'] = 10_000_000 + np.arange(len(columnas['torneo']))
+        self.indice_evento = {int(id_evento): i for i, id_evento in enumerate(self.eventos['id'])}
+
+        # Histórico de cada jugador ordenado por fecha (índices de eventos)
+        orden = np.argsort(self.eventos['timestamp'], kind='stable')
+        self.historico = {int(id_jugador): [] for id_jugador in ids}
+        for i in orden:
+            self.historico[int(self.eventos['home'][i])].append(i)
+            self.historico[int(self.eventos['away'][i])].append(i)
+        self.por_season = {}
+        for i in orden:
+            self.por_season.setdefault((int(self.eventos['torneo'][i]), int(self.eventos['season'][i])), []).append(i)
+
+    # ------------------------------------------------------------------ Sofascore
+
+    def torneo(self, id_torneo):
+        for id_t, nombre, puntos, superficie in TORNEOS:
+            if id_t == id_torneo:
+                return {'id': id_t, 'name': nombre, 'tennisPoints': puntos, 'groundType': superficie}
+        return {'id': id_torneo, 'name': f'Challenger {id_torneo - 9000}', 'tennisPoints': 100, 'groundType': 'Hardcourt outdoor'}
+
+    def unique_tournaments(self):
+        torneos = []
+        for id_torneo, nombre, puntos, _ in TORNEOS:
+            torneo = {'id': id_torneo, 'name': nombre}
+            if puntos is not None:
+                torneo['tennisPoints'] = puntos
+            torneos.append(torneo)
+        return {'groups': [{'name': 'ATP', 'uniqueTournaments': torneos}]}
+
+    def seasons(self, id_torneo):
+        if id_torneo not in self.temporadas:
+            return None
+        return {'seasons': [{'id': season, 'year': str(year), 'name': f'{self.torneo(id_torneo)["name"]} {year}'}
+                            for season, year in reversed(self.temporadas[id_torneo])]}
+
+    def _pagina(self, indices, pagina, por_pagina=POR_PAGINA):
+        """Página de eventos como en Sofascore: la 0 son los más recientes, y cada página va de antiguo a reciente."""
+        fin = len(indices) - pagina * por_pagina
+        if fin <= 0:
+            return None
+        inicio = max(fin - por_pagina, 0)
+        return {'events': [self.evento(i) for i in indices[inicio:fin]], 'hasNextPage': inicio > 0}
+
+    def season_events(self, id_torneo, season, pagina):
+        return self._pagina(self.por_season.get((id_torneo, season), []), pagina)
+
+    def team_events(self, id_jugador, pagina):
+        if id_jugador not in self.historico:
+            return None
+        return self._pagina(self.historico[id_jugador], pagina)
+
+    def evento(self, i):
+        """JSON de un partido (el contenido de 'event' en /event/{id})."""
+        rng = np.random.default_rng(int(self.eventos['id'][i]))
+        id_torneo = int(self.eventos['torneo'][i])
+        torneo = self.torneo(id_torneo)
+        periodos = 5 if id_torneo in GRAND_SLAMS else 3
+        ganador = int(rng.integers(1, 3))
+        sets_ganador = periodos // 2 + 1
+        sets_perdedor = int(rng.integers(0, sets_ganador))
+        marcador = {1: {'current': 0}, 2: {'current': 0}}
+        # El último set siempre lo gana el ganador del partido
+        resultados = list(rng.permutation([ganador] * (sets_ganador - 1) + [3 - ganador] * sets_perdedor)) + [ganador]
+        for n_set, ganador_set in enumerate(map(int, resultados), start=1):
+            juegos_perdedor = int(rng.integers(0, 6))
+            marcador[ganador_set][f'period{n_set}'] = 7 if juegos_perdedor == 5 else 6
+            marcador[3 - ganador_set][f'period{n_set}'] = juegos_perdedor
+            marcador[ganador_set]['current'] += 1
+        return {
+            'id': int(self.eventos['id'][i]),
+            'tournament': {'name': torneo['name'], 'uniqueTournament': {'id': id_torneo, 'name': torneo['name']}},
+            'season': {'id': int(self.eventos['season'][i]), 'year': str(self.eventos['year'][i])},
+            'roundInfo': {'round': int(self.eventos['round'][i])},
+            'groundType': torneo['groundType'],
+            'defaultPeriodCount': periodos,
+            'startTimestamp': int(self.eventos['timestamp'][i]),
+            'status': {'code': 100 if rng.random() > 0.03 else 92},
+            'winnerCode': ganador,
+            'homeTeam': {'id': int(self.eventos['home'][i])},
+            'awayTeam': {'id': int(self.eventos['away'][i])},
+            'homeScore': marcador[1],
+            'awayScore': marcador[2],
+        }
+
+    def event(self, id_evento):
+        if id_evento not in self.indice_evento:
+            return None
+        return {'event': self.evento(self.indice_evento[id_evento])}
+
+    def odds(self, id_evento):
+        if id_evento not in self.indice_evento:
+            return None
+        i = self.indice_evento[id_evento]
+        rng = np.random.default_rng(int(id_evento) + 1)
+        if rng.random() < 0.05:
+            return None
+        # Probabilidad del local según la diferencia de ranking en esa semana, con un 5% de margen
+        semana = min(max(np.searchsorted(self.fechas, self.eventos['timestamp'][i]) - 1, 0), len(self.fechas) - 1)
+        rank_home = self.posiciones[semana, self.indice_jugador[int(self.eventos['home'][i])]]
+        rank_away = self.posiciones[semana, self.indice_jugador[int(self.eventos['away'][i])]]
+        rank_home, rank_away = (rank_home if rank_home > 0 else 500), (rank_away if rank_away > 0 else 500)
+        prob_home = 1 / (1 + np.exp((np.log(rank_home) - np.log(rank_away))))
+        choices = []
+        for prob in (prob_home, 1 - prob_home):
+            inicial = _fraccion(1 / (prob * 1.05) - 1)
+            actual = _fraccion(1 / (min(max(prob + rng.normal(0, 0.03), 0.02), 0.98) * 1.05) - 1)
+            choices.append({'initialFractionalValue': inicial, 'fractionalValue': actual})
+        return {'featured': {'default': {'choices': choices}}}
+
+    def team(self, id_jugador):
+        if id_jugador not in self.indice_jugador:
+            return None
+        jugador = self.jugadores.iloc[self.indice_jugador[id_jugador]]
+        info = {'birthDateTimestamp': int(jugador['birthDate']),
+                'plays': 'right-handed' if jugador['rightHanded'] == 1 else 'left-handed'}
+        if not np.isnan(jugador['height']):
+            info['height'] = int(round(jugador['height'] * 100))
+        if not np.isnan(jugador['weight']):
+            info['weight'] = int(jugador['weight'])
+        return {'team': {'id': id_jugador, 'fullName': jugador['fullName'], 'country': {'alpha3': jugador['country']},
+                         'playerTeamInfo': info}}
+
+    # ------------------------------------------------------------------ Matchstat
+
+    def filtros_ranking(self):
+        return {'date': [datetime.fromtimestamp(int(fecha), timezone.utc).strftime('%Y-%m-%dT%H:%M:%S.000Z')
+                         for fecha in reversed(self.fechas)]}
+
+    def ranking_pagina(self, fecha, pagina):
+        try:
+            timestamp = int(datetime.strptime(fecha, '%d.%m.%Y').replace(tzinfo=timezone.utc).timestamp())
+        except (TypeError, ValueError):
+            return None
+        k = np.searchsorted(self.fechas, timestamp)
+        if k >= len(self.fechas) or abs(int(self.fechas[k]) - timestamp) > 86400:
+            return []
+        posiciones = self.posiciones[k]
+        orden = [j for j in np.argsort(posiciones) if posiciones[j] > 0]
+        orden = orden[pagina * POR_PAGINA_RANKING:(pagina + 1) * POR_PAGINA_RANKING]
+        return [{'position': int(posiciones[j]), 'player': {'name': self.nombres_ranking[j]}} for j in orden]
+
+    def perfil(self, nombre):
+        j = self.indice_nombre.get(nombre.lower())
+        if j is None:
+            return None
+        nacimiento = datetime.fromtimestamp(int(self.ranking['birthDate'].iloc[j]), timezone.utc)
+        return {'name': self.nombres_ranking[j], 'birthday': nacimiento.strftime('%Y-%m-%dT%H:%M:%S.000Z'),
+                'country': {'name': self.ranking['country'].iloc[j]}}
+
+
+def _fraccion(valor):
+    """Cuota fraccional ('4/5') a partir de su valor decimal."""
+    fraccion = Fraction(max(valor, 0.01)).limit_denominator(20)
+    return f'{fraccion.numerator}/{fraccion.denominator}'
+
+
+class ConfiguracionFallos:
+    """Comportamiento anómalo a simular en las respuestas del servidor."""
+
+    def __init__(self, latencia_ms=0, jitter_ms=0, tasa_error=0.0, tasa_403=0.0, tasa_429=0.0, retry_after=1,
+                 limite=0, bloqueo_segundos=0, semilla=0):
+        """
+        Args:
+            latencia_ms (float): Latencia fija de cada respuesta.
+            jitter_ms (float): Latencia aleatoria adicional (uniforme entre 0 y jitter_ms).
+            tasa_error (float): Probabilidad de responder 500.
+            tasa_403 (float): Probabilidad de responder 403.
+            tasa_429 (float): Probabilidad de responder 429 aunque no se supere el límite.
+            retry_after (int): Segundos de la cabecera Retry-After en las respuestas 429.
+            limite (float): Peticiones por segundo permitidas (0 = sin límite). Por encima se responde 429.
+            bloqueo_segundos (float): Si es mayor que 0, al superar el límite se responde 403 a todo durante
+                ese tiempo, como hace la protección de Sofascore.
+            semilla (int): Semilla de los fallos aleatorios.
+        """
+        self.latencia_ms = latencia_ms
+        self.jitter_ms = jitter_ms
+        self.tasa_error = tasa_error
+        self.tasa_403 = tasa_403
+        self.tasa_429 = tasa_429
+        self.retry_after = retry_after
+        self.limite = limite
+        self.bloqueo_segundos = bloqueo_segundos
+        self._rng = random.Random(semilla)
+        self._lock = threading.Lock()
+        self._fichas = limite
+        self._ultima = time.monotonic()
+        self._bloqueado_hasta = 0.0
+
+    def decidir(self):
+        """
+        Decide la respuesta de una petición según los fallos configurados.
+        Returns:
+            tuple: Código de estado (None si la petición se sirve con normalidad) y segundos de latencia.
+        """
+        with self._lock:
+            ahora = time.monotonic()
+            latencia = (self.latencia_ms + self._rng.uniform(0, self.jitter_ms)) / 1000
+            if ahora < self._bloqueado_hasta:
+                return 403, latencia
+            if self.limite > 0:
+                # Cubeta de fichas: se recargan `limite` fichas por segundo, con un máximo de `limite`
+                self._fichas = min(self.limite, self._fichas + (ahora - self._ultima) * self.limite)
+                self._ultima = ahora
+                if self._fichas < 1:
+                    if self.bloqueo_segundos > 0:
+                        self._bloqueado_hasta = ahora + self.bloqueo_segundos
+                        return 403, latencia
+                    return 429, latencia
+                self._fichas -= 1
+            sorteo = self._rng.random()
+            if sorteo < self.tasa_403:
+                return 403, latencia
+            if sorteo < self.tasa_403 + self.tasa_429:
+                return 429, latencia
+            if sorteo < self.tasa_403 + self.tasa_429 + self.tasa_error:
+                return 500, latencia
+            return None, latencia
+
+
+def ruta_grabacion(directorio, ruta, consulta=''):
+    """
+    Fichero en el que se busca la respuesta grabada de una petición: la ruta de la URL (sin la barra inicial)
+    y, si hay parámetros, '__' seguido de los parámetros con los caracteres especiales cambiados por '_'.
+    Por ejemplo /api/v1/event/123 -> <directorio>/api/v1/event/123.json.
+    """
+    nombre = ruta.strip('/')
+    if consulta:
+        nombre += '__' + re.sub(r'[^\w.=-]', '_', consulta)
+    return os.path.join(directorio, nombre + '.json')
+
+
+class ServidorReplay(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, direccion, mundo=None, grabaciones=None, fallos=None, verbose=False):
+        super().__init__(direccion, _Manejador)
+        self.mundo = mundo
+        self.grabaciones = grabaciones
+        self.fallos = fallos or ConfiguracionFallos()
+        self.verbose = verbose
+        self.estadisticas = Counter()
+        self._lock_estadisticas = threading.Lock()
+        # (familia del endpoint, patrón de la ruta, función que genera la respuesta)
+        self.rutas = [
+            ('tournaments', PREFIJO_SOFASCORE + r'/category/3/unique-tournaments/?$', lambda m, q: self.mundo.unique_tournaments()),
+            ('seasons', PREFIJO_SOFASCORE + r'/unique-tournament/(\d+)/seasons/?$', lambda m, q: self.mundo.seasons(int(m[1]))),
+            ('season_events', PREFIJO_SOFASCORE + r'/unique-tournament/(\d+)/season/(\d+)/events/last/(\d+)/?$',
+             lambda m, q: self.mundo.season_events(int(m[1]), int(m[2]), int(m[3]))),
+            ('odds', PREFIJO_SOFASCORE + r'/event/(\d+)/odds/1/featured/?$', lambda m, q: self.mundo.odds(int(m[1]))),
+            ('event', PREFIJO_SOFASCORE + r'/event/(\d+)/?$', lambda m, q: self.mundo.event(int(m[1]))),
+            ('team_events', PREFIJO_SOFASCORE + r'/team/(\d+)/events/last/(\d+)/?$', lambda m, q: self.mundo.team_events(int(m[1]), int(m[2]))),
+            ('team', PREFIJO_SOFASCORE + r'/team/(\d+)/?$', lambda m, q: self.mundo.team(int(m[1]))),
+            ('ranking_filters', PREFIJO_MATCHSTAT + r'/ranking/atp/filters/?$', lambda m, q: self.mundo.filtros_ranking()),
+            ('ranking', PREFIJO_MATCHSTAT + r'/ranking/atp/?$',
+             lambda m, q: self.mundo.ranking_pagina(q.get('date', [None])[0], int(q.get('page', ['0'])[0]))),
+            ('profile', PREFIJO_MATCHSTAT + r'/profile/(.+)$', lambda m, q: self.mundo.perfil(unquote(m[1]))),
+        ]
+        self.rutas = [(familia, re.compile(patron), funcion) for familia, patron, funcion in self.rutas]
+
+    def contar(self, familia, estado):
+        with self._lock_estadisticas:
+            self.estadisticas[f'{familia} {estado}'] += 1
+            self.estadisticas[f'total {estado}'] += 1
+
+    def responder(self, ruta, consulta):
+        """
+        Returns:
+            tuple: Familia del endpoint (para las estadísticas) y JSON a devolver, o None si no existe.
+        """
+        if self.grabaciones is not None:
+            fichero = ruta_grabacion(self.grabaciones, ruta, consulta)
+            if os.path.exists(fichero):
+                with open(fichero, encoding='utf-8') as f:
+                    return 'grabacion', json.load(f)
+        if self.mundo is None:
+            return 'sin_grabacion', None
+        for familia, patron, funcion in self.rutas:
+            encontrado = patron.match(ruta)
+            if encontrado:
+                return familia, funcion(encontrado, parse_qs(consulta))
+        return 'desconocida', None
+
+
+class _Manejador(BaseHTTPRequestHandler):
+
+    def do_GET(self):
+        url = urlsplit(self.path)
+        if url.path == '/__estadisticas':
+            self._enviar(200, dict(self.server.estadisticas))
+            return
+
+        estado, latencia = self.server.fallos.decidir()
+        if latencia > 0:
+            time.sleep(latencia)
+        familia = 'fallo'
+        if estado is None:
+            try:
+                familia, datos = self.server.responder(url.path, url.query)
+            except Exception as e:
+                print(f'Error generando la respuesta de {self.path}: {e}')
+                familia, datos, estado = 'error', None, 500
+            if estado is None:
+                estado = 200 if datos is not None else 404
+        self.server.contar(familia, estado)
+
+        if estado == 200:
+            self._enviar(200, datos)
+        elif estado == 429:
+            self._enviar(429, {'error': {'code': 429, 'message': 'Too Many Requests'}},
+                         {'Retry-After': str(self.server.fallos.retry_after)})
+        else:
+            self._enviar(estado, {'error': {'code': estado}})
+
+    def _enviar(self, estado, datos, cabeceras=None):
+        cuerpo = json.dumps(datos).encode('utf-8')
+        self.send_response(estado)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(cuerpo)))
+        for clave, valor in (cabeceras or {}).items():
+            self.send_header(clave, valor)
+        self.end_headers()
+        self.wfile.write(cuerpo)
+
+    def log_message(self, formato, *args):
+        if self.server.verbose:
+            super().log_message(formato, *args)
+
+
+def crear_servidor(puerto=8000, host='127.0.0.1', mundo=None, grabaciones=None, fallos=None, verbose=False):
+    """
+    Crea el servidor (sin arrancarlo). Para arrancarlo en segundo plano:
+        servidor = crear_servidor(...)
+        threading.Thread(target=servidor.serve_forever, daemon=True).start()
+    Args:
+        puerto (int): Puerto en el que escuchar (0 para uno libre, ver servidor.server_address).
+        host (str): Dirección en la que escuchar.
+        mundo (MundoSintetico): Datos sintéticos para las peticiones sin grabación. None para servir solo grabaciones.
+        grabaciones (str): Carpeta con respuestas grabadas (ver ruta_grabacion).
+        fallos (ConfiguracionFallos): Latencia y errores a simular.
+        verbose (bool): Si es True, se imprime cada petición.
+    Returns:
+        ServidorReplay: Servidor listo para serve_forever.
+    """
+    return ServidorReplay((host, puerto), mundo, grabaciones, fallos, verbose)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Servidor local con respuestas grabadas o sintéticas de Sofascore y Matchstat')
+    parser.add_argument('--puerto', type=int, default=8000)
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--grabaciones', default=None, help='Carpeta con respuestas grabadas')
+    parser.add_argument('--solo-grabaciones', action='store_true', help='No generar datos sintéticos: 404 si no hay grabación')
+    parser.add_argument('--jugadores', type=int, default=300)
+    parser.add_argument('--years', type=int, nargs='+', default=[2019, 2020, 2021, 2022, 2023, 2024])
+    parser.add_argument('--semilla', type=int, default=0)
+    parser.add_argument('--latencia', type=float, default=0, help='Latencia fija en milisegundos')
+    parser.add_argument('--jitter', type=float, default=0, help='Latencia aleatoria adicional en milisegundos')
+    parser.add_argument('--tasa-error', type=float, default=0.0)
+    parser.add_argument('--tasa-403', type=float, default=0.0)
+    parser.add_argument('--tasa-429', type=float, default=0.0)
+    parser.add_argument('--retry-after', type=int, default=1)
+    parser.add_argument('--limite', type=float, default=0, help='Peticiones por segundo (0 = sin límite)')
+    parser.add_argument('--bloqueo', type=float, default=0, help='Segundos de 403 tras superar el límite')
+    parser.add_argument('--verbose', action='store_true')
+    args = parser.parse_args()
+
+    mundo = None
+    if not args.solo_grabaciones:
+        print('Generando datos sintéticos...')
+        mundo = MundoSintetico(args.jugadores, args.years, args.semilla)
+    fallos = ConfiguracionFallos(args.latencia, args.jitter, args.tasa_error, args.tasa_403, args.tasa_429,
+                                 args.retry_after, args.limite, args.bloqueo, args.semilla)
+    servidor = crear_servidor(args.puerto, args.host, mundo, args.grabaciones, fallos, args.verbose)
+    print(f'Sirviendo en http://{args.host}:{args.puerto} (Sofascore: {PREFIJO_SOFASCORE}, Matchstat: {PREFIJO_MATCHSTAT})')
+    try:
+        servidor.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        servidor.server_close()
+        print(json.dumps(dict(servidor.estadisticas), indent=2))
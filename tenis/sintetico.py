@@ -0,0 +1,221 @@
+"""
+Generador de datos sintéticos con la misma forma que los datos reales, para medir el rendimiento de las
+etapas del scraper y del entrenamiento sin descargar nada: matriz de ranking, tabla de jugadores, partidos
+actuales y previos (bloques de 2*num_previos filas) y datasets preprocesados para la red.
+"""
+import numpy as np
+import pandas as pd
+
+# Lunes 6 de enero de 2020, primera fecha de la matriz de ranking sintética
+INICIO = 1578268800
+SEMANA = 7 * 24 * 3600
+PAISES = ['ESP', 'FRA', 'ITA', 'USA', 'ARG', 'GER', 'SRB', 'AUS', 'GBR', 'RUS']
+SILABAS = ['ra', 'fa', 'el', 'na', 'dal', 'no', 'vak', 'djo', 'ko', 'vic', 'car', 'los', 'al', 'ca', 'raz', 'ja',
+           'nik', 'sin', 'ner', 'da', 'nil', 'med', 've', 'dev', 'ste', 'fa', 'nos', 'tsi', 'tsi', 'pas']
+
+
+def _nombre(rng):
+    nombre = ''.join(rng.choice(SILABAS, 2)).capitalize()
+    apellido = ''.join(rng.choice(SILABAS, 3)).capitalize()
+    return f'{nombre} {apellido}'
+
+
+def generar_ranking(n_jugadores=500, n_fechas=200, fraccion_sin_ranking=0.1, semilla=0, inicio=INICIO):
+    """
+    Genera una matriz de ranking con el formato de ranking.csv: player, birthDate, country y una columna por
+    fecha (timestamp semanal) con la posición de cada jugador, -1 si no está en el ranking esa semana.
+    Args:
+        n_jugadores (int): Número de jugadores.
+        n_fechas (int): Número de semanas.
+        fraccion_sin_ranking (float): Fracción de posiciones sin ranking (-1).
+        semilla (int): Semilla del generador.
+        inicio (int): Timestamp de la primera fecha.
+    Returns:
+        pd.DataFrame: Matriz de ranking.
+    """
+    rng = np.random.default_rng(semilla)
+    nombres = []
+    while len(nombres) < n_jugadores:
+        nombre = _nombre(rng)
+        if nombre.lower() not in nombres:
+            nombres.append(nombre.lower())
+    ranking = pd.DataFrame({
+        'player': nombres,
+        'birthDate': rng.integers(631152000, 1104537600, n_jugadores),  # 1990-2005
+        'country': rng.choice(PAISES, n_jugadores),
+    })
+    # El ranking de cada semana es una permutación que evoluciona poco a poco
+    nivel = rng.normal(size=n_jugadores)
+    fechas = {}
+    for k in range(n_fechas):
+        nivel = nivel + rng.normal(scale=0.05, size=n_jugadores)
+        posiciones = np.empty(n_jugadores, dtype=int)
+        posiciones[np.argsort(-nivel)] = np.arange(1, n_jugadores + 1)
+        posiciones[rng.random(n_jugadores) < fraccion_sin_ranking] = -1
+        fechas[str(inicio + k * SEMANA)] = posiciones
+    return pd.concat([ranking, pd.DataFrame(fechas)], axis=1)
+
+
+def generar_jugadores(ranking, fraccion_variantes=0.2, fraccion_na=0.05, semilla=0):
+    """
+    Genera la tabla de jugadores (players.csv) a partir de la matriz de ranking. Una parte de los nombres se
+    altera ligeramente para que get_player tenga que buscarlos por similitud, como pasa con los datos reales.
+    Args:
+        ranking (pd.DataFrame): Matriz de ranking (ver generar_ranking).
+        fraccion_variantes (float): Fracción de jugadores con el nombre alterado.
+        fraccion_na (float): Fracción de alturas y pesos vacíos.
+        semilla (int): Semilla del generador.
+    Returns:
+        pd.DataFrame: Tabla de jugadores con id, birthDate, height, weight, rightHanded, fullName y country.
+    """
+    rng = np.random.default_rng(semilla)
+    n = ranking.shape[0]
+    nombres = [nombre.title() for nombre in ranking['player']]
+    for i in np.flatnonzero(rng.random(n) < fraccion_variantes):
+        # Se quita una letra del apellido (errores de transliteración, tildes...)
+        nombre = nombres[i]
+        posicion = rng.integers(nombre.index(' ') + 2, len(nombre))
+        nombres[i] = nombre[:posicion] + nombre[posicion + 1:]
+    altura = rng.normal(1.85, 0.07, n).round(2)
+    peso = (altura * 100 - 105 + rng.normal(0, 5, n)).round()
+    # Como en los datos reales, a ningún jugador le faltan a la vez la altura y el peso
+    sin_altura = rng.random(n) < fraccion_na
+    altura[sin_altura] = np.nan
+    peso[~sin_altura & (rng.random(n) < fraccion_na)] = np.nan
+    return pd.DataFrame({
+        'id': np.arange(10000, 10000 + n),
+        'birthDate': ranking['birthDate'].values,
+        'height': altura,
+        'weight': peso,
+        'rightHanded': (rng.random(n) < 0.85).astype(int),
+        'fullName': nombres,
+        'country': ranking['country'].values,
+    })
+
+
+def _datos_jugador(rng, jugadores, ids, lado):
+    """Columnas del jugador local o visitante ('Home' o 'Away') para una lista de ids."""
+    filas = jugadores.set_index('id').loc[ids]
+    actual = rng.integers(1, 901, len(ids))
+    return {
+        f'id{lado}': ids,
+        f'birthDate{lado}': filas['birthDate'].values,
+        f'ActualRanking{lado}': actual,
+        f'BestRanking{lado}': np.maximum(actual - rng.integers(0, 200, len(ids)), 1),
+        f'BestRankingDate{lado}': str(INICIO),
+        f'Height{lado}': filas['height'].values,
+        f'Weight{lado}': filas['weight'].values,
+        f'RightHanded{lado}': filas['rightHanded'].values.astype(float),
+        f'country{lado}': filas['country'].values,
+    }
+
+
+def _partidos(rng, jugadores, ids_home, ids_away, timestamps):
+    """Filas de partidos en el formato del scraper (sin columnas específicas de actual o previos)."""
+    n = len(ids_home)
+    periodos = rng.choice([3, 5], n, p=[0.8, 0.2])
+    ganador = rng.integers(0, 2, n)
+    sets_ganador = periodos // 2 + 1
+    sets_perdedor = rng.integers(0, sets_ganador)
+    df = pd.DataFrame({
+        'idTournament': rng.choice([2480, 2363, 2449, 2361, 2391, 2374], n),
+        'tournamentName': 'Torneo sintético',
+        'idSeason': rng.integers(30000, 60000, n),
+        'idEvent': rng.integers(10**7, 10**8, n),
+        'round': rng.integers(1, 30, n),
+        'groundType': rng.choice(['Hardcourt outdoor', 'Red clay', 'Grass', 'Hardcourt indoor'], n),
+        'periodCount': periodos,
+        'winnerCode': ganador,
+        'startTimestamp': timestamps,
+        'year': pd.to_datetime(timestamps, unit='s').year,
+    })
+    df = pd.concat([df, pd.DataFrame(_datos_jugador(rng, jugadores, ids_home, 'Home')),
+                    pd.DataFrame(_datos_jugador(rng, jugadores, ids_away, 'Away'))], axis=1)
+    df['status'] = 'finished'
+    return df, ganador, sets_ganador, sets_perdedor
+
+
+def generar_partidos(jugadores, n_actuales=100, num_previos=50, fraccion_incompletos=0.0, min_previos=10, semilla=0):
+    """
+    Genera partidos actuales y previos con el formato de actual.parquet y previos.parquet antes del postprocesado:
+    por cada partido actual, num_previos previos del jugador local y num_previos del visitante, del más reciente
+    al más antiguo y con el jugador unas veces como local y otras como visitante.
+    Args:
+        jugadores (pd.DataFrame): Tabla de jugadores (ver generar_jugadores).
+        n_actuales (int): Número de partidos actuales.
+        num_previos (int): Tamaño de cada bloque de previos.
+        fraccion_incompletos (float): Fracción de jugadores con menos de num_previos previos (bloque con relleno).
+        min_previos (int): Número mínimo de previos de los jugadores incompletos.
+        semilla (int): Semilla del generador.
+    Returns:
+        tuple: DataFrames actual y previos.
+    """
+    rng = np.random.default_rng(semilla)
+    ids = jugadores['id'].values
+    ids_home = rng.choice(ids, n_actuales)
+    ids_away = np.array([rng.choice(ids[ids != home]) for home in ids_home])
+    # Los partidos actuales empiezan un año después del inicio para que haya sitio para los previos
+    timestamps = INICIO + 52 * SEMANA + rng.integers(0, 150 * SEMANA, n_actuales)
+    actual, _, _, _ = _partidos(rng, jugadores, ids_home, ids_away, timestamps)
+    actual['ProbabilityHome'] = rng.uniform(0.05, 0.95, n_actuales).round(3)
+    actual['ProbabilityAway'] = (1.05 - actual['ProbabilityHome']).round(3)
+
+    bloques = []
+    longitudes = {'Home': [], 'Away': []}
+    for i in range(n_actuales):
+        for lado, jugador in (('Home', ids_home[i]), ('Away', ids_away[i])):
+            reales = num_previos
+            if rng.random() < fraccion_incompletos:
+                reales = int(rng.integers(min_previos, num_previos))
+            longitudes[lado].append(reales)
+            rivales = rng.choice(ids[ids != jugador], reales)
+            es_local = rng.random(reales) < 0.5
+            anteriores = timestamps[i] - np.cumsum(rng.integers(1, 14, reales)) * 24 * 3600
+            bloque, ganador, sets_ganador, sets_perdedor = _partidos(
+                rng, jugadores, np.where(es_local, jugador, rivales), np.where(es_local, rivales, jugador), anteriores)
+            bloque['homeScore'] = np.where(ganador == 1, sets_ganador, sets_perdedor)
+            bloque['awayScore'] = np.where(ganador == 1, sets_perdedor, sets_ganador)
+            for s in range(1, 6):
+                jugado = s <= bloque['homeScore'] + bloque['awayScore']
+                bloque[f'set{s}performanceHome'] = np.where(jugado, rng.uniform(0, 1, reales).round(4), -1)
+                bloque[f'set{s}performanceAway'] = np.where(jugado, (1 - bloque[f'set{s}performanceHome']).round(4), -1)
+            bloque['totalGamesHome'] = rng.integers(6, 40, reales)
+            bloque['totalGamesAway'] = rng.integers(6, 40, reales)
+            bloque['idNext'] = actual.loc[i, 'idEvent']
+            bloque['lastMatchTimestamp'] = np.append(anteriores[1:], anteriores[-1] - 7 * 24 * 3600)
+            bloque['relleno'] = 0
+            if reales < num_previos:
+                relleno = pd.DataFrame(np.nan, index=range(num_previos - reales), columns=bloque.columns)
+                relleno['relleno'] = 1
+                bloque = pd.concat([bloque, relleno], ignore_index=True)
+            bloques.append(bloque)
+    actual['numPreviosHome'] = longitudes['Home']
+    actual['numPreviosAway'] = longitudes['Away']
+    return actual, pd.concat(bloques, ignore_index=True)
+
+
+def generar_preprocesado(n_actuales=2000, semanas=60, num_previos=50, features_actual=18, features_previos=40, semilla=0):
+    """
+    Genera un dataset con el formato de actual_diferencias_preproc_escalado.parquet y de los previos ya separados
+    (ver tenis.entrenamiento.separar_previos), listo para preparar_tensores.
+    Args:
+        n_actuales (int): Número de partidos actuales.
+        semanas (int): Número de semanas distintas (year_week_id).
+        num_previos (int): Longitud de la secuencia de previos.
+        features_actual (int): Número de características de los partidos actuales.
+        features_previos (int): Número de características de los previos.
+        semilla (int): Semilla del generador.
+    Returns:
+        tuple: DataFrames actual_diferencias, previos_home y previos_away.
+    """
+    rng = np.random.default_rng(semilla)
+    actual_diferencias = pd.DataFrame(rng.normal(size=(n_actuales, features_actual)),
+                                      columns=[f'x{i}' for i in range(features_actual)])
+    logit = actual_diferencias.iloc[:, :3].sum(axis=1).values
+    actual_diferencias['probability_away'] = 1 / (1 + np.exp(logit))
+    actual_diferencias['winnerCode'] = (rng.random(n_actuales) < actual_diferencias['probability_away']).astype(int)
+    actual_diferencias['year_week_id'] = np.sort(rng.integers(0, semanas, n_actuales))
+    columnas = [f'p{i}' for i in range(features_previos)]
+    previos_home = pd.DataFrame(rng.normal(size=(n_actuales * num_previos, features_previos)), columns=columnas)
+    previos_away = pd.DataFrame(rng.normal(size=(n_actuales * num_previos, features_previos)), columns=columnas)
+    return actual_diferencias, previos_home, previos_away
@@ -0,0 +1,248 @@
+"""
+Valoraciones Elo y Glicko calculadas con los propios partidos, como alternativa local al ranking semanal de
+Matchstat: no dependen del scraping del ranking, de la búsqueda por similitud de nombres de get_player ni de los
+-100 / 0.1 con los que se rellenan los jugadores sin emparejar.
+
+Los partidos actuales y los previos (sin repetir: cada previo aparece en muchos bloques) se recorren en orden de
+startTimestamp. El estado son arrays indexados por jugador (Elo global, Elo por superficie, Glicko y su
+desviación, último partido), y de cada partido se emiten las valoraciones de los dos jugadores justo antes de
+jugarlo, así que no hay fuga del resultado.
+
+    partidos = partidos_ordenados(actual, previos)
+    valoraciones = calcular_valoraciones(partidos)
+    actual = anadir_valoraciones(actual, valoraciones)
+    previos = anadir_valoraciones(previos, valoraciones)
+
+    python -m tenis.valoraciones --datos ../data
+"""
+import argparse
+import math
+import os
+import time
+
+import numpy as np
+import pandas as pd
+
+from tenis.esquema import leer_tabla
+
+COLUMNAS_PARTIDO = ['idEvent', 'startTimestamp', 'idHome', 'idAway', 'groundType', 'winnerCode']
+# Columnas que añade anadir_valoraciones, cada una con su versión Home y Away
+VALORACIONES = ['Elo', 'EloSuperficie', 'Glicko', 'GlickoRd']
+SEGUNDOS_DIA = 24 * 3600
+# Escala de Glicko: q = ln(10) / 400
+Q = math.log(10) / 400
+
+
+def partidos_ordenados(actual, previos=None):
+    """
+    Args:
+        actual (pd.DataFrame): Partidos actuales en el formato del scraper (actual.parquet).
+        previos (pd.DataFrame): Previos en bloques, con idHome reorganizado al jugador de cada bloque. Las filas
+            de relleno (sin idEvent) se descartan.
+    Returns:
+        pd.DataFrame: Un partido por idEvent con COLUMNAS_PARTIDO, ordenados por startTimestamp.
+    """
+    partes = [actual[COLUMNAS_PARTIDO]]
+    if previos is not None:
+        partes.append(previos[COLUMNAS_PARTIDO])
+    partidos = pd.concat(partes, ignore_index=True).dropna(subset=['idEvent', 'startTimestamp', 'idHome', 'idAway', 'winnerCode'])
+    # Cada previo aparece en los bloques de muchos partidos y a veces con local y visitante intercambiados: se
+    # queda la primera aparición, con su winnerCode en la misma orientación
+    partidos = partidos.drop_duplicates(subset='idEvent', keep='first')
+    partidos = partidos.sort_values('startTimestamp', kind='stable').reset_index(drop=True)
+    partidos['groundType'] = partidos['groundType'].astype(object).fillna('desconocida')
+    return partidos
+
+
+class MotorValoraciones:
+    """
+    Elo (global y por superficie) y Glicko-1 de todos los jugadores. Se alimenta con partidos en orden
+    cronológico, en uno o en varios lotes: el estado se conserva entre llamadas y los jugadores y superficies
+    nuevos se añaden al vuelo.
+    """
+
+    def __init__(self, k=250.0, desplazamiento=5.0, forma=0.4, elo_inicial=1500.0, rd_inicial=350.0,
+                 rd_minimo=30.0, c=8.0):
+        """
+        Args:
+            k, desplazamiento, forma (float): Factor K de Elo que decrece con la experiencia del jugador,
+                k / (partidos + desplazamiento) ** forma.
+            elo_inicial (float): Valoración de un jugador sin partidos (también la inicial de Glicko).
+            rd_inicial (float): Desviación de Glicko de un jugador sin partidos, y la máxima.
+            rd_minimo (float): Desviación mínima de Glicko.
+            c (float): Aumento de la desviación de Glicko por día sin jugar (la varianza crece c² por día).
+        """
+        self.k = k
+        self.desplazamiento = desplazamiento
+        self.forma = forma
+        self.elo_inicial = elo_inicial
+        self.rd_inicial = rd_inicial
+        self.rd_minimo = rd_minimo
+        self.c = c
+        self.jugadores = {}
+        self.superficies = {}
+        self.elo = np.empty(0)
+        self.partidos = np.empty(0)
+        self.elo_superficie = np.empty((0, 0))
+        self.partidos_superficie = np.empty((0, 0))
+        self.glicko = np.empty(0)
+        self.rd = np.empty(0)
+        self.ultimo = np.empty(0)
+
+    def _indices(self, valores, diccionario):
+        """Índice compacto de cada valor, añadiendo al diccionario los que no estaban."""
+        codigos, unicos = pd.factorize(pd.Series(valores))
+        for valor in unicos:
+            if valor not in diccionario:
+                diccionario[valor] = len(diccionario)
+        return np.array([diccionario[valor] for valor in unicos], dtype=np.int64)[codigos]
+
+    def _crecer(self):
+        """Amplía los arrays de estado con los jugadores y superficies nuevos."""
+        n, s = len(self.jugadores), len(self.superficies)
+        nuevos = n - len(self.elo)
+        if nuevos:
+            self.elo = np.append(self.elo, np.full(nuevos, self.elo_inicial))
+            self.partidos = np.append(self.partidos, np.zeros(nuevos))
+            self.glicko = np.append(self.glicko, np.full(nuevos, self.elo_inicial))
+            self.rd = np.append(self.rd, np.full(nuevos, self.rd_inicial))
+            self.ultimo = np.append(self.ultimo, np.full(nuevos, np.nan))
+        if self.elo_superficie.shape != (s, n):
+            elo_superficie = np.full((s, n), self.elo_inicial)
+            partidos_superficie = np.zeros((s, n))
+            filas, columnas = self.elo_superficie.shape
+            elo_superficie[:filas, :columnas] = self.elo_superficie
+            partidos_superficie[:filas, :columnas] = self.partidos_superficie
+            self.elo_superficie, self.partidos_superficie = elo_superficie, partidos_superficie
+
+    def procesar(self, partidos):
+        """
+        Args:
+            partidos (pd.DataFrame): Partidos con COLUMNAS_PARTIDO en orden cronológico (ver partidos_ordenados).
+                winnerCode es 0 si gana el local y 1 si gana el visitante.
+        Returns:
+            pd.DataFrame: Por partido, idEvent, idHome y las valoraciones de los dos jugadores antes del partido
+                (EloHome, EloAway, EloSuperficieHome, ..., GlickoRdAway).
+        """
+        home = self._indices(partidos['idHome'].to_numpy(), self.jugadores)
+        away = self._indices(partidos['idAway'].to_numpy(), self.jugadores)
+        superficie = self._indices(partidos['groundType'].to_numpy(), self.superficies)
+        self._crecer()
+
+        # El bucle trabaja con listas de floats de Python, bastante más rápidas de indexar que los arrays
+        elo, n_partidos, glicko, rd, ultimo = (self.elo.tolist(), self.partidos.tolist(), self.glicko.tolist(),
+                                               self.rd.tolist(), self.ultimo.tolist())
+        elo_superficie = [fila.tolist() for fila in self.elo_superficie]
+        partidos_superficie = [fila.tolist() for fila in self.partidos_superficie]
+        dias = (partidos['startTimestamp'].to_numpy(dtype=float) / SEGUNDOS_DIA).tolist()
+        gana_home = (partidos['winnerCode'].to_numpy(dtype=float) == 0).tolist()
+        k, desplazamiento, forma = self.k, self.desplazamiento, self.forma
+        c2, rd_inicial, rd_minimo = self.c ** 2, self.rd_inicial, self.rd_minimo
+        pi2 = math.pi ** 2
+
+        n = len(home)
+        salida = np.empty((n, 2 * len(VALORACIONES)))
+        for i, (h, a, s, dia, resultado) in enumerate(zip(home.tolist(), away.tolist(), superficie.tolist(), dias, gana_home)):
+            elo_s = elo_superficie[s]
+            partidos_s = partidos_superficie[s]
+
+            # Glicko: la desviación crece con los días sin jugar antes del partido
+            rd_h, rd_a = rd[h], rd[a]
+            if ultimo[h] == ultimo[h]:
+                rd_h = min(math.sqrt(rd_h * rd_h + c2 * (dia - ultimo[h])), rd_inicial)
+            if ultimo[a] == ultimo[a]:
+                rd_a = min(math.sqrt(rd_a * rd_a + c2 * (dia - ultimo[a])), rd_inicial)
+            salida[i] = (elo[h], elo[a], elo_s[h], elo_s[a], glicko[h], glicko[a], rd_h, rd_a)
+            s_h = 1.0 if resultado else 0.0
+
+            # Elo global y por superficie, con K decreciente con los partidos jugados
+            esperado = 1.0 / (1.0 + 10.0 ** ((elo[a] - elo[h]) / 400.0))
+            cambio_h = k / (n_partidos[h] + desplazamiento) ** forma * (s_h - esperado)
+            cambio_a = k / (n_partidos[a] + desplazamiento) ** forma * (s_h - esperado)
+            elo[h] += cambio_h
+            elo[a] -= cambio_a
+            esperado = 1.0 / (1.0 + 10.0 ** ((elo_s[a] - elo_s[h]) / 400.0))
+            cambio_h = k / (partidos_s[h] + desplazamiento) ** forma * (s_h - esperado)
+            cambio_a = k / (partidos_s[a] + desplazamiento) ** forma * (s_h - esperado)
+            elo_s[h] += cambio_h
+            elo_s[a] -= cambio_a
+            n_partidos[h] += 1
+            n_partidos[a] += 1
+            partidos_s[h] += 1
+            partidos_s[a] += 1
+
+            # Glicko-1 con el partido como único resultado del periodo de cada jugador
+            g_h = 1.0 / math.sqrt(1.0 + 3.0 * Q * Q * rd_h * rd_h / pi2)
+            g_a = 1.0 / math.sqrt(1.0 + 3.0 * Q * Q * rd_a * rd_a / pi2)
+            esperado_h = 1.0 / (1.0 + 10.0 ** (-g_a * (glicko[h] - glicko[a]) / 400.0))
+            esperado_a = 1.0 / (1.0 + 10.0 ** (-g_h * (glicko[a] - glicko[h]) / 400.0))
+            inversa_h = 1.0 / (rd_h * rd_h) + Q * Q * g_a * g_a * esperado_h * (1.0 - esperado_h)
+            inversa_a = 1.0 / (rd_a * rd_a) + Q * Q * g_h * g_h * esperado_a * (1.0 - esperado_a)
+            glicko[h] += Q / inversa_h * g_a * (s_h - esperado_h)
+            glicko[a] += Q / inversa_a * g_h * ((1.0 - s_h) - esperado_a)
+            rd[h] = max(math.sqrt(1.0 / inversa_h), rd_minimo)
+            rd[a] = max(math.sqrt(1.0 / inversa_a), rd_minimo)
+            ultimo[h] = dia
+            ultimo[a] = dia
+
+        self.elo, self.partidos, self.glicko, self.rd, self.ultimo = (
+            np.array(elo), np.array(n_partidos), np.array(glicko), np.array(rd), np.array(ultimo))
+        self.elo_superficie = np.array(elo_superficie).reshape(self.elo_superficie.shape)
+        self.partidos_superficie = np.array(partidos_superficie).reshape(self.partidos_superficie.shape)
+
+        columnas = [f'{valoracion}{lado}' for valoracion in VALORACIONES for lado in ('Home', 'Away')]
+        df = pd.DataFrame(salida, columns=columnas)
+        df.insert(0, 'idHome', partidos['idHome'].to_numpy())
+        df.insert(0, 'idEvent', partidos['idEvent'].to_numpy())
+        return df
+
+
+def calcular_valoraciones(partidos, **parametros):
+    """
+    Args:
+        partidos (pd.DataFrame): Partidos en orden cronológico (ver partidos_ordenados).
+        **parametros: Parámetros de MotorValoraciones.
+    Returns:
+        pd.DataFrame: Valoraciones de los dos jugadores antes de cada partido (ver MotorValoraciones.procesar).
+    """
+    return MotorValoraciones(**parametros).procesar(partidos)
+
+
+def anadir_valoraciones(df, valoraciones):
+    """
+    Añade a actual o a previos las valoraciones de sus partidos, en la orientación de cada fila: en los previos
+    el local de la fila puede ser el visitante del partido calculado, y entonces se intercambian Home y Away.
+    Args:
+        df (pd.DataFrame): Partidos con idEvent e idHome (las filas de relleno quedan con NaN).
+        valoraciones (pd.DataFrame): Resultado de calcular_valoraciones.
+    Returns:
+        pd.DataFrame: df con las columnas de VALORACIONES en su versión Home y Away.
+    """
+    # Los ids se comparan como float: en los previos tipados el relleno tiene pd.NA (ver tenis.esquema)
+    fila = pd.Index(valoraciones['idEvent'].astype(float)).get_indexer(df['idEvent'].astype(float))
+    encontrado = fila >= 0
+    intercambiar = encontrado & (df['idHome'].astype(float).to_numpy() != valoraciones['idHome'].astype(float).to_numpy()[fila])
+    df = df.copy()
+    for valoracion in VALORACIONES:
+        home = valoraciones[f'{valoracion}Home'].to_numpy()[fila]
+        away = valoraciones[f'{valoracion}Away'].to_numpy()[fila]
+        df[f'{valoracion}Home'] = np.where(encontrado, np.where(intercambiar, away, home), np.nan)
+        df[f'{valoracion}Away'] = np.where(encontrado, np.where(intercambiar, home, away), np.nan)
+    return df
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Valoraciones Elo y Glicko de los jugadores a partir de los partidos descargados')
+    parser.add_argument('--datos', default='../data')
+    parser.add_argument('--salida', default=None, help='CSV de salida (por defecto valoraciones.csv en --datos)')
+    args = parser.parse_args()
+
+    actual = leer_tabla(os.path.join(args.datos, 'actual.parquet'), columnas=COLUMNAS_PARTIDO)
+    previos = leer_tabla(os.path.join(args.datos, 'previos.parquet'), columnas=COLUMNAS_PARTIDO)
+    inicio = time.perf_counter()
+    partidos = partidos_ordenados(actual, previos)
+    valoraciones = calcular_valoraciones(partidos)
+    print(f'{len(partidos)} partidos distintos procesados en {time.perf_counter() - inicio:.2f} s')
+    salida = args.salida or os.path.join(args.datos, 'valoraciones.csv')
+    valoraciones.to_csv(salida, index=False)
+    print(f'Valoraciones guardadas en {salida}')
@@ -0,0 +1,59 @@
+"""Pruebas del cliente HTTP (tenis/peticiones.py) con una sesión falsa que devuelve respuestas fijadas."""
+import json
+import threading
+
+import pytest
+
+from tenis.peticiones import ClienteHTTP, PoliticaReintentos
+
+
+class RespuestaFalsa:
+    def __init__(self, status_code, texto=None):
+        self.status_code = status_code
+        self.text = texto if texto is not None else json.dumps({'ok': status_code})
+        self.content = self.text.encode()
+        self.headers = {}
+        self.reason = 'prueba'
+
+
+class SesionFalsa:
+    """Devuelve las respuestas en orden; cuando se acaban, repite la última."""
+
+    def __init__(self, respuestas):
+        self.respuestas = list(respuestas)
+        self.peticiones = 0
+
+    def get(self, url, timeout=None):
+        self.peticiones += 1
+        return self.respuestas.pop(0) if len(self.respuestas) > 1 else self.respuestas[0]
+
+
+def cliente(respuestas, **kwargs):
+    sesion = SesionFalsa(respuestas)
+    politica = PoliticaReintentos(max_reintentos=3, base=0.01, maximo=0.01, semilla=0)
+    return ClienteHTTP(politica=politica, tasa_inicial=1000, pausa=0.01, pausa_maxima=0.01, sesion=sesion, **kwargs), sesion
+
+
+def obtener_con_limite(cliente_http, url='http://api.prueba/evento/1', limite=5.0):
+    """Llama a obtener_json en un hilo y falla si no termina en `limite` segundos."""
+    resultado = {}
+    hilo = threading.Thread(target=lambda: resultado.setdefault('json', cliente_http.obtener_json(url)), daemon=True)
+    hilo.start()
+    hilo.join(limite)
+    assert not hilo.is_alive(), 'obtener_json se ha quedado bloqueado'
+    return resultado['json']
+
+
+@pytest.mark.parametrize('intermedia', [RespuestaFalsa(429), RespuestaFalsa(200, 'no es json')])
+def test_prueba_semiabierta_sin_resultado_no_bloquea(intermedia):
+    # 403 abre el circuito, la petición de prueba recibe un 429 o un JSON no válido y el reintento tiene que pasar
+    cliente_http, sesion = cliente([RespuestaFalsa(403), intermedia, RespuestaFalsa(200)])
+    assert obtener_con_limite(cliente_http) == {'ok': 200}
+    assert sesion.peticiones == 3
+    assert not cliente_http.circuitos['api.prueba']._probando
+
+
+def test_403_permanente_devuelve_none():
+    cliente_http, sesion = cliente([RespuestaFalsa(403)], max_bloqueos=3)
+    assert obtener_con_limite(cliente_http) is None
+    assert sesion.peticiones == 3